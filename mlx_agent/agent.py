@@ -10,6 +10,7 @@ MLX-Agent 主类 - v0.3.0 生产就绪版
 """
 
 import asyncio
+import json
 import signal
 import time
 from pathlib import Path
@@ -19,17 +20,19 @@ from contextlib import asynccontextmanager
 from loguru import logger
 
 from .config import Config
-from .memory import MemorySystem, create_memory_backend
+from .memory import MemoryEntry, MemorySystem, create_memory_backend, embedding_registry
 from .memory.consolidation import MemoryConsolidator
 from .identity import IdentityManager
 from .compression import TokenCompressor
 from .skills import SkillManager, ToolExecutor
 from .tasks import TaskQueue, TaskWorker, TaskExecutor, TaskPriority, Task, TaskResult
 from .chat import ChatSessionManager, ChatResponse
-from .llm import LLMClient
+from .http_pool import llm_http_pool
+from .llm import LLMClient, LLMResponseCache
 from .api_manager import APIManager, get_api_manager
 from .health import HealthCheckServer
 from .plugins import PluginManager, create_plugin_manager, initialize_plugins
+from .prompt_cache import PromptBundle, PromptCache, RenderedTools
 
 
 class MLXAgent:
@@ -43,6 +46,9 @@ class MLXAgent:
         >>> await agent.start()
     """
     
+    # 工具自带 timeout 参数时，外层超时在其基础上多留的秒数
+    TOOL_TIMEOUT_MARGIN = 10.0
+    
     def __init__(self, config_path: Optional[str] = None):
         """初始化 MLX-Agent
         
@@ -102,6 +108,9 @@ class MLXAgent:
         # 插件系统
         self.plugin_manager: Optional[PluginManager] = None
         
+        # 系统提示与工具 Schema 缓存
+        self._prompt_cache = PromptCache()
+        
         # 设置信号处理
         self._setup_signal_handlers()
         
@@ -313,20 +322,38 @@ class MLXAgent:
         # 从配置获取记忆后端提供商（默认使用 chroma 保持兼容）
         memory_provider = getattr(self.config.memory, 'provider', 'chroma')
         embedding_provider = getattr(self.config.memory, 'embedding_provider', 'local')
+        embedding_registry.configure(
+            idle_unload_s=getattr(self.config.memory, 'embedding_idle_unload_s', 600.0)
+        )
+        archive_config = getattr(self.config.memory, 'auto_archive', None)
+        archive_compression = getattr(archive_config, 'compression', 'auto')
 
         memory_config = {
             "provider": memory_provider,
             "chroma": {
                 "path": getattr(self.config.memory, 'chroma_path', './memory/chroma'),
                 "embedding_provider": embedding_provider,
-                "auto_archive": True
+                "auto_archive": True,
+                "archive_compression": archive_compression
             },
             "sqlite": {
                 "path": getattr(self.config.memory, 'sqlite_path', './memory/memory.db'),
                 "embedding_provider": embedding_provider,
-                "auto_archive": True
+                "auto_archive": True,
+                "archive_compression": archive_compression,
+                "vector_index": getattr(self.config.memory, 'vector_index', 'flat'),
+                "ann_config": getattr(self.config.memory, 'ann', {}),
+                "embedding_storage": getattr(self.config.memory, 'embedding_storage', 'float32'),
+                "vector_quantization": getattr(self.config.memory, 'vector_quantization', None),
+                "quantization_config": getattr(self.config.memory, 'quantization', {})
             }
         }
+        search_cache = getattr(self.config.memory, 'search_cache', None)
+        if search_cache is not None:
+            memory_config["search_cache"] = search_cache.model_dump()
+        write_behind = getattr(self.config.memory, 'write_behind', None)
+        if write_behind is not None:
+            memory_config["write_behind"] = write_behind.model_dump()
 
         self.memory = await create_memory_backend(memory_config)
         logger.info(f"Memory system initialized (provider={memory_provider})")
@@ -356,6 +383,7 @@ class MLXAgent:
                     'model': primary_data.model,
                     'temperature': primary_data.temperature,
                     'max_tokens': primary_data.max_tokens,
+                    'prompt_cache': primary_data.prompt_cache,
                 }
                 
                 if self.config.llm.fallback:
@@ -367,6 +395,7 @@ class MLXAgent:
                         'model': fallback_data.model,
                         'temperature': fallback_data.temperature,
                         'max_tokens': fallback_data.max_tokens,
+                        'prompt_cache': fallback_data.prompt_cache,
                     }
                 
                 failover_enabled = self.config.llm.failover.enabled
@@ -380,14 +409,31 @@ class MLXAgent:
                     'model': self.config.llm.model,
                     'temperature': self.config.llm.temperature,
                     'max_tokens': self.config.llm.max_tokens,
+                    'prompt_cache': self.config.llm.prompt_cache,
                 }
             
             if primary_config and primary_config.get('api_key'):
+                llm_http_pool.configure(
+                    max_connections=self.config.performance.connection_pool_size,
+                    **self.config.llm.http.model_dump()
+                )
+                
+                response_cache = None
+                cache_config = self.config.llm.response_cache
+                if cache_config.enabled:
+                    response_cache = LLMResponseCache(
+                        max_entries=cache_config.max_entries,
+                        ttl_seconds=cache_config.ttl_seconds,
+                        semantic_threshold=cache_config.semantic_threshold,
+                        embedding_model=cache_config.embedding_model
+                    )
+                
                 self.llm = LLMClient(
                     primary_config=primary_config,
                     fallback_config=fallback_config,
                     failover_enabled=failover_enabled,
-                    max_retries=3
+                    max_retries=3,
+                    response_cache=response_cache
                 )
                 logger.info(f"LLM client initialized: {primary_config.get('model')}")
             else:
@@ -437,6 +483,11 @@ class MLXAgent:
         if results['failed'] > 0:
             for name, error in results['errors'].items():
                 logger.warning(f"Plugin '{name}' failed to initialize: {error}")
+        
+        # 备份插件按条目恢复记忆时需要记忆后端
+        backup_plugin = self.plugin_manager.get("backup")
+        if backup_plugin and hasattr(backup_plugin, "attach_memory"):
+            backup_plugin.attach_memory(self.memory)
     
     async def _close_plugins(self):
         """关闭插件系统"""
@@ -574,65 +625,27 @@ class MLXAgent:
             except Exception as e:
                 logger.warning(f"Memory search failed: {e}")
         
-        # 构建系统提示
-        base_prompt = """你是 MLX-Agent，一个强大的 AI 助手。请保持对话连贯性，参考之前的对话历史。
-
-【重要规则】
-1. 当工具返回错误信息时，你必须将错误内容原样展示给用户，不要隐瞒或修改
-2. 错误信息中通常包含原因分析和解决方案，请帮助用户理解
-3. 如果错误提示需要联系管理员，请明确告知用户
-"""
-        
-        # 添加插件技能说明到系统提示
-        plugin_capabilities = self._get_plugin_capabilities_text()
-        if plugin_capabilities:
-            base_prompt += f"\n\n【你的技能】\n{plugin_capabilities}"
-        
-        if self.identity:
-            system_prompt = self.identity.inject_to_prompt(base_prompt)
-        else:
-            system_prompt = base_prompt
-        
-        current_model = "unknown"
-        if self.llm:
-            current_model = self.llm.get_current_model()
-            system_prompt += f"\n\n当前使用的模型: {current_model}"
-        
-        if memories:
-            memory_context = "\n\n相关记忆:\n" + "\n".join([f"- {m.get('content', '')[:100]}" for m in memories[:3]])
-            system_prompt += memory_context
+        # 系统提示与工具集（按插件/人设/模型版本缓存）
+        bundle = self._get_prompt_bundle()
         
-        messages.append({"role": "system", "content": system_prompt})
+        # 静态系统提示在最前，逐字节不变，便于服务端前缀缓存
+        messages.append({"role": "system", "content": bundle.system_prompt})
         
         # 添加历史对话
         if history:
             history_to_use = [m for m in history if m.get("role") in ["user", "assistant", "tool"]][-20:]
             messages.extend(history_to_use)
         
-        messages.append({"role": "user", "content": text})
-        
-        # 获取可用工具 (技能系统 + 插件系统)
-        tools = None
-        all_tools = []
-        
-        # 从技能系统获取工具
-        if self.skill_manager:
-            try:
-                skill_tools = self.skill_manager.get_all_tools_schema()
-                all_tools.extend(skill_tools)
-            except Exception as e:
-                logger.error(f"Failed to get skill tools: {e}")
+        # 每轮变化的记忆放在本轮用户消息开头：不破坏前面的缓存前缀，
+        # 也不产生非首位的 system 消息（部分兼容后端与聊天模板不接受）
+        user_content = text
+        if memories:
+            memory_context = "相关记忆:\n" + "\n".join([f"- {m.get('content', '')[:100]}" for m in memories[:3]])
+            user_content = f"{memory_context}\n\n{text}"
         
-        # 从插件系统获取工具
-        if self.plugin_manager:
-            try:
-                plugin_tools = self.plugin_manager.get_all_tools()
-                all_tools.extend(plugin_tools)
-            except Exception as e:
-                logger.error(f"Failed to get plugin tools: {e}")
+        messages.append({"role": "user", "content": user_content})
         
-        if all_tools:
-            tools = all_tools
+        tools = bundle.tools
         
         if task:
             task.set_progress("🧠 调用 AI 生成回复...", 0.6)
@@ -678,71 +691,7 @@ class MLXAgent:
                 if task:
                     task.set_progress(f"🔧 执行工具 ({len(tool_calls)} 个)...", 0.8)
                 
-                for tool_call in tool_calls:
-                    function_name = tool_call.get("function", {}).get("name")
-                    call_id = tool_call.get("id")
-                    
-                    try:
-                        arguments = tool_call.get("function", {}).get("arguments", {})
-                        if isinstance(arguments, str):
-                            import json
-                            arguments = json.loads(arguments)
-                        
-                        # 判断工具属于哪个系统，然后调用
-                        result = None
-                        
-                        # 检查是否是技能系统的原生工具
-                        is_native_tool = False
-                        if self.skill_manager:
-                            from .tools import get_available_tools
-                            is_native_tool = function_name in get_available_tools()
-                        
-                        if is_native_tool and self.tool_executor:
-                            # 调用技能系统
-                            result = await self.tool_executor.execute(
-                                function_name,
-                                arguments,
-                                context or {}
-                            )
-                        elif self.plugin_manager:
-                            # 调用插件系统
-                            plugin_result = await self.plugin_manager.handle_tool(
-                                function_name,
-                                arguments
-                            )
-                            # 统一输出格式
-                            if isinstance(plugin_result, dict):
-                                if plugin_result.get("success"):
-                                    result = {
-                                        "success": True,
-                                        "output": plugin_result.get("message") or plugin_result.get("data") or str(plugin_result)
-                                    }
-                                else:
-                                    result = {
-                                        "success": False,
-                                        "error": plugin_result.get("error", "Unknown error")
-                                    }
-                            else:
-                                result = {"success": True, "output": str(plugin_result)}
-                        
-                        if result is None:
-                            tool_output = f"这个功能暂时没法用，可能还没准备好..."
-                        elif result.get("success"):
-                            tool_output = result.get("output", "")
-                        else:
-                            # 获取错误信息并自然展示
-                            error_msg = result.get('error', '出了点问题')
-                            tool_output = error_msg
-                            
-                    except Exception as e:
-                        tool_output = f"执行这个功能时遇到了些麻烦... 错误: {str(e)[:100]}"
-                    
-                    messages.append({
-                        "role": "tool",
-                        "tool_call_id": call_id,
-                        "name": function_name,
-                        "content": str(tool_output)
-                    })
+                messages.extend(await self._execute_tool_calls(tool_calls, context))
                 
                 continue
                 
@@ -752,6 +701,213 @@ class MLXAgent:
         
         return "交互次数过多，已终止。"
     
+    def _prompt_cache_key(self) -> tuple:
+        """系统提示/工具集的来源版本号"""
+        from .tools import tool_registry
+        return (
+            tool_registry.version,
+            self.skill_manager.version if self.skill_manager else None,
+            self.plugin_manager.version if self.plugin_manager else None,
+            self.identity.version if self.identity else None,
+            self.llm.get_current_model() if self.llm else None,
+        )
+    
+    def _get_prompt_bundle(self) -> PromptBundle:
+        """获取缓存的系统提示与工具集，插件/技能注册、人设重载或模型切换后重建"""
+        return self._prompt_cache.get_or_build(self._prompt_cache_key(), self._build_prompt_bundle)
+    
+    def _build_prompt_bundle(self) -> PromptBundle:
+        """构建系统提示（不含记忆）与工具 Schema 列表"""
+        base_prompt = """你是 MLX-Agent，一个强大的 AI 助手。请保持对话连贯性，参考之前的对话历史。
+
+【重要规则】
+1. 当工具返回错误信息时，你必须将错误内容原样展示给用户，不要隐瞒或修改
+2. 错误信息中通常包含原因分析和解决方案，请帮助用户理解
+3. 如果错误提示需要联系管理员，请明确告知用户
+"""
+        
+        # 添加插件技能说明到系统提示
+        plugin_capabilities = self._get_plugin_capabilities_text()
+        if plugin_capabilities:
+            base_prompt += f"\n\n【你的技能】\n{plugin_capabilities}"
+        
+        if self.identity:
+            system_prompt = self.identity.inject_to_prompt(base_prompt)
+        else:
+            system_prompt = base_prompt
+        
+        if self.llm:
+            system_prompt += f"\n\n当前使用的模型: {self.llm.get_current_model()}"
+        
+        # 获取可用工具 (技能系统 + 插件系统)
+        all_tools = []
+        
+        # 从技能系统获取工具
+        if self.skill_manager:
+            try:
+                skill_tools = self.skill_manager.get_all_tools_schema()
+                all_tools.extend(skill_tools)
+            except Exception as e:
+                logger.error(f"Failed to get skill tools: {e}")
+        
+        # 从插件系统获取工具
+        if self.plugin_manager:
+            try:
+                plugin_tools = self.plugin_manager.get_all_tools()
+                all_tools.extend(plugin_tools)
+            except Exception as e:
+                logger.error(f"Failed to get plugin tools: {e}")
+        
+        logger.debug(f"Prompt bundle rebuilt: {len(all_tools)} tools, {len(system_prompt)} chars")
+        return PromptBundle(
+            system_prompt=system_prompt,
+            tools=RenderedTools(all_tools) if all_tools else None,
+            key=None
+        )
+    
+    def _tool_has_side_effects(self, function_name: str) -> bool:
+        """工具是否声明了副作用（原生工具 side_effects / 插件 side_effect_tools）"""
+        from .tools import tool_registry
+        if tool_registry.has_side_effects(function_name):
+            return True
+        return bool(self.plugin_manager and self.plugin_manager.has_side_effects(function_name))
+    
+    async def _execute_tool_call(self, tool_call: dict, context: dict = None) -> str:
+        """执行单个工具调用，返回给模型的工具输出"""
+        function_name = tool_call.get("function", {}).get("name")
+        
+        try:
+            arguments = tool_call.get("function", {}).get("arguments", {})
+            if isinstance(arguments, str):
+                arguments = json.loads(arguments)
+            
+            # 判断工具属于哪个系统，然后调用
+            result = None
+            
+            # 检查是否是技能系统的原生工具
+            is_native_tool = False
+            if self.skill_manager:
+                from .tools import get_available_tools
+                is_native_tool = function_name in get_available_tools()
+            
+            if is_native_tool and self.tool_executor:
+                # 调用技能系统
+                result = await self.tool_executor.execute(
+                    function_name,
+                    arguments,
+                    context or {}
+                )
+            elif self.plugin_manager:
+                # 调用插件系统
+                plugin_result = await self.plugin_manager.handle_tool(
+                    function_name,
+                    arguments
+                )
+                # 统一输出格式
+                if isinstance(plugin_result, dict):
+                    if plugin_result.get("success"):
+                        result = {
+                            "success": True,
+                            "output": plugin_result.get("message") or plugin_result.get("data") or str(plugin_result)
+                        }
+                    else:
+                        result = {
+                            "success": False,
+                            "error": plugin_result.get("error", "Unknown error")
+                        }
+                else:
+                    result = {"success": True, "output": str(plugin_result)}
+            
+            if result is None:
+                tool_output = f"这个功能暂时没法用，可能还没准备好..."
+            elif result.get("success"):
+                tool_output = result.get("output", "")
+            else:
+                # 获取错误信息并自然展示
+                error_msg = result.get('error', '出了点问题')
+                tool_output = error_msg
+                
+        except Exception as e:
+            tool_output = f"执行这个功能时遇到了些麻烦... 错误: {str(e)[:100]}"
+    
+        return str(tool_output)
+    
+    def _tool_call_timeout(self, tool_call: dict) -> Optional[float]:
+        """单个工具调用的外层超时
+        
+        声明副作用的工具不加外层超时：中途取消可能留下已发生一半的写入或仍在运行的子进程，
+        由工具自身的超时参数控制。其他工具使用 tools.timeout_seconds，参数中带 timeout
+        且更长时放宽到该值再加 TOOL_TIMEOUT_MARGIN。
+        """
+        function = tool_call.get("function", {})
+        if self._tool_has_side_effects(function.get("name")):
+            return None
+        
+        timeout = getattr(getattr(self.config, 'tools', None), 'timeout_seconds', 60.0)
+        arguments = function.get("arguments")
+        if isinstance(arguments, str):
+            try:
+                arguments = json.loads(arguments)
+            except ValueError:
+                arguments = None
+        requested = arguments.get("timeout") if isinstance(arguments, dict) else None
+        if isinstance(requested, (int, float)) and not isinstance(requested, bool):
+            timeout = max(timeout, requested + self.TOOL_TIMEOUT_MARGIN)
+        return timeout
+    
+    async def _execute_tool_calls(self, tool_calls: list, context: dict = None) -> list:
+        """执行一轮中的全部工具调用
+        
+        无副作用的调用并发执行（受 tools.max_concurrency 限制），声明副作用的调用
+        按原顺序串行执行；超时见 _tool_call_timeout。
+        返回的工具消息按 tool_calls 原顺序排列。
+        """
+        tools_config = getattr(self.config, 'tools', None)
+        max_concurrency = max(1, getattr(tools_config, 'max_concurrency', 4))
+        semaphore = asyncio.Semaphore(max_concurrency)
+        outputs = [None] * len(tool_calls)
+        
+        async def run(index: int):
+            tool_call = tool_calls[index]
+            function_name = tool_call.get("function", {}).get("name")
+            timeout = self._tool_call_timeout(tool_call)
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    outputs[index] = await asyncio.wait_for(
+                        self._execute_tool_call(tool_call, context), timeout=timeout
+                    )
+                except asyncio.TimeoutError:
+                    logger.warning(f"Tool {function_name} timed out after {timeout}s")
+                    outputs[index] = f"这个功能执行超时了（{timeout:g} 秒），请稍后再试"
+                logger.debug(f"Tool {function_name} finished in {(time.perf_counter() - start) * 1000:.0f}ms")
+        
+        async def run_serial(indices: list):
+            for index in indices:
+                await run(index)
+        
+        serial = [i for i, tc in enumerate(tool_calls)
+                  if self._tool_has_side_effects(tc.get("function", {}).get("name"))]
+        if max_concurrency == 1:
+            serial = list(range(len(tool_calls)))
+        serial_set = set(serial)
+        concurrent = [i for i in range(len(tool_calls)) if i not in serial_set]
+        
+        jobs = [run(i) for i in concurrent]
+        if serial:
+            jobs.append(run_serial(serial))
+        await asyncio.gather(*jobs)
+        
+        return [
+            {
+                "role": "tool",
+                "tool_call_id": tool_call.get("id"),
+                "name": tool_call.get("function", {}).get("name"),
+                "content": outputs[i]
+            }
+            for i, tool_call in enumerate(tool_calls)
+        ]
+    
     async def _slow_handle_message_stream(
         self,
         text: str,
@@ -766,32 +922,29 @@ class MLXAgent:
         messages = []
         history = history or []
         
-        # 构建系统提示
-        base_prompt = "你是 MLX-Agent，一个强大的 AI 助手。"
-        
-        if self.identity:
-            system_prompt = self.identity.inject_to_prompt(base_prompt)
-        else:
-            system_prompt = base_prompt
-        
         # 搜索相关记忆
+        memories = []
         if self.memory:
             try:
                 memories = await self.memory.search(text, limit=3)
-                if memories:
-                    memory_context = "\n\n相关记忆:\n" + "\n".join([f"- {m.get('content', '')[:100]}" for m in memories[:3]])
-                    system_prompt += memory_context
             except Exception as e:
                 logger.warning(f"Memory search failed: {e}")
         
-        messages.append({"role": "system", "content": system_prompt})
+        # 与非流式路径共用缓存的静态系统提示，保持前缀不变
+        messages.append({"role": "system", "content": self._get_prompt_bundle().system_prompt})
         
         # 添加历史
         if history:
             history_to_use = [m for m in history if m.get("role") in ["user", "assistant", "tool"]][-20:]
             messages.extend(history_to_use)
         
-        messages.append({"role": "user", "content": text})
+        # 每轮变化的记忆放在本轮用户消息开头
+        user_content = text
+        if memories:
+            memory_context = "相关记忆:\n" + "\n".join([f"- {m.get('content', '')[:100]}" for m in memories[:3]])
+            user_content = f"{memory_context}\n\n{text}"
+        
+        messages.append({"role": "user", "content": user_content})
         
         # 流式调用 LLM
         if not self.llm:
@@ -862,8 +1015,8 @@ class MLXAgent:
         # 保存到记忆
         if self.memory and result.success:
             try:
-                await self.memory.add(
-                    f"Task {task.id} completed: {result.output[:200] if result.output else 'No output'}",
+                await self.memory.add(MemoryEntry(
+                    content=f"Task {task.id} completed: {result.output[:200] if result.output else 'No output'}",
                     metadata={
                         'platform': task.platform,
                         'user_id': task.user_id,
@@ -871,7 +1024,7 @@ class MLXAgent:
                         'task_id': task.id
                     },
                     level='P2'
-                )
+                ))
             except Exception as e:
                 logger.warning(f"Failed to save task memory: {e}")
     
@@ -1003,10 +1156,14 @@ class MLXAgent:
                 'loaded': len(self.plugin_manager.list_plugins()) if self.plugin_manager else 0,
                 'names': self.plugin_manager.list_plugins() if self.plugin_manager else []
             },
-            'memory': self.memory.get_stats() if self.memory else None,
+            'memory': await self.memory.get_stats() if self.memory else None,
+            'embedding_models': embedding_registry.get_stats(),
+            'llm_http_pool': llm_http_pool.get_stats(),
             'tasks': self.task_queue.get_stats() if self.task_queue else None,
             'worker': self.task_worker.get_stats() if self.task_worker else None,
-            'sessions': self.chat_manager.get_stats() if self.chat_manager else None
+            'sessions': self.chat_manager.get_stats() if self.chat_manager else None,
+            'prompt_cache': self._prompt_cache.get_stats(),
+            'llm': self.llm.get_cache_stats() if self.llm else None
         }
         return stats
     
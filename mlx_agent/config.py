@@ -19,6 +19,26 @@ class MemoryArchiveConfig(BaseModel):
     interval_hours: int = 24
     p1_max_age_days: int = 7
     p2_max_age_days: int = 1
+    # 归档段压缩: auto (有 zstandard 时用 zstd，否则 gzip) / zstd / gzip / none
+    compression: str = "auto"
+
+
+class MemorySearchCacheConfig(BaseModel):
+    """记忆搜索结果缓存配置"""
+    enabled: bool = True
+    max_entries: int = 512
+    ttl_seconds: float = 300.0
+
+
+class MemoryWriteBehindConfig(BaseModel):
+    """记忆异步批量写入配置（开启后写入为最终一致，需显式启用）"""
+    enabled: bool = False
+    journal_path: str = "./memory/write_behind.jsonl"
+    max_pending: int = 1000
+    batch_size: int = 64
+    flush_interval_ms: float = 200.0
+    fsync: bool = True
+    max_retries: int = 5  # 单批重试上限，超过后转入 *.dead.jsonl 死信日志
 
 
 class MemoryConfig(BaseModel):
@@ -32,6 +52,23 @@ class MemoryConfig(BaseModel):
     chroma_path: str = "./memory/chroma"
     ollama_url: str = "http://localhost:11434"
     openai_api_key: Optional[str] = None
+    # 本地嵌入模型在所有后端间共享，空闲超过该秒数后卸载（<= 0 不卸载）
+    embedding_idle_unload_s: float = 600.0
+    
+    # SQLite 向量索引: flat (精确) / ivf (近似，适合大规模记忆)
+    vector_index: str = "flat"
+    ann: Dict[str, Any] = {}
+    
+    # 嵌入量化: BLOB 存储精度 (float32 / float16 / int8)，flat 索引常驻量化 (float16 / int8 / pq)
+    embedding_storage: str = "float32"
+    vector_quantization: Optional[str] = None
+    quantization: Dict[str, Any] = {}
+    
+    # 搜索结果缓存 (LRU + TTL)
+    search_cache: MemorySearchCacheConfig = MemorySearchCacheConfig()
+    
+    # 异步批量写入 (write-behind 队列 + 本地日志)
+    write_behind: MemoryWriteBehindConfig = MemoryWriteBehindConfig()
     
     # 自动归档
     auto_archive: MemoryArchiveConfig = MemoryArchiveConfig()
@@ -77,6 +114,8 @@ class LLMModelConfig(BaseModel):
     model: str = "gpt-4o-mini"
     temperature: float = 0.7
     max_tokens: int = 2000
+    # 服务端前缀缓存提示: None / "openai" (prompt_cache_key) / "cache_control" (Anthropic 风格断点，OpenRouter、通义等)
+    prompt_cache: Optional[str] = None
     
     def model_post_init(self, __context):
         """Expand environment variables"""
@@ -99,6 +138,27 @@ class FailoverConfig(BaseModel):
     timeout: int = 30
 
 
+class LLMResponseCacheConfig(BaseModel):
+    """LLM 响应缓存配置（仅缓存无工具的非流式请求）"""
+    enabled: bool = False
+    max_entries: int = 256
+    ttl_seconds: float = 600.0
+    # 语义命中的余弦相似度阈值，None 表示只做精确命中
+    semantic_threshold: Optional[float] = None
+    embedding_model: str = "BAAI/bge-m3"
+
+
+class LLMHTTPConfig(BaseModel):
+    """LLM 请求共享连接池配置（连接上限取 performance.connection_pool_size）"""
+    http2: bool = True  # 需要 h2，服务端不支持时自动回退 HTTP/1.1
+    max_keepalive_connections: Optional[int] = None  # None 表示与连接上限相同
+    keepalive_expiry: float = 60.0
+    connect_timeout: float = 10.0
+    read_timeout: float = 120.0
+    write_timeout: float = 30.0
+    pool_timeout: float = 10.0
+
+
 class LLMConfig(BaseModel):
     """LLM provider configuration (supporting multi-model)"""
     # 兼容旧配置：直接作为字段
@@ -109,11 +169,14 @@ class LLMConfig(BaseModel):
     model: Optional[str] = None
     temperature: Optional[float] = None
     max_tokens: Optional[int] = None
+    prompt_cache: Optional[str] = None
     
     # 新配置：主备模型
     primary: Optional[LLMModelConfig] = None
     fallback: Optional[LLMModelConfig] = None
     failover: FailoverConfig = FailoverConfig()
+    response_cache: LLMResponseCacheConfig = LLMResponseCacheConfig()
+    http: LLMHTTPConfig = LLMHTTPConfig()
     
     def model_post_init(self, __context):
         """Expand environment variables and handle compatibility"""
@@ -139,7 +202,8 @@ class LLMConfig(BaseModel):
                 auth_token=self.auth_token,
                 model=self.model or "gpt-4o-mini",
                 temperature=self.temperature or 0.7,
-                max_tokens=self.max_tokens or 2000
+                max_tokens=self.max_tokens or 2000,
+                prompt_cache=self.prompt_cache
             )
 
 
@@ -151,6 +215,12 @@ class PerformanceConfig(BaseModel):
     connection_pool_size: int = 100
 
 
+class ToolsConfig(BaseModel):
+    """工具调用执行配置"""
+    max_concurrency: int = 4  # 同一轮中并发执行的工具调用数，1 表示串行
+    timeout_seconds: float = 60.0  # 单个工具调用超时
+
+
 class SecurityConfig(BaseModel):
     """Security configuration"""
     default_bind: str = "127.0.0.1"  # 不是 0.0.0.0，更安全
@@ -254,6 +324,7 @@ class Config(BaseSettings):
     platforms: PlatformsConfig = PlatformsConfig()
     llm: LLMConfig = LLMConfig()
     performance: PerformanceConfig = PerformanceConfig()
+    tools: ToolsConfig = ToolsConfig()
     security: SecurityConfig = SecurityConfig()
     health_check: HealthCheckConfig = HealthCheckConfig()
     shutdown: ShutdownConfig = ShutdownConfig()
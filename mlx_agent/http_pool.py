@@ -0,0 +1,178 @@
+"""
+LLM 请求共享 HTTP 连接池
+
+主 Agent、子代理等各自的 LLMClient 共用同一个 httpx.AsyncClient:
+- 连接上限取自 PerformanceConfig.connection_pool_size，空闲连接保活复用，
+  TLS 握手不再落在每个新客户端的首个请求上
+- 安装 h2 (pip install "httpx[http2]") 时启用 HTTP/2，由 ALPN 协商，服务端不支持时回退 HTTP/1.1
+- connect / read / write / pool 分别设置超时
+- 通过 httpcore trace 统计新建连接、TLS 握手与各协议版本的请求数
+
+Example:
+    >>> client = llm_http_pool.acquire()
+    >>> response = await client.post(url, content=body)
+    >>> await llm_http_pool.release()
+"""
+
+from typing import Any, Dict, Optional
+
+import httpx
+from loguru import logger
+
+try:
+    import h2  # noqa: F401
+    HAS_H2 = True
+except ImportError:
+    HAS_H2 = False
+
+_SETTINGS = (
+    "max_connections", "max_keepalive_connections", "keepalive_expiry", "http2",
+    "connect_timeout", "read_timeout", "write_timeout", "pool_timeout",
+)
+
+
+class LLMHTTPPool:
+    """进程级 LLM HTTP 连接池（按引用计数共享一个 AsyncClient）"""
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: Optional[int] = None,
+        keepalive_expiry: float = 60.0,
+        http2: bool = True,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 120.0,
+        write_timeout: float = 30.0,
+        pool_timeout: float = 10.0
+    ):
+        """
+        Args:
+            max_connections: 最大连接数
+            max_keepalive_connections: 最大保活空闲连接数，None 表示与 max_connections 相同
+            keepalive_expiry: 空闲连接保活时间（秒）
+            http2: 是否启用 HTTP/2（需要 h2）
+            connect_timeout: 建立连接（含 TLS 握手）超时
+            read_timeout: 读取响应超时（流式时为两个数据块之间的间隔）
+            write_timeout: 发送请求体超时
+            pool_timeout: 等待连接池空闲连接的超时
+        """
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        self.pool_timeout = pool_timeout
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._refs = 0
+
+        # 统计
+        self._requests = 0
+        self._connections_opened = 0
+        self._tls_handshakes = 0
+        self._http_versions: Dict[str, int] = {}
+
+    def configure(self, **settings):
+        """调整连接池参数
+
+        已有客户端在引用期间不会重建，新参数在全部引用释放后的下一次 acquire 生效。
+        """
+        for name, value in settings.items():
+            if name not in _SETTINGS:
+                raise ValueError(f"Unknown HTTP pool setting: {name}")
+            if value is not None or name == "max_keepalive_connections":
+                setattr(self, name, value)
+        if self._client is not None:
+            logger.debug("HTTP pool reconfigured, changes apply after the current client is released")
+
+    @property
+    def http2_enabled(self) -> bool:
+        return self.http2 and HAS_H2
+
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout
+        )
+
+    def limits(self) -> httpx.Limits:
+        keepalive = self.max_keepalive_connections
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections if keepalive is None else keepalive,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    def acquire(self) -> httpx.AsyncClient:
+        """获取共享客户端（首次调用时创建）"""
+        if self._client is None or self._client.is_closed:
+            if self.http2 and not HAS_H2:
+                logger.info("h2 not installed, LLM requests use HTTP/1.1 (pip install 'httpx[http2]')")
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout(),
+                limits=self.limits(),
+                http2=self.http2_enabled,
+                event_hooks={"request": [self._on_request], "response": [self._on_response]}
+            )
+            logger.debug(
+                f"LLM HTTP pool created: max_connections={self.max_connections}, "
+                f"http2={self.http2_enabled}"
+            )
+        self._refs += 1
+        return self._client
+
+    async def release(self):
+        """释放引用，最后一个引用释放时关闭客户端"""
+        if self._refs <= 0:
+            return
+        self._refs -= 1
+        if self._refs == 0 and self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {
+            "active": self._client is not None,
+            "refs": self._refs,
+            "http2": self.http2_enabled,
+            "max_connections": self.max_connections,
+            "keepalive_expiry": self.keepalive_expiry,
+            "requests": self._requests,
+            "connections_opened": self._connections_opened,
+            "tls_handshakes": self._tls_handshakes,
+            "reuse_rate": round(1 - self._connections_opened / self._requests, 4) if self._requests else 0.0,
+            "http_versions": dict(self._http_versions),
+        }
+        stats.update(self._pool_connections())
+        return stats
+
+    def _pool_connections(self) -> Dict[str, int]:
+        """读取 httpcore 连接池中的当前连接（内部属性，读取失败时返回空）"""
+        try:
+            connections = list(self._client._transport._pool.connections)
+        except AttributeError:
+            return {}
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {"open_connections": len(connections), "idle_connections": idle}
+
+    async def _on_request(self, request: httpx.Request):
+        self._requests += 1
+        request.extensions["trace"] = self._trace
+
+    async def _on_response(self, response: httpx.Response):
+        version = response.http_version
+        self._http_versions[version] = self._http_versions.get(version, 0) + 1
+
+    async def _trace(self, event_name: str, info: Dict[str, Any]):
+        if event_name == "connection.connect_tcp.complete":
+            self._connections_opened += 1
+        elif event_name == "connection.start_tls.complete":
+            self._tls_handshakes += 1
+
+
+# 全局连接池
+llm_http_pool = LLMHTTPPool()
@@ -30,6 +30,7 @@ class IdentityManager:
         self.identity: Dict[str, str] = {}
         self._loaded = False
         self._last_modified: Dict[str, float] = {}
+        self.version = 0  # 每次加载递增，供系统提示缓存判断失效
     
     async def load(self, force: bool = False) -> bool:
         """加载人设文件
@@ -65,6 +66,7 @@ class IdentityManager:
                 self.identity = self._get_default_identity()
             
             self._loaded = True
+            self.version += 1
             return True
             
         except Exception as e:
@@ -72,6 +74,7 @@ class IdentityManager:
             self.soul = self._get_default_soul()
             self.identity = self._get_default_identity()
             self._loaded = True
+            self.version += 1
             return False
     
     async def check_reload(self) -> bool:
@@ -5,11 +5,270 @@ LLM 客户端 - 支持多模型、故障转移、工具调用和流式输出
 """
 
 import asyncio
+import hashlib
 import json
-from typing import List, Dict, Optional, Any, Union, AsyncGenerator
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List, Dict, Optional, Any, Union, AsyncGenerator, Callable, Set, Tuple
 import httpx
+import numpy as np
 from loguru import logger
 
+from .http_pool import LLMHTTPPool, llm_http_pool
+from .prompt_cache import RenderedTools
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def encode_payload(data: Dict[str, Any]) -> bytes:
+    """序列化请求体，预渲染的工具集 (RenderedTools) 直接拼接而不重新序列化"""
+    tools = data.get("tools")
+    if isinstance(tools, RenderedTools):
+        body = json.dumps({k: v for k, v in data.items() if k != "tools"}, ensure_ascii=False)
+        return f'{body[:-1]},"tools":{tools.json}}}'.encode("utf-8")
+    return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+PROMPT_CACHE_STYLES = ("openai", "cache_control")
+
+
+def extract_cached_tokens(usage: Optional[Dict[str, Any]]) -> int:
+    """从 usage 中读取命中前缀缓存的 prompt token 数（兼容各家字段）"""
+    if not usage:
+        return 0
+    details = usage.get("prompt_tokens_details") or {}
+    for value in (
+        details.get("cached_tokens"),           # OpenAI / 通义
+        usage.get("prompt_cache_hit_tokens"),   # DeepSeek
+        usage.get("cached_tokens"),             # Moonshot
+        usage.get("cache_read_input_tokens"),   # Anthropic 兼容层
+    ):
+        if value:
+            return int(value)
+    return 0
+
+
+def _canonical(value: Any) -> str:
+    """请求体的规范 JSON（键排序、紧凑分隔），用作缓存键"""
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def _normalize_text(text: str) -> str:
+    """NFKC、大小写折叠、合并空白"""
+    return _SPACE_RE.sub(" ", unicodedata.normalize("NFKC", text).casefold()).strip()
+
+
+# LLMResponseCache.get() 未计算查询向量时的占位值
+NOT_ENCODED = object()
+
+
+class LLMResponseCache:
+    """LLM 响应缓存（LRU + TTL，可选语义命中）
+
+    只缓存无工具的非流式请求（简短回复、子任务、简报等 simple_chat 路径）:
+    - 精确命中: 键为规范化请求体（模型、消息、温度、max_tokens、思考模式）的哈希，
+      最后一条用户消息做 NFKC / 大小写 / 空白归一化
+    - 语义命中: 除最后一条用户消息外完全相同的请求视为同一上下文，
+      对最后一条用户消息做向量相似度比较，达到阈值即命中
+
+    Example:
+        >>> cache = LLMResponseCache(max_entries=256, ttl_seconds=600, semantic_threshold=0.95)
+        >>> llm = LLMClient(primary_config, response_cache=cache)
+        >>> await llm.simple_chat("你好")              # 未命中，写入缓存
+        >>> await llm.simple_chat("你好 ")             # 精确命中
+        >>> await llm.simple_chat("你好", cache=False) # 绕过缓存
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl_seconds: float = 600.0,
+        semantic_threshold: Optional[float] = None,
+        embedding_model: str = "BAAI/bge-m3",
+        embed: Optional[Callable[[List[str]], Any]] = None
+    ):
+        """
+        Args:
+            max_entries: 最大缓存条数
+            ttl_seconds: 条目有效期（秒），<= 0 表示不过期
+            semantic_threshold: 语义命中的余弦相似度阈值，None 表示只做精确命中
+            embedding_model: 语义命中使用的嵌入模型（经 embedding_registry 共享）
+            embed: 自定义嵌入函数 texts -> 向量列表，优先于 embedding_model
+        """
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl_seconds
+        self.semantic_threshold = semantic_threshold
+        self.embedding_model = embedding_model
+
+        self._embed = embed
+        self._handle = None
+        # exact_key -> (响应, 过期时间, 节省 token 数, context_key, 归一化向量)
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], float, int, str, Any]]" = OrderedDict()
+        self._by_context: Dict[str, Set[str]] = {}
+
+        # 统计
+        self._exact_hits = 0
+        self._semantic_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._saved_tokens = 0
+        self._embed_failures = 0
+
+    @staticmethod
+    def make_key(request: Dict[str, Any]) -> Tuple[str, str, str]:
+        """计算 (精确键, 上下文键, 最后一条用户消息)"""
+        messages = request.get("messages") or []
+        last = len(messages) - 1
+        while last >= 0 and messages[last].get("role") != "user":
+            last -= 1
+        query = messages[last].get("content") if last >= 0 else None
+        query = query if isinstance(query, str) else ""
+
+        context = dict(request, messages=messages[:last] + messages[last + 1:] if last >= 0 else messages)
+        context_key = hashlib.sha256(_canonical(context).encode("utf-8")).hexdigest()
+        exact_key = hashlib.sha256(
+            f"{context_key}\x00{last}\x00{_normalize_text(query)}".encode("utf-8")
+        ).hexdigest()
+        return exact_key, context_key, query
+
+    async def get(self, request: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Any]:
+        """查找缓存
+
+        Returns:
+            (命中时的响应副本或 None, 查询向量)；未命中时把查询向量传给 put()，避免重复编码。
+            未做语义比较时向量为 NOT_ENCODED。
+        """
+        exact_key, context_key, query = self.make_key(request)
+
+        entry = self._lookup(exact_key)
+        if entry is not None:
+            self._exact_hits += 1
+            return self._hit(exact_key, entry), NOT_ENCODED
+
+        vector = NOT_ENCODED
+        if self.semantic_threshold is not None and query and self._by_context.get(context_key):
+            vector = await self._encode(query)
+            if vector is not None:
+                best_key, best_score = None, self.semantic_threshold
+                for key in list(self._by_context.get(context_key, ())):
+                    entry = self._lookup(key)
+                    if entry is None or entry[4] is None:
+                        continue
+                    score = float(np.dot(vector, entry[4]))
+                    if score >= best_score:
+                        best_key, best_score = key, score
+                if best_key is not None:
+                    self._semantic_hits += 1
+                    logger.debug(f"[LLM Cache] Semantic hit (score={best_score:.3f})")
+                    return self._hit(best_key, self._entries[best_key]), vector
+
+        self._misses += 1
+        return None, vector
+
+    async def put(
+        self,
+        request: Dict[str, Any],
+        response: Dict[str, Any],
+        tokens: int = 0,
+        vector: Any = NOT_ENCODED
+    ):
+        """写入缓存
+
+        Args:
+            request: 请求体（最后一条用户消息与 get 使用的相同，模型可以不同）
+            response: 响应消息
+            tokens: 该次调用消耗的 token 数，命中时计入节省量
+            vector: get() 返回的查询向量，NOT_ENCODED 时在此编码
+        """
+        exact_key, context_key, query = self.make_key(request)
+        if self.semantic_threshold is None or not query:
+            vector = None
+        elif vector is NOT_ENCODED:
+            vector = await self._encode(query)
+
+        if exact_key in self._entries:
+            self._remove(exact_key)
+        expires_at = time.monotonic() + self.ttl if self.ttl > 0 else 0.0
+        self._entries[exact_key] = (dict(response), expires_at, int(tokens or 0), context_key, vector)
+        self._by_context.setdefault(context_key, set()).add(exact_key)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self._evictions += 1
+
+    def clear(self):
+        """清空缓存"""
+        self._entries.clear()
+        self._by_context.clear()
+
+    def close(self):
+        """释放嵌入模型引用"""
+        if self._handle is not None:
+            self._handle.release()
+            self._handle = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        hits = self._exact_hits + self._semantic_hits
+        total = hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits_exact": self._exact_hits,
+            "hits_semantic": self._semantic_hits,
+            "misses": self._misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "saved_tokens": self._saved_tokens,
+            "evictions": self._evictions,
+            "expirations": self._expirations,
+            "embed_failures": self._embed_failures,
+        }
+
+    def _lookup(self, key: str):
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] and time.monotonic() > entry[1]:
+            self._remove(key)
+            self._expirations += 1
+            return None
+        return entry
+
+    def _hit(self, key: str, entry) -> Dict[str, Any]:
+        self._entries.move_to_end(key)
+        self._saved_tokens += entry[2]
+        return dict(entry[0])
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._by_context.get(entry[3])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_context[entry[3]]
+
+    async def _encode(self, text: str):
+        """在线程池中计算归一化向量，失败时返回 None（退化为只做精确命中）"""
+        try:
+            embed = self._embed
+            if embed is None:
+                if self._handle is None:
+                    from .memory.embedding_registry import embedding_registry
+                    self._handle = embedding_registry.acquire(self.embedding_model)
+                handle = self._handle
+                embed = lambda texts: handle.encode(texts, convert_to_numpy=True)
+            loop = asyncio.get_running_loop()
+            vectors = await loop.run_in_executor(None, embed, [_normalize_text(text)])
+            vector = np.asarray(vectors[0], dtype=np.float32)
+            norm = float(np.linalg.norm(vector))
+            return vector / norm if norm else None
+        except Exception as e:
+            self._embed_failures += 1
+            logger.warning(f"[LLM Cache] Embedding failed, semantic lookup disabled for this call: {e}")
+            return None
+
 
 class LLMClient:
     """LLM 客户端 - 支持主备模型和流式输出"""
@@ -20,7 +279,9 @@ class LLMClient:
         fallback_config: Optional[Dict] = None,
         failover_enabled: bool = True,
         max_retries: int = 3,
-        retry_delay: float = 1.0
+        retry_delay: float = 1.0,
+        response_cache: Optional[LLMResponseCache] = None,
+        http_pool: Optional[LLMHTTPPool] = None
     ):
         """
         Args:
@@ -29,15 +290,27 @@ class LLMClient:
             failover_enabled: 是否启用故障转移
             max_retries: 最大重试次数
             retry_delay: 重试延迟（秒）
+            response_cache: 响应缓存，None 表示不缓存
+            http_pool: HTTP 连接池，默认使用进程共享的 llm_http_pool
         """
         self.primary_config = primary_config
         self.fallback_config = fallback_config
         self.failover_enabled = failover_enabled and fallback_config is not None
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.response_cache = response_cache
         
         self.current_config = primary_config
-        self.client = httpx.AsyncClient(timeout=120.0)
+        self._http_pool = http_pool or llm_http_pool
+        self.client = self._http_pool.acquire()
+        
+        # 前缀缓存命中统计（来自响应 usage）
+        self._usage = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "cache_hits": 0}
+        self._prefix_key_cache: Optional[tuple] = None
+        for cfg in (primary_config, fallback_config):
+            style = (cfg or {}).get('prompt_cache')
+            if style and style not in PROMPT_CACHE_STYLES:
+                raise ValueError(f"Unknown prompt_cache style: {style}. Use one of {PROMPT_CACHE_STYLES}")
         
         logger.info(f"LLMClient initialized")
         logger.info(f"  Primary: {primary_config.get('model', 'unknown')}")
@@ -53,7 +326,8 @@ class LLMClient:
         tool_choice: Optional[Union[str, Dict]] = None,
         force_model: Optional[str] = None,
         reasoning: bool = False,
-        auto_reasoning: bool = True
+        auto_reasoning: bool = True,
+        cache: bool = True
     ) -> Dict[str, Any]:
         """调用聊天接口，支持工具调用和故障转移
         
@@ -66,6 +340,7 @@ class LLMClient:
             force_model: 强制使用指定模型 (primary/fallback)
             reasoning: 是否启用深度思考模式 (Kimi k2.5 支持)
             auto_reasoning: 是否自动根据工具调用启用思考模式 (默认 True)
+            cache: 是否使用响应缓存 (仅对无工具请求生效，False 表示绕过)
             
         Returns:
             完整消息对象 (Dict)，包含 content 和 tool_calls
@@ -81,11 +356,54 @@ class LLMClient:
         else:
             config = self.current_config
         
-        # 指数退避重试
+        # 响应缓存: 工具调用有副作用，带工具的请求不缓存
+        use_cache = cache and self.response_cache is not None and not tools
+        
+        def cache_request(model: str) -> Dict[str, Any]:
+            return {
+                "model": model,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "reasoning": reasoning,
+            }
+        
+        if use_cache:
+            cached, query_vector = await self.response_cache.get(cache_request(config['model']))
+            if cached is not None:
+                return cached
+        
+        usage: Dict[str, Any] = {}
+        response = await self._chat_with_failover(
+            config, messages, temperature, max_tokens, tools, tool_choice, reasoning, usage
+        )
+        
+        if use_cache and not response.get("tool_calls"):
+            tokens = usage.get("total_tokens") or (
+                int(usage.get("prompt_tokens") or 0) + int(usage.get("completion_tokens") or 0)
+            )
+            # 按实际回答的模型写入（故障转移后为备用模型）
+            await self.response_cache.put(
+                cache_request(self.current_config['model']), response, tokens, vector=query_vector
+            )
+        return response
+    
+    async def _chat_with_failover(
+        self,
+        config: Dict,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        max_tokens: int,
+        tools: Optional[List[Dict]],
+        tool_choice: Optional[Union[str, Dict]],
+        reasoning: bool,
+        usage: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """指数退避重试，最后一次失败后切换备用模型"""
         for attempt in range(self.max_retries):
             try:
                 response = await self._call_api(
-                    config, messages, temperature, max_tokens, tools, tool_choice, reasoning
+                    config, messages, temperature, max_tokens, tools, tool_choice, reasoning, usage
                 )
                 self.current_config = config  # 成功后更新当前配置
                 return response
@@ -99,7 +417,7 @@ class LLMClient:
                         try:
                             response = await self._call_api(
                                 self.fallback_config, messages, temperature, max_tokens, 
-                                tools, tool_choice, reasoning
+                                tools, tool_choice, reasoning, usage
                             )
                             self.current_config = self.fallback_config
                             logger.info("Fallback model succeeded")
@@ -192,9 +510,14 @@ class LLMClient:
         max_tokens: int,
         tools: Optional[List[Dict]] = None,
         tool_choice: Optional[Union[str, Dict]] = None,
-        reasoning: bool = False
+        reasoning: bool = False,
+        usage: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
-        """调用 API (非流式)"""
+        """调用 API (非流式)
+        
+        Args:
+            usage: 传入字典时写入本次响应的 usage
+        """
         api_base = config['api_base'].rstrip('/')
         url = f"{api_base}/chat/completions"
         
@@ -223,18 +546,23 @@ class LLMClient:
             data["reasoning"] = True
             logger.debug(f"[LLM] Reasoning mode enabled")
         
+        self._apply_cache_hints(config, data)
+        
         logger.debug(f"[LLM] Calling {config['model']} at {api_base}")
         if tools:
             logger.debug(f"[LLM] Tools count: {len(tools)}")
         
         try:
-            response = await self.client.post(url, headers=headers, json=data)
+            response = await self.client.post(url, headers=headers, content=encode_payload(data))
             response.raise_for_status()
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP error: {e.response.status_code} - {e.response.text[:200]}")
             raise
         
         result = response.json()
+        self._record_usage(result.get("usage"))
+        if usage is not None:
+            usage.update(result.get("usage") or {})
         message = result["choices"][0]["message"]
         
         content = message.get("content")
@@ -286,14 +614,21 @@ class LLMClient:
         if reasoning:
             data["reasoning"] = True
         
+        # 开启缓存提示时请求末尾的 usage 块以统计命中
+        track_usage = bool(config.get('prompt_cache'))
+        if track_usage:
+            data["stream_options"] = {"include_usage": True}
+        self._apply_cache_hints(config, data)
+        
         logger.debug(f"[LLM Stream] Calling {config['model']}")
         
         accumulated_content = ""
         accumulated_reasoning = ""
         tool_calls_buffer = {}
+        finished = None
         
         try:
-            async with self.client.stream("POST", url, headers=headers, json=data, timeout=120.0) as response:
+            async with self.client.stream("POST", url, headers=headers, content=encode_payload(data)) as response:
                 response.raise_for_status()
                 
                 async for line in response.aiter_lines():
@@ -306,13 +641,16 @@ class LLMClient:
                         
                         # 流结束标记
                         if json_str == "[DONE]":
-                            yield {"type": "done", "finish_reason": "stop"}
+                            yield {"type": "done", "finish_reason": finished or "stop"}
                             break
                         
                         try:
                             chunk = json.loads(json_str)
-                            delta = chunk.get("choices", [{}])[0].get("delta", {})
-                            finish_reason = chunk.get("choices", [{}])[0].get("finish_reason")
+                            if chunk.get("usage"):
+                                self._record_usage(chunk["usage"])
+                            choice = (chunk.get("choices") or [{}])[0]
+                            delta = choice.get("delta") or {}
+                            finish_reason = choice.get("finish_reason")
                             
                             # 内容片段
                             content = delta.get("content")
@@ -352,7 +690,12 @@ class LLMClient:
                                 if tool_calls_buffer:
                                     for tc in tool_calls_buffer.values():
                                         yield {"type": "tool_call", "tool_call": tc}
+                                    tool_calls_buffer = {}
                                 
+                                if track_usage:
+                                    # usage 块在 finish_reason 之后、[DONE] 之前
+                                    finished = finish_reason
+                                    continue
                                 yield {"type": "done", "finish_reason": finish_reason}
                                 break
                                 
@@ -362,6 +705,10 @@ class LLMClient:
                         except Exception as e:
                             logger.error(f"[LLM Stream] Error processing chunk: {e}")
                             continue
+                else:
+                    # 连接关闭但未收到 [DONE]
+                    if finished is not None:
+                        yield {"type": "done", "finish_reason": finished}
                             
         except httpx.HTTPStatusError as e:
             error_text = await e.response.aread()
@@ -371,8 +718,19 @@ class LLMClient:
             logger.error(f"[LLM Stream] Error: {e}")
             yield {"type": "error", "error": str(e)}
     
-    async def simple_chat(self, user_message: str, system_prompt: Optional[str] = None) -> str:
-        """简单对话 (仅返回文本)"""
+    async def simple_chat(
+        self,
+        user_message: str,
+        system_prompt: Optional[str] = None,
+        cache: bool = True
+    ) -> str:
+        """简单对话 (仅返回文本)
+        
+        Args:
+            user_message: 用户消息
+            system_prompt: 系统提示
+            cache: 是否使用响应缓存，False 表示绕过
+        """
         messages = []
         
         if system_prompt:
@@ -381,7 +739,7 @@ class LLMClient:
         messages.append({"role": "user", "content": user_message})
         
         try:
-            response = await self.chat(messages)
+            response = await self.chat(messages, cache=cache)
             return response.get("content", "") or ""
         except Exception as e:
             logger.error(f"Simple chat failed: {e}")
@@ -413,6 +771,75 @@ class LLMClient:
             logger.error(f"Simple chat stream failed: {e}")
             yield f"抱歉，遇到错误: {e}"
     
+    def _apply_cache_hints(self, config: Dict, data: Dict[str, Any]):
+        """按配置为请求添加服务端前缀缓存提示
+        
+        - openai: prompt_cache_key 设为静态前缀（模型 + 前导 system 消息 + 工具集）的哈希，
+          相同前缀的请求路由到同一缓存
+        - cache_control: 在最后一条前导 system 消息上打 Anthropic 风格的 ephemeral 断点，
+          工具集与系统提示一起缓存
+        """
+        style = config.get('prompt_cache')
+        if not style:
+            return
+        messages = data["messages"]
+        prefix_end = 0
+        while prefix_end < len(messages) and messages[prefix_end].get("role") == "system":
+            prefix_end += 1
+        
+        if style == "openai":
+            data["prompt_cache_key"] = self._prefix_key(data, messages[:prefix_end])
+        elif style == "cache_control" and prefix_end:
+            last = messages[prefix_end - 1]
+            if isinstance(last.get("content"), str):
+                marked = dict(last, content=[{
+                    "type": "text",
+                    "text": last["content"],
+                    "cache_control": {"type": "ephemeral"}
+                }])
+                data["messages"] = messages[:prefix_end - 1] + [marked] + messages[prefix_end:]
+    
+    def _prefix_key(self, data: Dict[str, Any], prefix: List[Dict[str, Any]]) -> str:
+        """静态前缀的稳定哈希（前缀不变时复用上次结果）"""
+        tools = data.get("tools")
+        tools_json = tools.json if isinstance(tools, RenderedTools) else json.dumps(tools, ensure_ascii=False)
+        prefix_json = json.dumps(prefix, ensure_ascii=False)
+        ident = (data["model"], prefix_json, tools_json)
+        cached = self._prefix_key_cache
+        if cached is not None and cached[0] == ident:
+            return cached[1]
+        digest = hashlib.sha256("\x00".join(ident).encode("utf-8")).hexdigest()[:32]
+        self._prefix_key_cache = (ident, digest)
+        return digest
+    
+    def _record_usage(self, usage: Optional[Dict[str, Any]]):
+        """累计 prompt token 与缓存命中 token"""
+        if not usage:
+            return
+        cached = extract_cached_tokens(usage)
+        self._usage["requests"] += 1
+        self._usage["prompt_tokens"] += int(usage.get("prompt_tokens") or usage.get("input_tokens") or 0)
+        self._usage["cached_tokens"] += cached
+        if cached:
+            self._usage["cache_hits"] += 1
+        logger.debug(f"[LLM] Usage: prompt={usage.get('prompt_tokens')} cached={cached}")
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """前缀缓存命中统计（启用响应缓存时附带 response_cache）"""
+        usage = self._usage
+        stats = {
+            **usage,
+            "cached_ratio": round(usage["cached_tokens"] / usage["prompt_tokens"], 4) if usage["prompt_tokens"] else 0.0,
+            "hit_rate": round(usage["cache_hits"] / usage["requests"], 4) if usage["requests"] else 0.0,
+        }
+        if self.response_cache is not None:
+            stats["response_cache"] = self.response_cache.get_stats()
+        return stats
+    
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """HTTP 连接池统计"""
+        return self._http_pool.get_stats()
+    
     def get_current_model(self) -> str:
         """获取当前使用的模型"""
         return self.current_config.get('model', 'unknown')
@@ -424,5 +851,9 @@ class LLMClient:
             self.current_config = self.primary_config
     
     async def close(self):
-        """关闭客户端"""
-        await self.client.aclose()
+        """关闭客户端（释放共享连接池引用）"""
+        if self.client is not None:
+            self.client = None
+            await self._http_pool.release()
+        if self.response_cache is not None:
+            self.response_cache.close()
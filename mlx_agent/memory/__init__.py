@@ -7,6 +7,9 @@
 - Hybrid: 混合模式（ChromaDB + SQLite），支持内存不足时自动降级
 - Tiered: 三层架构（热/温/冷），优化存储和检索效率
 
+可选的搜索结果缓存 (search_cache) 与异步批量写入 (write_behind) 可包装以上任意后端。
+归档 (archive) 为压缩分段 JSONL，可按月份流式导入任意后端 (import_archive)。
+
 使用方式:
     from mlx_agent.memory import create_memory_backend, MemoryEntry, MemoryLevel
     
@@ -33,6 +36,13 @@ from .chroma import ChromaMemoryBackend
 from .sqlite import SQLiteMemoryBackend
 from .hybrid import HybridMemoryBackend, HybridConfig, create_hybrid_backend
 from .tiered import TieredMemoryBackend
+from .vector_index import VectorIndex, VectorMatrixIndex, create_vector_index
+from .ann_index import IVFFlatIndex
+from .quantization import QuantizedMatrixIndex
+from .search_cache import CachedMemoryBackend, SearchResultCache
+from .write_behind import WriteBehindMemoryBackend
+from .embedding_registry import EmbeddingModelRegistry, embedding_registry
+from .archive import ArchiveWriter, export_archive, import_archive, iter_archive
 
 # 向后兼容：Memory 别名
 Memory = MemoryEntry
@@ -52,6 +62,8 @@ async def create_memory_backend(config: dict) -> MemoryBackend:
             - sqlite: SQLite 配置
             - hybrid: Hybrid 配置 (包含 chroma 和 sqlite 子配置)
             - tiered: 三层架构配置 (热/温/冷)
+            - search_cache: 搜索结果缓存配置 (enabled, max_entries, ttl_seconds)
+            - write_behind: 异步批量写入配置 (enabled, journal_path, max_pending, batch_size, ...)
     
     Returns:
         配置好的记忆后端实例
@@ -94,6 +106,16 @@ async def create_memory_backend(config: dict) -> MemoryBackend:
     else:
         raise ValueError(f"Unknown memory provider: {provider}. Use 'chroma', 'sqlite', 'hybrid', or 'tiered'")
     
+    # 异步批量写入（在搜索缓存内层，缓存的失效仍由 add 触发）
+    write_behind_config = dict(config.get("write_behind") or {})
+    if write_behind_config.pop("enabled", False):
+        backend = WriteBehindMemoryBackend(backend, **write_behind_config)
+    
+    # 搜索结果缓存
+    cache_config = dict(config.get("search_cache") or {})
+    if cache_config.pop("enabled", False):
+        backend = CachedMemoryBackend(backend, **cache_config)
+    
     # 自动初始化
     await backend.initialize()
     
@@ -111,6 +133,25 @@ __all__ = [
     "HybridMemoryBackend",
     "HybridConfig",
     "TieredMemoryBackend",
+    # 向量索引
+    "VectorIndex",
+    "VectorMatrixIndex",
+    "IVFFlatIndex",
+    "QuantizedMatrixIndex",
+    "create_vector_index",
+    # 搜索缓存
+    "CachedMemoryBackend",
+    "SearchResultCache",
+    # 异步批量写入
+    "WriteBehindMemoryBackend",
+    # 共享嵌入模型
+    "EmbeddingModelRegistry",
+    "embedding_registry",
+    # 归档
+    "ArchiveWriter",
+    "export_archive",
+    "import_archive",
+    "iter_archive",
     # 工厂函数
     "create_memory_backend",
     "create_hybrid_backend",
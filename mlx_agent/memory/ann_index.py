@@ -0,0 +1,465 @@
+"""
+近似最近邻索引 - IVF-Flat
+
+纯 NumPy 实现的倒排文件索引，适合百万级记忆：
+- 球面 k-means 粗量化器，把向量划分到 nlist 个桶
+- 查询时只扫描与查询最接近的 nprobe 个桶
+- 增量插入：训练后新向量直接分配到最近的桶
+- 墓碑删除：删除只打标记，墓碑过多时自动压缩
+- 持久化为 .npz 文件（与 memory.db 同目录），启动时无需重新聚类
+
+数据量低于 train_threshold 时不训练，退化为精确扫描。
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from .vector_index import VectorIndex
+
+
+def _nearest_centroids(data: np.ndarray, centroids: np.ndarray, chunk_size: int = 8192) -> np.ndarray:
+    """分块计算每行最近的质心（内积最大）"""
+    assign = np.empty(data.shape[0], dtype=np.int32)
+    for start in range(0, data.shape[0], chunk_size):
+        block = data[start:start + chunk_size]
+        assign[start:start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+def spherical_kmeans(
+    data: np.ndarray,
+    k: int,
+    iters: int = 10,
+    rng: Optional[np.random.Generator] = None
+) -> np.ndarray:
+    """球面 k-means（输入需已归一化）
+
+    Args:
+        data: (n, dim) 归一化向量
+        k: 质心数量
+        iters: 迭代次数
+        rng: 随机数生成器
+
+    Returns:
+        (k, dim) 归一化质心
+    """
+    rng = rng or np.random.default_rng()
+    n = data.shape[0]
+    k = max(1, min(k, n))
+    centroids = data[rng.choice(n, k, replace=False)].copy()
+
+    for _ in range(iters):
+        assign = _nearest_centroids(data, centroids)
+
+        # 按簇排序后 reduceat 求和，避免 np.add.at 的逐元素开销
+        order = np.argsort(assign, kind="stable")
+        sorted_assign = assign[order]
+        counts = np.bincount(sorted_assign, minlength=k)
+        nonempty = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts[nonempty])[:-1]))
+        sums = np.add.reduceat(data[order], starts, axis=0)
+
+        new_centroids = centroids.copy()
+        new_centroids[nonempty] = sums
+
+        # 空簇重新随机选点
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            new_centroids[empty] = data[rng.choice(n, empty.size, replace=False)]
+
+        norms = np.linalg.norm(new_centroids, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = new_centroids / norms
+
+    return centroids.astype(np.float32)
+
+
+class IVFFlatIndex(VectorIndex):
+    """IVF-Flat 近似向量索引
+
+    行存储在连续矩阵中，每个桶保存所属行号。删除只打墓碑，
+    墓碑比例超过 compact_ratio 时压缩。训练在数据快照上进行，
+    不阻塞并发的查询和写入。
+    """
+
+    persistent = True
+
+    def __init__(
+        self,
+        dim: Optional[int] = None,
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        train_threshold: int = 4096,
+        retrain_ratio: float = 4.0,
+        kmeans_iters: int = 10,
+        max_train_samples: int = 65536,
+        compact_ratio: float = 0.2,
+        initial_capacity: int = 1024,
+        seed: int = 42
+    ):
+        """
+        Args:
+            dim: 向量维度，None 表示由第一条向量决定
+            nlist: 桶数量，None 表示按 4*sqrt(n) 自动选择
+            nprobe: 查询时扫描的桶数量
+            train_threshold: 达到该数量后才训练（之前为精确扫描）
+            retrain_ratio: 数据量增长到训练时的多少倍后重新训练
+            kmeans_iters: k-means 迭代次数
+            max_train_samples: 训练采样上限
+            compact_ratio: 墓碑比例超过该值时压缩
+            initial_capacity: 初始行容量
+            seed: 随机种子
+        """
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self.retrain_ratio = retrain_ratio
+        self.kmeans_iters = kmeans_iters
+        self.max_train_samples = max_train_samples
+        self.compact_ratio = compact_ratio
+        self._initial_capacity = max(1, initial_capacity)
+        self._rng = np.random.default_rng(seed)
+
+        self._lock = threading.RLock()
+        self._training = False
+        self._reset()
+
+    def _reset(self):
+        self._vectors: Optional[np.ndarray] = None
+        self._levels: Optional[np.ndarray] = None
+        self._deleted: Optional[np.ndarray] = None
+        self._assign: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._size = 0
+        self._tombstones = 0
+
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[np.ndarray] = []
+        self._list_sizes: Optional[np.ndarray] = None
+        self._trained_size = 0
+
+        if self.dim is not None:
+            self._allocate(self._initial_capacity)
+
+    def __len__(self) -> int:
+        return self._size - self._tombstones
+
+    def __contains__(self, memory_id: str) -> bool:
+        return memory_id in self._id_to_row
+
+    @property
+    def is_trained(self) -> bool:
+        return self._centroids is not None
+
+    @property
+    def needs_training(self) -> bool:
+        live = len(self)
+        if self._training or live < self.train_threshold:
+            return False
+        return not self.is_trained or live >= self._trained_size * self.retrain_ratio
+
+    # ===== 存储 =====
+
+    def _allocate(self, capacity: int):
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        levels = np.full(capacity, self.UNKNOWN_LEVEL, dtype=np.uint8)
+        deleted = np.zeros(capacity, dtype=bool)
+        assign = np.full(capacity, -1, dtype=np.int32)
+        if self._vectors is not None and self._size:
+            vectors[:self._size] = self._vectors[:self._size]
+            levels[:self._size] = self._levels[:self._size]
+            deleted[:self._size] = self._deleted[:self._size]
+            assign[:self._size] = self._assign[:self._size]
+        self._vectors = vectors
+        self._levels = levels
+        self._deleted = deleted
+        self._assign = assign
+
+    def _ensure_capacity(self, extra: int):
+        capacity = 0 if self._vectors is None else self._vectors.shape[0]
+        needed = self._size + extra
+        if needed <= capacity:
+            return
+        new_capacity = max(capacity, self._initial_capacity)
+        while new_capacity < needed:
+            new_capacity *= 2
+        self._allocate(new_capacity)
+
+    def _append_to_list(self, list_id: int, row: int):
+        size = self._list_sizes[list_id]
+        bucket = self._lists[list_id]
+        if size == bucket.shape[0]:
+            grown = np.empty(max(16, size * 2), dtype=np.int64)
+            grown[:size] = bucket[:size]
+            self._lists[list_id] = bucket = grown
+        bucket[size] = row
+        self._list_sizes[list_id] = size + 1
+
+    def _rebuild_lists(self):
+        """根据 _assign 重建倒排表（忽略墓碑）"""
+        nlist = self._centroids.shape[0]
+        rows = np.flatnonzero(~self._deleted[:self._size] & (self._assign[:self._size] >= 0))
+        assign = self._assign[rows]
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=nlist)
+        bounds = np.concatenate(([0], np.cumsum(counts)))
+        sorted_rows = rows[order].astype(np.int64)
+        self._lists = [sorted_rows[bounds[i]:bounds[i + 1]].copy() for i in range(nlist)]
+        self._list_sizes = counts.astype(np.int64)
+
+    def _compact(self):
+        """移除墓碑行并重排行号"""
+        keep = np.flatnonzero(~self._deleted[:self._size])
+        self._vectors[:keep.size] = self._vectors[keep]
+        self._levels[:keep.size] = self._levels[keep]
+        self._assign[:keep.size] = self._assign[keep]
+        self._deleted[:] = False
+        self._levels[keep.size:] = self.UNKNOWN_LEVEL
+        self._assign[keep.size:] = -1
+
+        self._ids = [self._ids[i] for i in keep]
+        self._id_to_row = {memory_id: row for row, memory_id in enumerate(self._ids)}
+        self._size = keep.size
+        self._tombstones = 0
+
+        if self.is_trained:
+            self._rebuild_lists()
+        logger.debug(f"IVFFlatIndex compacted to {self._size} rows")
+
+    def _maybe_compact(self):
+        if self._training or self._tombstones < 1024:
+            return
+        if self._tombstones > self._size * self.compact_ratio:
+            self._compact()
+
+    # ===== 写入 =====
+
+    def add_many(self, memory_ids: List[str], vectors, levels: Optional[Iterable] = None) -> int:
+        """批量添加向量（已存在的 ID 会先打墓碑再追加）"""
+        if not memory_ids:
+            return 0
+        levels = list(levels) if levels is not None else [None] * len(memory_ids)
+
+        with self._lock:
+            normalized = self._normalize_rows(vectors)
+            if self.dim is None:
+                self.dim = normalized.shape[1]
+                self._allocate(self._initial_capacity)
+            if normalized.shape[1] != self.dim:
+                logger.warning(
+                    f"IVFFlatIndex: dimension mismatch, expected {self.dim}, skipping {len(memory_ids)} vectors"
+                )
+                return 0
+
+            assign = _nearest_centroids(normalized, self._centroids) if self.is_trained else None
+
+            self._ensure_capacity(len(memory_ids))
+            for i, (memory_id, level) in enumerate(zip(memory_ids, levels)):
+                old_row = self._id_to_row.get(memory_id)
+                if old_row is not None:
+                    self._deleted[old_row] = True
+                    self._tombstones += 1
+
+                row = self._size
+                self._size += 1
+                self._vectors[row] = normalized[i]
+                self._levels[row] = self._level_code(level)
+                self._ids.append(memory_id)
+                self._id_to_row[memory_id] = row
+                if assign is not None:
+                    self._assign[row] = assign[i]
+                    self._append_to_list(int(assign[i]), row)
+
+            self._maybe_compact()
+            return len(memory_ids)
+
+    def remove(self, memory_id: str) -> bool:
+        """墓碑删除"""
+        with self._lock:
+            row = self._id_to_row.pop(memory_id, None)
+            if row is None:
+                return False
+            self._deleted[row] = True
+            self._tombstones += 1
+            self._maybe_compact()
+            return True
+
+    def set_level(self, memory_id: str, level) -> bool:
+        with self._lock:
+            row = self._id_to_row.get(memory_id)
+            if row is None:
+                return False
+            self._levels[row] = self._level_code(level)
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    # ===== 训练 =====
+
+    def train(self):
+        """训练粗量化器并重新分配所有行
+
+        k-means 在快照上运行，不持有锁；训练期间新增的行在安装质心时补分配。
+        """
+        with self._lock:
+            if self._training or self.dim is None:
+                return
+            live_rows = np.flatnonzero(~self._deleted[:self._size])
+            if live_rows.size == 0:
+                return
+            self._training = True
+            snapshot_size = self._size
+            vectors = self._vectors
+            sample_size = min(live_rows.size, self.max_train_samples)
+            sample = self._rng.choice(live_rows, sample_size, replace=False)
+            train_data = vectors[sample].copy()
+
+        try:
+            nlist = self.nlist or int(4 * np.sqrt(live_rows.size))
+            nlist = max(1, min(nlist, sample_size // 8 or 1))
+            centroids = spherical_kmeans(train_data, nlist, self.kmeans_iters, self._rng)
+            # 行写入后不再修改（压缩在训练期间被禁止），可在锁外分配
+            assign = _nearest_centroids(vectors[:snapshot_size], centroids)
+
+            with self._lock:
+                if self._size < snapshot_size:
+                    # 训练期间索引被清空
+                    return
+                if self._size > snapshot_size:
+                    extra = _nearest_centroids(self._vectors[snapshot_size:self._size], centroids)
+                    assign = np.concatenate((assign, extra))
+                self._assign[:self._size] = assign
+                self._centroids = centroids
+                self._trained_size = len(self)
+                self._rebuild_lists()
+                logger.info(f"IVFFlatIndex trained: nlist={centroids.shape[0]}, vectors={self._trained_size}")
+        finally:
+            with self._lock:
+                self._training = False
+                self._maybe_compact()
+
+    # ===== 查询 =====
+
+    def search(self, query, k: int, level=None) -> List[Tuple[str, float]]:
+        """近似 Top-K 检索（未训练时为精确扫描）"""
+        with self._lock:
+            if len(self) == 0 or k <= 0:
+                return []
+            q = self._normalize_rows(query)
+            if q.shape[1] != self.dim:
+                logger.warning(f"IVFFlatIndex: query dimension mismatch, expected {self.dim}")
+                return []
+            q = q[0]
+
+            if self.is_trained:
+                nprobe = min(self.nprobe, self._centroids.shape[0])
+                centroid_scores = self._centroids @ q
+                if nprobe < centroid_scores.shape[0]:
+                    probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+                else:
+                    probe = np.arange(centroid_scores.shape[0])
+                rows = np.concatenate([self._lists[p][:self._list_sizes[p]] for p in probe])
+            else:
+                rows = np.arange(self._size)
+
+            mask = ~self._deleted[rows]
+            if level is not None:
+                mask &= self._levels[rows] == self._level_code(level)
+            rows = rows[mask]
+            if rows.size == 0:
+                return []
+
+            scores = self._vectors[rows] @ q
+            k = min(k, scores.shape[0])
+            if k < scores.shape[0]:
+                top = np.argpartition(-scores, k - 1)[:k]
+            else:
+                top = np.arange(scores.shape[0])
+            top = top[np.argsort(-scores[top], kind="stable")]
+
+            return [(self._ids[rows[i]], float(scores[i])) for i in top]
+
+    # ===== 持久化 =====
+
+    def save(self, path, meta: Optional[Dict[str, Any]] = None):
+        """保存到 .npz（只保存有效行，原子替换）"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+
+        with self._lock:
+            keep = np.flatnonzero(~self._deleted[:self._size]) if self._size else np.array([], dtype=np.int64)
+            dim = self.dim or 0
+            arrays = {
+                "vectors": self._vectors[keep] if self._size else np.zeros((0, dim), dtype=np.float32),
+                "levels": self._levels[keep] if self._size else np.zeros(0, dtype=np.uint8),
+                "assign": self._assign[keep] if self._size else np.zeros(0, dtype=np.int32),
+                "ids": np.array([self._ids[i] for i in keep], dtype=np.str_),
+                "centroids": self._centroids if self.is_trained else np.zeros((0, dim), dtype=np.float32),
+                "meta": np.array(json.dumps({
+                    "dim": dim,
+                    "trained_size": self._trained_size,
+                    **(meta or {})
+                })),
+            }
+
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+        logger.debug(f"IVFFlatIndex saved to {path} ({len(arrays['ids'])} vectors)")
+
+    @classmethod
+    def load(cls, path, **kwargs) -> Tuple["IVFFlatIndex", Dict[str, Any]]:
+        """从 .npz 加载
+
+        Returns:
+            (索引实例, 保存时附带的 meta)
+        """
+        with np.load(Path(path), allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            index = cls(**{**kwargs, "dim": meta.get("dim") or None})
+            ids = [str(i) for i in data["ids"]]
+            if ids:
+                index._ensure_capacity(len(ids))
+                index._vectors[:len(ids)] = data["vectors"]
+                index._levels[:len(ids)] = data["levels"]
+                index._assign[:len(ids)] = data["assign"]
+                index._ids = ids
+                index._id_to_row = {memory_id: row for row, memory_id in enumerate(ids)}
+                index._size = len(ids)
+            if data["centroids"].shape[0]:
+                index._centroids = data["centroids"].astype(np.float32)
+                index._trained_size = meta.get("trained_size", index._size)
+                index._rebuild_lists()
+        return index, meta
+
+    def get_stats(self) -> Dict[str, Any]:
+        capacity = 0 if self._vectors is None else self._vectors.shape[0]
+        memory_bytes = 0
+        if self._vectors is not None:
+            memory_bytes = int(
+                self._vectors.nbytes + self._levels.nbytes + self._deleted.nbytes + self._assign.nbytes
+                + sum(bucket.nbytes for bucket in self._lists)
+            )
+        return {
+            "type": "ivf",
+            "size": len(self),
+            "dim": self.dim or 0,
+            "capacity": capacity,
+            "tombstones": self._tombstones,
+            "trained": self.is_trained,
+            "trained_size": self._trained_size,
+            "nlist": 0 if self._centroids is None else int(self._centroids.shape[0]),
+            "nprobe": self.nprobe,
+            "memory_bytes": memory_bytes,
+        }
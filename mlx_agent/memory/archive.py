@@ -0,0 +1,494 @@
+"""
+记忆归档
+
+归档目录结构:
+    archive/
+        index.json                  # 段索引：月份、文件名、压缩方式、记录数、字节数
+        2026-10-00001.jsonl.zst     # 压缩 JSONL 段，每次 flush 追加一个独立压缩帧
+        2026-09.jsonl               # 旧版逐条追加的未压缩归档（只读兼容）
+
+- ArchiveWriter 缓冲记录，凑满 flush_records 或显式 flush() 时整块压缩写入，
+  段文件写满 segment_max_records 后换新段；写入后 fsync 并原子更新索引
+- 多个后端可共用一个归档目录：flush 持有目录锁（进程内锁 + .lock 文件锁），
+  每次都从磁盘重新读取索引，不依赖写入器缓存的索引
+- iter_archive() 按月份流式读取，import_archive() 分批 add_many() 到任意 MemoryBackend，
+  内存占用只与 batch_size 有关；进度写入检查点文件，中断后从断点继续
+
+zstandard 可用时默认使用 zstd，否则使用标准库 gzip。
+"""
+
+import asyncio
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+from loguru import logger
+
+from .base import MemoryBackend, MemoryEntry, MemoryLevel
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    zstandard = None
+    HAS_ZSTD = False
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+INDEX_FILE = "index.json"
+INDEX_VERSION = 1
+CHECKPOINT_FILE = ".import_checkpoint.json"
+LOCK_FILE = ".lock"
+
+_SUFFIXES = {"zstd": ".jsonl.zst", "gzip": ".jsonl.gz", "none": ".jsonl"}
+
+Months = Union[str, Iterable[str], None]
+
+
+def resolve_compression(compression: str) -> str:
+    """解析压缩方式，"auto" 优先 zstd，zstandard 不可用时回退到 gzip"""
+    if compression == "auto":
+        return "zstd" if HAS_ZSTD else "gzip"
+    if compression not in _SUFFIXES:
+        raise ValueError(f"Unknown archive compression: {compression}")
+    if compression == "zstd" and not HAS_ZSTD:
+        logger.warning("zstandard not installed, archiving with gzip instead")
+        return "gzip"
+    return compression
+
+
+def _compress(data: bytes, compression: str, level: Optional[int]) -> bytes:
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=level if level is not None else 3).compress(data)
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=level if level is not None else 6)
+    return data
+
+
+def _open_text(path: Path, compression: str) -> io.TextIOBase:
+    """以文本流打开段文件（多个压缩帧连续解压）"""
+    if compression == "zstd":
+        if not HAS_ZSTD:
+            raise RuntimeError(f"zstandard is required to read {path.name}")
+        raw = open(path, "rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(reader, encoding="utf-8")
+    if compression == "gzip":
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def _normalize_months(months: Months) -> Optional[set]:
+    if months is None:
+        return None
+    if isinstance(months, str):
+        return {months}
+    return set(months)
+
+
+@dataclass
+class ArchiveSegment:
+    """一个归档段文件"""
+    file: str
+    month: str
+    compression: str
+    records: int = 0
+    bytes: int = 0
+    legacy: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "file": self.file,
+            "month": self.month,
+            "compression": self.compression,
+            "records": self.records,
+            "bytes": self.bytes,
+        }
+
+
+def load_index(archive_path: Union[str, Path]) -> List[ArchiveSegment]:
+    """读取段索引（不存在或损坏时返回空列表）"""
+    path = Path(archive_path) / INDEX_FILE
+    if not path.exists():
+        return []
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Ignoring unreadable archive index {path}: {e}")
+        return []
+    if data.get("version") != INDEX_VERSION:
+        logger.warning(f"Unsupported archive index version in {path}")
+        return []
+    return [ArchiveSegment(**seg) for seg in data.get("segments", [])]
+
+
+def _save_index(archive_path: Path, segments: List[ArchiveSegment]):
+    """原子写入段索引"""
+    path = archive_path / INDEX_FILE
+    data = {"version": INDEX_VERSION, "segments": [seg.to_dict() for seg in segments]}
+    fd, tmp_name = tempfile.mkstemp(dir=archive_path, prefix=f".{INDEX_FILE}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_name, path)
+    except Exception:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+
+_dir_locks: Dict[str, threading.Lock] = {}
+_dir_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _archive_lock(archive_path: Path):
+    """归档目录的写锁：进程内按目录加线程锁，跨进程用 .lock 文件的 flock"""
+    key = str(archive_path.resolve())
+    with _dir_locks_guard:
+        lock = _dir_locks.setdefault(key, threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        with open(archive_path / LOCK_FILE, "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def list_segments(archive_path: Union[str, Path], months: Months = None) -> List[ArchiveSegment]:
+    """列出归档段（含旧版 YYYY-MM.jsonl 文件），按月份与写入顺序排列"""
+    archive_path = Path(archive_path)
+    wanted = _normalize_months(months)
+    segments = load_index(archive_path)
+    indexed = {seg.file for seg in segments}
+
+    if archive_path.exists():
+        for legacy in sorted(archive_path.glob("????-??.jsonl")):
+            if legacy.name not in indexed:
+                segments.append(ArchiveSegment(
+                    file=legacy.name, month=legacy.stem, compression="none",
+                    records=-1, bytes=legacy.stat().st_size, legacy=True
+                ))
+
+    if wanted is not None:
+        segments = [seg for seg in segments if seg.month in wanted]
+    # 稳定排序：同一月份内保持索引中的写入顺序
+    return sorted(segments, key=lambda seg: seg.month)
+
+
+def iter_segment(archive_path: Union[str, Path], segment: ArchiveSegment) -> Iterator[Dict[str, Any]]:
+    """流式读取一个段的记录（已索引的段只读取索引中确认的记录数）"""
+    path = Path(archive_path) / segment.file
+    with _open_text(path, segment.compression) as f:
+        for i, line in enumerate(f):
+            if not segment.legacy and i >= segment.records:
+                break
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping corrupt archive line {i + 1} in {segment.file}")
+
+
+def iter_archive(archive_path: Union[str, Path], months: Months = None) -> Iterator[Dict[str, Any]]:
+    """按月份流式读取归档记录
+
+    Args:
+        archive_path: 归档目录
+        months: 只读取指定月份 ("YYYY-MM" 或其集合)，None 表示全部
+    """
+    for segment in list_segments(archive_path, months):
+        yield from iter_segment(archive_path, segment)
+
+
+def count_archived(archive_path: Union[str, Path]) -> int:
+    """归档记录总数（已索引的段直接读索引，旧版文件逐行计数）"""
+    total = 0
+    for segment in list_segments(archive_path):
+        if segment.legacy:
+            with open(Path(archive_path) / segment.file, "r", encoding="utf-8") as f:
+                total += sum(1 for _ in f)
+        else:
+            total += segment.records
+    return total
+
+
+class ArchiveWriter:
+    """缓冲、压缩的归档写入器
+
+    Example:
+        >>> writer = ArchiveWriter("./memory/archive")
+        >>> writer.append(memory)     # 缓冲，凑满 flush_records 自动写入
+        >>> writer.flush()            # 落盘后再从主存储删除已归档记忆
+    """
+
+    def __init__(
+        self,
+        archive_path: Union[str, Path],
+        compression: str = "auto",
+        level: Optional[int] = None,
+        flush_records: int = 256,
+        segment_max_records: int = 50000
+    ):
+        """
+        Args:
+            archive_path: 归档目录
+            compression: "auto" / "zstd" / "gzip" / "none"
+            level: 压缩级别，None 使用各算法默认值
+            flush_records: 缓冲多少条记录后自动写入
+            segment_max_records: 单个段文件的最大记录数
+        """
+        self.archive_path = Path(archive_path)
+        self.compression = resolve_compression(compression)
+        self.level = level
+        self.flush_records = max(1, flush_records)
+        self.segment_max_records = max(1, segment_max_records)
+
+        self._buffers: Dict[str, List[bytes]] = {}
+        self._buffered = 0
+        self._written = 0
+        self._flushes = 0
+
+    def append(self, record: Dict[str, Any], month: Optional[str] = None):
+        """缓冲一条记录
+
+        Args:
+            record: 记忆字典
+            month: 归入的月份 (YYYY-MM)，默认为当前月份
+        """
+        month = month or datetime.now().strftime("%Y-%m")
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        self._buffers.setdefault(month, []).append(line.encode("utf-8"))
+        self._buffered += 1
+        if self._buffered >= self.flush_records:
+            self.flush()
+
+    @property
+    def buffered(self) -> int:
+        return self._buffered
+
+    def _open_segment(self, segments: List[ArchiveSegment], month: str) -> ArchiveSegment:
+        """该月份可继续写入的段，写满时新建（调用方持有目录锁，segments 为刚读取的索引）"""
+        month_segments = [seg for seg in segments if seg.month == month]
+        if month_segments:
+            current = month_segments[-1]
+            if current.compression == self.compression and current.records < self.segment_max_records:
+                path = self.archive_path / current.file
+                # 持锁时索引之外的尾部只可能来自崩溃的写入，丢弃，以索引为准
+                if path.exists() and path.stat().st_size > current.bytes:
+                    with open(path, "r+b") as f:
+                        f.truncate(current.bytes)
+                return current
+        seq = len(month_segments) + 1
+        indexed = {seg.file for seg in segments}
+        while True:
+            name = f"{month}-{seq:05d}{_SUFFIXES[self.compression]}"
+            # 已存在但不在索引中的文件（崩溃残留或索引损坏）不覆盖，跳到下一个序号
+            if name not in indexed and not (self.archive_path / name).exists():
+                break
+            seq += 1
+        segment = ArchiveSegment(file=name, month=month, compression=self.compression)
+        segments.append(segment)
+        return segment
+
+    def flush(self):
+        """把缓冲的记录压缩写入段文件并更新索引"""
+        if not self._buffered:
+            return
+        self.archive_path.mkdir(parents=True, exist_ok=True)
+        with _archive_lock(self.archive_path):
+            # 其他写入器可能已更新索引，持锁后重新读取
+            segments = load_index(self.archive_path)
+            for month, lines in self._buffers.items():
+                start = 0
+                while start < len(lines):
+                    segment = self._open_segment(segments, month)
+                    take = min(len(lines) - start, self.segment_max_records - segment.records)
+                    data = _compress(b"".join(lines[start:start + take]), self.compression, self.level)
+                    path = self.archive_path / segment.file
+                    with open(path, "ab") as f:
+                        f.write(data)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    segment.records += take
+                    segment.bytes += len(data)
+                    start += take
+            _save_index(self.archive_path, segments)
+
+        self._written += self._buffered
+        self._flushes += 1
+        self._buffers = {}
+        self._buffered = 0
+
+    def close(self):
+        self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        segments = load_index(self.archive_path)
+        return {
+            "compression": self.compression,
+            "segments": len(segments),
+            "records": sum(seg.records for seg in segments),
+            "bytes": sum(seg.bytes for seg in segments),
+            "buffered": self._buffered,
+            "written": self._written,
+            "flushes": self._flushes,
+        }
+
+
+def _record_to_entry(record: Dict[str, Any]) -> MemoryEntry:
+    """归档记录转为 MemoryEntry（兼容 SQLite 与 ChromaDB 两种格式）"""
+    metadata = record.get("metadata") or {}
+    created_at_str = record.get("created_at") or metadata.get("created_at")
+    try:
+        created_at = datetime.fromisoformat(created_at_str) if created_at_str else None
+    except (TypeError, ValueError):
+        created_at = None
+    return MemoryEntry(
+        content=record["content"],
+        metadata=metadata,
+        level=MemoryLevel(record.get("level", "P1")),
+        memory_id=record.get("id"),
+        created_at=created_at
+    )
+
+
+def _take(iterator: Iterator[Dict[str, Any]], n: int) -> List[Dict[str, Any]]:
+    batch = []
+    for record in iterator:
+        batch.append(record)
+        if len(batch) >= n:
+            break
+    return batch
+
+
+def _load_checkpoint(path: Path) -> Dict[str, int]:
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8")).get("segments", {})
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Ignoring unreadable import checkpoint {path}: {e}")
+        return {}
+
+
+def _save_checkpoint(path: Path, progress: Dict[str, int]):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps({"segments": progress}), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+async def import_archive(
+    backend: MemoryBackend,
+    archive_path: Union[str, Path],
+    months: Months = None,
+    batch_size: int = 500,
+    checkpoint_path: Optional[Union[str, Path]] = None,
+    resume: bool = True,
+    dedup_threshold: float = 1.1
+) -> Dict[str, Any]:
+    """把归档流式导入到记忆后端
+
+    每批 add_many() 成功后记录检查点（段文件 → 已导入记录数），中断后重新调用会跳过
+    已导入的部分；全部完成后删除检查点。批内重复写入由后端按记忆 ID 去重。
+
+    Args:
+        backend: 目标后端
+        archive_path: 归档目录
+        months: 只导入指定月份，None 表示全部
+        batch_size: 每批写入条数（决定内存占用上限）
+        checkpoint_path: 检查点文件，默认为归档目录下的 .import_checkpoint.json
+        resume: 是否从已有检查点继续
+        dedup_threshold: 传给 add_many 的去重阈值，默认 1.1 即不按相似度去重，原样恢复近似重复的记忆
+
+    Returns:
+        导入统计
+    """
+    archive_path = Path(archive_path)
+    checkpoint = Path(checkpoint_path) if checkpoint_path else archive_path / CHECKPOINT_FILE
+    progress = _load_checkpoint(checkpoint) if resume else {}
+    resumed_from = sum(progress.values())
+    loop = asyncio.get_event_loop()
+    stats = {"imported": 0, "skipped": 0, "segments": 0, "resumed_from": resumed_from}
+
+    for segment in list_segments(archive_path, months):
+        done = progress.get(segment.file, 0)
+        if not segment.legacy and segment.records <= done:
+            continue
+        records = iter_segment(archive_path, segment)
+        # 跳过已导入的记录（只解压，不写入）
+        if done:
+            await loop.run_in_executor(None, _take, records, done)
+        position = done
+        while True:
+            batch = await loop.run_in_executor(None, _take, records, max(1, batch_size))
+            if not batch:
+                break
+            entries = []
+            for record in batch:
+                try:
+                    entries.append(_record_to_entry(record))
+                except (KeyError, ValueError) as e:
+                    stats["skipped"] += 1
+                    logger.debug(f"Skipping invalid archive record: {e}")
+            if entries:
+                await backend.add_many(entries, dedup_threshold=dedup_threshold)
+            position += len(batch)
+            stats["imported"] += len(entries)
+            progress[segment.file] = position
+            _save_checkpoint(checkpoint, progress)
+        stats["segments"] += 1
+
+    if checkpoint.exists():
+        checkpoint.unlink()
+    logger.info(
+        f"Archive import complete: {stats['imported']} imported, {stats['skipped']} skipped "
+        f"from {stats['segments']} segments"
+    )
+    return stats
+
+
+async def export_archive(
+    backend: MemoryBackend,
+    archive_path: Union[str, Path],
+    levels: Optional[List[MemoryLevel]] = None,
+    compression: str = "auto",
+    flush_records: int = 1024
+) -> Dict[str, Any]:
+    """把后端中的记忆导出为压缩归档（按 created_at 所在月份分段，不删除原记忆）
+
+    Args:
+        backend: 来源后端
+        archive_path: 归档目录
+        levels: 导出的级别，None 表示全部
+        compression: 压缩方式
+        flush_records: 每多少条写入一个压缩帧
+
+    Returns:
+        写入器统计
+    """
+    writer = ArchiveWriter(archive_path, compression=compression, flush_records=flush_records)
+    for level in levels or list(MemoryLevel):
+        for memory in await backend.get_by_level(level):
+            created_at = memory.get("created_at") or (memory.get("metadata") or {}).get("created_at")
+            month = str(created_at)[:7] if created_at else None
+            writer.append(memory, month=month)
+    writer.close()
+    return writer.get_stats()
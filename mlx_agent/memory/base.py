@@ -95,6 +95,20 @@ class MemoryBackend(ABC):
         """
         ...
 
+    async def add_many(self, entries: List[MemoryEntry], dedup_threshold: float = 0.95) -> List[str]:
+        """批量添加记忆条目
+
+        默认逐条调用 add()（按后端自身规则去重），后端可覆盖为单事务批量写入。
+
+        Args:
+            entries: 记忆条目列表
+            dedup_threshold: 近重复相似度阈值，> 1 表示跳过近重复检测（迁移、回放等已去重的数据）
+
+        Returns:
+            记忆 ID 列表（与 entries 一一对应，重复条目同样返回其 ID）
+        """
+        return [await self.add(entry) for entry in entries]
+
     @abstractmethod
     async def search(
         self,
@@ -128,6 +142,23 @@ class MemoryBackend(ABC):
         """
         ...
 
+    async def delete_many(self, memory_ids: List[str]) -> int:
+        """批量删除记忆
+
+        默认逐条调用 delete()，后端可覆盖为单次批量删除。
+
+        Args:
+            memory_ids: 记忆 ID 列表
+
+        Returns:
+            实际删除条数
+        """
+        deleted = 0
+        for memory_id in memory_ids:
+            if await self.delete(memory_id):
+                deleted += 1
+        return deleted
+
     @abstractmethod
     async def get_by_level(self, level: MemoryLevel) -> List[Dict[str, Any]]:
         """获取特定级别的所有记忆
@@ -140,6 +171,44 @@ class MemoryBackend(ABC):
         """
         ...
 
+    async def get_by_age(
+        self,
+        min_days: int,
+        max_days: Optional[int] = None,
+        level: Optional[MemoryLevel] = None,
+        limit: Optional[int] = None,
+        include_embeddings: bool = False
+    ) -> List[Dict[str, Any]]:
+        """按年龄查询记忆（最旧的在前）
+
+        默认实现读取整个级别后在内存中过滤，后端可覆盖为按 created_at 索引查询。
+
+        Args:
+            min_days: 最小年龄（天，含）
+            max_days: 最大年龄（天，不含），None 表示不限
+            level: 筛选特定级别，None 表示所有级别
+            limit: 最多返回条数
+            include_embeddings: 是否附带已存储的嵌入 ("embedding" 字段)
+
+        Returns:
+            记忆列表，包含 id / content / metadata / level / created_at
+        """
+        now = datetime.now()
+        levels = [level] if level else list(MemoryLevel)
+        results = []
+        for lvl in levels:
+            for mem in await self.get_by_level(lvl):
+                created_at_str = mem.get('created_at') or mem.get('metadata', {}).get('created_at')
+                try:
+                    created_at = datetime.fromisoformat(created_at_str)
+                except (ValueError, TypeError):
+                    continue
+                age_days = (now - created_at).days
+                if age_days >= min_days and (max_days is None or age_days < max_days):
+                    results.append(dict(mem, created_at=created_at_str))
+        results.sort(key=lambda mem: mem['created_at'])
+        return results[:limit] if limit else results
+
     @abstractmethod
     async def get_stats(self) -> Dict[str, Any]:
         """获取统计信息
@@ -0,0 +1,132 @@
+"""
+持久化变更日志
+
+HybridMemoryBackend 在 ChromaDB 不可用（降级）或落后时，把每次写入/删除的记忆 ID
+按单调递增的序号追加到独立的 SQLite 文件中。后台追赶任务按序号批量把变更回放到
+ChromaDB，每批完成后推进已应用水位 (applied_seq)，进程重启后从水位继续。
+
+日志只记录操作与记忆 ID，内容在回放时从 SQLite 主表读取（已删除的记忆自然跳过）。
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from loguru import logger
+
+from .sqlite_pool import apply_pragmas
+
+OP_ADD = "add"
+OP_DELETE = "delete"
+
+
+class ChangeLog:
+    """按序号排列的变更日志
+
+    Example:
+        >>> log = ChangeLog("./memory/hybrid.changes.db")
+        >>> log.open()
+        >>> seq = log.append(OP_ADD, [entry.memory_id])
+        >>> for seq, op, memory_id in log.read_after(log.applied_seq, 256): ...
+        >>> log.mark_applied(seq)
+    """
+
+    def __init__(self, path, synchronous: str = "FULL"):
+        """
+        Args:
+            path: 日志数据库路径
+            synchronous: 同步级别，FULL 保证每次追加掉电不丢
+        """
+        self.path = Path(path)
+        self.synchronous = synchronous
+        self._conn: sqlite3.Connection = None
+        self._lock = threading.Lock()
+        self._last_seq = 0
+        self._applied_seq = 0
+
+    def open(self):
+        """打开（或创建）日志并读取序号与水位"""
+        if self._conn is not None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        apply_pragmas(conn, journal_mode="WAL", synchronous=self.synchronous)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                op TEXT NOT NULL,
+                memory_id TEXT NOT NULL
+            )
+        """)
+        conn.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value INTEGER)")
+        conn.commit()
+
+        row = conn.execute("SELECT value FROM sync_state WHERE key = 'applied_seq'").fetchone()
+        self._applied_seq = row[0] if row else 0
+        # AUTOINCREMENT 的序号在压缩后仍单调递增
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        self._last_seq = max(row[0] if row else 0, self._applied_seq)
+        self._conn = conn
+        if self.pending:
+            logger.info(f"Change log {self.path}: {self.pending} changes pending (applied_seq={self._applied_seq})")
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    @property
+    def applied_seq(self) -> int:
+        return self._applied_seq
+
+    @property
+    def pending(self) -> int:
+        return self._last_seq - self._applied_seq
+
+    def append(self, op: str, memory_ids: List[str]) -> int:
+        """追加一组同类变更（单事务），返回最后一条的序号"""
+        if not memory_ids:
+            return self._last_seq
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO changes (op, memory_id) VALUES (?, ?)",
+                [(op, memory_id) for memory_id in memory_ids]
+            )
+            self._conn.commit()
+            self._last_seq = self._conn.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = 'changes'"
+            ).fetchone()[0]
+            return self._last_seq
+
+    def read_after(self, seq: int, limit: int) -> List[Tuple[int, str, str]]:
+        """读取序号大于 seq 的至多 limit 条变更"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT seq, op, memory_id FROM changes WHERE seq > ? ORDER BY seq LIMIT ?",
+                (seq, limit)
+            ).fetchall()
+
+    def mark_applied(self, seq: int):
+        """推进已应用水位，并删除水位之前的记录"""
+        with self._lock:
+            if seq <= self._applied_seq:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_state (key, value) VALUES ('applied_seq', ?)", (seq,)
+            )
+            self._conn.execute("DELETE FROM changes WHERE seq <= ?", (seq,))
+            self._conn.commit()
+            self._applied_seq = seq
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "last_seq": self._last_seq,
+            "applied_seq": self._applied_seq,
+            "pending": self.pending,
+        }
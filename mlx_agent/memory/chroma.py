@@ -2,48 +2,99 @@
 ChromaDB 记忆后端实现
 
 基于 ChromaDB 的向量存储，支持语义搜索
+
+元数据中除 ISO 格式的 created_at 外还写入数值型 created_ts，
+使按年龄查询可以下推为 ChromaDB where 范围过滤。
 """
 
 import asyncio
-import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Dict, List, Optional, Any, Union
 
 from loguru import logger
 
+from .archive import ArchiveWriter, count_archived
 from .base import MemoryBackend, MemoryEntry, MemoryLevel
+from .embedding_registry import EmbeddingModelHandle, embedding_registry
 
 
 class OllamaEmbeddingFunction:
-    """Ollama 嵌入函数适配器 - 延迟导入"""
+    """Ollama 嵌入函数适配器 - 延迟导入
+    
+    优先使用批量接口 /api/embed，一次请求编码整批文本；
+    旧版本 Ollama 不支持时回退到逐条 /api/embeddings。
+    """
     
     def __init__(self, model_name: str = "bge-m3", url: str = "http://localhost:11434"):
         self.model_name = model_name
         self.url = url.rstrip('/')
+        self._batch_supported = True
     
     def __call__(self, input: Union[str, List[str]]) -> List[List[float]]:
         """生成嵌入向量"""
-        import httpx
-        
         texts = [input] if isinstance(input, str) else input
-        embeddings = []
+        if not texts:
+            return []
         
-        for text in texts:
-            try:
-                response = httpx.post(
-                    f"{self.url}/api/embeddings",
-                    json={"model": self.model_name, "prompt": text},
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                result = response.json()
-                embeddings.append(result.get("embedding", []))
-            except Exception as e:
-                logger.error(f"Ollama embedding failed: {e}")
-                embeddings.append([])
+        if self._batch_supported:
+            embeddings = self._embed_batch(texts)
+            if embeddings is not None:
+                return embeddings
+        
+        return [self._embed_one(text) for text in texts]
+    
+    def _embed_batch(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """调用批量接口，不支持或失败时返回 None"""
+        import httpx
+        
+        try:
+            response = httpx.post(
+                f"{self.url}/api/embed",
+                json={"model": self.model_name, "input": texts},
+                timeout=30.0 + len(texts)
+            )
+            if response.status_code == 404:
+                logger.info("Ollama /api/embed not available, falling back to /api/embeddings")
+                self._batch_supported = False
+                return None
+            response.raise_for_status()
+            embeddings = response.json().get("embeddings", [])
+            if len(embeddings) != len(texts):
+                raise ValueError(f"expected {len(texts)} embeddings, got {len(embeddings)}")
+            return embeddings
+        except Exception as e:
+            logger.error(f"Ollama batch embedding failed: {e}")
+            return None
+    
+    def _embed_one(self, text: str) -> List[float]:
+        import httpx
         
-        return embeddings
+        try:
+            response = httpx.post(
+                f"{self.url}/api/embeddings",
+                json={"model": self.model_name, "prompt": text},
+                timeout=30.0
+            )
+            response.raise_for_status()
+            return response.json().get("embedding", [])
+        except Exception as e:
+            logger.error(f"Ollama embedding failed: {e}")
+            return []
+
+
+class SharedEmbeddingFunction:
+    """本地嵌入函数适配器 - 使用进程内共享的模型（见 embedding_registry）"""
+    
+    def __init__(self, handle: EmbeddingModelHandle):
+        self.handle = handle
+    
+    def __call__(self, input: Union[str, List[str]]) -> List[List[float]]:
+        """生成嵌入向量"""
+        texts = [input] if isinstance(input, str) else input
+        if not texts:
+            return []
+        return self.handle.encode(list(texts), convert_to_numpy=True).tolist()
 
 
 class ChromaMemoryBackend(MemoryBackend):
@@ -65,7 +116,11 @@ class ChromaMemoryBackend(MemoryBackend):
         openai_api_key: Optional[str] = None,
         auto_archive: bool = True,
         p1_max_age_days: int = 7,
-        p2_max_age_days: int = 1
+        p2_max_age_days: int = 1,
+        collection_name: str = "memories",
+        embedding_batch_size: int = 32,
+        embedding_batch_wait_ms: float = 5.0,
+        archive_compression: str = "auto"
     ):
         """初始化 ChromaDB 后端
         
@@ -78,9 +133,14 @@ class ChromaMemoryBackend(MemoryBackend):
             auto_archive: 是否启用自动归档
             p1_max_age_days: P1 记忆最大保留天数
             p2_max_age_days: P2 记忆最大保留天数
+            collection_name: 集合名称
+            embedding_batch_size: 嵌入微批处理的最大批次
+            embedding_batch_wait_ms: 嵌入微批处理的合并窗口 (毫秒)
+            archive_compression: 归档压缩方式 ("auto" / "zstd" / "gzip" / "none")
         """
         self.path = Path(path).resolve()
         self.archive_path = self.path.parent / "archive"
+        self._archiver = ArchiveWriter(self.archive_path, compression=archive_compression)
         
         self.embedding_provider = embedding_provider
         self.embedding_model = embedding_model or self.EMBEDDING_MODELS.get(embedding_provider)
@@ -90,11 +150,15 @@ class ChromaMemoryBackend(MemoryBackend):
         self.auto_archive = auto_archive
         self.p1_max_age_days = p1_max_age_days
         self.p2_max_age_days = p2_max_age_days
+        self.collection_name = collection_name
+        self.embedding_batch_size = embedding_batch_size
+        self.embedding_batch_wait_ms = embedding_batch_wait_ms
         
         # 延迟初始化的属性
         self._client = None
         self._collection = None
         self._embedding_func = None
+        self._embedder = None
         self._initialized = False
         
         logger.info(f"ChromaMemoryBackend configured:")
@@ -128,13 +192,44 @@ class ChromaMemoryBackend(MemoryBackend):
         
         # 获取或创建集合
         self._collection = self._client.get_or_create_collection(
-            name="memories",
+            name=self.collection_name,
             embedding_function=self._embedding_func,
             metadata={"hnsw:space": "cosine"}
         )
         
+        self._backfill_created_ts()
+        
         logger.info(f"ChromaDB initialized with {self._collection.count()} memories")
     
+    def _backfill_created_ts(self, page_size: int = 1000):
+        """为旧数据补充数值型 created_ts 元数据（一次性迁移）"""
+        updated = 0
+        offset = 0
+        while True:
+            page = self._collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            ids = page.get('ids') or []
+            if not ids:
+                break
+            fix_ids, fix_metadatas = [], []
+            for memory_id, metadata in zip(ids, page.get('metadatas') or []):
+                metadata = dict(metadata or {})
+                if "created_ts" in metadata:
+                    continue
+                try:
+                    created_at = datetime.fromisoformat(metadata.get("created_at", ""))
+                except (ValueError, TypeError):
+                    created_at = datetime.now()
+                    metadata["created_at"] = created_at.isoformat()
+                metadata["created_ts"] = created_at.timestamp()
+                fix_ids.append(memory_id)
+                fix_metadatas.append(metadata)
+            if fix_ids:
+                self._collection.update(ids=fix_ids, metadatas=fix_metadatas)
+                updated += len(fix_ids)
+            offset += len(ids)
+        if updated:
+            logger.info(f"Backfilled created_ts for {updated} memories")
+    
     def _init_embedding_function(self):
         """初始化嵌入函数 - 延迟导入"""
         if self._embedding_func is not None:
@@ -142,11 +237,13 @@ class ChromaMemoryBackend(MemoryBackend):
         
         try:
             if self.embedding_provider == "local":
-                from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
-                self._embedding_func = SentenceTransformerEmbeddingFunction(
-                    model_name=self.embedding_model
+                if not embedding_registry.is_available():
+                    raise ImportError("sentence-transformers not installed")
+                # 与其他后端共享同一份模型权重
+                self._embedding_func = SharedEmbeddingFunction(
+                    embedding_registry.acquire(self.embedding_model)
                 )
-                logger.info(f"Using local embedding: {self.embedding_model}")
+                logger.info(f"Using local embedding: {self.embedding_model} (shared)")
                 
             elif self.embedding_provider == "openai":
                 from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
@@ -172,6 +269,19 @@ class ChromaMemoryBackend(MemoryBackend):
             logger.warning("Falling back to default embedding")
             self._embedding_func = None
     
+    def _get_embedder(self):
+        """获取嵌入批处理器（使用默认嵌入函数时返回 None）"""
+        if self._embedder is None and self._embedding_func is not None:
+            from .embedding_batcher import EmbeddingBatcher
+            embedding_func = self._embedding_func
+            self._embedder = EmbeddingBatcher(
+                lambda texts: embedding_func(texts),
+                max_batch_size=self.embedding_batch_size,
+                max_wait_ms=self.embedding_batch_wait_ms,
+                name=f"chroma-embedding:{self.collection_name}"
+            )
+        return self._embedder
+    
     async def initialize(self):
         """初始化后端"""
         if self._initialized:
@@ -200,6 +310,13 @@ class ChromaMemoryBackend(MemoryBackend):
             logger.error(f"Failed to initialize ChromaMemoryBackend: {e}")
             raise
     
+    async def warm_up(self):
+        """初始化客户端并预加载嵌入模型，首个请求不再承担加载开销"""
+        await self.initialize()
+        if self._embedding_func is not None:
+            embedding_func = self._embedding_func
+            await asyncio.get_event_loop().run_in_executor(None, embedding_func, ["warm-up"])
+    
     async def add(self, entry: MemoryEntry) -> str:
         """添加记忆"""
         if not self._initialized:
@@ -212,12 +329,22 @@ class ChromaMemoryBackend(MemoryBackend):
         
         try:
             # 准备元数据
+            created_at = entry.created_at or datetime.now()
             chroma_metadata = {
+                **{k: str(v) for k, v in entry.metadata.items()},
                 "level": entry.level.value,
-                "created_at": entry.created_at.isoformat() if entry.created_at else datetime.now().isoformat(),
-                **{k: str(v) for k, v in entry.metadata.items()}
+                "created_at": created_at.isoformat(),
+                "created_ts": created_at.timestamp()
             }
             
+            # 嵌入经批处理器合并计算，失败时交给 ChromaDB 自行嵌入
+            add_kwargs = {}
+            embedder = self._get_embedder()
+            if embedder is not None:
+                embedding = await embedder.embed(entry.content)
+                if embedding is not None:
+                    add_kwargs["embeddings"] = [embedding.tolist()]
+            
             # 添加到 ChromaDB
             loop = asyncio.get_event_loop()
             await loop.run_in_executor(
@@ -225,7 +352,8 @@ class ChromaMemoryBackend(MemoryBackend):
                 lambda: self._collection.add(
                     ids=[entry.memory_id],
                     documents=[entry.content],
-                    metadatas=[chroma_metadata]
+                    metadatas=[chroma_metadata],
+                    **add_kwargs
                 )
             )
             
@@ -236,6 +364,125 @@ class ChromaMemoryBackend(MemoryBackend):
             logger.error(f"Failed to add memory: {e}")
             raise
     
+    async def add_many(
+        self,
+        entries: List[MemoryEntry],
+        dedup_threshold: float = 0.95,
+        batch_size: int = 500
+    ) -> List[str]:
+        """批量添加记忆
+        
+        每批: 批量嵌入 -> 按级别批量查询近重复 + 批内筛选 -> 一次 collection.add。
+        
+        Args:
+            entries: 记忆条目列表
+            dedup_threshold: 近重复分数阈值（与 search 的分数含义一致）
+            batch_size: 每次写入 ChromaDB 的条数
+        
+        Returns:
+            记忆 ID 列表（重复条目同样返回其 ID）
+        """
+        if not self._initialized:
+            await self.initialize()
+        
+        inserted = 0
+        for start in range(0, len(entries), batch_size):
+            inserted += await self._add_batch(entries[start:start + batch_size], dedup_threshold)
+        
+        logger.info(f"Bulk added {inserted}/{len(entries)} memories")
+        return [entry.memory_id for entry in entries]
+    
+    async def _add_batch(self, entries: List[MemoryEntry], dedup_threshold: float) -> int:
+        """写入一批记忆，返回实际写入条数"""
+        import numpy as np
+        from .vector_index import batch_duplicate_mask
+        
+        loop = asyncio.get_event_loop()
+        # 条目自带嵌入（迁移/恢复）时直接复用，其余批量生成
+        embeddings = [
+            np.asarray(entry.embedding, dtype=np.float32) if entry.embedding is not None else None
+            for entry in entries
+        ]
+        missing = [i for i, emb in enumerate(embeddings) if emb is None]
+        embedder = self._get_embedder()
+        if missing and embedder is not None:
+            generated = await embedder.embed_many([entries[i].content for i in missing])
+            for i, emb in zip(missing, generated):
+                embeddings[i] = emb
+        
+        keep = [True] * len(entries)
+        with_vec = [i for i, emb in enumerate(embeddings) if emb is not None]
+        
+        # dedup_threshold > 1 时不做筛选（层间迁移等已知无重复的场景）
+        if with_vec and dedup_threshold <= 1.0:
+            # 与集合中已有记忆比较（按级别分组批量查询）
+            by_level: Dict[str, List[int]] = {}
+            for i in with_vec:
+                by_level.setdefault(entries[i].level.value, []).append(i)
+            for level_value, indices in by_level.items():
+                try:
+                    results = await loop.run_in_executor(
+                        None,
+                        lambda: self._collection.query(
+                            query_embeddings=[embeddings[i].tolist() for i in indices],
+                            n_results=1,
+                            where={"level": level_value},
+                            include=["distances"]
+                        )
+                    )
+                    for i, distances in zip(indices, results.get('distances') or []):
+                        if distances and 1.0 - distances[0] / 2.0 >= dedup_threshold:
+                            keep[i] = False
+                except Exception as e:
+                    logger.debug(f"Batch duplicate check failed: {e}")
+            
+            # 批内比较：score = (1 + cos) / 2
+            mask = batch_duplicate_mask(
+                np.stack([embeddings[i] for i in with_vec]),
+                [entries[i].level.value for i in with_vec],
+                2 * dedup_threshold - 1
+            )
+            for i, kept in zip(with_vec, mask):
+                if not kept:
+                    keep[i] = False
+        
+        seen_ids = set()
+        kept_indices = []
+        for i, kept in enumerate(keep):
+            if kept and entries[i].memory_id not in seen_ids:
+                seen_ids.add(entries[i].memory_id)
+                kept_indices.append(i)
+        if not kept_indices:
+            return 0
+        
+        ids = [entries[i].memory_id for i in kept_indices]
+        documents = [entries[i].content for i in kept_indices]
+        now = datetime.now()
+        metadatas = [
+            {
+                **{k: str(v) for k, v in entries[i].metadata.items()},
+                "level": entries[i].level.value,
+                "created_at": (entries[i].created_at or now).isoformat(),
+                "created_ts": (entries[i].created_at or now).timestamp()
+            }
+            for i in kept_indices
+        ]
+        add_kwargs = {}
+        if all(embeddings[i] is not None for i in kept_indices):
+            add_kwargs["embeddings"] = [embeddings[i].tolist() for i in kept_indices]
+        
+        # upsert: 恢复备份时 ID 可能已存在
+        await loop.run_in_executor(
+            None,
+            lambda: self._collection.upsert(
+                ids=ids,
+                documents=documents,
+                metadatas=metadatas,
+                **add_kwargs
+            )
+        )
+        return len(ids)
+    
     async def search(
         self, 
         query: str, 
@@ -312,6 +559,73 @@ class ChromaMemoryBackend(MemoryBackend):
             logger.error(f"Failed to delete memory: {e}")
             return False
     
+    async def delete_many(self, memory_ids: List[str]) -> int:
+        """批量删除记忆（一次 collection.delete）"""
+        if not self._initialized or not memory_ids:
+            return 0
+        
+        try:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, lambda: self._collection.delete(ids=list(memory_ids)))
+            logger.debug(f"Deleted {len(memory_ids)} memories")
+            return len(memory_ids)
+        except Exception as e:
+            logger.error(f"Failed to delete memories: {e}")
+            return 0
+    
+    async def get_by_age(
+        self,
+        min_days: int,
+        max_days: Optional[int] = None,
+        level: Optional[MemoryLevel] = None,
+        limit: Optional[int] = None,
+        include_embeddings: bool = False
+    ) -> List[Dict[str, Any]]:
+        """按年龄查询记忆（created_ts 范围过滤下推到 ChromaDB，结果按时间从旧到新）"""
+        if not self._initialized:
+            return []
+        
+        now = datetime.now()
+        clauses: List[Dict[str, Any]] = [
+            {"created_ts": {"$lte": (now - timedelta(days=min_days)).timestamp()}}
+        ]
+        if max_days is not None:
+            clauses.append({"created_ts": {"$gt": (now - timedelta(days=max_days)).timestamp()}})
+        if level:
+            clauses.append({"level": level.value})
+        where = clauses[0] if len(clauses) == 1 else {"$and": clauses}
+        
+        include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        get_kwargs: Dict[str, Any] = {"where": where, "include": include}
+        if limit:
+            get_kwargs["limit"] = limit
+        
+        try:
+            loop = asyncio.get_event_loop()
+            results = await loop.run_in_executor(None, lambda: self._collection.get(**get_kwargs))
+        except Exception as e:
+            logger.error(f"Failed to get memories by age: {e}")
+            return []
+        
+        embeddings = results.get('embeddings') if include_embeddings else None
+        memories = []
+        for i, memory_id in enumerate(results.get('ids') or []):
+            metadata = results['metadatas'][i] if results.get('metadatas') else {}
+            mem = {
+                "id": memory_id,
+                "content": results['documents'][i],
+                "metadata": metadata,
+                "level": metadata.get('level', 'P1'),
+                "created_at": metadata.get('created_at')
+            }
+            if include_embeddings:
+                mem["embedding"] = embeddings[i] if embeddings is not None else None
+            memories.append(mem)
+        
+        # ChromaDB get 不支持排序
+        memories.sort(key=lambda mem: mem.get('metadata', {}).get('created_ts', 0.0))
+        return memories
+    
     async def get_by_level(self, level: MemoryLevel) -> List[Dict[str, Any]]:
         """获取特定级别的所有记忆"""
         if not self._initialized:
@@ -364,7 +678,7 @@ class ChromaMemoryBackend(MemoryBackend):
         """执行归档"""
         logger.info("Running memory archive...")
         
-        archived_count = 0
+        archived = []
         deleted_count = 0
         
         # 获取所有 P1 和 P2 记忆
@@ -379,8 +693,8 @@ class ChromaMemoryBackend(MemoryBackend):
                     if age_days > max_days:
                         if level == MemoryLevel.P1:
                             # 归档 P1
-                            await self._archive_memory(mem)
-                            archived_count += 1
+                            self._archiver.append(mem)
+                            archived.append(mem['id'])
                         else:
                             # 删除 P2
                             await self.delete(mem['id'])
@@ -389,21 +703,24 @@ class ChromaMemoryBackend(MemoryBackend):
                 except Exception as e:
                     logger.debug(f"Archive processing error: {e}")
         
+        archived_count = await self._commit_archive(archived)
         logger.info(f"Archive complete: {archived_count} archived, {deleted_count} deleted")
     
-    async def _archive_memory(self, memory: Dict):
-        """归档单条记忆"""
+    async def _commit_archive(self, memory_ids: List[str]) -> int:
+        """把缓冲的归档记录压缩落盘，成功后再从主存储批量删除
+        
+        Returns:
+            实际归档的条数（写入失败时为 0，记忆保留在主存储中）
+        """
+        if not memory_ids:
+            return 0
         try:
-            # 保存到归档文件
-            archive_file = self.archive_path / f"{datetime.now().strftime('%Y-%m')}.jsonl"
-            with open(archive_file, "a", encoding="utf-8") as f:
-                f.write(json.dumps(memory, ensure_ascii=False) + "\n")
-            
-            # 从主存储删除
-            await self.delete(memory['id'])
-            
+            await asyncio.get_event_loop().run_in_executor(None, self._archiver.flush)
         except Exception as e:
-            logger.error(f"Failed to archive memory: {e}")
+            logger.error(f"Failed to write archive, keeping {len(memory_ids)} memories: {e}")
+            return 0
+        await self.delete_many(memory_ids)
+        return len(memory_ids)
 
     # ===== Memory Enhancer 功能 =====
     
@@ -417,6 +734,7 @@ class ChromaMemoryBackend(MemoryBackend):
             return {"archived": 0, "deleted": 0, "error": "not_initialized"}
         
         result = {"archived": 0, "deleted": 0}
+        archived = []
         
         for level, max_days in [(MemoryLevel.P1, self.p1_max_age_days), (MemoryLevel.P2, self.p2_max_age_days)]:
             memories = await self.get_by_level(level)
@@ -428,25 +746,29 @@ class ChromaMemoryBackend(MemoryBackend):
                     
                     if age_days > max_days:
                         if level == MemoryLevel.P1:
-                            await self._archive_memory(mem)
-                            result["archived"] += 1
+                            self._archiver.append(mem)
+                            archived.append(mem['id'])
                         else:
                             await self.delete(mem['id'])
                             result["deleted"] += 1
                 except Exception as e:
                     logger.debug(f"Archive processing error: {e}")
         
+        result["archived"] = await self._commit_archive(archived)
         logger.info(f"Manual archive complete: {result['archived']} archived, {result['deleted']} deleted")
         return result
     
-    async def detect_duplicates(self, threshold: float = 0.9) -> List[str]:
+    async def detect_duplicates(self, threshold: float = 0.9, block_size: int = 1024) -> List[List[str]]:
         """检测重复记忆
         
+        分块矩阵乘法在线程池中计算，不阻塞事件循环。
+        
         Args:
             threshold: 相似度阈值，超过此值认为是重复
+            block_size: 分块大小，决定单次相似度矩阵的内存占用
             
         Returns:
-            重复的记忆 ID 列表（保留第一个，其余为重复）
+            重复簇列表，每个簇为记忆 ID 列表
         """
         if not self._initialized or not self._collection:
             return []
@@ -457,83 +779,78 @@ class ChromaMemoryBackend(MemoryBackend):
             # 获取所有记忆
             all_memories = await loop.run_in_executor(
                 None,
-                lambda: self._collection.get(include=["documents", "embeddings"])
+                lambda: self._collection.get(include=["embeddings"])
             )
             
-            if not all_memories['ids']:
+            ids = all_memories['ids']
+            embeddings = all_memories.get('embeddings')
+            if not ids or embeddings is None or len(embeddings) == 0:
                 return []
             
-            duplicates = []
-            seen = set()
-            
-            for i, mem_id in enumerate(all_memories['ids']):
-                if mem_id in seen:
-                    continue
-                
-                # 获取当前记忆的嵌入
-                if not all_memories['embeddings'] or not all_memories['embeddings'][i]:
-                    continue
-                
-                embedding_i = all_memories['embeddings'][i]
+            def compute() -> List[List[str]]:
+                import numpy as np
+                from .vector_index import find_duplicate_clusters
                 
-                # 与其他记忆比较
-                for j, other_id in enumerate(all_memories['ids']):
-                    if i >= j or other_id in seen:
-                        continue
-                    
-                    if not all_memories['embeddings'] or not all_memories['embeddings'][j]:
-                        continue
-                    
-                    embedding_j = all_memories['embeddings'][j]
-                    
-                    # 计算余弦相似度
-                    similarity = self._cosine_similarity(embedding_i, embedding_j)
-                    
-                    if similarity >= threshold:
-                        duplicates.append(other_id)
-                        seen.add(other_id)
-                
-                seen.add(mem_id)
+                valid = [i for i, emb in enumerate(embeddings) if emb is not None and len(emb)]
+                if not valid:
+                    return []
+                matrix = np.asarray([embeddings[i] for i in valid], dtype=np.float32)
+                clusters = find_duplicate_clusters(matrix, threshold, block_size)
+                return [[ids[valid[i]] for i in cluster] for cluster in clusters]
             
-            logger.info(f"Detected {len(duplicates)} duplicate memories")
-            return duplicates
+            clusters = await loop.run_in_executor(None, compute)
+            
+            logger.info(
+                f"Detected {sum(len(c) - 1 for c in clusters)} duplicate memories in {len(clusters)} clusters"
+            )
+            return clusters
             
         except Exception as e:
             logger.error(f"Duplicate detection failed: {e}")
             return []
     
-    def _cosine_similarity(self, a, b) -> float:
-        """计算余弦相似度"""
-        import numpy as np
-        a = np.array(a)
-        b = np.array(b)
-        norm_a = np.linalg.norm(a)
-        norm_b = np.linalg.norm(b)
-        if norm_a == 0 or norm_b == 0:
-            return 0.0
-        return float(np.dot(a, b) / (norm_a * norm_b))
-    
-    async def merge_duplicates(self, keep: str = "newest") -> Dict[str, int]:
+    async def merge_duplicates(self, keep: str = "newest", threshold: float = 0.9) -> Dict[str, int]:
         """合并重复记忆
         
         Args:
             keep: 保留策略，"newest" 或 "oldest"
+            threshold: 相似度阈值
             
         Returns:
             合并统计
         """
-        duplicates = await self.detect_duplicates(threshold=0.9)
+        if keep not in ("newest", "oldest"):
+            raise ValueError(f"Invalid keep strategy: {keep}. Use 'newest' or 'oldest'")
         
-        if not duplicates:
-            return {"merged": 0, "deleted": 0}
+        clusters = await self.detect_duplicates(threshold=threshold)
         
-        deleted_count = 0
-        for dup_id in duplicates:
-            if await self.delete(dup_id):
-                deleted_count += 1
+        if not clusters:
+            return {"merged": 0, "deleted": 0, "clusters": 0}
+        
+        # 批量读取创建时间
+        all_ids = [memory_id for cluster in clusters for memory_id in cluster]
+        loop = asyncio.get_event_loop()
+        result = await loop.run_in_executor(
+            None,
+            lambda: self._collection.get(ids=all_ids, include=["metadatas"])
+        )
+        created = {
+            memory_id: (metadata or {}).get("created_at", "")
+            for memory_id, metadata in zip(result['ids'], result.get('metadatas') or [])
+        }
         
-        logger.info(f"Merged duplicates: kept {keep}, deleted {deleted_count}")
-        return {"merged": len(duplicates), "deleted": deleted_count}
+        deleted_count = 0
+        for cluster in clusters:
+            # created_at 为 ISO 格式字符串，可直接比较；相同时保持簇内顺序
+            ordered = sorted(cluster, key=lambda memory_id: created.get(memory_id, ""))
+            keeper = ordered[-1] if keep == "newest" else ordered[0]
+            for dup_id in cluster:
+                if dup_id != keeper and await self.delete(dup_id):
+                    deleted_count += 1
+        
+        merged = sum(len(cluster) - 1 for cluster in clusters)
+        logger.info(f"Merged {len(clusters)} duplicate clusters: kept {keep}, deleted {deleted_count}")
+        return {"merged": merged, "deleted": deleted_count, "clusters": len(clusters)}
     
     async def upgrade_memory_level(self, memory_id: str, new_level: str) -> bool:
         """升级记忆级别 (P2 -> P1 -> P0)
@@ -607,22 +924,19 @@ class ChromaMemoryBackend(MemoryBackend):
                     level_stats[level.value] = 0
             
             # 计算重复率
-            duplicates = await self.detect_duplicates(threshold=0.9)
-            duplicate_rate = len(duplicates) / total if total > 0 else 0
+            clusters = await self.detect_duplicates(threshold=0.9)
+            duplicate_count = sum(len(cluster) - 1 for cluster in clusters)
+            duplicate_rate = duplicate_count / total if total > 0 else 0
             
             # 归档文件统计
-            archive_count = 0
-            if self.archive_path.exists():
-                for archive_file in self.archive_path.glob("*.jsonl"):
-                    with open(archive_file, 'r', encoding='utf-8') as f:
-                        archive_count += sum(1 for _ in f)
+            archive_count = count_archived(self.archive_path)
             
             return {
                 "status": "initialized",
                 "backend": "chroma",
                 "total_memories": total,
                 "by_level": level_stats,
-                "duplicate_count": len(duplicates),
+                "duplicate_count": duplicate_count,
                 "duplicate_rate": round(duplicate_rate, 4),
                 "archived_count": archive_count,
                 "embedding_provider": self.embedding_provider,
@@ -659,7 +973,8 @@ class ChromaMemoryBackend(MemoryBackend):
                 "total_memories": total,
                 "by_level": level_stats,
                 "embedding_provider": self.embedding_provider,
-                "embedding_model": self.embedding_model
+                "embedding_model": self.embedding_model,
+                "embedding_batcher": self._embedder.get_stats() if self._embedder else None
             }
         except Exception as e:
             return {"status": "error", "error": str(e)}
@@ -667,5 +982,13 @@ class ChromaMemoryBackend(MemoryBackend):
     async def close(self):
         """关闭后端"""
         self._initialized = False
+        if self._embedder is not None:
+            await self._embedder.close()
+            self._embedder = None
+        if isinstance(self._embedding_func, SharedEmbeddingFunction):
+            self._embedding_func.handle.release()
+            self._embedding_func = None
+            self._client = None
+            self._collection = None
         # ChromaDB 自动持久化，无需特别关闭
         logger.info("ChromaMemoryBackend closed")
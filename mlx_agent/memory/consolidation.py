@@ -5,18 +5,46 @@
 - 合并相似记忆
 - 识别过时信息
 - 生成摘要
+
+相似记忆分组有两种模式:
+- minhash (默认): 每条记忆只分词一次，MinHash + LSH 分桶后只对候选对计算 Jaccard
+- embedding: 通过 embedding_fn 取嵌入（如 SQLite 后端的嵌入缓存），按余弦相似度分块聚类
+
+文件修改先按文件汇总成编辑计划，每个文件只流式重写一次（临时文件 + 原子替换），
+归档条目一次性追加，文件读写次数与涉及的文件数成正比。
+
+整合是增量的：ConsolidationIndex 持久化文件 mtime/哈希与已处理条目的 MinHash 签名，
+每次只解析新增或变化的文件，新记忆与签名索引比对，只读取命中候选的旧文件。
 """
 
+import asyncio
 import hashlib
+import inspect
 import json
+import os
 import re
+import tempfile
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Dict, Optional, Set
+from typing import Any, Callable, List, Dict, Optional, Sequence, Set, Tuple
 from collections import defaultdict
 
+import numpy as np
 from loguru import logger
 
+from .consolidation_index import (
+    ConsolidationIndex, content_hash, decode_signature, encode_signature, entry_key, file_hash
+)
+from .minhash import MinHasher, MinHashLSH, jaccard, tokenize
+from .vector_index import find_duplicate_clusters
+
+# 条目标题行: ## [ID] HH:MM
+_ENTRY_HEADER_RE = re.compile(r'^##\s*\[([^\]]+)\]\s*(\d{2}:\d{2})\s*$')
+_ANY_ENTRY_RE = re.compile(r'^##\s*\[')
+
+# 编辑计划: 文件 -> {(记忆 ID, 时间): 替换文本，None 表示删除}
+EditPlan = Dict[Path, Dict[Tuple[str, str], Optional[str]]]
+
 
 class MemoryConsolidator:
     """记忆整合器
@@ -24,69 +52,121 @@ class MemoryConsolidator:
     定期整理碎片化记忆，保持记忆库整洁
     """
     
-    def __init__(self, memory_path: Path, similarity_threshold: float = 0.7):
+    def __init__(
+        self,
+        memory_path: Path,
+        similarity_threshold: float = 0.7,
+        cluster_mode: str = "minhash",
+        embedding_fn: Optional[Callable[[List[str]], Any]] = None,
+        embedding_threshold: float = 0.9,
+        num_perm: int = 128,
+        index_path: Optional[Path] = None
+    ):
         """初始化整合器
         
         Args:
             memory_path: 记忆目录路径
-            similarity_threshold: 相似度阈值，超过则合并
+            similarity_threshold: 相似度阈值 (Jaccard)，超过则合并
+            cluster_mode: 分组模式，"minhash" 或 "embedding"
+            embedding_fn: 批量取嵌入的函数（同步或异步），embedding 模式需要
+            embedding_threshold: embedding 模式的余弦相似度阈值
+            num_perm: MinHash 签名长度
+            index_path: 增量索引路径（默认 memory_path/.consolidation_index.json）
         """
+        if cluster_mode not in ("minhash", "embedding"):
+            raise ValueError(f"Invalid cluster_mode: {cluster_mode}. Use 'minhash' or 'embedding'")
         self.memory_path = Path(memory_path)
         self.similarity_threshold = similarity_threshold
+        self.cluster_mode = cluster_mode
+        self.embedding_fn = embedding_fn
+        self.embedding_threshold = embedding_threshold
+        self._hasher = MinHasher(num_perm=num_perm)
+        self.index = ConsolidationIndex(
+            Path(index_path) if index_path else self.memory_path / '.consolidation_index.json',
+            num_perm=num_perm
+        )
+        # 本次整合中已解析的旧文件（按需读取）
+        self._file_cache: Dict[str, List[Dict]] = {}
         self.consolidation_log: List[Dict] = []
     
     async def consolidate(
         self,
         days_back: int = 7,
-        dry_run: bool = False
+        dry_run: bool = False,
+        full: bool = False
     ) -> Dict:
         """执行记忆整合
         
+        只解析新增或变化的文件；新记忆与索引中的旧记忆比对，旧记忆之间不再重复比较。
+        
         Args:
             days_back: 处理最近几天的记忆
-            dry_run: 试运行模式（不实际修改文件）
+            dry_run: 试运行模式（不实际修改文件，也不更新索引）
+            full: 忽略增量索引，重新扫描并重建索引
             
         Returns:
             整合报告
         """
-        logger.info(f"Starting memory consolidation (days_back={days_back}, dry_run={dry_run})")
+        logger.info(f"Starting memory consolidation (days_back={days_back}, dry_run={dry_run}, full={full})")
         
         report = {
             'started_at': datetime.now().isoformat(),
             'dry_run': dry_run,
             'processed_files': 0,
             'memories_found': 0,
+            'new_memories': 0,
+            'files_scanned': 0,
+            'files_parsed': 0,
             'duplicates_removed': 0,
             'consolidated_groups': 0,
             'archived_memories': 0,
+            'files_read': 0,
+            'files_written': 0,
             'errors': []
         }
         
+        self._file_cache = {}
         try:
-            # 1. 扫描所有记忆文件
-            all_memories = self._scan_memories(days_back)
-            report['memories_found'] = len(all_memories)
+            # 1. 增量扫描：只解析新增或变化的文件
+            new_memories, known, records = self._scan_memories(days_back, full, report)
+            report['new_memories'] = len(new_memories)
+            report['memories_found'] = len(new_memories) + len(known)
             
-            # 2. 查找并合并相似记忆
-            groups = self._find_similar_groups(all_memories)
+            # 2. 新记忆与新记忆、旧记忆比对，查找相似记忆组
+            groups = await self._find_groups(new_memories, known, report)
             report['consolidated_groups'] = len(groups)
             
-            # 3. 识别过时记忆
-            outdated = self._find_outdated_memories(all_memories, days_threshold=30)
+            # 3. 识别过时记忆（旧记忆只在需要归档时读取原文）
+            outdated = []
+            for memory in self._find_outdated_memories(new_memories + known, days_threshold=30):
+                resolved = self._resolve_known(memory, report)
+                if resolved is not None:
+                    outdated.append(resolved)
             report['archived_memories'] = len(outdated)
             
-            # 4. 执行整合
+            # 4. 汇总编辑计划（合并 + 归档），每个文件只重写一次
+            plan: EditPlan = defaultdict(dict)
+            merged: Dict[Tuple[str, str, str], str] = {}
+            for group in groups:
+                report['duplicates_removed'] += self._plan_merge(group, plan, merged)
+            for memory in outdated:
+                self._plan_removal(memory, plan)
+            report['processed_files'] = len(plan)
+            
+            # 5. 执行整合并更新索引
             if not dry_run:
-                # 合并相似记忆
-                for group in groups:
-                    await self._merge_group(group)
+                for file_path, edits in plan.items():
+                    digest = self._rewrite_file(file_path, edits, report)
+                    self._update_record(records, file_path, edits, merged, digest)
+                self._append_archive(outdated, report)
                 
-                # 归档过时记忆
-                for memory in outdated:
-                    await self._archive_memory(memory)
-                
-                # 清理空文件
-                self._cleanup_empty_files()
+                for rel_path, record in records.items():
+                    if record is None:
+                        self.index.drop_file(rel_path)
+                    else:
+                        self.index.set_file(rel_path, record)
+                self.index.retain(rel for rel, record in records.items() if record is not None)
+                self.index.save()
             
             report['completed_at'] = datetime.now().isoformat()
             
@@ -97,17 +177,31 @@ class MemoryConsolidator:
             logger.error(f"Consolidation failed: {e}")
             report['errors'].append(str(e))
             return report
+        finally:
+            self._file_cache = {}
     
-    def _scan_memories(self, days_back: int) -> List[Dict]:
-        """扫描记忆文件
+    def _scan_memories(
+        self,
+        days_back: int,
+        full: bool,
+        report: Dict
+    ) -> Tuple[List[Dict], List[Dict], Dict[str, Optional[Dict]]]:
+        """增量扫描记忆文件
+        
+        mtime 与大小未变的文件不读取；内容哈希未变的文件不解析；
+        变化文件中正文未变的条目沿用索引中的签名，视为旧记忆。
         
         Args:
             days_back: 扫描最近几天的文件
+            full: 忽略索引，全部视为新记忆
+            report: 整合报告（累计扫描/读取/解析次数）
             
         Returns:
-            记忆条目列表
+            (新记忆列表, 旧记忆列表, 窗口内所有文件的最新索引记录)
+            旧记忆只含 ID、时间、级别等字段，需要原文时通过 _resolve_known 读取
         """
-        memories = []
+        new_memories, known = [], []
+        records: Dict[str, Optional[Dict]] = {}
         cutoff_date = datetime.now() - timedelta(days=days_back)
         
         for subdir in ['core', 'session', 'archive']:
@@ -119,18 +213,110 @@ class MemoryConsolidator:
                 try:
                     # 解析文件名日期
                     file_date = datetime.strptime(md_file.stem, '%Y-%m-%d')
-                    if file_date < cutoff_date:
-                        continue
-                    
-                    # 解析文件内容
-                    file_memories = self._parse_memory_file(md_file, subdir)
-                    memories.extend(file_memories)
-                    
                 except ValueError:
                     # 文件名不符合日期格式
                     continue
+                if file_date < cutoff_date:
+                    continue
+                
+                rel_path = f"{subdir}/{md_file.name}"
+                report['files_scanned'] += 1
+                stat = md_file.stat()
+                record = None if full else self.index.get_file(rel_path)
+                
+                if record and record['mtime'] == stat.st_mtime and record['size'] == stat.st_size:
+                    records[rel_path] = record
+                    known.extend(self._known_stubs(md_file, subdir, record))
+                    continue
+                
+                raw = md_file.read_bytes()
+                report['files_read'] += 1
+                digest = file_hash(raw)
+                if record and record['hash'] == digest:
+                    records[rel_path] = {**record, 'mtime': stat.st_mtime, 'size': stat.st_size}
+                    known.extend(self._known_stubs(md_file, subdir, record))
+                    continue
+                
+                memories = self._parse_memory_text(raw.decode('utf-8'), md_file, subdir)
+                report['files_parsed'] += 1
+                self._file_cache[str(md_file)] = memories
+                
+                old_entries = record['entries'] if record else {}
+                entries = {}
+                for memory in memories:
+                    key = entry_key(memory['id'], memory['time'])
+                    h = content_hash(memory['content'])
+                    old = old_entries.get(key)
+                    if old and old['hash'] == h:
+                        memory['_signature'] = decode_signature(old['sig'])
+                        entries[key] = old
+                        known.append(memory)
+                    else:
+                        memory['_signature'] = self._hasher.signature(tokenize(memory['content']))
+                        entries[key] = self._make_entry(memory, h)
+                        new_memories.append(memory)
+                
+                records[rel_path] = {
+                    'mtime': stat.st_mtime, 'size': stat.st_size, 'hash': digest, 'entries': entries
+                }
         
-        return memories
+        return new_memories, known, records
+    
+    @staticmethod
+    def _make_entry(memory: Dict, h: str) -> Dict:
+        """索引条目：正文哈希、签名与过时判断所需的标记"""
+        entry = {'hash': h, 'sig': encode_signature(memory.get('_signature'))}
+        metadata = memory.get('metadata', {})
+        if metadata.get('temporary'):
+            entry['temporary'] = True
+        if metadata.get('level') == 'P0':
+            entry['p0'] = True
+        return entry
+    
+    @staticmethod
+    def _known_stubs(file_path: Path, level: str, record: Dict) -> List[Dict]:
+        """由索引记录生成旧记忆占位（不读文件）"""
+        stubs = []
+        for key, entry in record.get('entries', {}).items():
+            memory_id, _, time_str = key.rpartition(' ')
+            metadata = {}
+            if entry.get('temporary'):
+                metadata['temporary'] = True
+            if entry.get('p0'):
+                metadata['level'] = 'P0'
+            stubs.append({
+                'id': memory_id,
+                'time': time_str,
+                'date': file_path.stem,
+                'level': level,
+                'metadata': metadata,
+                'source_file': str(file_path),
+                '_signature': decode_signature(entry.get('sig')),
+            })
+        return stubs
+    
+    def _resolve_known(self, memory: Dict, report: Optional[Dict] = None) -> Optional[Dict]:
+        """取旧记忆的完整内容（每个文件在一次整合中最多读取一次）
+        
+        Returns:
+            完整的记忆字典，条目已不存在时返回 None
+        """
+        if 'content' in memory:
+            return memory
+        path = memory['source_file']
+        if path not in self._file_cache:
+            try:
+                self._file_cache[path] = self._parse_memory_file(Path(path), memory['level'])
+            except OSError as e:
+                logger.warning(f"Failed to read {path}: {e}")
+                self._file_cache[path] = []
+            if report is not None:
+                report['files_read'] += 1
+        for candidate in self._file_cache[path]:
+            if candidate['id'] == memory['id'] and candidate['time'] == memory['time']:
+                candidate.setdefault('_signature', memory.get('_signature'))
+                return candidate
+        return None
     
     def _parse_memory_file(self, file_path: Path, level: str) -> List[Dict]:
         """解析记忆文件
@@ -142,8 +328,11 @@ class MemoryConsolidator:
         Returns:
             记忆条目列表
         """
+        return self._parse_memory_text(file_path.read_text(encoding='utf-8'), file_path, level)
+    
+    def _parse_memory_text(self, content: str, file_path: Path, level: str) -> List[Dict]:
+        """解析记忆文件内容（见 _parse_memory_file）"""
         memories = []
-        content = file_path.read_text(encoding='utf-8')
         
         # 匹配记忆条目：## [ID] HH:MM
         pattern = r'##\s*\[([^\]]+)\]\s*(\d{2}:\d{2})\s*\n([^#]+?)(?=\n##\s*\[|$)'
@@ -175,38 +364,81 @@ class MemoryConsolidator:
         
         return memories
     
-    def _find_similar_groups(self, memories: List[Dict]) -> List[List[Dict]]:
+    async def _find_groups(
+        self,
+        memories: List[Dict],
+        known: Sequence[Dict] = (),
+        report: Optional[Dict] = None
+    ) -> List[List[Dict]]:
+        """按配置的模式查找相似记忆组（embedding 模式失败时回退到 minhash）"""
+        if self.cluster_mode == "embedding" and self.embedding_fn is not None:
+            try:
+                return await self._find_embedding_groups(memories, known, report)
+            except Exception as e:
+                logger.warning(f"Embedding clustering failed, falling back to MinHash: {e}")
+        return self._find_similar_groups(memories, known, report)
+    
+    def _signature_of(self, memory: Dict, tokens: frozenset) -> Optional[np.ndarray]:
+        if '_signature' in memory:
+            return memory['_signature']
+        return self._hasher.signature(tokens)
+    
+    def _find_similar_groups(
+        self,
+        memories: List[Dict],
+        known: Sequence[Dict] = (),
+        report: Optional[Dict] = None
+    ) -> List[List[Dict]]:
         """查找相似记忆组
         
-        使用简单的文本相似度算法
+        每条记忆只分词一次；MinHash + LSH 分桶后只对候选对计算精确 Jaccard。
+        分组规则与逐对比较相同：按顺序取未分组的新记忆为锚点，
+        收集与锚点相似度达到阈值的其余未分组记忆（新记忆或旧记忆）。
+        旧记忆之间不再比较，命中候选的旧记忆才读取原文。
         
         Args:
-            memories: 记忆列表
+            memories: 新记忆列表
+            known: 已处理过的旧记忆（带 _signature 的占位或完整记忆）
+            report: 整合报告（累计读取次数）
             
         Returns:
             相似记忆组列表
         """
+        n = len(memories)
+        tokens = [tokenize(mem['content']) for mem in memories]
+        lsh = MinHashLSH(threshold=self.similarity_threshold, num_perm=self._hasher.num_perm)
+        signatures = []
+        for i, token_set in enumerate(tokens):
+            signature = self._signature_of(memories[i], token_set)
+            signatures.append(signature)
+            if signature is not None:
+                lsh.insert(i, signature)
+        for j, memory in enumerate(known):
+            if memory.get('_signature') is not None:
+                lsh.insert(n + j, memory['_signature'])
+        
         groups = []
         used = set()
         
         for i, mem1 in enumerate(memories):
-            if i in used:
+            if i in used or signatures[i] is None:
                 continue
             
             group = [mem1]
             used.add(i)
             
-            for j, mem2 in enumerate(memories[i+1:], start=i+1):
-                if j in used:
+            for j in sorted(lsh.query(signatures[i])):
+                if j <= i or j in used:
                     continue
-                
-                similarity = self._calculate_similarity(
-                    mem1['content'],
-                    mem2['content']
-                )
-                
-                if similarity >= self.similarity_threshold:
-                    group.append(mem2)
+                if j < n:
+                    other, other_tokens = memories[j], tokens[j]
+                else:
+                    other = self._resolve_known(known[j - n], report)
+                    if other is None:
+                        continue
+                    other_tokens = tokenize(other['content'])
+                if jaccard(tokens[i], other_tokens) >= self.similarity_threshold:
+                    group.append(other)
                     used.add(j)
             
             if len(group) > 1:
@@ -214,6 +446,59 @@ class MemoryConsolidator:
         
         return groups
     
+    async def _find_embedding_groups(
+        self,
+        memories: List[Dict],
+        known: Sequence[Dict] = (),
+        report: Optional[Dict] = None
+    ) -> List[List[Dict]]:
+        """按嵌入余弦相似度分组（分块矩阵乘法，不构造完整相似度矩阵）
+        
+        旧记忆先用签名索引预筛（放宽到 Jaccard 0.5），只有与新记忆共享分桶的才读取原文参与聚类；
+        不包含新记忆的组不再处理。
+        """
+        if known:
+            lsh = MinHashLSH(threshold=min(self.similarity_threshold, 0.5), num_perm=self._hasher.num_perm)
+            for j, memory in enumerate(known):
+                if memory.get('_signature') is not None:
+                    lsh.insert(j, memory['_signature'])
+            candidates: Set[int] = set()
+            for memory in memories:
+                signature = self._signature_of(memory, tokenize(memory['content']))
+                if signature is not None:
+                    candidates |= lsh.query(signature)
+            resolved = [self._resolve_known(known[j], report) for j in sorted(candidates)]
+            new_count = len(memories)
+            memories = memories + [m for m in resolved if m is not None]
+        else:
+            new_count = len(memories)
+        
+        if len(memories) < 2 or new_count == 0:
+            return []
+        
+        vectors = self.embedding_fn([mem['content'] for mem in memories])
+        if inspect.isawaitable(vectors):
+            vectors = await vectors
+        
+        # 只聚类主流维度的有效嵌入
+        valid = [i for i, v in enumerate(vectors) if v is not None and len(v)]
+        if len(valid) < 2:
+            return []
+        dims = [len(vectors[i]) for i in valid]
+        main_dim = max(set(dims), key=dims.count)
+        valid = [i for i in valid if len(vectors[i]) == main_dim]
+        matrix = np.stack([np.asarray(vectors[i], dtype=np.float32) for i in valid])
+        
+        loop = asyncio.get_event_loop()
+        clusters = await loop.run_in_executor(
+            None, find_duplicate_clusters, matrix, self.embedding_threshold
+        )
+        return [
+            [memories[valid[k]] for k in cluster]
+            for cluster in clusters
+            if any(valid[k] < new_count for k in cluster)
+        ]
+    
     def _calculate_similarity(self, text1: str, text2: str) -> float:
         """计算两段文本的相似度
         
@@ -228,25 +513,7 @@ class MemoryConsolidator:
         """
         if not text1 or not text2:
             return 0.0
-        
-        # 分词（简单按空格和标点分割）
-        def tokenize(text: str) -> Set[str]:
-            # 转小写，替换标点为空格
-            text = re.sub(r'[^\w\s]', ' ', text.lower())
-            # 分词并过滤短词
-            words = {w for w in text.split() if len(w) > 2}
-            return words
-        
-        words1 = tokenize(text1)
-        words2 = tokenize(text2)
-        
-        if not words1 or not words2:
-            return 0.0
-        
-        intersection = words1 & words2
-        union = words1 | words2
-        
-        return len(intersection) / len(union) if union else 0.0
+        return jaccard(tokenize(text1), tokenize(text2))
     
     def _find_outdated_memories(
         self,
@@ -289,112 +556,177 @@ class MemoryConsolidator:
         
         return outdated
     
-    async def _merge_group(self, group: List[Dict]):
-        """合并相似记忆组
+    def _plan_merge(
+        self,
+        group: List[Dict],
+        plan: EditPlan,
+        merged: Optional[Dict[Tuple[str, str, str], str]] = None
+    ) -> int:
+        """把相似记忆组的合并加入编辑计划
+        
+        保留最早的记忆并标注合并次数，删除其余记忆。
         
         Args:
             group: 相似记忆组
+            plan: 编辑计划
+            merged: 记录主记忆合并后的正文 {(文件, ID, 时间): 正文}，用于更新索引
+            
+        Returns:
+            计划删除的条目数
         """
         if len(group) < 2:
-            return
+            return 0
         
         # 保留最早的作为主要记忆
         main_memory = min(group, key=lambda m: f"{m.get('date', '')} {m.get('time', '')}")
-        
-        # 提取其他记忆的差异信息
-        variations = []
-        for mem in group:
-            if mem['id'] != main_memory['id']:
-                variations.append({
-                    'date': mem.get('date'),
-                    'content': mem.get('content', '')[:200]
-                })
+        variations = [mem for mem in group if mem['id'] != main_memory['id']]
         
         # 生成合并后的内容
         merged_content = main_memory['content']
         if variations:
             merged_content += f"\n\n[Related memories from {len(variations)} occasions]"
         
-        # 更新主记忆
-        main_file = Path(main_memory['source_file'])
-        if main_file.exists():
-            content = main_file.read_text(encoding='utf-8')
-            
-            # 更新内容
-            old_entry = f"## [{main_memory['id']}] {main_memory['time']}\n{main_memory['full_text']}"
-            new_entry = f"## [{main_memory['id']}] {main_memory['time']}\n{merged_content}\n<!-- metadata: {{\"consolidated\": true, \"variations\": {len(variations)}}} -->"
-            
-            content = content.replace(old_entry, new_entry)
-            main_file.write_text(content, encoding='utf-8')
-        
-        # 删除其他记忆
-        for mem in group:
-            if mem['id'] != main_memory['id']:
-                await self._remove_memory_entry(mem)
-        
-        logger.info(f"Merged {len(group)} similar memories into {main_memory['id']}")
+        main_key = (main_memory['id'], main_memory['time'])
+        new_entry = (
+            f"## [{main_memory['id']}] {main_memory['time']}\n{merged_content}\n"
+            f"<!-- metadata: {{\"consolidated\": true, \"variations\": {len(variations)}}} -->\n\n"
+        )
+        # 已计划删除（如同时过时）的条目不再改写
+        plan[Path(main_memory['source_file'])].setdefault(main_key, new_entry)
+        if merged is not None:
+            merged[(main_memory['source_file'], *main_key)] = merged_content
+        
+        for mem in variations:
+            self._plan_removal(mem, plan)
+        
+        logger.info(f"Planned merge of {len(group)} similar memories into {main_memory['id']}")
+        return len(variations)
+    
+    def _plan_removal(self, memory: Dict, plan: EditPlan):
+        """把记忆条目的删除加入编辑计划"""
+        plan[Path(memory['source_file'])][(memory['id'], memory['time'])] = None
     
-    async def _remove_memory_entry(self, memory: Dict):
-        """从文件中移除记忆条目
+    def _rewrite_file(self, file_path: Path, edits: Dict[Tuple[str, str], Optional[str]], report: Dict):
+        """按编辑计划流式重写单个文件
+        
+        逐行读取，命中计划的条目被替换或跳过，写入同目录临时文件后原子替换原文件。
+        重写后不再包含任何条目的文件直接删除。
         
         Args:
-            memory: 要移除的记忆
+            file_path: Markdown 文件路径
+            edits: {(记忆 ID, 时间): 替换文本或 None}
+            report: 整合报告（累计读写次数与错误）
+            
+        Returns:
+            重写后文件的内容哈希；文件被删除、不存在或重写失败时返回 None
         """
-        file_path = Path(memory['source_file'])
         if not file_path.exists():
-            return
-        
-        content = file_path.read_text(encoding='utf-8')
+            return None
         
-        # 构造要移除的条目模式
-        pattern = rf"##\s*\[{re.escape(memory['id'])}\]\s*{re.escape(memory['time'])}\s*\n[^#]*?(?=\n##\s*\[|$)"
-        
-        # 移除条目
-        new_content = re.sub(pattern, '', content, flags=re.DOTALL)
+        digest = hashlib.sha256()
+        fd, tmp_name = tempfile.mkstemp(dir=file_path.parent, prefix=f".{file_path.name}.", suffix=".tmp")
+        remaining_entries = 0
+        try:
+            # newline='' 保留原换行符，使哈希与按字节读取的一致
+            with open(file_path, 'r', encoding='utf-8', newline='') as src, \
+                    os.fdopen(fd, 'w', encoding='utf-8', newline='') as dst:
+                report['files_read'] += 1
+                
+                def write(text: str):
+                    dst.write(text)
+                    digest.update(text.encode('utf-8'))
+                
+                skipping = False
+                for line in src:
+                    if _ANY_ENTRY_RE.match(line):
+                        header = _ENTRY_HEADER_RE.match(line.rstrip('\r\n'))
+                        key = (header.group(1).strip(), header.group(2)) if header else None
+                        if key in edits:
+                            replacement = edits[key]
+                            skipping = True
+                            if replacement is not None:
+                                write(replacement)
+                                remaining_entries += 1
+                            continue
+                        skipping = False
+                        remaining_entries += 1
+                    elif skipping:
+                        continue
+                    write(line)
+            
+            if remaining_entries == 0:
+                # 不再包含任何条目（只剩标题等）的文件直接删除
+                os.unlink(tmp_name)
+                file_path.unlink()
+                logger.info(f"Removed empty file: {file_path}")
+                return None
+            os.replace(tmp_name, file_path)
+            report['files_written'] += 1
+            return digest.hexdigest()
+        except Exception as e:
+            logger.error(f"Failed to rewrite {file_path}: {e}")
+            report['errors'].append(f"{file_path}: {e}")
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            return None
+    
+    def _update_record(
+        self,
+        records: Dict[str, Optional[Dict]],
+        file_path: Path,
+        edits: Dict[Tuple[str, str], Optional[str]],
+        merged: Dict[Tuple[str, str, str], str],
+        digest: Optional[str]
+    ):
+        """按已执行的编辑更新文件的索引记录
+        
+        被删除的条目移出索引，主记忆改用合并后正文的签名；
+        文件被删除或重写失败时丢弃记录，下次整合重新解析。
+        """
+        rel_path = f"{file_path.parent.name}/{file_path.name}"
+        record = records.get(rel_path)
+        if record is None or digest is None:
+            records[rel_path] = None
+            return
         
-        if new_content != content:
-            file_path.write_text(new_content, encoding='utf-8')
-            logger.debug(f"Removed memory entry: {memory['id']}")
+        entries = dict(record['entries'])
+        for (memory_id, time_str), replacement in edits.items():
+            key = entry_key(memory_id, time_str)
+            if replacement is None:
+                entries.pop(key, None)
+                continue
+            content = merged.get((str(file_path), memory_id, time_str))
+            if content is not None and key in entries:
+                signature = self._hasher.signature(tokenize(content))
+                entries[key] = {
+                    **entries[key], 'hash': content_hash(content), 'sig': encode_signature(signature)
+                }
+        
+        stat = file_path.stat()
+        records[rel_path] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'hash': digest, 'entries': entries}
     
-    async def _archive_memory(self, memory: Dict):
-        """归档记忆
+    def _append_archive(self, memories: List[Dict], report: Dict):
+        """把过时记忆一次性追加到当天的归档文件"""
+        if not memories:
+            return
         
-        Args:
-            memory: 要归档的记忆
-        """
-        # 移动到 archive 目录
         archive_dir = self.memory_path / 'archive'
         archive_dir.mkdir(parents=True, exist_ok=True)
-        
-        # 从原文件移除
-        await self._remove_memory_entry(memory)
-        
-        # 添加到归档文件
         today = datetime.now().strftime('%Y-%m-%d')
         archive_file = archive_dir / f'{today}_consolidated.md'
         
-        archive_entry = f"\n## [{memory['id']}] {memory.get('date')} {memory.get('time')} (ARCHIVED)\n"
-        archive_entry += f"{memory['content']}\n"
-        archive_entry += f"<!-- metadata: {json.dumps(memory.get('metadata', {}), ensure_ascii=False)} -->\n"
+        chunks = []
+        for memory in memories:
+            chunks.append(
+                f"\n## [{memory['id']}] {memory.get('date')} {memory.get('time')} (ARCHIVED)\n"
+                f"{memory['content']}\n"
+                f"<!-- metadata: {json.dumps(memory.get('metadata', {}), ensure_ascii=False)} -->\n"
+            )
         
         with open(archive_file, 'a', encoding='utf-8') as f:
-            f.write(archive_entry)
-        
-        logger.debug(f"Archived memory: {memory['id']}")
-    
-    def _cleanup_empty_files(self):
-        """清理空文件"""
-        for subdir in ['core', 'session', 'archive']:
-            dir_path = self.memory_path / subdir
-            if not dir_path.exists():
-                continue
-            
-            for md_file in dir_path.glob('*.md'):
-                content = md_file.read_text(encoding='utf-8').strip()
-                # 如果文件内容为空或只有空白
-                if not content or not re.search(r'##\s*\[', content):
-                    md_file.unlink()
-                    logger.info(f"Removed empty file: {md_file}")
+            f.write("".join(chunks))
+        report['files_written'] += 1
+        logger.debug(f"Archived {len(memories)} memories to {archive_file}")
     
     def get_consolidation_history(self) -> List[Dict]:
         """获取整合历史"""
@@ -0,0 +1,141 @@
+"""
+记忆整合增量索引
+
+持久化记录每个记忆文件的状态，使整合只处理新增或变化的数据:
+- 文件: mtime、大小、内容哈希（mtime/大小未变则不读文件，哈希未变则不解析）
+- 条目: 已处理过的记忆 (ID + 时间)、正文哈希、MinHash 签名、过时判断所需的标记
+
+签名索引让新记忆无需重新解析历史文件即可找到相似的旧记忆；
+只有命中候选的旧文件才会被读取。索引以 JSON 保存，写入时原子替换。
+"""
+
+import base64
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+from loguru import logger
+
+INDEX_VERSION = 1
+
+
+def content_hash(text: str) -> str:
+    """条目正文哈希"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def file_hash(data: bytes) -> str:
+    """文件内容哈希"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def entry_key(memory_id: str, time_str: str) -> str:
+    """条目在文件内的键"""
+    return f"{memory_id} {time_str}"
+
+
+def encode_signature(signature: Optional[np.ndarray]) -> Optional[str]:
+    if signature is None:
+        return None
+    return base64.b64encode(np.asarray(signature, dtype=np.uint32).tobytes()).decode('ascii')
+
+
+def decode_signature(value: Optional[str]) -> Optional[np.ndarray]:
+    if not value:
+        return None
+    return np.frombuffer(base64.b64decode(value), dtype=np.uint32)
+
+
+class ConsolidationIndex:
+    """整合索引（文件状态 + 条目签名）
+
+    结构:
+        {"version": 1, "num_perm": 128, "files": {
+            "session/2026-02-13.md": {
+                "mtime": ..., "size": ..., "hash": "...",
+                "entries": {"31a784bc 08:05": {"hash": "...", "sig": "...", "temporary": true}}
+            }
+        }}
+
+    Example:
+        >>> index = ConsolidationIndex(memory_path / ".consolidation_index.json", num_perm=128)
+        >>> record = index.get_file("session/2026-02-13.md")
+        >>> index.set_file("session/2026-02-13.md", record)
+        >>> index.save()
+    """
+
+    def __init__(self, path: Path, num_perm: int = 128):
+        """
+        Args:
+            path: 索引文件路径
+            num_perm: MinHash 签名长度，与索引不一致时丢弃旧签名
+        """
+        self.path = Path(path)
+        self.num_perm = num_perm
+        self._files: Dict[str, Dict[str, Any]] = {}
+        self._loaded = False
+
+    def load(self):
+        """读取索引（只在首次使用时读取一次）"""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable consolidation index {self.path}: {e}")
+            return
+        if data.get('version') != INDEX_VERSION or data.get('num_perm') != self.num_perm:
+            logger.info("Consolidation index format changed, rebuilding")
+            return
+        self._files = data.get('files', {})
+
+    def save(self):
+        """原子写入索引"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {'version': INDEX_VERSION, 'num_perm': self.num_perm, 'files': self._files}
+        fd, tmp_name = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_name, self.path)
+        except Exception:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+
+    def get_file(self, rel_path: str) -> Optional[Dict[str, Any]]:
+        self.load()
+        return self._files.get(rel_path)
+
+    def set_file(self, rel_path: str, record: Dict[str, Any]):
+        self.load()
+        self._files[rel_path] = record
+
+    def drop_file(self, rel_path: str):
+        self.load()
+        self._files.pop(rel_path, None)
+
+    def retain(self, rel_paths: Iterable[str]):
+        """只保留给定文件的记录（清理已删除或超出整合窗口的文件）"""
+        self.load()
+        keep = set(rel_paths)
+        for rel_path in [p for p in self._files if p not in keep]:
+            del self._files[rel_path]
+
+    def clear(self):
+        self._files = {}
+        self._loaded = True
+
+    def get_stats(self) -> Dict[str, Any]:
+        self.load()
+        return {
+            'files': len(self._files),
+            'entries': sum(len(r.get('entries', {})) for r in self._files.values()),
+        }
@@ -0,0 +1,197 @@
+"""
+嵌入批处理服务
+
+把并发的单条嵌入请求在一个很短的时间窗口内合并成批次，
+一次调用编码器（SentenceTransformer.encode 列表 / Ollama 批量接口），
+再把结果分发回各个等待者。
+
+特点:
+- 第一个请求到达后最多等待 max_wait_ms，或凑满 max_batch_size 立即发车
+- 同一批次内相同文本只编码一次
+- 编码在线程池中执行，不阻塞事件循环
+- 记录批次大小、排队等待与编码耗时
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from loguru import logger
+
+
+class EmbeddingBatcher:
+    """嵌入微批处理器
+
+    Example:
+        >>> batcher = EmbeddingBatcher(lambda texts: model.encode(texts, convert_to_numpy=True))
+        >>> vec = await batcher.embed("hello")
+        >>> vecs = await batcher.embed_many(["a", "b", "c"])
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], Sequence],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        name: str = "embedding"
+    ):
+        """
+        Args:
+            encode_fn: 同步批量编码函数，输入文本列表，返回等长的向量序列
+            max_batch_size: 单批最大文本数
+            max_wait_ms: 第一个请求到达后最多等待的毫秒数
+            name: 日志与统计中使用的名称
+        """
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.name = name
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # 统计
+        self._batches = 0
+        self._texts = 0
+        self._encoded = 0
+        self._errors = 0
+        self._max_batch = 0
+        self._encode_ms: deque = deque(maxlen=1024)
+        self._wait_ms: deque = deque(maxlen=1024)
+
+    # ===== 公共接口 =====
+
+    async def embed(self, text: str) -> Optional[np.ndarray]:
+        """编码单条文本，失败时返回 None"""
+        return (await self.embed_many([text]))[0]
+
+    async def embed_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """编码多条文本（与其他并发请求合并成批次）"""
+        if not texts:
+            return []
+        self._ensure_worker()
+        loop = asyncio.get_running_loop()
+        now = time.perf_counter()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            await self._queue.put((text, future, now))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def close(self):
+        """停止后台批处理任务，未完成的请求返回 None"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._worker = None
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, future, _ = self._queue.get_nowait()
+                if not future.done():
+                    future.set_result(None)
+            self._queue = None
+        self._loop = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """批次大小与延迟统计"""
+        return {
+            "name": self.name,
+            "batches": self._batches,
+            "texts": self._texts,
+            "encoded": self._encoded,
+            "errors": self._errors,
+            "avg_batch_size": round(self._texts / self._batches, 2) if self._batches else 0.0,
+            "max_batch_size": self._max_batch,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "encode_ms": self._percentiles(self._encode_ms),
+            "queue_wait_ms": self._percentiles(self._wait_ms),
+        }
+
+    # ===== 内部实现 =====
+
+    @staticmethod
+    def _percentiles(samples: deque) -> Dict[str, float]:
+        if not samples:
+            return {"p50": 0.0, "p99": 0.0}
+        values = np.fromiter(samples, dtype=np.float64)
+        return {
+            "p50": round(float(np.percentile(values, 50)), 3),
+            "p99": round(float(np.percentile(values, 99)), 3),
+        }
+
+    def _ensure_worker(self):
+        """首次使用（或事件循环更换后）启动后台任务"""
+        loop = asyncio.get_running_loop()
+        if self._worker is not None and not self._worker.done() and self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._worker = loop.create_task(self._run())
+
+    async def _collect(self) -> List[tuple]:
+        """等待第一条请求，然后在时间窗口内尽量凑满批次"""
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            start = time.perf_counter()
+
+            # 批内去重
+            unique: Dict[str, int] = {}
+            for text, _, _ in batch:
+                unique.setdefault(text, len(unique))
+            texts = list(unique)
+
+            try:
+                vectors = await loop.run_in_executor(None, self.encode_fn, texts)
+                if len(vectors) != len(texts):
+                    raise ValueError(f"encoder returned {len(vectors)} vectors for {len(texts)} texts")
+                results = [
+                    np.asarray(v, dtype=np.float32) if v is not None and len(v) else None
+                    for v in vectors
+                ]
+            except asyncio.CancelledError:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_result(None)
+                raise
+            except Exception as e:
+                logger.error(f"{self.name} batch encode failed ({len(texts)} texts): {e}")
+                self._errors += 1
+                results = [None] * len(texts)
+
+            end = time.perf_counter()
+            for text, future, enqueued in batch:
+                self._wait_ms.append((start - enqueued) * 1000)
+                if not future.done():
+                    future.set_result(results[unique[text]])
+
+            self._batches += 1
+            self._texts += len(batch)
+            self._encoded += len(texts)
+            self._max_batch = max(self._max_batch, len(batch))
+            self._encode_ms.append((end - start) * 1000)
@@ -0,0 +1,283 @@
+"""
+两级嵌入缓存
+
+- L1: 进程内 LRU（按文本哈希），命中时不访问数据库
+- L2: SQLite embedding_cache 表，记录最近访问时间与字节数，
+  超过行数或字节上限时按最近访问时间淘汰到低水位
+
+访问时间不在每次命中时写回，而是累积后批量 UPDATE。
+数据库读写通过后端提供的 read / write_nowait 回调执行，
+与写线程组提交、只读连接池共用同一套连接。
+"""
+
+import hashlib
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List
+
+import numpy as np
+from loguru import logger
+
+from .quantization import decode_embedding, encode_embedding
+
+ReadFn = Callable[[Callable[[sqlite3.Connection], Any]], Awaitable[Any]]
+WriteFn = Callable[[Callable[[sqlite3.Connection], Any]], None]
+
+
+def text_hash(text: str) -> str:
+    """缓存键（与旧版 embedding_cache 表兼容）"""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def migrate_embedding_cache(conn: sqlite3.Connection):
+    """为旧版 embedding_cache 表补充 last_access / size_bytes 列与索引"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(embedding_cache)")}
+    if "last_access" not in columns:
+        conn.execute("ALTER TABLE embedding_cache ADD COLUMN last_access REAL")
+        conn.execute(
+            "UPDATE embedding_cache SET last_access = "
+            "COALESCE(CAST(strftime('%s', created_at) AS REAL), 0)"
+        )
+    if "size_bytes" not in columns:
+        conn.execute("ALTER TABLE embedding_cache ADD COLUMN size_bytes INTEGER")
+        conn.execute("UPDATE embedding_cache SET size_bytes = COALESCE(LENGTH(embedding), 0)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_embedding_cache_access ON embedding_cache(last_access)")
+
+
+class EmbeddingCache:
+    """两级嵌入缓存
+
+    Example:
+        >>> cache = EmbeddingCache(backend._read, backend._write_nowait)
+        >>> cache.load_totals(conn)
+        >>> found = await cache.get_many(hashes)
+        >>> cache.put_many({h: (preview, vector)})
+    """
+
+    def __init__(
+        self,
+        read: ReadFn,
+        write_nowait: WriteFn,
+        memory_entries: int = 4096,
+        max_rows: int = 200_000,
+        max_bytes: int = 512 * 1024 * 1024,
+        low_watermark: float = 0.9,
+        touch_batch: int = 256,
+        touch_interval_s: float = 30.0,
+        storage_dtype: str = "float32"
+    ):
+        """
+        Args:
+            read: 只读查询回调 (async fn(conn))
+            write_nowait: 异步写回调 (fn(conn))，不等待结果
+            memory_entries: 进程内 LRU 条数，0 关闭 L1
+            max_rows: SQLite 表最大行数，0 表示不限制
+            max_bytes: SQLite 表最大嵌入字节数，0 表示不限制
+            low_watermark: 淘汰后保留的比例
+            touch_batch: 累积多少次访问后批量写回访问时间
+            touch_interval_s: 最长多久写回一次访问时间
+            storage_dtype: SQLite 表中嵌入的存储精度 ("float32" / "float16" / "int8")
+        """
+        self._read = read
+        self._write_nowait = write_nowait
+        self.memory_entries = max(0, memory_entries)
+        self.max_rows = max(0, max_rows)
+        self.max_bytes = max(0, max_bytes)
+        self.low_watermark = min(max(low_watermark, 0.0), 1.0)
+        self.touch_batch = max(1, touch_batch)
+        self.touch_interval = touch_interval_s
+        self.storage_dtype = storage_dtype
+
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._memory_bytes = 0
+        self._touched: Dict[str, float] = {}
+        self._last_touch_flush = time.monotonic()
+        self._evicting = False
+
+        # SQLite 表规模（启动时读取，写入/淘汰时维护）
+        self._disk_rows = 0
+        self._disk_bytes = 0
+
+        # 统计
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._memory_evictions = 0
+        self._disk_evictions = 0
+        self._bytes_written = 0
+
+    def load_totals(self, conn: sqlite3.Connection):
+        """读取 SQLite 表当前的行数与字节数（初始化时调用）"""
+        self._disk_rows, self._disk_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM embedding_cache"
+        ).fetchone()
+
+    async def get_many(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """批量查询，先查 L1 再一次性查询 L2
+
+        Returns:
+            命中的 {hash: 向量}
+        """
+        found: Dict[str, np.ndarray] = {}
+        pending = []
+        for h in dict.fromkeys(hashes):
+            vec = self._memory.get(h)
+            if vec is not None:
+                self._memory.move_to_end(h)
+                found[h] = vec
+            else:
+                pending.append(h)
+        self._memory_hits += len(found)
+
+        if pending:
+            def lookup(conn) -> Dict[str, np.ndarray]:
+                rows = {}
+                for i in range(0, len(pending), 500):
+                    chunk = pending[i:i + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    cursor = conn.execute(
+                        f"SELECT text_hash, embedding FROM embedding_cache WHERE text_hash IN ({placeholders})",
+                        chunk
+                    )
+                    for row in cursor.fetchall():
+                        if row[1]:
+                            rows[row[0]] = decode_embedding(row[1])
+                return rows
+
+            disk = await self._read(lookup)
+            self._disk_hits += len(disk)
+            self._misses += len(pending) - len(disk)
+            for h, vec in disk.items():
+                self._remember(h, vec)
+            found.update(disk)
+
+        self._touch(found.keys())
+        return found
+
+    def put_many(self, items: Dict[str, tuple]):
+        """写入新编码的嵌入
+
+        Args:
+            items: {hash: (文本预览, 向量)}
+        """
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for h, (preview, vec) in items.items():
+            vec = np.asarray(vec, dtype=np.float32)
+            self._remember(h, vec)
+            blob = encode_embedding(vec, self.storage_dtype)
+            rows.append((h, preview, blob, now, len(blob)))
+            self._disk_bytes += len(blob)
+            self._bytes_written += len(blob)
+        self._disk_rows += len(rows)
+
+        self._write_nowait(lambda conn: conn.executemany(
+            "INSERT OR REPLACE INTO embedding_cache "
+            "(text_hash, text_preview, embedding, last_access, size_bytes) VALUES (?, ?, ?, ?, ?)",
+            rows
+        ))
+        self._maybe_evict()
+
+    def flush(self):
+        """把累积的访问时间写回 SQLite"""
+        if not self._touched:
+            return
+        updates = [(ts, h) for h, ts in self._touched.items()]
+        self._touched = {}
+        self._last_touch_flush = time.monotonic()
+        self._write_nowait(lambda conn: conn.executemany(
+            "UPDATE embedding_cache SET last_access = ? WHERE text_hash = ?", updates
+        ))
+
+    def clear_memory(self):
+        """清空进程内 LRU"""
+        self._memory.clear()
+        self._memory_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self._memory_hits + self._disk_hits + self._misses
+        hits = self._memory_hits + self._disk_hits
+        return {
+            "memory_hits": self._memory_hits,
+            "disk_hits": self._disk_hits,
+            "misses": self._misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_rows": self._disk_rows,
+            "disk_bytes": self._disk_bytes,
+            "bytes_written": self._bytes_written,
+            "memory_evictions": self._memory_evictions,
+            "disk_evictions": self._disk_evictions,
+            "pending_touches": len(self._touched),
+        }
+
+    # ===== 内部实现 =====
+
+    def _remember(self, h: str, vec: np.ndarray):
+        if self.memory_entries == 0:
+            return
+        old = self._memory.pop(h, None)
+        if old is not None:
+            self._memory_bytes -= old.nbytes
+        self._memory[h] = vec
+        self._memory_bytes += vec.nbytes
+        while len(self._memory) > self.memory_entries:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+            self._memory_evictions += 1
+
+    def _touch(self, hashes):
+        now = time.time()
+        for h in hashes:
+            self._touched[h] = now
+        if (len(self._touched) >= self.touch_batch
+                or time.monotonic() - self._last_touch_flush >= self.touch_interval):
+            self.flush()
+
+    def _over_limit(self) -> bool:
+        return bool(
+            (self.max_rows and self._disk_rows > self.max_rows)
+            or (self.max_bytes and self._disk_bytes > self.max_bytes)
+        )
+
+    def _maybe_evict(self):
+        """超过上限时按最近访问时间淘汰到低水位"""
+        if self._evicting or not self._over_limit():
+            return
+        self._evicting = True
+        # 先写回访问时间，避免淘汰刚被访问过的条目
+        self.flush()
+
+        target_rows = int(self.max_rows * self.low_watermark) if self.max_rows else None
+        target_bytes = int(self.max_bytes * self.low_watermark) if self.max_bytes else None
+
+        def evict(conn):
+            try:
+                rows, total = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM embedding_cache"
+                ).fetchone()
+                remove = 0
+                if target_rows is not None and rows > target_rows:
+                    remove = rows - target_rows
+                if target_bytes is not None and total > target_bytes and rows:
+                    avg = total / rows
+                    remove = max(remove, int((total - target_bytes) / avg) + 1)
+                if remove:
+                    conn.execute(
+                        "DELETE FROM embedding_cache WHERE text_hash IN ("
+                        "SELECT text_hash FROM embedding_cache ORDER BY last_access LIMIT ?)",
+                        (remove,)
+                    )
+                    self._disk_evictions += remove
+                    logger.debug(f"Evicted {remove} embedding cache rows")
+                self._disk_rows, self._disk_bytes = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM embedding_cache"
+                ).fetchone()
+            finally:
+                self._evicting = False
+
+        self._write_nowait(evict)
@@ -0,0 +1,242 @@
+"""
+共享嵌入模型注册表
+
+同一进程内所有记忆后端（Hybrid 的 SQLite/Chroma、Tiered 的三层、
+SubAgent 的隔离记忆）按模型名共享同一份权重:
+- 引用计数: 后端 acquire 得到句柄，close 时 release；引用归零即卸载
+- 延迟加载: 第一次 encode 时才加载模型
+- 空闲卸载: 超过 idle_unload_s 未使用的模型在后台卸载，下次 encode 时重新加载
+
+编码在调用方线程执行（通常是嵌入批处理器的线程池），加载/卸载由锁保护，
+正在编码的模型不会被卸载。
+"""
+
+import gc
+import importlib.util
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from loguru import logger
+
+ModelLoader = Callable[[str], Any]
+
+
+def _load_sentence_transformer(model_name: str) -> Any:
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+class _ModelEntry:
+    """单个模型的状态"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.model: Any = None
+        self.refs = 0
+        self.active = 0
+        self.last_used = time.monotonic()
+        self.loads = 0
+        self.unloads = 0
+        self.encodes = 0
+        self.load_ms = 0.0
+
+
+class EmbeddingModelHandle:
+    """模型句柄，接口与 SentenceTransformer.encode 兼容
+
+    Example:
+        >>> handle = embedding_registry.acquire("BAAI/bge-m3")
+        >>> vectors = handle.encode(["hello"], convert_to_numpy=True)
+        >>> handle.release()
+    """
+
+    def __init__(self, registry: "EmbeddingModelRegistry", name: str):
+        self._registry = registry
+        self.model_name = name
+        self._released = False
+
+    def encode(self, texts, **kwargs):
+        if self._released:
+            raise RuntimeError(f"Embedding model handle for {self.model_name} already released")
+        return self._registry._encode(self.model_name, texts, **kwargs)
+
+    def release(self):
+        """释放引用（重复调用无效）"""
+        if not self._released:
+            self._released = True
+            self._registry._release(self.model_name)
+
+
+class EmbeddingModelRegistry:
+    """进程级嵌入模型注册表"""
+
+    def __init__(
+        self,
+        loader: Optional[ModelLoader] = None,
+        idle_unload_s: float = 600.0,
+        check_interval_s: float = 60.0
+    ):
+        """
+        Args:
+            loader: 按模型名加载模型的函数（默认 SentenceTransformer）
+            idle_unload_s: 空闲多久后卸载模型，<= 0 表示不因空闲卸载
+            check_interval_s: 空闲检查间隔
+        """
+        self._loader = loader
+        self.idle_unload_s = idle_unload_s
+        self.check_interval_s = check_interval_s
+        self._entries: Dict[str, _ModelEntry] = {}
+        self._lock = threading.RLock()
+        self._reaper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def configure(
+        self,
+        loader: Optional[ModelLoader] = None,
+        idle_unload_s: Optional[float] = None,
+        check_interval_s: Optional[float] = None
+    ):
+        """调整加载函数与空闲卸载参数"""
+        with self._lock:
+            if loader is not None:
+                self._loader = loader
+            if idle_unload_s is not None:
+                self.idle_unload_s = idle_unload_s
+            if check_interval_s is not None:
+                self.check_interval_s = check_interval_s
+
+    def is_available(self) -> bool:
+        """能否加载模型（未设置自定义加载函数时检查 sentence-transformers 是否安装）"""
+        if self._loader is not None:
+            return True
+        return importlib.util.find_spec("sentence_transformers") is not None
+
+    def acquire(self, model_name: str) -> EmbeddingModelHandle:
+        """获取模型句柄（不立即加载）"""
+        with self._lock:
+            entry = self._entries.get(model_name)
+            if entry is None:
+                entry = self._entries[model_name] = _ModelEntry(model_name)
+            entry.refs += 1
+        return EmbeddingModelHandle(self, model_name)
+
+    def unload_idle(self) -> int:
+        """卸载空闲超时的模型
+
+        Returns:
+            卸载的模型数
+        """
+        if self.idle_unload_s <= 0:
+            return 0
+        now = time.monotonic()
+        unloaded = 0
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.model is not None and entry.active == 0 \
+                        and now - entry.last_used >= self.idle_unload_s:
+                    self._unload(entry, reason="idle")
+                    unloaded += 1
+        if unloaded:
+            gc.collect()
+        return unloaded
+
+    def shutdown(self):
+        """停止后台检查并卸载所有模型"""
+        self._stop.set()
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.model is not None:
+                    self._unload(entry, reason="shutdown")
+            self._entries.clear()
+        gc.collect()
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "idle_unload_s": self.idle_unload_s,
+                "models": {
+                    name: {
+                        "refs": entry.refs,
+                        "loaded": entry.model is not None,
+                        "loads": entry.loads,
+                        "unloads": entry.unloads,
+                        "encodes": entry.encodes,
+                        "load_ms": round(entry.load_ms, 1),
+                        "idle_s": round(now - entry.last_used, 1),
+                    }
+                    for name, entry in self._entries.items()
+                },
+            }
+
+    # ===== 内部实现 =====
+
+    def _encode(self, model_name: str, texts, **kwargs):
+        with self._lock:
+            entry = self._entries.get(model_name)
+            if entry is None or entry.refs == 0:
+                raise RuntimeError(f"Embedding model {model_name} is not acquired")
+            if entry.model is None:
+                self._load(entry)
+            entry.active += 1
+            model = entry.model
+        try:
+            return model.encode(texts, **kwargs)
+        finally:
+            with self._lock:
+                entry.active -= 1
+                entry.encodes += 1
+                entry.last_used = time.monotonic()
+
+    def _load(self, entry: _ModelEntry):
+        """加载模型（调用方持有锁）"""
+        loader = self._loader or _load_sentence_transformer
+        start = time.perf_counter()
+        entry.model = loader(entry.name)
+        entry.load_ms = (time.perf_counter() - start) * 1000
+        entry.loads += 1
+        entry.last_used = time.monotonic()
+        logger.info(f"Loaded embedding model: {entry.name} ({entry.load_ms:.0f}ms)")
+        self._ensure_reaper()
+
+    def _unload(self, entry: _ModelEntry, reason: str):
+        entry.model = None
+        entry.unloads += 1
+        logger.info(f"Unloaded embedding model: {entry.name} ({reason})")
+
+    def _release(self, model_name: str):
+        with self._lock:
+            entry = self._entries.get(model_name)
+            if entry is None:
+                return
+            entry.refs -= 1
+            if entry.refs > 0:
+                return
+            if entry.model is not None and entry.active == 0:
+                self._unload(entry, reason="no references")
+            if entry.active == 0:
+                del self._entries[model_name]
+        gc.collect()
+
+    def _ensure_reaper(self):
+        if self.idle_unload_s <= 0 or (self._reaper is not None and self._reaper.is_alive()):
+            return
+        self._stop.clear()
+        self._reaper = threading.Thread(target=self._reap_loop, name="embedding-model-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap_loop(self):
+        while not self._stop.wait(self.check_interval_s):
+            try:
+                self.unload_idle()
+            except Exception as e:
+                logger.warning(f"Embedding model idle check failed: {e}")
+            with self._lock:
+                if not any(entry.model is not None for entry in self._entries.values()):
+                    self._reaper = None
+                    return
+
+
+# 全局注册表
+embedding_registry = EmbeddingModelRegistry()
@@ -4,27 +4,32 @@
 ChromaDB: 负责向量存储和语义搜索
 SQLite: 负责关键词索引、元数据、缓存
 
-支持内存不足时自动降级为纯 SQLite 模式
+支持内存不足时自动降级为纯 SQLite 模式:
+- 后台监控可用内存（限速采样 + 滞回），请求路径不再调用 psutil
+- 内存恢复后在后台预热 ChromaDB 客户端与嵌入模型，预热完成前请求继续走 SQLite
+- ChromaDB 落后期间的写入与删除按序号记入持久化变更日志 (change_log.py)，
+  恢复后由后台追赶任务分批回放，进程重启后从已应用水位继续
 """
 
 import asyncio
 import logging
+import json
+import time
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Tuple
 
 import numpy as np
 
 from .base import MemoryBackend, MemoryEntry, MemoryLevel
+from .change_log import OP_ADD, OP_DELETE, ChangeLog
+from .quantization import decode_embedding
+from .resource_monitor import HAS_PSUTIL, MemoryPressureMonitor
 
 logger = logging.getLogger(__name__)
 
-# 尝试导入 psutil，如果不可用则使用模拟
-try:
-    import psutil
-    HAS_PSUTIL = True
-except ImportError:
-    HAS_PSUTIL = False
+if not HAS_PSUTIL:
     logger.warning("psutil not installed, memory monitoring disabled")
 
 
@@ -46,8 +51,17 @@ class HybridConfig:
     
     # 内存阈值 (MB)
     memory_threshold_mb: int = 500  # 可用内存 < 500MB 时降级
+    memory_recover_mb: Optional[int] = None  # 可用内存 >= 该值才计入恢复，默认阈值的 1.5 倍
+    memory_recover_samples: int = 3  # 连续多少次采样充足才恢复
     memory_check_interval: int = 60  # 每 60 秒检查一次
     
+    # 恢复混合模式
+    warm_up_retry_s: float = 60.0  # ChromaDB 预热/追赶失败后的重试间隔
+    
+    # ChromaDB 追赶同步
+    change_log_path: Optional[str] = None  # 默认与 SQLite 同目录的 .changes.db
+    sync_batch_size: int = 256  # 每批回放的变更数
+    
     # 降级模式配置
     fallback_mode: str = "auto"  # "auto", "never", "always"
 
@@ -62,7 +76,7 @@ class HybridMemoryBackend(MemoryBackend):
     特性:
     - 并行查询两个后端
     - RRF 算法合并结果
-    - 内存不足时自动降级为 SQLite-only
+    - 内存不足时自动降级为 SQLite-only，恢复时后台预热并按变更日志追赶 ChromaDB
     """
     
     def __init__(self, config: Optional[HybridConfig] = None):
@@ -90,89 +104,277 @@ class HybridMemoryBackend(MemoryBackend):
         
         # 状态
         self._degraded_mode = False  # 降级模式标志
-        self._last_memory_check = 0
         self._initialized = False
         
+        # 内存监控（后台采样，请求路径只读状态）
+        self._monitor = MemoryPressureMonitor(
+            low_mb=self.config.memory_threshold_mb,
+            recover_mb=self.config.memory_recover_mb,
+            interval_s=self.config.memory_check_interval,
+            recover_samples=self.config.memory_recover_samples,
+            on_change=self._on_memory_change
+        )
+        
+        # 后台预热
+        self._warm_up_task: Optional[asyncio.Task] = None
+        self._next_warm_up = 0.0
+        self._warm_ups = 0
+        
+        # ChromaDB 变更日志与追赶任务
+        self._change_log = ChangeLog(
+            self.config.change_log_path or Path(self.config.sqlite_path).with_suffix(".changes.db")
+        )
+        self._catch_up_task: Optional[asyncio.Task] = None
+        self._next_catch_up = 0.0
+        self._replayed = 0
+        self._replay_batches = 0
+        self._last_sync_error: Optional[str] = None
+        
         logger.info(f"HybridMemoryBackend configured:")
         logger.info(f"  SQLite: {self.config.sqlite_path}")
         logger.info(f"  ChromaDB: {self.config.chroma_path}")
         logger.info(f"  Memory threshold: {self.config.memory_threshold_mb}MB")
     
+    def _create_chroma(self):
+        return self._ChromaMemoryBackend(
+            path=self.config.chroma_path,
+            embedding_provider=self.config.embedding_provider,
+            embedding_model=self.config.embedding_model,
+            ollama_url=self.config.ollama_url,
+            openai_api_key=self.config.openai_api_key,
+            auto_archive=True
+        )
+    
     @property
     def chroma(self) -> Optional[Any]:
         """延迟初始化 ChromaDB"""
         if self._chroma is None and not self._degraded_mode:
             try:
-                self._chroma = self._ChromaMemoryBackend(
-                    path=self.config.chroma_path,
-                    embedding_provider=self.config.embedding_provider,
-                    embedding_model=self.config.embedding_model,
-                    ollama_url=self.config.ollama_url,
-                    openai_api_key=self.config.openai_api_key,
-                    auto_archive=True
-                )
+                self._chroma = self._create_chroma()
             except Exception as e:
                 logger.warning(f"Failed to init ChromaDB, switching to degraded mode: {e}")
                 self._enter_degraded_mode()
         return self._chroma
     
     def _check_memory(self) -> bool:
-        """检查内存是否充足
+        """检查内存是否充足（限速采样，间隔内返回缓存状态）
         
         Returns:
             True: 内存充足
             False: 内存不足，应降级
         """
-        if not HAS_PSUTIL:
-            return True  # 无法检测时假设充足
-        
-        try:
-            mem = psutil.virtual_memory()
-            available_mb = mem.available / (1024 * 1024)
-            return available_mb > self.config.memory_threshold_mb
-        except Exception:
-            return True  # 无法检测时假设充足
+        return not self._monitor.sample()
+    
+    def _should_degrade(self) -> bool:
+        """按配置与当前内存状态判断是否应处于降级模式"""
+        if self.config.fallback_mode == "always":
+            return True
+        if self.config.fallback_mode == "never":
+            return False
+        return self._monitor.low_memory
     
     def _enter_degraded_mode(self):
         """进入降级模式 (纯 SQLite)"""
         if not self._degraded_mode:
             logger.warning("🔻 Entering degraded mode (SQLite only) due to low memory")
             self._degraded_mode = True
-            self._chroma = None  # 释放 ChromaDB
+            chroma, self._chroma = self._chroma, None  # 释放 ChromaDB
+            if chroma is not None:
+                try:
+                    asyncio.get_running_loop().create_task(chroma.close())
+                except RuntimeError:
+                    pass
     
     def _exit_degraded_mode(self):
         """退出降级模式 (恢复混合)"""
         if self._degraded_mode:
             logger.info("🔺 Exiting degraded mode (restoring hybrid)")
             self._degraded_mode = False
-            # ChromaDB 会在下次访问时自动初始化
+            # 未经预热时 ChromaDB 会在下次访问时自动初始化
     
-    async def _maybe_switch_mode(self):
-        """根据需要切换模式"""
-        if self.config.fallback_mode == "always":
+    def _on_memory_change(self, low_memory: bool):
+        """内存监控状态变化回调"""
+        if self.config.fallback_mode != "auto":
+            return
+        if low_memory:
             self._enter_degraded_mode()
+        else:
+            self._schedule_warm_up()
+    
+    def _schedule_warm_up(self):
+        """在后台预热 ChromaDB（已在预热或处于重试间隔内时忽略）"""
+        if not self._degraded_mode or not self._initialized:
             return
-        
-        if self.config.fallback_mode == "never":
+        if self._warm_up_task is not None and not self._warm_up_task.done():
+            return
+        if time.monotonic() < self._next_warm_up:
+            return
+        self._warm_up_task = asyncio.create_task(self._warm_up_chroma())
+    
+    async def _warm_up_chroma(self):
+        """预热 ChromaDB 与嵌入模型后切回混合模式，并启动变更日志追赶"""
+        self._warm_ups += 1
+        chroma = self._create_chroma()
+        try:
+            start = time.perf_counter()
+            await chroma.warm_up()
+            if self._should_degrade():
+                # 预热期间内存再次紧张
+                await chroma.close()
+                return
+            self._chroma = chroma
             self._exit_degraded_mode()
+            logger.info(f"ChromaDB warmed up in {time.perf_counter() - start:.1f}s")
+            self._schedule_catch_up()
+        except Exception as e:
+            logger.warning(f"ChromaDB warm-up failed, staying in degraded mode: {e}")
+            self._next_warm_up = time.monotonic() + self.config.warm_up_retry_s
+            try:
+                await chroma.close()
+            except Exception:
+                pass
+    
+    def _in_sync(self) -> bool:
+        """ChromaDB 可用且没有待回放的变更时，写入可直接同步到 ChromaDB"""
+        return not self._degraded_mode and self._change_log.pending == 0
+    
+    async def _log_change(self, op: str, memory_ids: List[str]):
+        """记入变更日志（always 模式从不使用 ChromaDB，不记录）
+        
+        追加在线程池中执行：synchronous=FULL 的提交会 fsync，不阻塞事件循环。
+        """
+        if self.config.fallback_mode == "always":
+            return
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, self._change_log.append, op, memory_ids)
+        except Exception as e:
+            logger.error(f"Failed to append to change log, ChromaDB may miss {len(memory_ids)} changes: {e}")
+    
+    async def _write_chroma(self, fn) -> bool:
+        """在 ChromaDB 上执行 fn(chroma)，不可用或失败时返回 False"""
+        chroma = self.chroma if not self._degraded_mode else None
+        if chroma is None:
+            return False
+        try:
+            await fn(chroma)
+            return True
+        except Exception as e:
+            logger.warning(f"ChromaDB write failed, deferring to change log: {e}")
+            return False
+    
+    def _schedule_catch_up(self):
+        """有待回放变更且 ChromaDB 可用时启动后台追赶任务"""
+        if not self._initialized or self._degraded_mode or self._change_log.pending == 0:
+            return
+        if self._catch_up_task is not None and not self._catch_up_task.done():
             return
+        if time.monotonic() < self._next_catch_up:
+            return
+        self._catch_up_task = asyncio.create_task(self._catch_up())
+    
+    async def _catch_up(self):
+        """按序号分批把变更日志回放到 ChromaDB，每批完成后推进水位"""
+        chroma = self.chroma
+        loop = asyncio.get_event_loop()
+        start_pending = self._change_log.pending
+        try:
+            while not self._degraded_mode and chroma is not None and self._chroma is chroma:
+                batch = await loop.run_in_executor(
+                    None, self._change_log.read_after, self._change_log.applied_seq, self.config.sync_batch_size
+                )
+                if not batch:
+                    break
+                await self._apply_changes(chroma, batch)
+                await loop.run_in_executor(None, self._change_log.mark_applied, batch[-1][0])
+                self._replayed += len(batch)
+                self._replay_batches += 1
+            self._last_sync_error = None
+            if start_pending and self._change_log.pending == 0:
+                logger.info(f"ChromaDB caught up: replayed {start_pending} changes")
+        except Exception as e:
+            self._last_sync_error = str(e)
+            self._next_catch_up = time.monotonic() + self.config.warm_up_retry_s
+            logger.warning(f"ChromaDB catch-up failed at seq {self._change_log.applied_seq}, will retry: {e}")
+    
+    async def _apply_changes(self, chroma, batch: List[Tuple[int, str, str]]):
+        """回放一批变更：连续的同类操作合并为一次 add_many / delete_many"""
+        runs: List[Tuple[str, List[str]]] = []
+        for _, op, memory_id in batch:
+            if runs and runs[-1][0] == op:
+                runs[-1][1].append(memory_id)
+            else:
+                runs.append((op, [memory_id]))
+        
+        for op, memory_ids in runs:
+            memory_ids = list(dict.fromkeys(memory_ids))
+            if op == OP_DELETE:
+                await chroma.delete_many(memory_ids)
+                continue
+            entries = await self._load_entries(memory_ids)
+            if entries:
+                # SQLite 写入时已去重，ChromaDB 按 ID upsert
+                await chroma.add_many(entries, dedup_threshold=1.1)
+    
+    async def _load_entries(self, memory_ids: List[str]) -> List[MemoryEntry]:
+        """从 SQLite 读取记忆（已删除或被去重跳过的 ID 不返回）
         
-        # auto 模式
-        has_memory = self._check_memory()
-        if has_memory and self._degraded_mode:
-            self._exit_degraded_mode()
-        elif not has_memory and not self._degraded_mode:
+        两边使用同一本地模型时复用 SQLite 中的嵌入，回放无需重新编码。
+        """
+        reuse_embeddings = self.config.embedding_provider == "local"
+        columns = "id, content, metadata, level, created_at" + (", embedding" if reuse_embeddings else "")
+        
+        def load(conn):
+            rows = []
+            for i in range(0, len(memory_ids), 500):
+                chunk = memory_ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows.extend(conn.execute(
+                    f"SELECT {columns} FROM memories WHERE id IN ({placeholders})", chunk
+                ).fetchall())
+            return rows
+        
+        rows = await self.sqlite._read(load)
+        entries = []
+        for row in rows:
+            try:
+                created_at = datetime.fromisoformat(row['created_at']) if row['created_at'] else None
+            except (TypeError, ValueError):
+                created_at = None
+            embedding = None
+            if reuse_embeddings and row['embedding']:
+                embedding = decode_embedding(row['embedding']).tolist()
+            entries.append(MemoryEntry(
+                content=row['content'],
+                metadata=json.loads(row['metadata'] or '{}'),
+                level=row['level'],
+                embedding=embedding,
+                memory_id=row['id'],
+                created_at=created_at
+            ))
+        return entries
+    
+    async def _maybe_switch_mode(self):
+        """根据需要切换模式（只读取监控状态，不在请求路径上采样）"""
+        if self._should_degrade():
             self._enter_degraded_mode()
+        elif self._degraded_mode:
+            self._schedule_warm_up()
+        else:
+            self._schedule_catch_up()
     
     async def initialize(self):
         """初始化后端"""
         if self._initialized:
             return
         
-        # 初始化 SQLite
+        # 初始化 SQLite 与变更日志
         await self.sqlite.initialize()
+        await asyncio.get_event_loop().run_in_executor(None, self._change_log.open)
         
         # 根据内存情况决定是否初始化 ChromaDB
+        if self.config.fallback_mode == "auto":
+            self._monitor.sample(force=True)
+            self._monitor.start()
         await self._maybe_switch_mode()
         
         if not self._degraded_mode and self.chroma:
@@ -186,6 +388,9 @@ class HybridMemoryBackend(MemoryBackend):
         
         mode_str = "degraded (SQLite only)" if self._degraded_mode else "hybrid (SQLite + ChromaDB)"
         logger.info(f"HybridMemoryBackend initialized in {mode_str} mode")
+        
+        # 上次运行遗留的变更
+        self._schedule_catch_up()
     
     async def add(self, entry: MemoryEntry) -> str:
         """添加记忆
@@ -197,18 +402,50 @@ class HybridMemoryBackend(MemoryBackend):
         
         await self._maybe_switch_mode()
         
+        # ChromaDB 落后时先记日志再写 SQLite，崩溃后仍能补写
+        in_sync = self._in_sync()
+        if not in_sync:
+            await self._log_change(OP_ADD, [entry.memory_id])
+        
         # 始终写入 SQLite
         sqlite_id = await self.sqlite.add(entry)
         
-        # 如果未降级，也写入 ChromaDB
-        if not self._degraded_mode and self.chroma:
-            try:
-                await self.chroma.add(entry)
-            except Exception as e:
-                logger.warning(f"Failed to add to ChromaDB: {e}")
+        # 同步状态下直接写入 ChromaDB，失败时转入变更日志
+        if in_sync and not await self._write_chroma(lambda chroma: chroma.add(entry)):
+            await self._log_change(OP_ADD, [entry.memory_id])
+        self._schedule_catch_up()
         
         return sqlite_id
     
+    async def add_many(self, entries: List[MemoryEntry], dedup_threshold: float = 0.95) -> List[str]:
+        """批量添加记忆
+        
+        先批量写入 SQLite，未降级时再批量写入 ChromaDB
+        
+        Args:
+            entries: 记忆条目列表
+            dedup_threshold: 近重复相似度阈值（SQLite 按此去重，ChromaDB 随之写入）
+        """
+        if not self._initialized:
+            await self.initialize()
+        
+        await self._maybe_switch_mode()
+        
+        memory_ids = [entry.memory_id for entry in entries]
+        in_sync = self._in_sync()
+        if not in_sync:
+            await self._log_change(OP_ADD, memory_ids)
+        
+        ids = await self.sqlite.add_many(entries, dedup_threshold=dedup_threshold)
+        
+        if in_sync and not await self._write_chroma(
+            lambda chroma: chroma.add_many(entries, dedup_threshold=dedup_threshold)
+        ):
+            await self._log_change(OP_ADD, memory_ids)
+        self._schedule_catch_up()
+        
+        return ids
+    
     async def search(
         self, 
         query: str, 
@@ -291,21 +528,51 @@ class HybridMemoryBackend(MemoryBackend):
     async def delete(self, memory_id: str) -> bool:
         """删除记忆"""
         # 从两边都删除
+        in_sync = self._in_sync()
+        if not in_sync:
+            await self._log_change(OP_DELETE, [memory_id])
+        
         sqlite_ok = await self.sqlite.delete(memory_id)
         
-        if not self._degraded_mode and self.chroma:
-            try:
-                await self.chroma.delete(memory_id)
-            except Exception as e:
-                logger.warning(f"Failed to delete from ChromaDB: {e}")
+        if in_sync and not await self._write_chroma(lambda chroma: chroma.delete(memory_id)):
+            await self._log_change(OP_DELETE, [memory_id])
+        self._schedule_catch_up()
         
         return sqlite_ok
     
+    async def delete_many(self, memory_ids: List[str]) -> int:
+        """批量删除记忆（两边各一次批量删除）"""
+        memory_ids = list(memory_ids)
+        in_sync = self._in_sync()
+        if not in_sync:
+            await self._log_change(OP_DELETE, memory_ids)
+        
+        deleted = await self.sqlite.delete_many(memory_ids)
+        
+        if in_sync and not await self._write_chroma(lambda chroma: chroma.delete_many(memory_ids)):
+            await self._log_change(OP_DELETE, memory_ids)
+        self._schedule_catch_up()
+        
+        return deleted
+    
     async def get_by_level(self, level: MemoryLevel) -> List[Dict[str, Any]]:
         """获取特定级别的所有记忆"""
         # 从 SQLite 获取，因为它有更全面的元数据
         return await self.sqlite.get_by_level(level)
     
+    async def get_by_age(
+        self,
+        min_days: int,
+        max_days: Optional[int] = None,
+        level: Optional[MemoryLevel] = None,
+        limit: Optional[int] = None,
+        include_embeddings: bool = False
+    ) -> List[Dict[str, Any]]:
+        """按年龄查询记忆（走 SQLite 的 created_at 索引）"""
+        return await self.sqlite.get_by_age(
+            min_days, max_days=max_days, level=level, limit=limit, include_embeddings=include_embeddings
+        )
+    
     async def get_stats(self) -> Dict[str, Any]:
         """获取统计信息"""
         sqlite_stats = await self.sqlite.get_stats()
@@ -313,37 +580,54 @@ class HybridMemoryBackend(MemoryBackend):
         stats = {
             "mode": "degraded" if self._degraded_mode else "hybrid",
             "sqlite": sqlite_stats,
-            "chroma": None
+            "chroma": None,
+            "warming_up": self._warm_up_task is not None and not self._warm_up_task.done(),
+            "warm_ups": self._warm_ups,
+            "sync": {
+                **self._change_log.get_stats(),
+                "catching_up": self._catch_up_task is not None and not self._catch_up_task.done(),
+                "replayed": self._replayed,
+                "batches": self._replay_batches,
+                "last_error": self._last_sync_error
+            }
         }
         
-        if not self._degraded_mode and self.chroma:
+        if not self._degraded_mode and self._chroma is not None:
             try:
-                stats["chroma"] = await self.chroma.get_stats()
+                stats["chroma"] = await self._chroma.get_stats()
             except Exception as e:
                 logger.warning(f"Failed to get ChromaDB stats: {e}")
         
-        # 添加内存信息
+        # 添加内存信息（后台监控最近一次采样）
         if HAS_PSUTIL:
-            try:
-                mem = psutil.virtual_memory()
-                stats["system_memory"] = {
-                    "available_mb": mem.available / (1024 * 1024),
-                    "threshold_mb": self.config.memory_threshold_mb,
-                    "percent_used": mem.percent
-                }
-            except Exception:
-                pass
+            stats["system_memory"] = {
+                **self._monitor.get_stats(),
+                "threshold_mb": self.config.memory_threshold_mb
+            }
         
         return stats
     
     async def close(self):
         """关闭后端"""
+        await self._monitor.stop()
+        for task in (self._warm_up_task, self._catch_up_task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._warm_up_task = None
+        self._catch_up_task = None
+        self._change_log.close()
+        
         # 关闭 SQLite
         await self.sqlite.close()
         
         # 关闭 ChromaDB (如果已初始化)
-        if self.chroma:
-            await self.chroma.close()
+        if self._chroma is not None:
+            await self._chroma.close()
+            self._chroma = None
         
         self._initialized = False
         logger.info("HybridMemoryBackend closed")
@@ -369,7 +653,12 @@ async def create_hybrid_backend(config: Optional[Dict] = None) -> HybridMemoryBa
             openai_api_key=config.get("openai_api_key"),
             rrf_k=config.get("rrf_k", 60),
             memory_threshold_mb=config.get("memory_threshold_mb", 500),
+            memory_recover_mb=config.get("memory_recover_mb"),
+            memory_recover_samples=config.get("memory_recover_samples", 3),
             memory_check_interval=config.get("memory_check_interval", 60),
+            warm_up_retry_s=config.get("warm_up_retry_s", 60.0),
+            change_log_path=config.get("change_log_path"),
+            sync_batch_size=config.get("sync_batch_size", 256),
             fallback_mode=config.get("fallback_mode", "auto")
         )
     else:
@@ -0,0 +1,129 @@
+"""
+MinHash + LSH 近重复检索
+
+用于记忆整合时的相似记忆分组:
+- tokenize: 与原 Jaccard 相似度一致的分词（小写、去标点、过滤短词）
+- MinHasher: numpy 向量化计算 MinHash 签名，哈希稳定（跨进程可持久化）
+- MinHashLSH: 按 band 分桶，只有落入同一桶的记忆才成为候选对
+
+对 Jaccard 阈值 t，自动选择 bands × rows，使 S 曲线拐点接近 t。
+"""
+
+import re
+import zlib
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r'[^\w\s]')
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def tokenize(text: str) -> frozenset:
+    """分词（小写，标点替换为空格，过滤长度 <= 2 的词）"""
+    text = _TOKEN_RE.sub(' ', text.lower())
+    return frozenset(w for w in text.split() if len(w) > 2)
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    """两个词集的 Jaccard 相似度"""
+    if not a or not b:
+        return 0.0
+    intersection = len(a & b)
+    return intersection / (len(a) + len(b) - intersection)
+
+
+def optimal_bands(threshold: float, num_perm: int, false_negative_weight: float = 0.9) -> Tuple[int, int]:
+    """选择 (bands, rows)，使假阳性与假阴性概率的加权和最小
+
+    候选概率为 1 - (1 - s^r)^b，在 [0, t] 上积分得到假阳性，在 [t, 1] 上得到假阴性。
+    候选对之后还会做精确 Jaccard 校验，假阳性只多花计算，因此默认更看重召回。
+    """
+    grid = np.linspace(0.0, 1.0, 201)
+    step = grid[1] - grid[0]
+    best, best_cost = (num_perm, 1), float("inf")
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if bands == 0:
+            break
+        prob = 1.0 - (1.0 - grid ** rows) ** bands
+        low = grid <= threshold
+        false_pos = prob[low].sum() * step
+        false_neg = (1.0 - prob[~low]).sum() * step
+        cost = (1.0 - false_negative_weight) * false_pos + false_negative_weight * false_neg
+        if cost < best_cost:
+            best, best_cost = (bands, rows), cost
+    return best
+
+
+class MinHasher:
+    """MinHash 签名计算"""
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        """
+        Args:
+            num_perm: 排列（哈希函数）个数
+            seed: 随机种子，相同种子的签名可以互相比较
+        """
+        self.num_perm = num_perm
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+
+    def signature(self, tokens: Iterable[str]) -> Optional[np.ndarray]:
+        """计算词集的签名，空词集返回 None"""
+        hashes = np.fromiter(
+            (zlib.crc32(token.encode('utf-8')) for token in tokens), dtype=np.uint64
+        )
+        if hashes.size == 0:
+            return None
+        # 与 datasketch 相同的 (a * x + b) mod p 哈希族，uint64 溢出回绕
+        with np.errstate(over='ignore'):
+            permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+class MinHashLSH:
+    """LSH 索引：签名按 band 分桶"""
+
+    def __init__(self, threshold: float = 0.7, num_perm: int = 128):
+        """
+        Args:
+            threshold: 目标 Jaccard 阈值
+            num_perm: 签名长度（需与 MinHasher 一致）
+        """
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = optimal_bands(threshold, num_perm)
+        self._buckets: List[Dict[bytes, List[Hashable]]] = [dict() for _ in range(self.bands)]
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [
+            signature[i * self.rows:(i + 1) * self.rows].tobytes()
+            for i in range(self.bands)
+        ]
+
+    def insert(self, key: Hashable, signature: np.ndarray):
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            bucket.setdefault(band_key, []).append(key)
+
+    def remove(self, key: Hashable, signature: np.ndarray):
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            members = bucket.get(band_key)
+            if members and key in members:
+                members.remove(key)
+                if not members:
+                    del bucket[band_key]
+
+    def query(self, signature: np.ndarray) -> Set[Hashable]:
+        """返回与签名至少共享一个桶的 key"""
+        candidates: Set[Hashable] = set()
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            members = bucket.get(band_key)
+            if members:
+                candidates.update(members)
+        return candidates
+
+    def __len__(self) -> int:
+        return sum(len(members) for members in self._buckets[0].values()) if self._buckets else 0
@@ -0,0 +1,322 @@
+"""
+嵌入量化
+
+- 存储编码: memories.embedding / embedding_cache 的 BLOB 可存为 float32 (默认)、
+  float16 或 int8 (逐向量对称标量量化)。float16/int8 BLOB 带 4 字节魔数头，
+  无头的 BLOB 按旧版 float32 解析，新旧格式可以混存。
+- 量化索引: QuantizedMatrixIndex 在内存中只保存压缩码 (float16 / int8 / PQ)，
+  分数为近似值；调用方取 Top-(k * rerank_factor) 后按数据库中的向量全精度重排。
+
+乘积量化 (PQ) 把向量切成 m 段，每段用 256 个质心编码为 1 字节。
+数据量低于 train_threshold 时以 float16 暂存，训练后压缩为 PQ 码。
+"""
+
+from typing import Any, Dict, Optional
+
+import numpy as np
+from loguru import logger
+
+from .vector_index import VectorMatrixIndex
+
+STORAGE_DTYPES = ("float32", "float16", "int8")
+
+_MAGIC_FLOAT16 = b"MQf2"
+_MAGIC_INT8 = b"MQi8"
+
+
+def encode_embedding(vector, dtype: str = "float32") -> bytes:
+    """把向量编码为 BLOB
+
+    Args:
+        vector: 一维向量
+        dtype: "float32" / "float16" / "int8"
+
+    Returns:
+        BLOB 字节串（float32 为无头的原始字节，与旧数据兼容）
+    """
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    if dtype == "float32":
+        return vector.tobytes()
+    if dtype == "float16":
+        return _MAGIC_FLOAT16 + vector.astype(np.float16).tobytes()
+    if dtype == "int8":
+        codes, scale = quantize_int8(vector.reshape(1, -1))
+        return _MAGIC_INT8 + scale.astype(np.float32).tobytes() + codes.tobytes()
+    raise ValueError(f"Unknown embedding storage dtype: {dtype}. Use one of {STORAGE_DTYPES}")
+
+
+def decode_embedding(blob: bytes) -> np.ndarray:
+    """把 BLOB 解码为 float32 向量（自动识别存储格式）"""
+    header = bytes(blob[:4])
+    if header == _MAGIC_FLOAT16:
+        return np.frombuffer(blob, dtype=np.float16, offset=4).astype(np.float32)
+    if header == _MAGIC_INT8:
+        scale = np.frombuffer(blob, dtype=np.float32, count=1, offset=4)[0]
+        return np.frombuffer(blob, dtype=np.int8, offset=8).astype(np.float32) * scale
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+def quantize_int8(vectors: np.ndarray):
+    """逐行对称 int8 量化
+
+    Returns:
+        (int8 码矩阵, 每行缩放系数)，还原为 codes * scale
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _kmeans(data: np.ndarray, k: int, iters: int, rng: np.random.Generator) -> np.ndarray:
+    """欧氏 k-means（PQ 子空间码本）"""
+    n = data.shape[0]
+    k = max(1, min(k, n))
+    centroids = data[rng.choice(n, k, replace=False)].copy()
+    for _ in range(iters):
+        assign = _nearest(data, centroids)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        nonempty = counts > 0
+        centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+        empty = np.flatnonzero(~nonempty)
+        if empty.size:
+            centroids[empty] = data[rng.choice(n, empty.size, replace=False)]
+    return centroids
+
+
+def _nearest(data: np.ndarray, centroids: np.ndarray, chunk_size: int = 16384) -> np.ndarray:
+    """分块求每行欧氏距离最近的质心"""
+    c_norms = (centroids ** 2).sum(axis=1)
+    assign = np.empty(data.shape[0], dtype=np.int64)
+    for start in range(0, data.shape[0], chunk_size):
+        block = data[start:start + chunk_size]
+        assign[start:start + block.shape[0]] = np.argmin(c_norms[None, :] - 2.0 * block @ centroids.T, axis=1)
+    return assign
+
+
+class ProductQuantizer:
+    """乘积量化器
+
+    dim 维向量切成 m 段，每段 dim/m 维，用 ksub (<=256) 个质心编码为 uint8。
+    内积 <q, x> 近似为各段查表之和。
+    """
+
+    def __init__(self, dim: int, m: int = 64, ksub: int = 256, iters: int = 10, seed: int = 42):
+        """
+        Args:
+            dim: 向量维度
+            m: 段数（自动调整为能整除 dim 的最大值）
+            ksub: 每段质心数，最多 256
+            iters: k-means 迭代次数
+            seed: 随机种子
+        """
+        m = max(1, min(m, dim))
+        while dim % m:
+            m -= 1
+        self.dim = dim
+        self.m = m
+        self.dsub = dim // m
+        self.ksub = max(1, min(ksub, 256))
+        self.iters = iters
+        self._rng = np.random.default_rng(seed)
+        self.codebooks: Optional[np.ndarray] = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.codebooks is not None
+
+    def fit(self, data: np.ndarray):
+        """在样本上训练各段码本 (m, ksub, dsub)"""
+        data = np.asarray(data, dtype=np.float32)
+        codebooks = np.zeros((self.m, self.ksub, self.dsub), dtype=np.float32)
+        for j in range(self.m):
+            sub = data[:, j * self.dsub:(j + 1) * self.dsub]
+            centroids = _kmeans(sub, self.ksub, self.iters, self._rng)
+            codebooks[j, :centroids.shape[0]] = centroids
+        self.codebooks = codebooks
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """编码为 (n, m) uint8"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        codes = np.empty((vectors.shape[0], self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = _nearest(vectors[:, j * self.dsub:(j + 1) * self.dsub], self.codebooks[j])
+        return codes
+
+    def lookup_tables(self, queries: np.ndarray) -> np.ndarray:
+        """查询与各段质心的内积表 (n, m, ksub)"""
+        sub_queries = queries.reshape(queries.shape[0], self.m, self.dsub)
+        return np.einsum("nmd,mkd->nmk", sub_queries, self.codebooks)
+
+    @property
+    def nbytes(self) -> int:
+        return 0 if self.codebooks is None else int(self.codebooks.nbytes)
+
+
+class QuantizedMatrixIndex(VectorMatrixIndex):
+    """量化的内存矩阵索引
+
+    与 VectorMatrixIndex 共用 ID 映射、级别掩码和末行交换删除，
+    只是行以压缩码保存，分数按块解码计算，内存占用有界。
+
+    - float16: 每维 2 字节
+    - int8: 每维 1 字节 + 每行 4 字节缩放系数
+    - pq: 每行 m 字节（训练前以 float16 暂存）
+    """
+
+    approximate_scores = True
+
+    def __init__(
+        self,
+        quantization: str = "int8",
+        dim: Optional[int] = None,
+        initial_capacity: int = 1024,
+        rerank_factor: int = 4,
+        pq_m: int = 64,
+        pq_ksub: int = 256,
+        train_threshold: int = 4096,
+        max_train_samples: int = 16384,
+        kmeans_iters: int = 8,
+        block_size: int = 16384
+    ):
+        """
+        Args:
+            quantization: "float16" / "int8" / "pq"
+            dim: 向量维度，None 表示由第一条向量决定
+            initial_capacity: 初始行容量
+            rerank_factor: 建议调用方取回 k * rerank_factor 个候选做全精度重排
+            pq_m: PQ 段数
+            pq_ksub: PQ 每段质心数
+            train_threshold: PQ 达到该数量后才训练
+            max_train_samples: PQ 训练采样上限
+            kmeans_iters: PQ k-means 迭代次数
+            block_size: 打分时每块解码的行数
+        """
+        if quantization not in ("float16", "int8", "pq"):
+            raise ValueError(f"Unknown quantization: {quantization}. Use 'float16', 'int8' or 'pq'")
+        self.quantization = quantization
+        self.rerank_factor = max(1, rerank_factor)
+        self.pq_m = pq_m
+        self.pq_ksub = pq_ksub
+        self.train_threshold = max(1, train_threshold)
+        self.max_train_samples = max_train_samples
+        self.kmeans_iters = kmeans_iters
+        self.block_size = max(1, block_size)
+        self._scales: Optional[np.ndarray] = None
+        self._pq: Optional[ProductQuantizer] = None
+        self._rng = np.random.default_rng(42)
+        super().__init__(dim=dim, initial_capacity=initial_capacity)
+
+    @property
+    def _pq_trained(self) -> bool:
+        return self._pq is not None and self._pq.is_trained
+
+    @property
+    def needs_training(self) -> bool:
+        return self.quantization == "pq" and not self._pq_trained and self._size >= self.train_threshold
+
+    # ===== 存储 =====
+
+    def _allocate(self, capacity: int):
+        if self._pq_trained:
+            matrix = np.zeros((capacity, self._pq.m), dtype=np.uint8)
+        elif self.quantization == "int8":
+            matrix = np.zeros((capacity, self.dim), dtype=np.int8)
+        else:
+            matrix = np.zeros((capacity, self.dim), dtype=np.float16)
+        levels = np.full(capacity, self.UNKNOWN_LEVEL, dtype=np.uint8)
+        scales = np.ones(capacity, dtype=np.float32) if self.quantization == "int8" else None
+        if self._matrix is not None and self._size:
+            matrix[:self._size] = self._matrix[:self._size]
+            levels[:self._size] = self._levels[:self._size]
+            if scales is not None:
+                scales[:self._size] = self._scales[:self._size]
+        self._matrix = matrix
+        self._levels = levels
+        self._scales = scales
+
+    def _store_rows(self, rows: np.ndarray, vectors: np.ndarray):
+        if self.quantization == "int8":
+            codes, scales = quantize_int8(vectors)
+            self._matrix[rows] = codes
+            self._scales[rows] = scales
+        elif self._pq_trained:
+            self._matrix[rows] = self._pq.encode(vectors)
+        else:
+            self._matrix[rows] = vectors.astype(np.float16)
+
+    def _move_row(self, src: int, dst: int):
+        self._matrix[dst] = self._matrix[src]
+        if self._scales is not None:
+            self._scales[dst] = self._scales[src]
+
+    def _score_rows(self, queries: np.ndarray) -> np.ndarray:
+        """按块解码打分，避免一次性还原整个 float32 矩阵"""
+        scores = np.empty((queries.shape[0], self._size), dtype=np.float32)
+        tables = self._pq.lookup_tables(queries) if self._pq_trained else None
+        for start in range(0, self._size, self.block_size):
+            end = min(start + self.block_size, self._size)
+            block = self._matrix[start:end]
+            if tables is not None:
+                for i, table in enumerate(tables):
+                    scores[i, start:end] = table[np.arange(self._pq.m), block].sum(axis=1)
+            elif self.quantization == "int8":
+                scores[:, start:end] = (queries @ block.astype(np.float32).T) * self._scales[start:end]
+            else:
+                scores[:, start:end] = queries @ block.astype(np.float32).T
+        return scores
+
+    def clear(self):
+        with self._lock:
+            self._pq = None
+            super().clear()
+
+    # ===== PQ 训练 =====
+
+    def train(self):
+        """训练 PQ 码本并把 float16 暂存行压缩为 PQ 码
+
+        码本在采样上训练（不持有锁），压缩在锁内分块完成。
+        """
+        if self.quantization != "pq":
+            return
+        with self._lock:
+            if self._pq_trained or self._size == 0:
+                return
+            sample_size = min(self._size, self.max_train_samples)
+            sample = self._rng.choice(self._size, sample_size, replace=False)
+            train_data = self._matrix[sample].astype(np.float32)
+
+        pq = ProductQuantizer(self.dim, self.pq_m, self.pq_ksub, self.kmeans_iters)
+        pq.fit(train_data)
+
+        with self._lock:
+            if self._pq_trained or self._matrix is None or self._matrix.dtype != np.float16:
+                return
+            codes = np.zeros((self._matrix.shape[0], pq.m), dtype=np.uint8)
+            for start in range(0, self._size, self.block_size):
+                end = min(start + self.block_size, self._size)
+                codes[start:end] = pq.encode(self._matrix[start:end].astype(np.float32))
+            self._matrix = codes
+            self._pq = pq
+            logger.info(f"QuantizedMatrixIndex trained PQ: m={pq.m}, ksub={pq.ksub}, vectors={self._size}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        memory_bytes = stats["memory_bytes"]
+        if self._scales is not None:
+            memory_bytes += int(self._scales.nbytes)
+        if self._pq is not None:
+            memory_bytes += self._pq.nbytes
+        stats.update({
+            "quantization": self.quantization,
+            "rerank_factor": self.rerank_factor,
+            "memory_bytes": memory_bytes,
+        })
+        if self.quantization == "pq":
+            stats["pq_trained"] = self._pq_trained
+            stats["pq_m"] = self._pq.m if self._pq is not None else 0
+        return stats
@@ -0,0 +1,164 @@
+"""
+内存压力监控
+
+后台任务按固定间隔采样可用内存，请求路径只读取缓存的状态:
+- 采样限速：两次 psutil 调用之间至少间隔 min_sample_interval_s
+- 滞回：可用内存低于 low_mb 立即判定为内存不足；
+  连续 recover_samples 次高于 recover_mb 才判定为恢复，避免在阈值附近来回切换
+- 状态变化时调用 on_change(low_memory)
+
+psutil 不可用时始终视为内存充足。
+"""
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, Optional
+
+from loguru import logger
+
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    psutil = None
+    HAS_PSUTIL = False
+
+
+class MemoryPressureMonitor:
+    """带滞回的可用内存监控
+
+    Example:
+        >>> monitor = MemoryPressureMonitor(low_mb=500, on_change=lambda low: ...)
+        >>> monitor.start()
+        >>> monitor.low_memory       # 请求路径只读属性，不调用 psutil
+        >>> await monitor.stop()
+    """
+
+    def __init__(
+        self,
+        low_mb: float = 500,
+        recover_mb: Optional[float] = None,
+        interval_s: float = 60.0,
+        min_sample_interval_s: float = 1.0,
+        recover_samples: int = 3,
+        on_change: Optional[Callable[[bool], Any]] = None
+    ):
+        """
+        Args:
+            low_mb: 可用内存低于该值时判定为内存不足
+            recover_mb: 可用内存高于该值才计入恢复，默认 low_mb * 1.5
+            interval_s: 后台采样间隔（秒）
+            min_sample_interval_s: 两次实际采样的最小间隔（秒）
+            recover_samples: 连续多少次高于 recover_mb 判定为恢复
+            on_change: 状态变化回调，参数为新的 low_memory
+        """
+        self.low_mb = low_mb
+        self.recover_mb = recover_mb if recover_mb is not None else low_mb * 1.5
+        self.interval_s = max(0.01, interval_s)
+        self.min_sample_interval_s = max(0.0, min_sample_interval_s)
+        self.recover_samples = max(1, recover_samples)
+        self.on_change = on_change
+
+        self._low_memory = False
+        self._available_mb: Optional[float] = None
+        self._percent_used: Optional[float] = None
+        self._recover_streak = 0
+        self._last_sample = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+        # 统计
+        self._samples = 0
+        self._transitions = 0
+
+    @property
+    def low_memory(self) -> bool:
+        return self._low_memory
+
+    @property
+    def available_mb(self) -> Optional[float]:
+        return self._available_mb
+
+    def _read_available_mb(self) -> Optional[float]:
+        """读取可用内存 (MB)，无法检测时返回 None"""
+        if not HAS_PSUTIL:
+            return None
+        try:
+            mem = psutil.virtual_memory()
+        except Exception:
+            return None
+        self._percent_used = mem.percent
+        return mem.available / (1024 * 1024)
+
+    def sample(self, force: bool = False) -> bool:
+        """采样一次并更新状态（限速，间隔内直接返回缓存状态）
+
+        Returns:
+            当前是否内存不足
+        """
+        now = time.monotonic()
+        if not force and self._samples and now - self._last_sample < self.min_sample_interval_s:
+            return self._low_memory
+        self._last_sample = now
+
+        available = self._read_available_mb()
+        self._samples += 1
+        if available is None:
+            return self._low_memory
+        self._available_mb = available
+
+        if not self._low_memory:
+            if available < self.low_mb:
+                self._set_low(True)
+        elif available >= self.recover_mb:
+            self._recover_streak += 1
+            if self._recover_streak >= self.recover_samples:
+                self._set_low(False)
+        else:
+            self._recover_streak = 0
+        return self._low_memory
+
+    def _set_low(self, low: bool):
+        self._low_memory = low
+        self._recover_streak = 0
+        self._transitions += 1
+        logger.info(
+            f"Memory pressure {'high' if low else 'relieved'}: "
+            f"available={self._available_mb:.0f}MB (low<{self.low_mb:.0f}MB, recover>={self.recover_mb:.0f}MB)"
+        )
+        if self.on_change is not None:
+            try:
+                self.on_change(low)
+            except Exception as e:
+                logger.error(f"Memory pressure callback failed: {e}")
+
+    def start(self):
+        """启动后台采样任务（需在事件循环中调用）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """停止后台采样任务"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval_s)
+            self.sample(force=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "available_mb": None if self._available_mb is None else round(self._available_mb, 1),
+            "percent_used": self._percent_used,
+            "low_mb": self.low_mb,
+            "recover_mb": self.recover_mb,
+            "low_memory": self._low_memory,
+            "samples": self._samples,
+            "transitions": self._transitions,
+            "monitoring": HAS_PSUTIL,
+        }
@@ -0,0 +1,320 @@
+"""
+记忆搜索结果缓存
+
+CachedMemoryBackend 包装任意 MemoryBackend，为 search() 提供有界的 LRU + TTL 结果缓存:
+- 键: (归一化查询, level, limit, min_score)
+- 失效:
+  - add / add_many: 只清除同级别与不限级别的查询
+  - delete: 只清除结果中包含该 ID 的查询
+  - upgrade_memory_level: 清除包含该 ID 的查询与新级别的查询
+  - 其他批量修改方法 (merge_duplicates / auto_archive ...): 清空
+- 版本号防止与写入并发的搜索把旧结果写回缓存
+- 内层 write-behind 队列非空时不写入缓存（待写记忆刷新后向量搜索结果会变化）
+- 命中率等统计合并进 get_stats()["search_cache"]
+
+后端内部的后台任务（如自动归档）绕过包装层，由 TTL 限制结果陈旧时间。
+"""
+
+import asyncio
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from .base import MemoryBackend, MemoryEntry, MemoryLevel
+
+_PUNCT_RE = re.compile(r"^[\W_]+|[\W_]+$")
+_SPACE_RE = re.compile(r"\s+")
+
+CacheKey = Tuple[str, Optional[str], int, float]
+
+
+def normalize_query(query: str) -> str:
+    """归一化查询文本: NFKC、大小写折叠、合并空白、去掉首尾标点
+
+    Example:
+        >>> normalize_query("  What's my  NAME? ")
+        "what's my name"
+    """
+    text = unicodedata.normalize("NFKC", query).casefold()
+    text = _SPACE_RE.sub(" ", text).strip()
+    return _PUNCT_RE.sub("", text)
+
+
+class SearchResultCache:
+    """LRU + TTL 搜索结果缓存
+
+    除缓存本身外维护两个反向索引，用于精确失效:
+    - 记忆 ID -> 包含该 ID 的缓存键
+    - level -> 该级别（None 表示不限级别）的缓存键
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 300.0):
+        """
+        Args:
+            max_entries: 最大缓存条数
+            ttl_seconds: 条目有效期（秒），<= 0 表示不过期
+        """
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl_seconds
+
+        self._entries: "OrderedDict[CacheKey, Tuple[List[Dict[str, Any]], float]]" = OrderedDict()
+        self._by_id: Dict[str, Set[CacheKey]] = {}
+        self._by_level: Dict[Optional[str], Set[CacheKey]] = {}
+        self.version = 0
+
+        # 统计
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def make_key(query: str, limit: int, level: Optional[MemoryLevel], min_score: float) -> CacheKey:
+        level_value = MemoryLevel(level).value if level is not None else None
+        return normalize_query(query), level_value, int(limit), round(float(min_score), 4)
+
+    def get(self, key: CacheKey) -> Optional[List[Dict[str, Any]]]:
+        """读取缓存，命中时返回结果副本"""
+        item = self._entries.get(key)
+        if item is None:
+            self._misses += 1
+            return None
+
+        results, expires_at = item
+        if expires_at and time.monotonic() > expires_at:
+            self._remove(key)
+            self._expirations += 1
+            self._misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return [dict(r) for r in results]
+
+    def put(self, key: CacheKey, results: List[Dict[str, Any]], version: int):
+        """写入缓存
+
+        Args:
+            key: 缓存键
+            results: 搜索结果
+            version: 发起搜索时的版本号，期间发生过失效则放弃写入
+        """
+        if version != self.version:
+            return
+        if key in self._entries:
+            self._remove(key)
+
+        expires_at = time.monotonic() + self.ttl if self.ttl > 0 else 0.0
+        self._entries[key] = ([dict(r) for r in results], expires_at)
+        for r in results:
+            memory_id = r.get("id")
+            if memory_id is not None:
+                self._by_id.setdefault(memory_id, set()).add(key)
+        self._by_level.setdefault(key[1], set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._evictions += 1
+
+    def invalidate_ids(self, memory_ids: List[str]):
+        """清除结果中包含这些 ID 的查询"""
+        keys = set()
+        for memory_id in memory_ids:
+            keys |= self._by_id.get(memory_id, set())
+        self._invalidate(keys)
+
+    def invalidate_levels(self, levels: List[Optional[str]]):
+        """清除这些级别的查询（None 表示不限级别的查询）"""
+        keys = set()
+        for level in levels:
+            keys |= self._by_level.get(level, set())
+        self._invalidate(keys)
+
+    def clear(self):
+        """清空缓存"""
+        self._invalidations += len(self._entries)
+        self._entries.clear()
+        self._by_id.clear()
+        self._by_level.clear()
+        self.version += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self._hits + self._misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            "evictions": self._evictions,
+            "expirations": self._expirations,
+            "invalidations": self._invalidations,
+        }
+
+    def _invalidate(self, keys: Set[CacheKey]):
+        self.version += 1
+        for key in keys:
+            if key in self._entries:
+                self._remove(key)
+                self._invalidations += 1
+
+    def _remove(self, key: CacheKey):
+        results, _ = self._entries.pop(key)
+        for r in results:
+            keys = self._by_id.get(r.get("id"))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_id[r.get("id")]
+        level_keys = self._by_level.get(key[1])
+        if level_keys is not None:
+            level_keys.discard(key)
+            if not level_keys:
+                del self._by_level[key[1]]
+
+
+class CachedMemoryBackend(MemoryBackend):
+    """为任意记忆后端增加搜索结果缓存
+
+    未显式包装的属性与方法透传给内部后端；其中会批量修改数据的方法
+    调用后清空缓存。
+
+    Example:
+        >>> backend = CachedMemoryBackend(SQLiteMemoryBackend(), max_entries=256, ttl_seconds=120)
+        >>> await backend.search("我的名字", limit=3)   # 未命中，查询后端
+        >>> await backend.search("我的名字？", limit=3)  # 命中
+    """
+
+    # 透传调用后需要清空缓存的方法
+    BULK_MUTATIONS = frozenset({
+        "merge_duplicates", "auto_archive", "auto_tier",
+    })
+
+    def __init__(self, backend: MemoryBackend, max_entries: int = 512, ttl_seconds: float = 300.0):
+        """
+        Args:
+            backend: 被包装的记忆后端
+            max_entries: 最大缓存条数
+            ttl_seconds: 缓存有效期（秒）
+        """
+        from .write_behind import WriteBehindMemoryBackend
+
+        self.backend = backend
+        self.cache = SearchResultCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._write_behind = backend if isinstance(backend, WriteBehindMemoryBackend) else None
+        logger.info(f"Memory search cache enabled (max_entries={max_entries}, ttl={ttl_seconds}s)")
+
+    def __getattr__(self, name: str):
+        if name == "backend":
+            raise AttributeError(name)
+        attr = getattr(self.backend, name)
+        if name in self.BULK_MUTATIONS and asyncio.iscoroutinefunction(attr):
+            async def invalidating(*args, **kwargs):
+                try:
+                    return await attr(*args, **kwargs)
+                finally:
+                    self.cache.clear()
+            return invalidating
+        return attr
+
+    async def initialize(self):
+        await self.backend.initialize()
+
+    async def add(self, entry: MemoryEntry) -> str:
+        try:
+            return await self.backend.add(entry)
+        finally:
+            self.cache.invalidate_levels([None, MemoryLevel(entry.level).value])
+
+    async def add_many(self, entries: List[MemoryEntry], dedup_threshold: float = 0.95) -> List[str]:
+        try:
+            return await self.backend.add_many(entries, dedup_threshold=dedup_threshold)
+        finally:
+            levels = {MemoryLevel(entry.level).value for entry in entries}
+            self.cache.invalidate_levels([None, *levels])
+
+    async def search(
+        self,
+        query: str,
+        limit: int = 5,
+        level: Optional[MemoryLevel] = None,
+        min_score: float = 0.0,
+        use_cache: bool = True
+    ) -> List[Dict[str, Any]]:
+        """搜索记忆（带结果缓存）
+
+        Args:
+            query: 查询文本
+            limit: 返回结果数量
+            level: 筛选特定级别
+            min_score: 最小相似度分数
+            use_cache: 为 False 时绕过缓存直接查询后端
+
+        Returns:
+            相关记忆列表
+        """
+        if not use_cache:
+            return await self.backend.search(query, limit=limit, level=level, min_score=min_score)
+
+        key = self.cache.make_key(query, limit, level, min_score)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        version = self.cache.version
+        results = await self.backend.search(query, limit=limit, level=level, min_score=min_score)
+        # 内层 write-behind 尚有待写记忆时，结果只按字符匹配合并了待写部分，刷新后会变化，不缓存
+        if self._write_behind is None or not self._write_behind.pending_writes:
+            self.cache.put(key, results, version)
+        return results
+
+    async def delete(self, memory_id: str) -> bool:
+        try:
+            return await self.backend.delete(memory_id)
+        finally:
+            self.cache.invalidate_ids([memory_id])
+
+    async def delete_many(self, memory_ids: List[str]) -> int:
+        try:
+            return await self.backend.delete_many(memory_ids)
+        finally:
+            self.cache.invalidate_ids(list(memory_ids))
+
+    async def upgrade_memory_level(self, memory_id: str, new_level: str) -> bool:
+        try:
+            return await self.backend.upgrade_memory_level(memory_id, new_level)
+        finally:
+            level_value = new_level.value if isinstance(new_level, MemoryLevel) else str(new_level)
+            self.cache.invalidate_ids([memory_id])
+            self.cache.invalidate_levels([level_value])
+
+    async def get_by_level(self, level: MemoryLevel) -> List[Dict[str, Any]]:
+        return await self.backend.get_by_level(level)
+
+    async def get_by_age(
+        self,
+        min_days: int,
+        max_days: Optional[int] = None,
+        level: Optional[MemoryLevel] = None,
+        limit: Optional[int] = None,
+        include_embeddings: bool = False
+    ) -> List[Dict[str, Any]]:
+        return await self.backend.get_by_age(
+            min_days, max_days=max_days, level=level, limit=limit, include_embeddings=include_embeddings
+        )
+
+    async def get_stats(self) -> Dict[str, Any]:
+        stats = dict(await self.backend.get_stats())
+        stats["search_cache"] = self.cache.get_stats()
+        return stats
+
+    async def close(self):
+        self.cache.clear()
+        await self.backend.close()
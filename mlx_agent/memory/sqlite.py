@@ -5,14 +5,18 @@ SQLite 记忆后端实现
 
 特点:
 - 向量存储为 BLOB (numpy array)
-- 余弦相似度纯 Python 计算
+- 常驻内存向量索引：flat (精确矩阵) 或 ivf (IVF-Flat 近似，持久化到 .ann.npz)
+- 可选量化：BLOB 存为 float16 / int8，flat 索引以 float16 / int8 / PQ 常驻，
+  近似候选按数据库中的向量重排
 - FTS5 关键词搜索
+- WAL + 单写线程组提交 + 只读连接池，查询不阻塞事件循环
 - 轻量级，适合资源受限环境
 """
 
 import sqlite3
 import json
 import asyncio
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Dict, List, Optional, Any, Tuple
@@ -20,7 +24,14 @@ from typing import Dict, List, Optional, Any, Tuple
 import numpy as np
 from loguru import logger
 
+from .archive import ArchiveWriter, count_archived
 from .base import MemoryBackend, MemoryEntry, MemoryLevel
+from .embedding_batcher import EmbeddingBatcher
+from .embedding_cache import EmbeddingCache, migrate_embedding_cache, text_hash
+from .embedding_registry import EmbeddingModelHandle, embedding_registry
+from .quantization import STORAGE_DTYPES, decode_embedding, encode_embedding
+from .sqlite_pool import SQLiteReadPool, SQLiteWriter, apply_pragmas
+from .vector_index import batch_duplicate_mask, create_vector_index, find_duplicate_clusters
 
 
 class SQLiteMemoryBackend(MemoryBackend):
@@ -36,7 +47,25 @@ class SQLiteMemoryBackend(MemoryBackend):
         auto_archive: bool = True,
         p1_max_age_days: int = 7,
         p2_max_age_days: int = 1,
-        vector_weight: float = 0.7
+        vector_weight: float = 0.7,
+        vector_index: str = "flat",
+        ann_config: Optional[Dict[str, Any]] = None,
+        embedding_batch_size: int = 32,
+        embedding_batch_wait_ms: float = 5.0,
+        journal_mode: str = "WAL",
+        synchronous: str = "NORMAL",
+        mmap_size: int = 256 * 1024 * 1024,
+        cache_size_kb: int = 64 * 1024,
+        read_pool_size: int = 4,
+        group_commit_ms: float = 2.0,
+        dedicated_writer: bool = True,
+        embedding_cache_entries: int = 4096,
+        embedding_cache_max_rows: int = 200_000,
+        embedding_cache_max_mb: int = 512,
+        embedding_storage: str = "float32",
+        vector_quantization: Optional[str] = None,
+        quantization_config: Optional[Dict[str, Any]] = None,
+        archive_compression: str = "auto"
     ):
         """初始化 SQLite 后端
         
@@ -50,9 +79,31 @@ class SQLiteMemoryBackend(MemoryBackend):
             p1_max_age_days: P1 记忆最大保留天数
             p2_max_age_days: P2 记忆最大保留天数
             vector_weight: 向量搜索权重 (0-1)
+            vector_index: 向量索引类型 ("flat" 精确 / "ivf" 近似)
+            ann_config: 近似索引参数 (nlist, nprobe, train_threshold 等)
+            embedding_batch_size: 嵌入微批处理的最大批次
+            embedding_batch_wait_ms: 嵌入微批处理的合并窗口 (毫秒)
+            journal_mode: 日志模式，WAL 允许读写并发
+            synchronous: 同步级别，WAL 下 NORMAL 只在检查点 fsync
+            mmap_size: 内存映射字节数，0 关闭 mmap
+            cache_size_kb: 每个连接的页缓存大小 (KiB)
+            read_pool_size: 只读连接数，0 表示查询直接使用写连接
+            group_commit_ms: 组提交合并窗口 (毫秒)
+            dedicated_writer: 是否启用单写线程组提交
+            embedding_cache_entries: 进程内嵌入 LRU 条数
+            embedding_cache_max_rows: 嵌入缓存表最大行数
+            embedding_cache_max_mb: 嵌入缓存表最大嵌入字节数 (MB)
+            embedding_storage: 嵌入 BLOB 存储精度 ("float32" / "float16" / "int8")
+            vector_quantization: flat 索引常驻量化 (None / "float16" / "int8" / "pq")
+            quantization_config: 量化索引参数 (rerank_factor, pq_m, train_threshold 等)
+            archive_compression: 归档压缩方式 ("auto" / "zstd" / "gzip" / "none")
         """
+        if embedding_storage not in STORAGE_DTYPES:
+            raise ValueError(f"Unknown embedding storage: {embedding_storage}. Use one of {STORAGE_DTYPES}")
         self.path = Path(path).resolve()
         self.archive_path = self.path.parent / "archive"
+        self._archiver = ArchiveWriter(self.archive_path, compression=archive_compression)
+        self.index_path = self.path.with_suffix(".ann.npz")
         
         self.embedding_provider = embedding_provider
         self.embedding_model = embedding_model
@@ -63,12 +114,49 @@ class SQLiteMemoryBackend(MemoryBackend):
         self.p1_max_age_days = p1_max_age_days
         self.p2_max_age_days = p2_max_age_days
         self.vector_weight = vector_weight
+        self.vector_index_type = vector_index
+        self.ann_config = ann_config or {}
+        self.embedding_batch_size = embedding_batch_size
+        self.embedding_batch_wait_ms = embedding_batch_wait_ms
+        self.embedding_storage = embedding_storage
+        self.vector_quantization = vector_quantization
+        self.quantization_config = quantization_config or {}
+        self.pragmas = {
+            "journal_mode": journal_mode,
+            "synchronous": synchronous,
+            "mmap_size": mmap_size,
+            "cache_size_kb": cache_size_kb,
+        }
+        self.read_pool_size = read_pool_size
+        self.group_commit_ms = group_commit_ms
+        self.dedicated_writer = dedicated_writer
         
         # 延迟初始化的属性
         self._db = None
+        self._writer: Optional[SQLiteWriter] = None
+        self._read_pool: Optional[SQLiteReadPool] = None
         self._embedding_model_obj = None
+        self._embedder: Optional[EmbeddingBatcher] = None
+        self._embedding_cache = EmbeddingCache(
+            self._read,
+            self._write_nowait,
+            memory_entries=embedding_cache_entries,
+            max_rows=embedding_cache_max_rows,
+            max_bytes=embedding_cache_max_mb * 1024 * 1024,
+            storage_dtype=embedding_storage
+        )
+        if vector_quantization:
+            index_config = {"quantization": vector_quantization, **self.quantization_config}
+        else:
+            index_config = self.ann_config if vector_index != "flat" else {}
+        self._vector_index = create_vector_index(vector_index, **index_config)
+        self._index_train_future = None
         self._initialized = False
         
+        # 搜索阶段耗时统计: stage -> (累计毫秒, 次数)
+        self._stage_timings: Dict[str, Tuple[float, int]] = {}
+        self._search_count = 0
+        
         logger.info(f"SQLiteMemoryBackend configured:")
         logger.info(f"  Path: {self.path}")
         logger.info(f"  Embedding: {embedding_provider}")
@@ -82,15 +170,54 @@ class SQLiteMemoryBackend(MemoryBackend):
         self.path.parent.mkdir(parents=True, exist_ok=True)
         self.archive_path.mkdir(parents=True, exist_ok=True)
         
-        # 连接数据库
+        # 连接数据库（写连接）
         self._db = sqlite3.connect(str(self.path), check_same_thread=False)
         self._db.row_factory = sqlite3.Row
+        apply_pragmas(self._db, **self.pragmas)
         
         # 创建表
         self._create_tables()
+        self._embedding_cache.load_totals(self._db)
+        
+        # 加载向量索引
+        self._load_vector_index()
+        
+        # 写线程与只读连接池
+        if self.dedicated_writer:
+            self._writer = SQLiteWriter(self._db, max_delay_ms=self.group_commit_ms)
+            self._writer.start()
+        if self.read_pool_size > 0:
+            self._read_pool = SQLiteReadPool(self.path, self.read_pool_size, **{
+                k: v for k, v in self.pragmas.items() if k in ("mmap_size", "cache_size_kb")
+            })
         
         logger.info(f"SQLite database initialized at {self.path}")
     
+    async def _write(self, fn):
+        """执行写操作 fn(conn)
+        
+        启用写线程时交给写线程组提交，否则在当前线程执行并立即提交。
+        """
+        if self._writer is not None and self._writer.running:
+            return await self._writer.execute(fn)
+        result = fn(self._db)
+        self._db.commit()
+        return result
+    
+    def _write_nowait(self, fn):
+        """提交无需等待结果的写操作（如嵌入缓存）"""
+        if self._writer is not None and self._writer.running:
+            self._writer.submit_nowait(fn)
+            return
+        fn(self._db)
+        self._db.commit()
+    
+    async def _read(self, fn):
+        """执行只读查询 fn(conn)，有连接池时在池线程中执行"""
+        if self._read_pool is not None:
+            return await self._read_pool.run(fn)
+        return fn(self._db)
+    
     def _create_tables(self):
         """创建数据库表"""
         cursor = self._db.cursor()
@@ -110,6 +237,7 @@ class SQLiteMemoryBackend(MemoryBackend):
         # 创建索引
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_level ON memories(level)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_created ON memories(created_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_level_created ON memories(level, created_at)")
         
         # 尝试创建 FTS5 虚拟表用于全文搜索
         try:
@@ -128,10 +256,11 @@ class SQLiteMemoryBackend(MemoryBackend):
                 END
             """)
             
+            # memory_fts 不是外部内容表，不支持 'delete' 命令，直接按 ID 删除
+            cursor.execute("DROP TRIGGER IF EXISTS memories_ad")
             cursor.execute("""
-                CREATE TRIGGER IF NOT EXISTS memories_ad AFTER DELETE ON memories BEGIN
-                    INSERT INTO memory_fts(memory_fts, rowid, content, memory_id) 
-                    VALUES ('delete', old.rowid, old.content, old.id);
+                CREATE TRIGGER memories_ad AFTER DELETE ON memories BEGIN
+                    DELETE FROM memory_fts WHERE memory_id = old.id;
                 END
             """)
             
@@ -146,68 +275,163 @@ class SQLiteMemoryBackend(MemoryBackend):
                 text_hash TEXT PRIMARY KEY,
                 text_preview TEXT,
                 embedding BLOB,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_access REAL,
+                size_bytes INTEGER
             )
         """)
+        migrate_embedding_cache(self._db)
         
         self._db.commit()
     
+    def _index_signature(self) -> List[int]:
+        """数据库中嵌入的签名，用于校验持久化索引是否过期"""
+        cursor = self._db.cursor()
+        cursor.execute(
+            "SELECT COUNT(*) AS n, COALESCE(MAX(rowid), 0) AS max_rowid FROM memories WHERE embedding IS NOT NULL"
+        )
+        row = cursor.fetchone()
+        return [row['n'], row['max_rowid']]
+    
+    def _load_vector_index(self):
+        """加载向量索引
+        
+        持久化索引与数据库签名一致时直接加载，否则从数据库重建。
+        """
+        if self._vector_index.persistent and self.index_path.exists():
+            try:
+                index, meta = type(self._vector_index).load(self.index_path, **self.ann_config)
+                if meta.get("signature") == self._index_signature():
+                    self._vector_index = index
+                    logger.info(f"Vector index loaded from {self.index_path}: {len(index)} vectors")
+                    return
+                logger.info("Persisted vector index is stale, rebuilding from database")
+            except Exception as e:
+                logger.warning(f"Failed to load vector index from {self.index_path}: {e}")
+        
+        self._rebuild_vector_index()
+        
+        if self._vector_index.needs_training:
+            self._vector_index.train()
+        self._save_vector_index()
+    
+    def _rebuild_vector_index(self):
+        """从数据库加载全部嵌入到向量索引"""
+        self._vector_index.clear()
+        
+        cursor = self._db.cursor()
+        cursor.execute("SELECT id, level, embedding FROM memories WHERE embedding IS NOT NULL")
+        
+        ids, vectors, levels = [], [], []
+        for row in cursor.fetchall():
+            ids.append(row['id'])
+            vectors.append(decode_embedding(row['embedding']))
+            levels.append(row['level'])
+        
+        if not ids:
+            return
+        
+        # 按维度分组，只加载主流维度（更换过嵌入模型时旧向量无法比较）
+        dims = [v.shape[0] for v in vectors]
+        main_dim = max(set(dims), key=dims.count)
+        keep = [i for i, d in enumerate(dims) if d == main_dim]
+        if len(keep) < len(ids):
+            logger.warning(f"Skipped {len(ids) - len(keep)} embeddings with mismatched dimension")
+        
+        self._vector_index.add_many(
+            [ids[i] for i in keep],
+            np.stack([vectors[i] for i in keep]),
+            [levels[i] for i in keep]
+        )
+        logger.info(f"Vector index loaded: {len(self._vector_index)} vectors (dim={main_dim})")
+    
+    def _save_vector_index(self):
+        """持久化向量索引（仅近似索引需要）"""
+        if not self._vector_index.persistent or self._db is None:
+            return
+        try:
+            self._vector_index.save(self.index_path, meta={"signature": self._index_signature()})
+        except Exception as e:
+            logger.warning(f"Failed to save vector index: {e}")
+    
+    def _maybe_train_index(self):
+        """数据量增长后在后台线程训练近似索引"""
+        if not self._vector_index.needs_training:
+            return
+        if self._index_train_future is not None and not self._index_train_future.done():
+            return
+        loop = asyncio.get_event_loop()
+        self._index_train_future = loop.run_in_executor(None, self._vector_index.train)
+    
     def _init_embedding_model(self):
         """延迟初始化嵌入模型"""
         if self._embedding_model_obj is not None:
             return
         
         if self.embedding_provider == "local":
-            try:
-                from sentence_transformers import SentenceTransformer
-                self._embedding_model_obj = SentenceTransformer(self.embedding_model)
-                logger.info(f"Loaded embedding model: {self.embedding_model}")
-            except ImportError:
+            # 进程内共享同一份模型权重，第一次编码时才加载
+            if embedding_registry.is_available():
+                self._embedding_model_obj = embedding_registry.acquire(self.embedding_model)
+            else:
                 logger.warning("sentence-transformers not installed, embeddings disabled")
                 self._embedding_model_obj = None
         else:
             logger.warning(f"SQLite backend only supports local embeddings currently")
             self._embedding_model_obj = None
     
+    def _get_embedder(self) -> Optional[EmbeddingBatcher]:
+        """获取嵌入批处理器（模型可用时才创建）"""
+        if self._embedder is None and self._embedding_model_obj is not None:
+            model = self._embedding_model_obj
+            self._embedder = EmbeddingBatcher(
+                lambda texts: model.encode(texts, convert_to_numpy=True, batch_size=len(texts)),
+                max_batch_size=self.embedding_batch_size,
+                max_wait_ms=self.embedding_batch_wait_ms,
+                name="sqlite-embedding"
+            )
+        return self._embedder
+    
     async def _get_embedding(self, text: str) -> Optional[np.ndarray]:
         """获取文本的嵌入向量"""
-        import hashlib
+        return (await self._get_embeddings([text]))[0]
+    
+    async def _get_embeddings(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """批量获取嵌入向量
         
-        # 检查缓存
-        text_hash = hashlib.sha256(text.encode()).hexdigest()
+        先查两级嵌入缓存，未命中的文本交给批处理器编码，
+        与其他并发请求合并成批次。
+        """
+        if not texts:
+            return []
         
-        cursor = self._db.cursor()
-        cursor.execute(
-            "SELECT embedding FROM embedding_cache WHERE text_hash = ?",
-            (text_hash,)
-        )
-        row = cursor.fetchone()
+        hashes = [text_hash(text) for text in texts]
+        cached = await self._embedding_cache.get_many(hashes)
         
-        if row and row['embedding']:
-            return np.frombuffer(row['embedding'], dtype=np.float32)
+        results: List[Optional[np.ndarray]] = [cached.get(h) for h in hashes]
+        missing = [i for i, vec in enumerate(results) if vec is None]
+        if not missing:
+            return results
         
         # 生成嵌入
-        if self._embedding_model_obj is None:
-            return None
+        embedder = self._get_embedder()
+        if embedder is None:
+            return results
         
         try:
-            loop = asyncio.get_event_loop()
-            embedding = await loop.run_in_executor(
-                None,
-                lambda: self._embedding_model_obj.encode(text, convert_to_numpy=True)
-            )
+            embeddings = await embedder.embed_many([texts[i] for i in missing])
             
             # 缓存嵌入
-            cursor.execute(
-                "INSERT OR REPLACE INTO embedding_cache (text_hash, text_preview, embedding) VALUES (?, ?, ?)",
-                (text_hash, text[:100], embedding.astype(np.float32).tobytes())
-            )
-            self._db.commit()
-            
-            return embedding
+            new_items = {}
+            for i, embedding in zip(missing, embeddings):
+                if embedding is None:
+                    continue
+                results[i] = embedding
+                new_items[hashes[i]] = (texts[i][:100], embedding)
+            self._embedding_cache.put_many(new_items)
         except Exception as e:
             logger.error(f"Failed to generate embedding: {e}")
-            return None
+        
+        return results
     
     @staticmethod
     def _cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
@@ -254,23 +478,26 @@ class SQLiteMemoryBackend(MemoryBackend):
         try:
             # 生成嵌入
             embedding = await self._get_embedding(entry.content)
-            embedding_bytes = embedding.astype(np.float32).tobytes() if embedding is not None else None
+            embedding_bytes = encode_embedding(embedding, self.embedding_storage) if embedding is not None else None
             
             # 插入数据库
-            cursor = self._db.cursor()
-            cursor.execute(
+            params = (
+                entry.memory_id,
+                entry.content,
+                json.dumps(entry.metadata),
+                entry.level.value,
+                embedding_bytes,
+                entry.created_at.isoformat() if entry.created_at else datetime.now().isoformat()
+            )
+            await self._write(lambda conn: conn.execute(
                 """INSERT INTO memories (id, content, metadata, level, embedding, created_at) 
                    VALUES (?, ?, ?, ?, ?, ?)""",
-                (
-                    entry.memory_id,
-                    entry.content,
-                    json.dumps(entry.metadata),
-                    entry.level.value,
-                    embedding_bytes,
-                    entry.created_at.isoformat() if entry.created_at else datetime.now().isoformat()
-                )
-            )
-            self._db.commit()
+                params
+            ))
+            
+            if embedding is not None:
+                self._vector_index.add(entry.memory_id, embedding, entry.level.value)
+                self._maybe_train_index()
             
             logger.debug(f"Added memory: {entry.memory_id[:20]}... (level={entry.level.value})")
             return entry.memory_id
@@ -279,6 +506,162 @@ class SQLiteMemoryBackend(MemoryBackend):
             logger.error(f"Failed to add memory: {e}")
             raise
     
+    async def add_many(
+        self,
+        entries: List[MemoryEntry],
+        dedup_threshold: float = 0.95,
+        batch_size: int = 500
+    ) -> List[str]:
+        """批量添加记忆
+        
+        每批: 批量嵌入 -> 批内与索引近重复筛选 -> 单事务 executemany。
+        
+        Args:
+            entries: 记忆条目列表
+            dedup_threshold: 近重复相似度阈值
+            batch_size: 每个事务写入的条数
+        
+        Returns:
+            记忆 ID 列表（重复或已存在的条目同样返回其 ID）
+        """
+        if not self._initialized:
+            await self.initialize()
+        
+        inserted = 0
+        for start in range(0, len(entries), batch_size):
+            inserted += await self._add_batch(entries[start:start + batch_size], dedup_threshold)
+        
+        logger.info(f"Bulk added {inserted}/{len(entries)} memories")
+        return [entry.memory_id for entry in entries]
+    
+    async def _add_batch(self, entries: List[MemoryEntry], dedup_threshold: float) -> int:
+        """写入一批记忆，返回实际插入条数"""
+        # 跳过已存在的 ID 与批内重复 ID
+        placeholders = ",".join("?" * len(entries))
+        batch_ids = [entry.memory_id for entry in entries]
+        existing = await self._read(lambda conn: conn.execute(
+            f"SELECT id FROM memories WHERE id IN ({placeholders})", batch_ids
+        ).fetchall())
+        seen = {row['id'] for row in existing}
+        unique = []
+        for entry in entries:
+            if entry.memory_id not in seen:
+                seen.add(entry.memory_id)
+                unique.append(entry)
+        if not unique:
+            return 0
+        
+        # 条目自带嵌入（迁移/恢复）时直接复用，其余批量生成
+        embeddings: List[Optional[np.ndarray]] = [
+            np.asarray(entry.embedding, dtype=np.float32) if entry.embedding is not None else None
+            for entry in unique
+        ]
+        missing = [i for i, emb in enumerate(embeddings) if emb is None]
+        if missing:
+            generated = await self._get_embeddings([unique[i].content for i in missing])
+            for i, emb in zip(missing, generated):
+                embeddings[i] = emb
+        keep = await self._screen_duplicates(unique, embeddings, dedup_threshold)
+        
+        rows, index_ids, index_vectors, index_levels = [], [], [], []
+        for entry, embedding, kept in zip(unique, embeddings, keep):
+            if not kept:
+                continue
+            rows.append((
+                entry.memory_id,
+                entry.content,
+                json.dumps(entry.metadata),
+                entry.level.value,
+                encode_embedding(embedding, self.embedding_storage) if embedding is not None else None,
+                entry.created_at.isoformat() if entry.created_at else datetime.now().isoformat()
+            ))
+            if embedding is not None:
+                index_ids.append(entry.memory_id)
+                index_vectors.append(embedding)
+                index_levels.append(entry.level.value)
+        
+        if not rows:
+            return 0
+        
+        # 整批在一个事务中写入（并发写入同 ID 时忽略）
+        await self._write(lambda conn: conn.executemany(
+            """INSERT OR IGNORE INTO memories (id, content, metadata, level, embedding, created_at) 
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            rows
+        ))
+        
+        if index_ids:
+            dims = [v.shape[0] for v in index_vectors]
+            if len(set(dims)) == 1:
+                self._vector_index.add_many(index_ids, np.stack(index_vectors), index_levels)
+            else:
+                for memory_id, vector, level in zip(index_ids, index_vectors, index_levels):
+                    self._vector_index.add(memory_id, vector, level)
+            self._maybe_train_index()
+        
+        skipped = len(unique) - len(rows)
+        if skipped:
+            logger.debug(f"Skipped {skipped} near-duplicate memories in batch")
+        return len(rows)
+    
+    async def _screen_duplicates(
+        self,
+        entries: List[MemoryEntry],
+        embeddings: List[Optional[np.ndarray]],
+        threshold: float
+    ) -> List[bool]:
+        """向量化近重复筛选（批内 + 已有索引），无嵌入的条目按内容精确去重
+        
+        threshold > 1 时不做筛选（层间迁移等已知无重复的场景）。
+        量化索引的分数是近似值，命中候选按存储向量复核，避免误删。
+        """
+        keep = [True] * len(entries)
+        if threshold > 1.0:
+            return keep
+        
+        with_vec = [
+            i for i, emb in enumerate(embeddings)
+            if emb is not None and (self._vector_index.dim is None or emb.shape[0] == self._vector_index.dim)
+        ]
+        if with_vec:
+            vectors = np.stack([embeddings[i] for i in with_vec])
+            levels = [entries[i].level.value for i in with_vec]
+            
+            # 与已有索引比较
+            if len(self._vector_index) and self._vector_index.approximate_scores:
+                hits = self._vector_index.search_batch(vectors, self._vector_index.rerank_factor, levels)
+                stored = await self._load_embeddings(list({m for top in hits for m, _ in top}))
+                normalized = self._vector_index._normalize_rows(vectors)
+                for i, query, top in zip(with_vec, normalized, hits):
+                    for memory_id, _ in top:
+                        vector = stored.get(memory_id)
+                        if vector is not None and vector.shape == query.shape and vector @ query >= threshold:
+                            keep[i] = False
+                            break
+            elif len(self._vector_index):
+                hits = self._vector_index.search_batch(vectors, 1, levels)
+                for i, top in zip(with_vec, hits):
+                    if top and top[0][1] >= threshold:
+                        keep[i] = False
+            
+            # 批内比较
+            mask = batch_duplicate_mask(vectors, levels, threshold)
+            for i, kept in zip(with_vec, mask):
+                if not kept:
+                    keep[i] = False
+        
+        vec_set = set(with_vec)
+        seen_content = set()
+        for i, entry in enumerate(entries):
+            if i in vec_set:
+                continue
+            key = (entry.content, entry.level.value)
+            if key in seen_content:
+                keep[i] = False
+            seen_content.add(key)
+        
+        return keep
+    
     async def search(
         self, 
         query: str, 
@@ -286,20 +669,40 @@ class SQLiteMemoryBackend(MemoryBackend):
         level: Optional[MemoryLevel] = None,
         min_score: float = 0.0
     ) -> List[Dict[str, Any]]:
-        """搜索记忆（向量 + 关键词混合搜索）"""
+        """搜索记忆（向量 + 关键词混合搜索）
+        
+        候选阶段只处理 ID 与分数，合并排序后一次性批量取回 Top-K 的内容。
+        """
         if not self._initialized:
             logger.warning("SQLiteMemoryBackend not initialized")
             return []
         
         try:
-            # 1. 向量搜索
-            vector_results = await self._vector_search(query, limit * 2, level)
+            search_start = time.perf_counter()
+            
+            # 1. 向量候选
+            vector_scores = await self._vector_search(query, limit * 2, level)
             
-            # 2. 关键词搜索
-            keyword_results = await self._keyword_search(query, limit * 2, level)
+            # 2. 关键词候选
+            keyword_scores = await self._keyword_search(query, limit * 2, level)
             
-            # 3. 合并结果
-            combined = self._merge_results(vector_results, keyword_results, limit, min_score)
+            # 3. 合并排序
+            stage_start = time.perf_counter()
+            ranked = self._merge_results(vector_scores, keyword_scores, limit, min_score)
+            self._record_stage("merge", stage_start)
+            
+            # 4. 批量取回内容
+            stage_start = time.perf_counter()
+            rows = await self._fetch_rows([memory_id for memory_id, _ in ranked])
+            combined = []
+            for memory_id, score in ranked:
+                row = rows.get(memory_id)
+                if row is not None:
+                    combined.append({**row, "score": score})
+            self._record_stage("fetch", stage_start)
+            
+            self._record_stage("total", search_start)
+            self._search_count += 1
             
             logger.debug(f"Found {len(combined)} memories for: {query[:50]}...")
             return combined
@@ -308,99 +711,143 @@ class SQLiteMemoryBackend(MemoryBackend):
             logger.error(f"Search failed: {e}")
             return []
     
+    def _record_stage(self, stage: str, start: float):
+        """累计搜索阶段耗时"""
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        total_ms, count = self._stage_timings.get(stage, (0.0, 0))
+        self._stage_timings[stage] = (total_ms + elapsed_ms, count + 1)
+    
+    def _get_search_timings(self) -> Dict[str, Any]:
+        """各搜索阶段的平均耗时 (毫秒)"""
+        return {
+            "searches": self._search_count,
+            "avg_ms": {
+                stage: round(total_ms / count, 3)
+                for stage, (total_ms, count) in self._stage_timings.items() if count
+            }
+        }
+    
+    async def _fetch_rows(self, memory_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """一次查询批量取回记忆内容"""
+        if not memory_ids:
+            return {}
+        
+        placeholders = ",".join("?" * len(memory_ids))
+        rows = await self._read(lambda conn: conn.execute(
+            f"SELECT id, content, metadata, level FROM memories WHERE id IN ({placeholders})",
+            memory_ids
+        ).fetchall())
+        return {
+            row['id']: {
+                "id": row['id'],
+                "content": row['content'],
+                "metadata": json.loads(row['metadata'] or '{}'),
+                "level": row['level']
+            }
+            for row in rows
+        }
+    
     async def _vector_search(
         self, 
         query: str, 
         limit: int,
         level: Optional[MemoryLevel] = None
-    ) -> Dict[str, Tuple[float, Dict]]:
-        """向量相似度搜索"""
+    ) -> Dict[str, float]:
+        """向量候选（内存索引 Top-K），返回 {memory_id: 相似度}
+        
+        量化索引先取 limit * rerank_factor 个近似候选，再按数据库中的向量重排。
+        """
+        stage_start = time.perf_counter()
         query_embedding = await self._get_embedding(query)
+        self._record_stage("embed", stage_start)
         if query_embedding is None:
             return {}
         
-        cursor = self._db.cursor()
+        stage_start = time.perf_counter()
+        if not self._vector_index.approximate_scores:
+            hits = self._vector_index.search(query_embedding, limit, level)
+            self._record_stage("vector", stage_start)
+            return dict(hits)
         
-        if level:
-            cursor.execute(
-                "SELECT id, content, metadata, level, embedding FROM memories WHERE level = ?",
-                (level.value,)
-            )
-        else:
-            cursor.execute("SELECT id, content, metadata, level, embedding FROM memories")
+        hits = self._vector_index.search(query_embedding, limit * self._vector_index.rerank_factor, level)
+        self._record_stage("vector", stage_start)
+        stage_start = time.perf_counter()
+        reranked = await self._rerank(query_embedding, [memory_id for memory_id, _ in hits], limit)
+        self._record_stage("rerank", stage_start)
+        return reranked
+    
+    async def _load_embeddings(self, memory_ids: List[str]) -> Dict[str, np.ndarray]:
+        """一次查询取回存储向量（解码并归一化）"""
+        if not memory_ids:
+            return {}
         
-        results = {}
-        for row in cursor.fetchall():
-            if row['embedding'] is None:
-                continue
-            
-            mem_embedding = np.frombuffer(row['embedding'], dtype=np.float32)
-            similarity = self._cosine_similarity(query_embedding, mem_embedding)
-            
-            results[row['id']] = (
-                similarity,
-                {
-                    "id": row['id'],
-                    "content": row['content'],
-                    "metadata": json.loads(row['metadata'] or '{}'),
-                    "level": row['level']
-                }
-            )
+        def load(conn) -> Dict[str, np.ndarray]:
+            found = {}
+            for i in range(0, len(memory_ids), 500):
+                chunk = memory_ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                cursor = conn.execute(
+                    f"SELECT id, embedding FROM memories WHERE id IN ({placeholders}) AND embedding IS NOT NULL",
+                    chunk
+                )
+                for row in cursor.fetchall():
+                    found[row['id']] = row['embedding']
+            return found
         
-        return results
+        blobs = await self._read(load)
+        return {
+            memory_id: self._vector_index._normalize_rows(decode_embedding(blob))[0]
+            for memory_id, blob in blobs.items()
+        }
+    
+    async def _rerank(self, query_embedding: np.ndarray, memory_ids: List[str], limit: int) -> Dict[str, float]:
+        """按存储向量的余弦相似度重排候选并截取 Top-limit"""
+        stored = await self._load_embeddings(memory_ids)
+        query = self._vector_index._normalize_rows(query_embedding)[0]
+        ids = [memory_id for memory_id in memory_ids if memory_id in stored and stored[memory_id].shape == query.shape]
+        if not ids:
+            return {}
+        
+        scores = np.stack([stored[memory_id] for memory_id in ids]) @ query
+        top = np.argsort(-scores, kind="stable")[:limit]
+        return {ids[i]: float(scores[i]) for i in top}
     
     async def _keyword_search(
         self, 
         query: str, 
         limit: int,
         level: Optional[MemoryLevel] = None
-    ) -> Dict[str, Tuple[float, Dict]]:
-        """关键词搜索"""
+    ) -> Dict[str, float]:
+        """关键词候选，返回 {memory_id: 分数}"""
         if not self._fts_enabled:
             # 简单的 LIKE 搜索作为后备
             return await self._fallback_keyword_search(query, limit, level)
         
-        cursor = self._db.cursor()
+        stage_start = time.perf_counter()
+        
+        # 清理查询字符串
+        clean_query = query.replace('"', '""').strip()
+        
+        # 级别过滤通过 JOIN 在同一条查询中完成
+        if level:
+            sql = """SELECT f.memory_id, f.rank FROM memory_fts f
+                     JOIN memories m ON m.id = f.memory_id
+                     WHERE memory_fts MATCH ? AND m.level = ?
+                     ORDER BY f.rank LIMIT ?"""
+            params = (clean_query, level.value, limit * 2)
+        else:
+            sql = "SELECT memory_id, rank FROM memory_fts WHERE memory_fts MATCH ? ORDER BY rank LIMIT ?"
+            params = (clean_query, limit * 2)
         
         try:
-            # 清理查询字符串
-            clean_query = query.replace('"', '""').strip()
-            
-            cursor.execute(
-                "SELECT memory_id, rank FROM memory_fts WHERE memory_fts MATCH ? ORDER BY rank LIMIT ?",
-                (clean_query, limit * 2)
-            )
-            
-            results = {}
-            for row in cursor.fetchall():
-                memory_id = row['memory_id']
-                
-                # 获取完整记忆
-                if level:
-                    cursor.execute(
-                        "SELECT id, content, metadata, level FROM memories WHERE id = ? AND level = ?",
-                        (memory_id, level.value)
-                    )
-                else:
-                    cursor.execute(
-                        "SELECT id, content, metadata, level FROM memories WHERE id = ?",
-                        (memory_id,)
-                    )
-                
-                mem_row = cursor.fetchone()
-                if mem_row:
-                    # FTS rank 越小越相关，转换为 0-1 分数
-                    score = 1.0 / (1.0 + abs(row['rank']))
-                    results[memory_id] = (
-                        score,
-                        {
-                            "id": mem_row['id'],
-                            "content": mem_row['content'],
-                            "metadata": json.loads(mem_row['metadata'] or '{}'),
-                            "level": mem_row['level']
-                        }
-                    )
+            rows = await self._read(lambda conn: conn.execute(sql, params).fetchall())
             
+            # FTS rank 越小越相关，转换为 0-1 分数
+            results = {
+                row['memory_id']: 1.0 / (1.0 + abs(row['rank']))
+                for row in rows
+            }
+            self._record_stage("keyword", stage_start)
             return results
             
         except sqlite3.OperationalError as e:
@@ -412,9 +859,9 @@ class SQLiteMemoryBackend(MemoryBackend):
         query: str, 
         limit: int,
         level: Optional[MemoryLevel] = None
-    ) -> Dict[str, Tuple[float, Dict]]:
-        """后备关键词搜索（使用 LIKE）"""
-        cursor = self._db.cursor()
+    ) -> Dict[str, float]:
+        """后备关键词搜索（使用 LIKE），返回 {memory_id: 分数}"""
+        stage_start = time.perf_counter()
         keywords = [k.strip() for k in query.split() if len(k.strip()) > 2]
         
         if not keywords:
@@ -425,73 +872,43 @@ class SQLiteMemoryBackend(MemoryBackend):
         params = [f"%{k}%" for k in keywords]
         
         if level:
-            sql = f"SELECT id, content, metadata, level FROM memories WHERE ({conditions}) AND level = ? LIMIT ?"
+            sql = f"SELECT id, content FROM memories WHERE ({conditions}) AND level = ? LIMIT ?"
             params.append(level.value)
             params.append(limit * 2)
         else:
-            sql = f"SELECT id, content, metadata, level FROM memories WHERE {conditions} LIMIT ?"
+            sql = f"SELECT id, content FROM memories WHERE {conditions} LIMIT ?"
             params.append(limit * 2)
         
-        cursor.execute(sql, params)
+        rows = await self._read(lambda conn: conn.execute(sql, params).fetchall())
         
+        # 简单的相关性评分：匹配的关键词越多分数越高
+        lowered = [k.lower() for k in keywords]
         results = {}
-        for row in cursor.fetchall():
-            # 简单的相关性评分：匹配的关键词越多分数越高
-            score = sum(1 for k in keywords if k.lower() in row['content'].lower()) / len(keywords)
-            
-            results[row['id']] = (
-                score,
-                {
-                    "id": row['id'],
-                    "content": row['content'],
-                    "metadata": json.loads(row['metadata'] or '{}'),
-                    "level": row['level']
-                }
-            )
+        for row in rows:
+            content = row['content'].lower()
+            results[row['id']] = sum(1 for k in lowered if k in content) / len(keywords)
         
+        self._record_stage("keyword", stage_start)
         return results
     
     def _merge_results(
         self,
-        vector_results: Dict[str, Tuple[float, Dict]],
-        keyword_results: Dict[str, Tuple[float, Dict]],
+        vector_scores: Dict[str, float],
+        keyword_scores: Dict[str, float],
         limit: int,
         min_score: float
-    ) -> List[Dict[str, Any]]:
-        """合并向量搜索和关键词搜索结果"""
-        combined = {}
-        
-        # 向量结果加权
-        for mem_id, (score, data) in vector_results.items():
-            combined[mem_id] = {
-                "vector_score": score * self.vector_weight,
-                "keyword_score": 0.0,
-                "data": data
-            }
-        
-        # 关键词结果加权
-        for mem_id, (score, data) in keyword_results.items():
-            if mem_id in combined:
-                combined[mem_id]["keyword_score"] = score * (1 - self.vector_weight)
-            else:
-                combined[mem_id] = {
-                    "vector_score": 0.0,
-                    "keyword_score": score * (1 - self.vector_weight),
-                    "data": data
-                }
+    ) -> List[Tuple[str, float]]:
+        """合并向量与关键词候选，返回按分数降序的 [(memory_id, 分数), ...]"""
+        keyword_weight = 1 - self.vector_weight
+        combined: Dict[str, float] = {
+            mem_id: score * self.vector_weight for mem_id, score in vector_scores.items()
+        }
+        for mem_id, score in keyword_scores.items():
+            combined[mem_id] = combined.get(mem_id, 0.0) + score * keyword_weight
         
-        # 计算最终分数并过滤
-        results = []
-        for mem_id, scores in combined.items():
-            final_score = scores["vector_score"] + scores["keyword_score"]
-            if final_score >= min_score:
-                result = scores["data"].copy()
-                result["score"] = final_score
-                results.append(result)
-        
-        # 按分数排序并限制数量
-        results.sort(key=lambda x: x["score"], reverse=True)
-        return results[:limit]
+        ranked = [(mem_id, score) for mem_id, score in combined.items() if score >= min_score]
+        ranked.sort(key=lambda x: x[1], reverse=True)
+        return ranked[:limit]
     
     async def delete(self, memory_id: str) -> bool:
         """删除记忆"""
@@ -499,30 +916,100 @@ class SQLiteMemoryBackend(MemoryBackend):
             return False
         
         try:
-            cursor = self._db.cursor()
-            cursor.execute("DELETE FROM memories WHERE id = ?", (memory_id,))
-            self._db.commit()
+            deleted = await self._write(
+                lambda conn: conn.execute("DELETE FROM memories WHERE id = ?", (memory_id,)).rowcount
+            )
+            self._vector_index.remove(memory_id)
             
             logger.debug(f"Deleted memory: {memory_id[:20]}...")
-            return cursor.rowcount > 0
+            return deleted > 0
         except Exception as e:
             logger.error(f"Failed to delete memory: {e}")
             return False
     
+    async def delete_many(self, memory_ids: List[str]) -> int:
+        """批量删除记忆（单事务）"""
+        if not self._initialized or not memory_ids:
+            return 0
+        
+        def delete(conn) -> int:
+            deleted = 0
+            for i in range(0, len(memory_ids), 500):
+                chunk = memory_ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                deleted += conn.execute(f"DELETE FROM memories WHERE id IN ({placeholders})", chunk).rowcount
+            return deleted
+        
+        try:
+            deleted = await self._write(delete)
+            for memory_id in memory_ids:
+                self._vector_index.remove(memory_id)
+            logger.debug(f"Deleted {deleted} memories")
+            return deleted
+        except Exception as e:
+            logger.error(f"Failed to delete memories: {e}")
+            return 0
+    
+    async def get_by_age(
+        self,
+        min_days: int,
+        max_days: Optional[int] = None,
+        level: Optional[MemoryLevel] = None,
+        limit: Optional[int] = None,
+        include_embeddings: bool = False
+    ) -> List[Dict[str, Any]]:
+        """按年龄查询记忆（走 (level, created_at) 索引，最旧的在前）"""
+        if not self._initialized:
+            return []
+        
+        now = datetime.now()
+        columns = "id, content, metadata, level, created_at" + (", embedding" if include_embeddings else "")
+        conditions = ["created_at <= ?"]
+        params: List[Any] = [(now - timedelta(days=min_days)).isoformat()]
+        if max_days is not None:
+            conditions.append("created_at > ?")
+            params.append((now - timedelta(days=max_days)).isoformat())
+        if level:
+            conditions.append("level = ?")
+            params.append(level.value)
+        sql = f"SELECT {columns} FROM memories WHERE {' AND '.join(conditions)} ORDER BY created_at"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        
+        try:
+            rows = await self._read(lambda conn: conn.execute(sql, params).fetchall())
+        except Exception as e:
+            logger.error(f"Failed to get memories by age: {e}")
+            return []
+        
+        memories = []
+        for row in rows:
+            mem = {
+                "id": row['id'],
+                "content": row['content'],
+                "metadata": json.loads(row['metadata'] or '{}'),
+                "level": row['level'],
+                "created_at": row['created_at']
+            }
+            if include_embeddings:
+                mem["embedding"] = decode_embedding(row['embedding']) if row['embedding'] else None
+            memories.append(mem)
+        return memories
+    
     async def get_by_level(self, level: MemoryLevel) -> List[Dict[str, Any]]:
         """获取特定级别的所有记忆"""
         if not self._initialized:
             return []
         
         try:
-            cursor = self._db.cursor()
-            cursor.execute(
+            rows = await self._read(lambda conn: conn.execute(
                 "SELECT id, content, metadata, level, created_at FROM memories WHERE level = ?",
                 (level.value,)
-            )
+            ).fetchall())
             
             memories = []
-            for row in cursor.fetchall():
+            for row in rows:
                 memories.append({
                     "id": row['id'],
                     "content": row['content'],
@@ -558,7 +1045,7 @@ class SQLiteMemoryBackend(MemoryBackend):
         """执行归档"""
         logger.info("Running memory archive...")
         
-        archived_count = 0
+        archived = []
         deleted_count = 0
         
         # 获取所有 P1 和 P2 记忆
@@ -573,8 +1060,8 @@ class SQLiteMemoryBackend(MemoryBackend):
                     if age_days > max_days:
                         if level == MemoryLevel.P1:
                             # 归档 P1
-                            await self._archive_memory(mem)
-                            archived_count += 1
+                            self._archiver.append(mem)
+                            archived.append(mem['id'])
                         else:
                             # 删除 P2
                             await self.delete(mem['id'])
@@ -583,21 +1070,24 @@ class SQLiteMemoryBackend(MemoryBackend):
                 except Exception as e:
                     logger.debug(f"Archive processing error: {e}")
         
+        archived_count = await self._commit_archive(archived)
         logger.info(f"Archive complete: {archived_count} archived, {deleted_count} deleted")
     
-    async def _archive_memory(self, memory: Dict):
-        """归档单条记忆"""
+    async def _commit_archive(self, memory_ids: List[str]) -> int:
+        """把缓冲的归档记录压缩落盘，成功后再从主存储批量删除
+        
+        Returns:
+            实际归档的条数（写入失败时为 0，记忆保留在主存储中）
+        """
+        if not memory_ids:
+            return 0
         try:
-            # 保存到归档文件
-            archive_file = self.archive_path / f"{datetime.now().strftime('%Y-%m')}.jsonl"
-            with open(archive_file, "a", encoding="utf-8") as f:
-                f.write(json.dumps(memory, ensure_ascii=False) + "\n")
-            
-            # 从主存储删除
-            await self.delete(memory['id'])
-            
+            await asyncio.get_event_loop().run_in_executor(None, self._archiver.flush)
         except Exception as e:
-            logger.error(f"Failed to archive memory: {e}")
+            logger.error(f"Failed to write archive, keeping {len(memory_ids)} memories: {e}")
+            return 0
+        await self.delete_many(memory_ids)
+        return len(memory_ids)
 
     # ===== Memory Enhancer 功能 =====
     
@@ -611,6 +1101,7 @@ class SQLiteMemoryBackend(MemoryBackend):
             return {"archived": 0, "deleted": 0, "error": "not_initialized"}
         
         result = {"archived": 0, "deleted": 0}
+        archived = []
         
         for level, max_days in [(MemoryLevel.P1, self.p1_max_age_days), (MemoryLevel.P2, self.p2_max_age_days)]:
             memories = await self.get_by_level(level)
@@ -622,95 +1113,114 @@ class SQLiteMemoryBackend(MemoryBackend):
                     
                     if age_days > max_days:
                         if level == MemoryLevel.P1:
-                            await self._archive_memory(mem)
-                            result["archived"] += 1
+                            self._archiver.append(mem)
+                            archived.append(mem['id'])
                         else:
                             await self.delete(mem['id'])
                             result["deleted"] += 1
                 except Exception as e:
                     logger.debug(f"Archive processing error: {e}")
         
+        result["archived"] = await self._commit_archive(archived)
         logger.info(f"Manual archive complete: {result['archived']} archived, {result['deleted']} deleted")
         return result
     
-    async def detect_duplicates(self, threshold: float = 0.9) -> List[str]:
+    async def detect_duplicates(self, threshold: float = 0.9, block_size: int = 1024) -> List[List[str]]:
         """检测重复记忆
         
+        分块矩阵乘法在线程池中计算，不阻塞事件循环。
+        
         Args:
             threshold: 相似度阈值，超过此值认为是重复
+            block_size: 分块大小，决定单次相似度矩阵的内存占用
             
         Returns:
-            重复的记忆 ID 列表（保留第一个，其余为重复）
+            重复簇列表，每个簇为记忆 ID 列表（首个为最早写入的记忆）
         """
         if not self._initialized or not self._db:
             return []
         
+        def load(conn):
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, embedding FROM memories WHERE embedding IS NOT NULL ORDER BY rowid")
+            return cursor.fetchall()
+        
         try:
-            cursor = self._db.cursor()
-            cursor.execute("SELECT id, content, embedding FROM memories WHERE embedding IS NOT NULL")
-            rows = cursor.fetchall()
+            rows = await self._read(load)
             
             if not rows:
                 return []
             
-            duplicates = []
-            seen = set()
+            ids = [row['id'] for row in rows]
+            blobs = [row['embedding'] for row in rows]
             
-            for i, row_i in enumerate(rows):
-                mem_id_i = row_i['id']
-                if mem_id_i in seen:
-                    continue
-                
-                if row_i['embedding'] is None:
-                    continue
-                
-                embedding_i = np.frombuffer(row_i['embedding'], dtype=np.float32)
-                
-                for j, row_j in enumerate(rows):
-                    if i >= j:
-                        continue
-                    
-                    mem_id_j = row_j['id']
-                    if mem_id_j in seen or row_j['embedding'] is None:
-                        continue
-                    
-                    embedding_j = np.frombuffer(row_j['embedding'], dtype=np.float32)
-                    similarity = self._cosine_similarity(embedding_i, embedding_j)
-                    
-                    if similarity >= threshold:
-                        duplicates.append(mem_id_j)
-                        seen.add(mem_id_j)
-                
-                seen.add(mem_id_i)
+            def compute() -> List[List[str]]:
+                vectors = [decode_embedding(blob) for blob in blobs]
+                # 只比较主流维度
+                dims = [v.shape[0] for v in vectors]
+                main_dim = max(set(dims), key=dims.count)
+                keep = [i for i, d in enumerate(dims) if d == main_dim]
+                clusters = find_duplicate_clusters(np.stack([vectors[i] for i in keep]), threshold, block_size)
+                return [[ids[keep[i]] for i in cluster] for cluster in clusters]
             
-            logger.info(f"Detected {len(duplicates)} duplicate memories")
-            return duplicates
+            loop = asyncio.get_event_loop()
+            clusters = await loop.run_in_executor(None, compute)
+            
+            logger.info(
+                f"Detected {sum(len(c) - 1 for c in clusters)} duplicate memories in {len(clusters)} clusters"
+            )
+            return clusters
             
         except Exception as e:
             logger.error(f"Duplicate detection failed: {e}")
             return []
     
-    async def merge_duplicates(self, keep: str = "newest") -> Dict[str, int]:
+    async def merge_duplicates(self, keep: str = "newest", threshold: float = 0.9) -> Dict[str, int]:
         """合并重复记忆
         
         Args:
             keep: 保留策略，"newest" 或 "oldest"
+            threshold: 相似度阈值
             
         Returns:
             合并统计
         """
-        duplicates = await self.detect_duplicates(threshold=0.9)
+        if keep not in ("newest", "oldest"):
+            raise ValueError(f"Invalid keep strategy: {keep}. Use 'newest' or 'oldest'")
         
-        if not duplicates:
-            return {"merged": 0, "deleted": 0}
+        clusters = await self.detect_duplicates(threshold=threshold)
+        
+        if not clusters:
+            return {"merged": 0, "deleted": 0, "clusters": 0}
+        
+        # 批量读取创建时间
+        all_ids = [memory_id for cluster in clusters for memory_id in cluster]
+        
+        def load_created(conn) -> Dict[str, str]:
+            cursor = conn.cursor()
+            found = {}
+            for i in range(0, len(all_ids), 500):
+                chunk = all_ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                cursor.execute(f"SELECT id, created_at FROM memories WHERE id IN ({placeholders})", chunk)
+                for row in cursor.fetchall():
+                    found[row['id']] = row['created_at'] or ""
+            return found
+        
+        created = await self._read(load_created)
         
         deleted_count = 0
-        for dup_id in duplicates:
-            if await self.delete(dup_id):
-                deleted_count += 1
+        for cluster in clusters:
+            # created_at 为 ISO 格式字符串，可直接比较；相同时保持簇内顺序
+            ordered = sorted(cluster, key=lambda memory_id: created.get(memory_id, ""))
+            keeper = ordered[-1] if keep == "newest" else ordered[0]
+            for dup_id in cluster:
+                if dup_id != keeper and await self.delete(dup_id):
+                    deleted_count += 1
         
-        logger.info(f"Merged duplicates: kept {keep}, deleted {deleted_count}")
-        return {"merged": len(duplicates), "deleted": deleted_count}
+        merged = sum(len(cluster) - 1 for cluster in clusters)
+        logger.info(f"Merged {len(clusters)} duplicate clusters: kept {keep}, deleted {deleted_count}")
+        return {"merged": merged, "deleted": deleted_count, "clusters": len(clusters)}
     
     async def upgrade_memory_level(self, memory_id: str, new_level: str) -> bool:
         """升级记忆级别 (P2 -> P1 -> P0)
@@ -725,29 +1235,57 @@ class SQLiteMemoryBackend(MemoryBackend):
         if not self._initialized or not self._db:
             return False
         
-        try:
-            cursor = self._db.cursor()
+        def update(conn) -> Optional[int]:
+            cursor = conn.cursor()
             
             # 检查记忆是否存在
             cursor.execute("SELECT id FROM memories WHERE id = ?", (memory_id,))
             if not cursor.fetchone():
-                logger.warning(f"Memory not found: {memory_id}")
-                return False
+                return None
             
             # 更新级别
             cursor.execute(
                 "UPDATE memories SET level = ? WHERE id = ?",
                 (new_level, memory_id)
             )
-            self._db.commit()
+            return cursor.rowcount
+        
+        try:
+            updated = await self._write(update)
+            if updated is None:
+                logger.warning(f"Memory not found: {memory_id}")
+                return False
+            self._vector_index.set_level(memory_id, new_level)
             
             logger.info(f"Upgraded memory {memory_id[:20]}... to {new_level}")
-            return cursor.rowcount > 0
+            return updated > 0
             
         except Exception as e:
             logger.error(f"Failed to upgrade memory: {e}")
             return False
     
+    @staticmethod
+    def _count_memories(conn) -> Tuple[int, Dict[str, int], int]:
+        """统计总数、各级别数量与嵌入缓存条数"""
+        cursor = conn.cursor()
+        
+        # 总记忆数
+        cursor.execute("SELECT COUNT(*) as total FROM memories")
+        total = cursor.fetchone()['total']
+        
+        # 按级别统计
+        level_stats = {level.value: 0 for level in MemoryLevel}
+        cursor.execute("SELECT level, COUNT(*) as count FROM memories GROUP BY level")
+        for row in cursor.fetchall():
+            if row['level'] in level_stats:
+                level_stats[row['level']] = row['count']
+        
+        # 嵌入缓存统计
+        cursor.execute("SELECT COUNT(*) as count FROM embedding_cache")
+        cache_count = cursor.fetchone()['count']
+        
+        return total, level_stats, cache_count
+    
     async def get_memory_stats(self) -> Dict[str, Any]:
         """获取详细记忆统计
         
@@ -758,39 +1296,22 @@ class SQLiteMemoryBackend(MemoryBackend):
             return {"status": "not_initialized"}
         
         try:
-            cursor = self._db.cursor()
-            
-            # 总记忆数
-            cursor.execute("SELECT COUNT(*) as total FROM memories")
-            total = cursor.fetchone()['total']
-            
-            # 按级别统计
-            level_stats = {}
-            for level in MemoryLevel:
-                cursor.execute("SELECT COUNT(*) as count FROM memories WHERE level = ?", (level.value,))
-                level_stats[level.value] = cursor.fetchone()['count']
+            total, level_stats, cache_count = await self._read(self._count_memories)
             
             # 计算重复率
-            duplicates = await self.detect_duplicates(threshold=0.9)
-            duplicate_rate = len(duplicates) / total if total > 0 else 0
-            
-            # 嵌入缓存统计
-            cursor.execute("SELECT COUNT(*) as count FROM embedding_cache")
-            cache_count = cursor.fetchone()['count']
+            clusters = await self.detect_duplicates(threshold=0.9)
+            duplicate_count = sum(len(cluster) - 1 for cluster in clusters)
+            duplicate_rate = duplicate_count / total if total > 0 else 0
             
             # 归档文件统计
-            archive_count = 0
-            if self.archive_path.exists():
-                for archive_file in self.archive_path.glob("*.jsonl"):
-                    with open(archive_file, 'r', encoding='utf-8') as f:
-                        archive_count += sum(1 for _ in f)
+            archive_count = count_archived(self.archive_path)
             
             return {
                 "status": "initialized",
                 "backend": "sqlite",
                 "total_memories": total,
                 "by_level": level_stats,
-                "duplicate_count": len(duplicates),
+                "duplicate_count": duplicate_count,
                 "duplicate_rate": round(duplicate_rate, 4),
                 "archived_count": archive_count,
                 "embedding_provider": self.embedding_provider,
@@ -808,21 +1329,7 @@ class SQLiteMemoryBackend(MemoryBackend):
             return {"status": "not_initialized"}
         
         try:
-            cursor = self._db.cursor()
-            
-            # 总记忆数
-            cursor.execute("SELECT COUNT(*) as total FROM memories")
-            total = cursor.fetchone()['total']
-            
-            # 按级别统计
-            level_stats = {}
-            for level in MemoryLevel:
-                cursor.execute("SELECT COUNT(*) as count FROM memories WHERE level = ?", (level.value,))
-                level_stats[level.value] = cursor.fetchone()['count']
-            
-            # 嵌入缓存统计
-            cursor.execute("SELECT COUNT(*) as count FROM embedding_cache")
-            cache_count = cursor.fetchone()['count']
+            total, level_stats, cache_count = await self._read(self._count_memories)
             
             return {
                 "status": "initialized",
@@ -832,7 +1339,17 @@ class SQLiteMemoryBackend(MemoryBackend):
                 "embedding_provider": self.embedding_provider,
                 "embedding_model": self.embedding_model,
                 "fts_enabled": self._fts_enabled,
-                "embedding_cache_size": cache_count
+                "embedding_cache_size": cache_count,
+                "embedding_storage": self.embedding_storage,
+                "embedding_cache": self._embedding_cache.get_stats(),
+                "embedding_batcher": self._embedder.get_stats() if self._embedder else None,
+                "vector_index": self._vector_index.get_stats(),
+                "search_timings": self._get_search_timings(),
+                "sqlite": {
+                    "pragmas": self.pragmas,
+                    "writer": self._writer.get_stats() if self._writer else None,
+                    "read_pool": self._read_pool.get_stats() if self._read_pool else None
+                }
             }
         except Exception as e:
             return {"status": "error", "error": str(e)}
@@ -840,7 +1357,25 @@ class SQLiteMemoryBackend(MemoryBackend):
     async def close(self):
         """关闭后端"""
         self._initialized = False
+        if self._embedder is not None:
+            await self._embedder.close()
+            self._embedder = None
+        if isinstance(self._embedding_model_obj, EmbeddingModelHandle):
+            self._embedding_model_obj.release()
+        self._embedding_model_obj = None
+        if self._db is not None:
+            self._embedding_cache.flush()
+        self._embedding_cache.clear_memory()
+        if self._writer is not None:
+            # 写完队列中剩余的操作
+            await asyncio.get_event_loop().run_in_executor(None, self._writer.stop)
+            self._writer = None
+        if self._read_pool is not None:
+            self._read_pool.close()
+            self._read_pool = None
         if self._db:
+            self._save_vector_index()
             self._db.close()
             self._db = None
+        self._vector_index.clear()
         logger.info("SQLiteMemoryBackend closed")
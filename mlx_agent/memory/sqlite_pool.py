@@ -0,0 +1,306 @@
+"""
+SQLite 连接管理
+
+为 SQLiteMemoryBackend 提供:
+- apply_pragmas: WAL / synchronous / mmap_size / cache_size 等连接调优
+- SQLiteWriter: 独占写连接的专用线程，合并并发写操作为一次提交 (group commit)
+- SQLiteReadPool: 只读连接池，在线程池中执行查询，不阻塞事件循环
+
+WAL 模式下读连接不会被写事务阻塞，写线程每批只 fsync 一次。
+"""
+
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+from loguru import logger
+
+
+def apply_pragmas(
+    conn: sqlite3.Connection,
+    journal_mode: Optional[str] = "WAL",
+    synchronous: Optional[str] = "NORMAL",
+    mmap_size: int = 0,
+    cache_size_kb: int = 0,
+    busy_timeout_ms: int = 5000,
+    read_only: bool = False
+):
+    """应用连接级 PRAGMA
+
+    Args:
+        conn: SQLite 连接
+        journal_mode: 日志模式 (WAL / DELETE ...)，None 表示不修改；只读连接忽略
+        synchronous: 同步级别 (OFF / NORMAL / FULL)，None 表示不修改
+        mmap_size: 内存映射字节数，0 表示不使用 mmap
+        cache_size_kb: 页缓存大小 (KiB)，0 表示使用默认值
+        busy_timeout_ms: 锁等待超时
+        read_only: 是否为只读连接
+    """
+    conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+    if journal_mode and not read_only:
+        mode = conn.execute(f"PRAGMA journal_mode = {journal_mode}").fetchone()[0]
+        if mode.lower() != journal_mode.lower():
+            logger.warning(f"SQLite journal_mode {journal_mode} not applied (got {mode})")
+    if synchronous and not read_only:
+        conn.execute(f"PRAGMA synchronous = {synchronous}")
+    if mmap_size:
+        conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+    if cache_size_kb:
+        # 负数表示以 KiB 为单位
+        conn.execute(f"PRAGMA cache_size = {-int(cache_size_kb)}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    if read_only:
+        conn.execute("PRAGMA query_only = ON")
+
+
+def _percentiles(samples: deque) -> Dict[str, float]:
+    if not samples:
+        return {"p50": 0.0, "p99": 0.0}
+    values = np.fromiter(samples, dtype=np.float64)
+    return {
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+    }
+
+
+class SQLiteWriter:
+    """单写线程 + 组提交
+
+    写操作以 fn(conn) 的形式提交，写线程把一个时间窗口内到达的操作
+    放进同一个事务，每个操作包在 SAVEPOINT 中（单个失败不影响其他操作），
+    最后统一 COMMIT。调用方在提交完成后才被唤醒。
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        max_batch: int = 256,
+        max_delay_ms: float = 2.0
+    ):
+        """
+        Args:
+            conn: 写连接（之后只应由写线程使用）
+            max_batch: 单次提交的最大操作数
+            max_delay_ms: 第一个操作到达后最多等待的毫秒数
+        """
+        self.conn = conn
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max(0.0, max_delay_ms) / 1000
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+        # 统计
+        self._commits = 0
+        self._ops = 0
+        self._errors = 0
+        self._commit_ms: deque = deque(maxlen=1024)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+            self._thread.start()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    async def execute(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """提交写操作并等待其所在批次提交完成
+
+        Returns:
+            fn 的返回值
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((fn, future, loop))
+        return await future
+
+    def submit_nowait(self, fn: Callable[[sqlite3.Connection], Any]):
+        """提交写操作但不等待结果（失败只记录日志）"""
+        self._queue.put((fn, None, None))
+
+    def stop(self, timeout: float = 10.0):
+        """写完队列中剩余的操作后停止（阻塞调用）"""
+        if self._thread is None:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "commits": self._commits,
+            "ops": self._ops,
+            "errors": self._errors,
+            "avg_ops_per_commit": round(self._ops / self._commits, 2) if self._commits else 0.0,
+            "pending": self._queue.qsize(),
+            "commit_ms": _percentiles(self._commit_ms),
+        }
+
+    # ===== 写线程 =====
+
+    def _collect(self, first) -> tuple:
+        """收集一个批次，返回 (批次, 是否收到停止信号)"""
+        batch = [first]
+        deadline = time.perf_counter() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is self._STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is self._STOP:
+                break
+            batch, stop = self._collect(first)
+            self._process(batch)
+
+        # 停止前处理剩余操作
+        remaining = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not self._STOP:
+                remaining.append(item)
+        if remaining:
+            self._process(remaining)
+
+    def _process(self, batch):
+        start = time.perf_counter()
+        outcomes = []
+        conn = self.conn
+        try:
+            if not conn.in_transaction:
+                conn.execute("BEGIN")
+            for fn, _, _ in batch:
+                conn.execute("SAVEPOINT op")
+                try:
+                    result = fn(conn)
+                    conn.execute("RELEASE op")
+                    outcomes.append((True, result))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO op")
+                    conn.execute("RELEASE op")
+                    outcomes.append((False, e))
+            conn.commit()
+        except Exception as e:
+            logger.error(f"SQLite group commit failed ({len(batch)} ops): {e}")
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            outcomes = [(False, e)] * len(batch)
+
+        self._commits += 1
+        self._ops += len(batch)
+        self._commit_ms.append((time.perf_counter() - start) * 1000)
+
+        for (fn, future, loop), (ok, value) in zip(batch, outcomes):
+            if not ok:
+                self._errors += 1
+            if future is None:
+                if not ok:
+                    logger.error(f"SQLite background write failed: {value}")
+                continue
+            try:
+                loop.call_soon_threadsafe(self._resolve, future, ok, value)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, ok: bool, value: Any):
+        if future.done():
+            return
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+
+
+class SQLiteReadPool:
+    """只读连接池
+
+    每个工作线程从池中取一个只读连接执行查询，WAL 模式下与写线程并行。
+    """
+
+    def __init__(self, path: Path, size: int = 4, **pragmas):
+        """
+        Args:
+            path: 数据库路径
+            size: 连接数（同时也是线程数）
+            **pragmas: 传给 apply_pragmas 的参数
+        """
+        self.path = Path(path)
+        self.size = max(1, size)
+        self._connections: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        self._all = []
+        for _ in range(self.size):
+            conn = sqlite3.connect(
+                f"{self.path.as_uri()}?mode=ro", uri=True, check_same_thread=False
+            )
+            conn.row_factory = sqlite3.Row
+            apply_pragmas(conn, read_only=True, **pragmas)
+            self._connections.put(conn)
+            self._all.append(conn)
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="sqlite-read")
+
+        # 统计
+        self._queries = 0
+        self._errors = 0
+        self._query_ms: deque = deque(maxlen=1024)
+
+    def _call(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        conn = self._connections.get()
+        start = time.perf_counter()
+        try:
+            return fn(conn)
+        except Exception:
+            self._errors += 1
+            raise
+        finally:
+            self._queries += 1
+            self._query_ms.append((time.perf_counter() - start) * 1000)
+            self._connections.put(conn)
+
+    async def run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """在只读连接上执行 fn(conn)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, fn)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for conn in self._all:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._all = []
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "idle": self._connections.qsize(),
+            "queries": self._queries,
+            "errors": self._errors,
+            "query_ms": _percentiles(self._query_ms),
+        }
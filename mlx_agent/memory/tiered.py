@@ -4,12 +4,23 @@
 热层 (Hot): ChromaDB - 活跃记忆，快速访问
 温层 (Warm): SQLite - 中期归档，关键词搜索
 冷层 (Cold): ChromaDB - 长期存档，深度检索
+
+分层迁移按 created_at 索引 / ChromaDB where 过滤分批查询，携带已有嵌入批量写入目标层，
+再批量从源层删除。
+
+warm / deep 搜索并发查询各层（每层有独立的延迟预算），
+按排名融合 + 分数归一化合并结果；热层结果足够可信时跳过更深的层。
 """
 
-from typing import Dict, List, Optional, Any, Literal
+from typing import Callable, Dict, List, Optional, Any, Literal, Tuple
+from collections import deque
 from datetime import datetime, timedelta
 from pathlib import Path
 import asyncio
+import bisect
+import time
+
+import numpy as np
 from loguru import logger
 
 from .base import MemoryBackend, MemoryEntry, MemoryLevel
@@ -17,6 +28,40 @@ from .chroma import ChromaMemoryBackend
 from .sqlite import SQLiteMemoryBackend
 
 
+class LatencyHistogram:
+    """固定桶延迟直方图 (毫秒)，附带最近样本的 p50/p99"""
+    
+    BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+    
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.timeouts = 0
+        self.errors = 0
+        self.skipped = 0
+        self._recent: deque = deque(maxlen=1024)
+    
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(self.BUCKETS_MS, ms)] += 1
+        self._recent.append(ms)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        labels = [f"le_{b}" for b in self.BUCKETS_MS] + ["inf"]
+        stats = {
+            "count": sum(self.counts),
+            "buckets": dict(zip(labels, self.counts)),
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "p50_ms": 0.0,
+            "p99_ms": 0.0,
+        }
+        if self._recent:
+            values = np.fromiter(self._recent, dtype=np.float64)
+            stats["p50_ms"] = round(float(np.percentile(values, 50)), 3)
+            stats["p99_ms"] = round(float(np.percentile(values, 99)), 3)
+        return stats
+
+
 class TieredMemoryBackend(MemoryBackend):
     """
     三层记忆后端
@@ -33,9 +78,30 @@ class TieredMemoryBackend(MemoryBackend):
         warm_path: str = "./memory/warm.db",
         cold_path: str = "./memory/cold",
         embedding_provider: str = "local",
-        auto_tiering: bool = True
+        auto_tiering: bool = True,
+        vector_index: str = "flat",
+        ann_config: Optional[Dict[str, Any]] = None,
+        embedding_storage: str = "float32",
+        vector_quantization: Optional[str] = None,
+        tier_budgets_ms: Optional[Dict[str, float]] = None,
+        hot_head_start_ms: float = 50.0,
+        early_stop_score: float = 0.8,
+        rrf_k: int = 60,
+        migration_batch_size: int = 500
     ):
-        """初始化三层记忆后端"""
+        """初始化三层记忆后端
+        
+        Args:
+            vector_index: 温层向量索引类型 ("flat" / "ivf")
+            ann_config: 温层近似索引参数
+            embedding_storage: 温层嵌入 BLOB 存储精度 ("float32" / "float16" / "int8")
+            vector_quantization: 温层 flat 索引常驻量化 (None / "float16" / "int8" / "pq")
+            tier_budgets_ms: 各层搜索的延迟预算 {"hot": ..., "warm": ..., "cold": ...}，超时的层视为无结果
+            hot_head_start_ms: 先等待热层的时间，期间热层已足够可信则不再查询更深的层
+            early_stop_score: 热层结果视为可信的最低分数
+            rrf_k: 排名融合 (RRF) 平滑常数
+            migration_batch_size: 分层迁移每批条数
+        """
         
         # 热层: ChromaDB (活跃记忆)
         self.hot = ChromaMemoryBackend(
@@ -49,7 +115,11 @@ class TieredMemoryBackend(MemoryBackend):
         self.warm = SQLiteMemoryBackend(
             path=warm_path,
             embedding_provider=embedding_provider,
-            auto_archive=False  # 手动控制归档
+            auto_archive=False,  # 手动控制归档
+            vector_index=vector_index,
+            ann_config=ann_config,
+            embedding_storage=embedding_storage,
+            vector_quantization=vector_quantization
         )
         
         # 冷层: ChromaDB (长期存档)
@@ -62,6 +132,19 @@ class TieredMemoryBackend(MemoryBackend):
         
         self.auto_tiering = auto_tiering
         
+        # 并发搜索参数
+        self.tier_budgets_ms = {"hot": 500.0, "warm": 800.0, "cold": 1500.0}
+        self.tier_budgets_ms.update(tier_budgets_ms or {})
+        self.hot_head_start_ms = hot_head_start_ms
+        self.early_stop_score = early_stop_score
+        self.rrf_k = rrf_k
+        self._tier_latency = {tier: LatencyHistogram() for tier in ("hot", "warm", "cold")}
+        self._early_terminations = 0
+        
+        # 分层迁移
+        self.migration_batch_size = max(1, migration_batch_size)
+        self._last_tier_run: Optional[Dict[str, Any]] = None
+        
         # 分层阈值 (天)
         self.hot_warm_threshold = 7    # P1: 7天后移到温层
         self.warm_cold_threshold = 30  # P1: 30天后移到冷层
@@ -103,6 +186,13 @@ class TieredMemoryBackend(MemoryBackend):
         # 确保 P0 记忆不会被自动归档
         return await self.hot.add(entry)
     
+    async def add_many(self, entries: List[MemoryEntry], dedup_threshold: float = 0.95) -> List[str]:
+        """批量添加记忆到热层"""
+        if not self._initialized:
+            await self.initialize()
+        
+        return await self.hot.add_many(entries, dedup_threshold=dedup_threshold)
+    
     async def search(
         self,
         query: str,
@@ -128,31 +218,65 @@ class TieredMemoryBackend(MemoryBackend):
             await self.initialize()
         
         if depth == "hot":
-            # 只搜索热层
-            return await self.hot.search(query, limit=limit, level=level, min_score=min_score)
-        
+            # 只搜索热层：没有其他层可兜底，不受延迟预算限制（冷启动加载模型可能超过预算）
+            return await self._search_tier("hot", query, limit, level, min_score, use_budget=False)
         elif depth == "warm":
-            # 热层 + 温层
-            hot_results = await self.hot.search(query, limit=limit, level=level, min_score=min_score)
-            if len(hot_results) >= limit:
-                return hot_results[:limit]
-            
-            # 补充温层搜索
-            warm_limit = limit - len(hot_results)
-            warm_results = await self.warm.search(query, limit=warm_limit, level=level, min_score=min_score)
-            
-            return self._merge_results(hot_results, warm_results)[:limit]
-        
+            tiers = ["hot", "warm"]
         elif depth == "deep":
-            # 全层搜索
-            hot_results = await self.hot.search(query, limit=limit//2, level=level, min_score=min_score)
-            warm_results = await self.warm.search(query, limit=limit//3, level=level, min_score=min_score)
-            cold_results = await self.cold.search(query, limit=limit//3, level=level, min_score=min_score)
-            
-            return self._merge_results(hot_results, warm_results, cold_results)[:limit]
-        
+            tiers = ["hot", "warm", "cold"]
         else:
             raise ValueError(f"Unknown depth: {depth}")
+        
+        # 热层先行，给它一小段时间；足够可信时跳过更深的层
+        tasks = {"hot": asyncio.create_task(self._search_tier("hot", query, limit, level, min_score))}
+        await asyncio.wait([tasks["hot"]], timeout=self.hot_head_start_ms / 1000)
+        if tasks["hot"].done() and self._is_confident(tasks["hot"].result(), limit):
+            self._early_terminations += 1
+            for tier in tiers[1:]:
+                self._tier_latency[tier].skipped += 1
+            return tasks["hot"].result()[:limit]
+        
+        # 更深的层并发查询
+        for tier in tiers[1:]:
+            tasks[tier] = asyncio.create_task(self._search_tier(tier, query, limit, level, min_score))
+        results = await asyncio.gather(*(tasks[tier] for tier in tiers))
+        
+        return self._fuse_results(list(zip(tiers, results)))[:limit]
+    
+    async def _search_tier(
+        self,
+        tier: str,
+        query: str,
+        limit: int,
+        level: Optional[MemoryLevel],
+        min_score: float,
+        use_budget: bool = True
+    ) -> List[Dict[str, Any]]:
+        """在预算内搜索单层，超时或失败时返回空列表（use_budget=False 时不限时）"""
+        backend = getattr(self, tier)
+        histogram = self._tier_latency[tier]
+        budget = self.tier_budgets_ms.get(tier) if use_budget else None
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(
+                backend.search(query, limit=limit, level=level, min_score=min_score),
+                timeout=budget / 1000 if budget else None
+            )
+        except asyncio.TimeoutError:
+            histogram.timeouts += 1
+            logger.debug(f"{tier} tier search exceeded {budget}ms budget")
+            return []
+        except Exception as e:
+            histogram.errors += 1
+            logger.warning(f"{tier} tier search failed: {e}")
+            return []
+        finally:
+            histogram.observe((time.perf_counter() - start) * 1000)
+    
+    def _is_confident(self, results: List[Dict[str, Any]], limit: int) -> bool:
+        """热层是否已有足够多的高分结果"""
+        confident = sum(1 for r in results if r.get('score', 0) >= self.early_stop_score)
+        return confident >= limit
     
     async def delete(self, memory_id: str) -> bool:
         """删除记忆（尝试从所有层删除）"""
@@ -180,58 +304,120 @@ class TieredMemoryBackend(MemoryBackend):
         
         return self._merge_results(hot_results, warm_results, cold_results)
     
-    async def auto_tier(self) -> Dict[str, int]:
+    async def auto_tier(
+        self,
+        progress: Optional[Callable[[str, int, float], None]] = None
+    ) -> Dict[str, int]:
         """
         自动分层归档
         
+        Args:
+            progress: 进度回调 progress(迁移名称, 已迁移条数, 每秒条数)，每批调用一次
+        
         Returns:
             归档统计 {"hot_to_warm": N, "warm_to_cold": N, "p2_to_cold": N}
         """
         if not self._initialized:
             return {"hot_to_warm": 0, "warm_to_cold": 0, "p2_to_cold": 0, "error": "not_initialized"}
         
-        stats = {"hot_to_warm": 0, "warm_to_cold": 0, "p2_to_cold": 0}
+        start = time.perf_counter()
+        stats = {
+            # 1. P2 记忆 (1天+) → 冷层
+            "p2_to_cold": await self._migrate(
+                "p2_to_cold", self.hot, self.cold, MemoryLevel.P2,
+                min_days=self.p2_hot_threshold, progress=progress
+            ),
+            # 2. P1 记忆 (7-30天) → 温层
+            "hot_to_warm": await self._migrate(
+                "hot_to_warm", self.hot, self.warm, MemoryLevel.P1,
+                min_days=self.hot_warm_threshold, max_days=self.warm_cold_threshold, progress=progress
+            ),
+            # 3. 温层 P1 (30天+) → 冷层
+            "warm_to_cold": await self._migrate(
+                "warm_to_cold", self.warm, self.cold, MemoryLevel.P1,
+                min_days=self.warm_cold_threshold, progress=progress
+            ),
+        }
         
-        now = datetime.now()
+        elapsed = time.perf_counter() - start
+        moved = sum(stats.values())
+        self._last_tier_run = {
+            **stats,
+            "finished_at": datetime.now().isoformat(),
+            "duration_s": round(elapsed, 3),
+            "per_second": round(moved / elapsed, 1) if elapsed > 0 else 0.0,
+        }
         
-        # 1. P2 记忆 (1天+) → 冷层
-        p2_expired = await self._query_by_age_and_level(
-            self.hot, 
-            min_days=self.p2_hot_threshold,
-            level=MemoryLevel.P2
-        )
-        for mem in p2_expired:
-            entry = self._dict_to_entry(mem)
-            await self.cold.add(entry)
-            await self.hot.delete(mem['id'])
-            stats["p2_to_cold"] += 1
-        
-        # 2. P1 记忆 (7天+) → 温层
-        p1_warm = await self._query_by_age_and_level(
-            self.hot,
-            min_days=self.hot_warm_threshold,
-            max_days=self.warm_cold_threshold,
-            level=MemoryLevel.P1
-        )
-        for mem in p1_warm:
-            entry = self._dict_to_entry(mem)
-            await self.warm.add(entry)
-            await self.hot.delete(mem['id'])
-            stats["hot_to_warm"] += 1
-        
-        # 3. 温层 P1 (30天+) → 冷层
-        warm_expired = await self._query_warm_by_age(min_days=self.warm_cold_threshold)
-        for mem in warm_expired:
-            entry = self._dict_to_entry(mem)
-            await self.cold.add(entry)
-            await self.warm.delete(mem['id'])
-            stats["warm_to_cold"] += 1
-        
-        if any(stats.values()):
-            logger.info(f"Auto-tier completed: {stats}")
+        if moved:
+            logger.info(f"Auto-tier completed: {stats} in {elapsed:.2f}s")
         
         return stats
     
+    async def _migrate(
+        self,
+        name: str,
+        source: MemoryBackend,
+        target: MemoryBackend,
+        level: MemoryLevel,
+        min_days: int,
+        max_days: Optional[int] = None,
+        progress: Optional[Callable[[str, int, float], None]] = None
+    ) -> int:
+        """分批把源层中符合年龄条件的记忆移到目标层
+        
+        每批: 按年龄索引查询（附带嵌入）-> 目标层 add_many（复用嵌入、不做去重）
+        -> 源层 delete_many。源层删除失败时停止，避免重复处理同一批。
+        
+        Returns:
+            迁移条数
+        """
+        moved = 0
+        seen = set()
+        start = time.perf_counter()
+        
+        while True:
+            batch = await source.get_by_age(
+                min_days=min_days,
+                max_days=max_days,
+                level=level,
+                limit=self.migration_batch_size,
+                include_embeddings=True
+            )
+            batch = [mem for mem in batch if mem['id'] not in seen]
+            if not batch:
+                break
+            
+            entries = [self._dict_to_entry(mem) for mem in batch]
+            ids = [entry.memory_id for entry in entries]
+            seen.update(ids)
+            
+            await self._add_migrated(target, entries)
+            deleted = await source.delete_many(ids)
+            
+            moved += len(entries)
+            elapsed = time.perf_counter() - start
+            rate = moved / elapsed if elapsed > 0 else 0.0
+            logger.debug(f"Tier migration {name}: {moved} moved ({rate:.0f}/s)")
+            if progress is not None:
+                progress(name, moved, rate)
+            
+            if deleted < len(ids):
+                logger.warning(
+                    f"Tier migration {name} stopped: deleted {deleted}/{len(ids)} "
+                    f"migrated memories from source tier"
+                )
+                break
+            
+            if len(batch) < self.migration_batch_size:
+                break
+        
+        return moved
+    
+    @staticmethod
+    async def _add_migrated(target: MemoryBackend, entries: List[MemoryEntry]):
+        """写入迁移条目：复用嵌入，跳过近重复检测"""
+        await target.add_many(entries, dedup_threshold=1.1)
+    
     async def get_stats(self) -> Dict[str, Any]:
         """获取三层统计信息"""
         if not self._initialized:
@@ -255,6 +441,12 @@ class TieredMemoryBackend(MemoryBackend):
             "warm": warm_stats,
             "cold": cold_stats,
             "total_memories": total_memories,
+            "last_tier_run": self._last_tier_run,
+            "search": {
+                "early_terminations": self._early_terminations,
+                "budgets_ms": self.tier_budgets_ms,
+                "latency": {tier: h.get_stats() for tier, h in self._tier_latency.items()}
+            },
             "tiering_thresholds": {
                 "hot_to_warm_days": self.hot_warm_threshold,
                 "warm_to_cold_days": self.warm_cold_threshold,
@@ -291,62 +483,69 @@ class TieredMemoryBackend(MemoryBackend):
         
         return merged
     
+    def _fuse_results(self, tier_results: List[Tuple[str, List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+        """融合多层搜索结果
+        
+        Chroma 与 SQLite 的分数尺度不同，先在每层内做 min-max 归一化，
+        再与 RRF 排名分各占一半；同一记忆出现在多层时 RRF 分累加、归一化分取最大。
+        某层只有一条结果（或分数全部相同）时无法归一化，改用截断到 [0, 1] 的原始分数，
+        避免单条低分结果被当作满分。
+        
+        Returns:
+            按融合分数排序的结果，score 为融合分数，tier_score 为原始分数
+        """
+        rrf_top = 1.0 / (self.rrf_k + 1)
+        fused: Dict[str, Dict[str, Any]] = {}
+        
+        for tier, results in tier_results:
+            if not results:
+                continue
+            scores = [r.get('score', 0.0) for r in results]
+            lo, hi = min(scores), max(scores)
+            for rank, mem in enumerate(results):
+                mem_id = mem.get('id') or mem.get('memory_id')
+                if not mem_id:
+                    continue
+                raw = mem.get('score', 0.0)
+                norm = (raw - lo) / (hi - lo) if hi > lo else min(max(raw, 0.0), 1.0)
+                rrf = (1.0 / (self.rrf_k + rank + 1)) / rrf_top
+                item = fused.get(mem_id)
+                if item is None:
+                    fused[mem_id] = {
+                        "mem": dict(mem, tier=tier, tier_score=raw),
+                        "rrf": rrf,
+                        "norm": norm,
+                    }
+                else:
+                    item["rrf"] += rrf
+                    item["norm"] = max(item["norm"], norm)
+        
+        merged = []
+        for item in fused.values():
+            mem = item["mem"]
+            mem["score"] = 0.5 * item["norm"] + 0.5 * min(item["rrf"], 1.0)
+            merged.append(mem)
+        merged.sort(key=lambda x: x["score"], reverse=True)
+        return merged
+    
+    # 后端写入时自行生成的元数据字段
+    _RESERVED_METADATA = ("level", "created_at", "created_ts")
+    
     def _dict_to_entry(self, data: Dict[str, Any]) -> MemoryEntry:
-        """将字典转换为 MemoryEntry"""
+        """将字典转换为 MemoryEntry（携带已有嵌入）"""
+        metadata = {
+            k: v for k, v in (data.get('metadata') or {}).items() if k not in self._RESERVED_METADATA
+        }
+        embedding = data.get('embedding')
         return MemoryEntry(
             content=data.get('content', ''),
-            metadata=data.get('metadata', {}),
+            metadata=metadata,
             level=MemoryLevel(data.get('level', 'P1')),
+            embedding=embedding if embedding is not None and len(embedding) else None,
             memory_id=data.get('id') or data.get('memory_id'),
             created_at=datetime.fromisoformat(data['created_at']) if data.get('created_at') else None
         )
     
-    async def _query_by_age_and_level(
-        self,
-        backend: MemoryBackend,
-        min_days: int,
-        max_days: Optional[int] = None,
-        level: Optional[MemoryLevel] = None
-    ) -> List[Dict[str, Any]]:
-        """按年龄和级别查询记忆"""
-        results = []
-        now = datetime.now()
-        
-        if level:
-            memories = await backend.get_by_level(level)
-        else:
-            # 获取所有级别
-            memories = []
-            for lvl in MemoryLevel:
-                memories.extend(await backend.get_by_level(lvl))
-        
-        for mem in memories:
-            try:
-                created_at_str = mem.get('metadata', {}).get('created_at') or mem.get('created_at')
-                if not created_at_str:
-                    continue
-                
-                created_at = datetime.fromisoformat(created_at_str)
-                age_days = (now - created_at).days
-                
-                # 检查年龄范围
-                if age_days >= min_days:
-                    if max_days is None or age_days < max_days:
-                        results.append(mem)
-            except (ValueError, TypeError) as e:
-                logger.debug(f"Failed to parse created_at for memory {mem.get('id')}: {e}")
-                continue
-        
-        return results
-    
-    async def _query_warm_by_age(self, min_days: int) -> List[Dict[str, Any]]:
-        """从温层查询指定年龄以上的记忆"""
-        return await self._query_by_age_and_level(
-            self.warm,
-            min_days=min_days,
-            level=MemoryLevel.P1
-        )
-    
     async def _auto_tier_loop(self):
         """自动分层循环"""
         while self._initialized:
@@ -370,13 +569,13 @@ class TieredMemoryBackend(MemoryBackend):
                 return True
         return False
     
-    async def detect_duplicates(self, threshold: float = 0.9) -> List[str]:
-        """检测重复记忆（只在热层检测）"""
-        return await self.hot.detect_duplicates(threshold)
+    async def detect_duplicates(self, threshold: float = 0.9, block_size: int = 1024) -> List[List[str]]:
+        """检测重复记忆（只在热层检测），返回重复簇"""
+        return await self.hot.detect_duplicates(threshold, block_size)
     
-    async def merge_duplicates(self, keep: str = "newest") -> Dict[str, int]:
+    async def merge_duplicates(self, keep: str = "newest", threshold: float = 0.9) -> Dict[str, int]:
         """合并重复记忆"""
-        return await self.hot.merge_duplicates(keep)
+        return await self.hot.merge_duplicates(keep, threshold)
     
     async def get_memory_stats(self) -> Dict[str, Any]:
         """获取详细记忆统计"""
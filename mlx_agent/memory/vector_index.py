@@ -0,0 +1,470 @@
+"""
+向量索引
+
+为 SQLite 后端提供可插拔的 Top-K 向量检索：
+- flat: 常驻内存的预归一化 float32 矩阵，一次矩阵乘法精确检索
+- ivf: IVF-Flat 近似检索（见 ann_index.py），适合百万级记忆
+
+flat 索引特点:
+- id -> 行号映射，支持 O(1) 删除（末行交换）
+- 每行记录级别编码，按级别过滤时使用布尔掩码
+- argpartition 选取 Top-K，避免全量排序
+"""
+
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+
+class VectorIndex(ABC):
+    """向量索引抽象基类"""
+
+    # 是否需要持久化到磁盘（flat 索引直接从数据库重建即可）
+    persistent = False
+
+    # 分数是否为近似值（量化索引），为 True 时调用方应按全精度向量重排
+    approximate_scores = False
+
+    # 级别编码 (uint8)，未知级别统一映射为 255
+    LEVEL_CODES = {"P0": 0, "P1": 1, "P2": 2}
+    UNKNOWN_LEVEL = 255
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    @abstractmethod
+    def __contains__(self, memory_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def add_many(self, memory_ids: List[str], vectors, levels: Optional[Iterable] = None) -> int:
+        """批量添加向量，返回实际写入条数"""
+        ...
+
+    @abstractmethod
+    def remove(self, memory_id: str) -> bool:
+        """删除向量"""
+        ...
+
+    @abstractmethod
+    def set_level(self, memory_id: str, level) -> bool:
+        """更新级别"""
+        ...
+
+    @abstractmethod
+    def search(self, query, k: int, level=None) -> List[Tuple[str, float]]:
+        """Top-K 检索，返回 [(memory_id, score), ...]"""
+        ...
+
+    @abstractmethod
+    def clear(self):
+        """清空索引"""
+        ...
+
+    @abstractmethod
+    def get_stats(self) -> Dict[str, Any]:
+        """索引统计"""
+        ...
+
+    def add(self, memory_id: str, vector, level=None) -> bool:
+        """添加或覆盖单条向量"""
+        return self.add_many([memory_id], [vector], [level]) == 1
+
+    def search_batch(self, queries, k: int, levels: Optional[Iterable] = None) -> List[List[Tuple[str, float]]]:
+        """批量 Top-K 检索
+
+        Args:
+            queries: (n, dim) 查询矩阵
+            k: 每个查询返回数量
+            levels: 每个查询的级别过滤，None 表示不过滤
+
+        Returns:
+            每个查询的 [(memory_id, score), ...]
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        levels = list(levels) if levels is not None else [None] * len(queries)
+        return [self.search(q, k, level) for q, level in zip(queries, levels)]
+
+    @property
+    def needs_training(self) -> bool:
+        """是否需要（重新）训练，只有近似索引会返回 True"""
+        return False
+
+    def train(self):
+        """训练索引（精确索引无需训练）"""
+        pass
+
+    @classmethod
+    def _level_code(cls, level) -> int:
+        value = getattr(level, "value", level)
+        return cls.LEVEL_CODES.get(value, cls.UNKNOWN_LEVEL)
+
+    @staticmethod
+    def _normalize_rows(vectors) -> np.ndarray:
+        """转换为二维 float32 并按行归一化"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+def batch_duplicate_mask(vectors, levels: Optional[List] = None, threshold: float = 0.95) -> np.ndarray:
+    """批内近重复筛选
+
+    按顺序保留第一条，之后与已保留条目余弦相似度 >= threshold（且级别相同）的视为重复。
+
+    Args:
+        vectors: (n, dim) 向量矩阵
+        levels: 级别列表，None 表示忽略级别
+        threshold: 相似度阈值
+
+    Returns:
+        长度 n 的布尔数组，True 表示保留
+    """
+    normalized = VectorIndex._normalize_rows(vectors)
+    n = normalized.shape[0]
+    keep = np.ones(n, dtype=bool)
+    if n < 2:
+        return keep
+
+    sims = normalized @ normalized.T
+    if levels is not None:
+        codes = np.array([VectorIndex._level_code(level) for level in levels])
+        sims[codes[:, None] != codes[None, :]] = -1.0
+    # 只比较排在前面的条目
+    sims[np.triu_indices(n)] = -1.0
+    candidates = np.flatnonzero((sims >= threshold).any(axis=1))
+    for i in candidates:
+        if (sims[i, :i][keep[:i]] >= threshold).any():
+            keep[i] = False
+    return keep
+
+
+def find_duplicate_clusters(vectors, threshold: float = 0.9, block_size: int = 1024) -> List[List[int]]:
+    """分块矩阵乘法查找重复簇
+
+    按行顺序，每个尚未归簇的向量作为簇首，收拢其后所有相似度 >= threshold
+    且尚未归簇的向量。相似度按 block_size x block_size 分块计算，内存占用有界。
+
+    Args:
+        vectors: (n, dim) 向量矩阵
+        threshold: 相似度阈值
+        block_size: 分块大小
+
+    Returns:
+        重复簇列表，每个簇为行号列表（簇首在前，至少两个元素）
+    """
+    normalized = VectorIndex._normalize_rows(vectors)
+    n = normalized.shape[0]
+    block_size = max(1, block_size)
+
+    # 收集所有 i < j 且相似的行对（稀疏）
+    neighbors: Dict[int, List[np.ndarray]] = {}
+    for i0 in range(0, n, block_size):
+        i1 = min(i0 + block_size, n)
+        row_block = normalized[i0:i1]
+        for j0 in range(i0, n, block_size):
+            j1 = min(j0 + block_size, n)
+            tile = row_block @ normalized[j0:j1].T
+            if j0 == i0:
+                tile = np.triu(tile, k=1)
+            rows, cols = np.nonzero(tile >= threshold)
+            if rows.size == 0:
+                continue
+            rows += i0
+            cols += j0
+            order = np.argsort(rows, kind="stable")
+            rows, cols = rows[order], cols[order]
+            starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+            for start, end in zip(starts, np.r_[starts[1:], rows.size]):
+                neighbors.setdefault(int(rows[start]), []).append(cols[start:end])
+
+    assigned = np.zeros(n, dtype=bool)
+    clusters = []
+    for i in sorted(neighbors):
+        if assigned[i]:
+            continue
+        members = np.unique(np.concatenate(neighbors[i]))
+        members = members[~assigned[members]]
+        if members.size == 0:
+            continue
+        assigned[i] = True
+        assigned[members] = True
+        clusters.append([i] + members.tolist())
+    return clusters
+
+
+def create_vector_index(kind: str = "flat", **kwargs) -> VectorIndex:
+    """创建向量索引
+
+    Args:
+        kind: "flat" (精确) 或 "ivf" (IVF-Flat 近似)
+        **kwargs: 索引参数，flat 索引可传 quantization ("float16" / "int8" / "pq")
+
+    Returns:
+        向量索引实例
+    """
+    kind = (kind or "flat").lower()
+    quantization = kwargs.pop("quantization", None)
+    if quantization and kind != "flat":
+        raise ValueError(f"Quantization is only supported by the flat index, got: {kind}")
+    if kind == "flat":
+        if quantization:
+            from .quantization import QuantizedMatrixIndex
+            return QuantizedMatrixIndex(quantization=quantization, **kwargs)
+        return VectorMatrixIndex(**kwargs)
+    if kind == "ivf":
+        from .ann_index import IVFFlatIndex
+        return IVFFlatIndex(**kwargs)
+    raise ValueError(f"Unknown vector index: {kind}. Use 'flat' or 'ivf'")
+
+
+class VectorMatrixIndex(VectorIndex):
+    """精确向量索引（内存矩阵）
+
+    所有向量在写入时归一化，余弦相似度即为点积。
+    行按容量倍增分配，删除时把末行搬到空位，矩阵始终保持紧凑。
+    """
+
+    def __init__(self, dim: Optional[int] = None, initial_capacity: int = 1024):
+        """
+        Args:
+            dim: 向量维度，None 表示由第一条向量决定
+            initial_capacity: 初始行容量
+        """
+        self.dim = dim
+        self._initial_capacity = max(1, initial_capacity)
+        self._matrix: Optional[np.ndarray] = None
+        self._levels: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._size = 0
+        self._lock = threading.RLock()
+
+        if dim is not None:
+            self._allocate(self._initial_capacity)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, memory_id: str) -> bool:
+        return memory_id in self._id_to_row
+
+    # ===== 内部工具 =====
+
+    def _allocate(self, capacity: int):
+        """分配（或扩容）底层数组"""
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        levels = np.full(capacity, self.UNKNOWN_LEVEL, dtype=np.uint8)
+        if self._matrix is not None and self._size:
+            matrix[:self._size] = self._matrix[:self._size]
+            levels[:self._size] = self._levels[:self._size]
+        self._matrix = matrix
+        self._levels = levels
+
+    def _ensure_capacity(self, extra: int):
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        needed = self._size + extra
+        if needed <= capacity:
+            return
+        new_capacity = max(capacity, self._initial_capacity)
+        while new_capacity < needed:
+            new_capacity *= 2
+        self._allocate(new_capacity)
+
+    def _store_rows(self, rows: np.ndarray, vectors: np.ndarray):
+        """把归一化向量写入指定行（子类可改为压缩存储）"""
+        self._matrix[rows] = vectors
+
+    def _move_row(self, src: int, dst: int):
+        """删除时把 src 行搬到 dst"""
+        self._matrix[dst] = self._matrix[src]
+
+    def _score_rows(self, queries: np.ndarray) -> np.ndarray:
+        """(n, dim) 归一化查询对全部有效行的相似度，返回 (n, size)"""
+        return queries @ self._matrix[:self._size].T
+
+    def _prepare(self, vectors) -> Optional[np.ndarray]:
+        """归一化，维度不符时返回 None"""
+        vectors = self._normalize_rows(vectors)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self._allocate(self._initial_capacity)
+        if vectors.shape[1] != self.dim:
+            return None
+        return vectors
+
+    # ===== 写入 =====
+
+    def add_many(self, memory_ids: List[str], vectors, levels: Optional[Iterable] = None) -> int:
+        """批量添加向量
+
+        Args:
+            memory_ids: 记忆 ID 列表
+            vectors: 向量列表或 (n, dim) 矩阵
+            levels: 级别列表，与 memory_ids 一一对应
+
+        Returns:
+            实际写入的条数
+        """
+        if not memory_ids:
+            return 0
+        levels = list(levels) if levels is not None else [None] * len(memory_ids)
+
+        with self._lock:
+            normalized = self._prepare(np.asarray(vectors, dtype=np.float32))
+            if normalized is None:
+                logger.warning(
+                    f"VectorMatrixIndex: dimension mismatch, expected {self.dim}, skipping {len(memory_ids)} vectors"
+                )
+                return 0
+
+            self._ensure_capacity(len(memory_ids))
+            rows = np.empty(len(memory_ids), dtype=np.int64)
+            for i, (memory_id, level) in enumerate(zip(memory_ids, levels)):
+                row = self._id_to_row.get(memory_id)
+                if row is None:
+                    row = self._size
+                    self._size += 1
+                    self._ids.append(memory_id)
+                    self._id_to_row[memory_id] = row
+                rows[i] = row
+                self._levels[row] = self._level_code(level)
+            self._store_rows(rows, normalized)
+            return len(memory_ids)
+
+    def remove(self, memory_id: str) -> bool:
+        """删除向量（末行交换，O(1)）"""
+        with self._lock:
+            row = self._id_to_row.pop(memory_id, None)
+            if row is None:
+                return False
+            last = self._size - 1
+            if row != last:
+                moved_id = self._ids[last]
+                self._move_row(last, row)
+                self._levels[row] = self._levels[last]
+                self._ids[row] = moved_id
+                self._id_to_row[moved_id] = row
+            self._ids.pop()
+            self._levels[last] = self.UNKNOWN_LEVEL
+            self._size = last
+            return True
+
+    def set_level(self, memory_id: str, level) -> bool:
+        """更新某条向量的级别"""
+        with self._lock:
+            row = self._id_to_row.get(memory_id)
+            if row is None:
+                return False
+            self._levels[row] = self._level_code(level)
+            return True
+
+    def clear(self):
+        """清空索引（保留维度）"""
+        with self._lock:
+            self._ids = []
+            self._id_to_row = {}
+            self._size = 0
+            self._matrix = None
+            self._levels = None
+            if self.dim is not None:
+                self._allocate(self._initial_capacity)
+
+    # ===== 查询 =====
+
+    def search(
+        self,
+        query,
+        k: int,
+        level=None
+    ) -> List[Tuple[str, float]]:
+        """Top-K 余弦相似度检索
+
+        Args:
+            query: 查询向量
+            k: 返回数量
+            level: 只在指定级别中检索
+
+        Returns:
+            [(memory_id, score), ...]，按分数降序
+        """
+        with self._lock:
+            if self._size == 0 or k <= 0:
+                return []
+            q = self._prepare(np.asarray(query, dtype=np.float32))
+            if q is None:
+                logger.warning(f"VectorMatrixIndex: query dimension mismatch, expected {self.dim}")
+                return []
+
+            scores = self._score_rows(q)[0]
+            if level is not None:
+                mask = self._levels[:self._size] == self._level_code(level)
+                candidates = np.flatnonzero(mask)
+                if candidates.size == 0:
+                    return []
+                scores = scores[candidates]
+            else:
+                candidates = None
+
+            k = min(k, scores.shape[0])
+            if k < scores.shape[0]:
+                top = np.argpartition(-scores, k - 1)[:k]
+            else:
+                top = np.arange(scores.shape[0])
+            top = top[np.argsort(-scores[top], kind="stable")]
+
+            rows = candidates[top] if candidates is not None else top
+            return [(self._ids[row], float(scores[i])) for row, i in zip(rows, top)]
+
+    def search_batch(self, queries, k: int, levels: Optional[Iterable] = None) -> List[List[Tuple[str, float]]]:
+        """批量 Top-K 检索（一次矩阵乘法，级别过滤用掩码）"""
+        with self._lock:
+            n = len(queries)
+            if self._size == 0 or k <= 0 or n == 0:
+                return [[] for _ in range(n)]
+            q = self._prepare(np.asarray(queries, dtype=np.float32))
+            if q is None:
+                logger.warning(f"VectorMatrixIndex: query dimension mismatch, expected {self.dim}")
+                return [[] for _ in range(n)]
+
+            scores = self._score_rows(q)
+            if levels is not None:
+                codes = np.array([
+                    -1 if level is None else self._level_code(level) for level in levels
+                ])
+                mismatch = (codes[:, None] >= 0) & (self._levels[None, :self._size] != codes[:, None])
+                scores[mismatch] = -np.inf
+            k = min(k, self._size)
+            if k < self._size:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            else:
+                top = np.tile(np.arange(self._size), (n, 1))
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            return [
+                [
+                    (self._ids[row], float(score))
+                    for row, score in zip(rows, row_scores) if score != -np.inf
+                ]
+                for rows, row_scores in zip(top, top_scores)
+            ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """索引统计"""
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        return {
+            "type": "flat",
+            "size": self._size,
+            "dim": self.dim or 0,
+            "capacity": capacity,
+            "memory_bytes": 0 if self._matrix is None else int(self._matrix.nbytes + self._levels.nbytes),
+        }
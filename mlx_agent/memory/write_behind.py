@@ -0,0 +1,490 @@
+"""
+记忆写入后置队列 (write-behind)
+
+WriteBehindMemoryBackend 包装任意 MemoryBackend，把 add() 从请求路径上移开:
+- add() 只追加日志并入队，立即返回记忆 ID；嵌入、去重、提交与 ChromaDB 写入由后台批量完成
+- 队列容量有上限，满时 add() 等待（背压）
+- 凑满 batch_size 或等待 flush_interval_ms 后调用一次 add_many()
+- 入队前先写本地日志 (JSON Lines) 并 fsync，启动时重放未确认的条目，崩溃不丢数据
+- 刷新完成前的 search() / get_by_level() 合并队列中的待写记忆（读己之写）
+- 批量写入失败时退避重试，超过 max_retries 后整批转入死信日志，不阻塞后续写入
+
+其他修改操作（delete、upgrade_memory_level、批量归档等）执行前先等待队列刷新完成。
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from loguru import logger
+
+from .base import MemoryBackend, MemoryEntry, MemoryLevel
+from .search_cache import normalize_query
+
+
+def _bigrams(text: str) -> Set[str]:
+    text = text.replace(" ", "")
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def pending_match_score(query: str, content: str) -> float:
+    """待写记忆与查询的匹配分数（子串命中为 1，否则按字符二元组覆盖率，适用于中英文）"""
+    q = normalize_query(query)
+    c = normalize_query(content)
+    if not q or not c:
+        return 0.0
+    if q in c:
+        return 1.0
+    q_grams = _bigrams(q)
+    return len(q_grams & _bigrams(c)) / len(q_grams) if q_grams else 0.0
+
+
+class WriteBehindMemoryBackend(MemoryBackend):
+    """为任意记忆后端增加异步批量写入
+
+    Example:
+        >>> backend = WriteBehindMemoryBackend(HybridMemoryBackend(), journal_path="./memory/write_behind.jsonl")
+        >>> await backend.initialize()          # 重放上次未写入的条目
+        >>> await backend.add(entry)             # 写日志后立即返回
+        >>> await backend.search("...")          # 包含尚未刷新的记忆
+        >>> await backend.flush()
+    """
+
+    def __init__(
+        self,
+        backend: MemoryBackend,
+        journal_path: Optional[str] = "./memory/write_behind.jsonl",
+        max_pending: int = 1000,
+        batch_size: int = 64,
+        flush_interval_ms: float = 200.0,
+        fsync: bool = True,
+        pending_min_score: float = 0.3,
+        retry_delay_s: float = 1.0,
+        max_retries: int = 5,
+        dead_letter_path: Optional[str] = None,
+        compact_bytes: int = 4 * 1024 * 1024
+    ):
+        """
+        Args:
+            backend: 被包装的记忆后端
+            journal_path: 日志路径，None 表示不落盘（进程崩溃会丢失队列中的记忆）
+            max_pending: 队列容量，满时 add() 等待
+            batch_size: 单次 add_many() 的最大条数
+            flush_interval_ms: 第一条记忆入队后最多等待的毫秒数
+            fsync: 每次追加日志后是否 fsync
+            pending_min_score: 待写记忆参与搜索结果的最低匹配分数
+            retry_delay_s: 批量写入失败后的重试间隔（指数退避，上限 30 秒）
+            max_retries: 单批最多重试次数，仍失败则写入死信日志并丢弃
+            dead_letter_path: 死信日志路径，默认与 journal_path 同目录的 *.dead.jsonl
+            compact_bytes: 日志超过该大小且仍有待写记忆时重写日志
+        """
+        self.backend = backend
+        self.journal_path = Path(journal_path) if journal_path else None
+        self.max_pending = max(1, max_pending)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.0, flush_interval_ms) / 1000
+        self.fsync = fsync
+        self.pending_min_score = pending_min_score
+        self.retry_delay_s = retry_delay_s
+        self.max_retries = max(0, max_retries)
+        if dead_letter_path:
+            self.dead_letter_path = Path(dead_letter_path)
+        elif self.journal_path is not None:
+            self.dead_letter_path = self.journal_path.with_name(f"{self.journal_path.stem}.dead.jsonl")
+        else:
+            self.dead_letter_path = None
+        self.compact_bytes = compact_bytes
+
+        # 待写记忆（按入队顺序），刷新成功后移除
+        self._pending: "OrderedDict[str, MemoryEntry]" = OrderedDict()
+        # 死信日志也写失败的记忆，日志压缩时保留，重启后重放
+        self._unrecorded: "OrderedDict[str, MemoryEntry]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._journal = None
+        self._journal_lock = asyncio.Lock()
+        self._journal_bytes = 0
+        # 每批写完（或转入死信）后通知 flush()
+        self._batch_done = asyncio.Condition()
+        self._initialized = False
+
+        # 统计
+        self._enqueued = 0
+        self._flushed = 0
+        self._batches = 0
+        self._flush_errors = 0
+        self._dead_lettered = 0
+        self._backpressure_waits = 0
+        self._replayed = 0
+        self._compactions = 0
+        self._flush_ms: List[float] = []
+
+    def __getattr__(self, name: str):
+        if name == "backend":
+            raise AttributeError(name)
+        attr = getattr(self.backend, name)
+        if asyncio.iscoroutinefunction(attr):
+            async def flushed_first(*args, **kwargs):
+                # 未显式包装的操作可能读写底层数据，先等待队列写完
+                await self.flush()
+                return await attr(*args, **kwargs)
+            return flushed_first
+        return attr
+
+    # ===== 生命周期 =====
+
+    async def initialize(self):
+        """初始化后端、打开日志并重放未确认的记忆"""
+        if self._initialized:
+            return
+        await self.backend.initialize()
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+
+        replay: List[MemoryEntry] = []
+        if self.journal_path is not None:
+            loop = asyncio.get_event_loop()
+            replay = await loop.run_in_executor(None, self._open_journal)
+
+        self._worker = asyncio.create_task(self._flush_loop())
+        self._initialized = True
+
+        for entry in replay:
+            self._track(entry)
+            await self._enqueue(entry)
+        if replay:
+            self._replayed += len(replay)
+            logger.info(f"Replaying {len(replay)} unflushed memories from {self.journal_path}")
+
+    async def close(self):
+        """写完队列中的记忆后关闭"""
+        if self._initialized:
+            await self.flush()
+            if self._worker is not None:
+                self._worker.cancel()
+                try:
+                    await self._worker
+                except asyncio.CancelledError:
+                    pass
+                self._worker = None
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            self._initialized = False
+        await self.backend.close()
+
+    # ===== 写入 =====
+
+    async def add(self, entry: MemoryEntry) -> str:
+        """写日志并入队，立即返回记忆 ID"""
+        if not self._initialized:
+            await self.initialize()
+        # 先登记为待写再写日志，日志压缩时不会漏掉正在写入的记忆
+        self._track(entry)
+        await self._append_journal([{"op": "add", "entry": self._entry_to_dict(entry)}])
+        await self._enqueue(entry)
+        return entry.memory_id
+
+    async def add_many(self, entries: List[MemoryEntry], dedup_threshold: float = 0.95) -> List[str]:
+        """批量入队；非默认去重阈值（迁移、回放）在刷新队列后直接写入后端"""
+        if not self._initialized:
+            await self.initialize()
+        if dedup_threshold != 0.95:
+            await self.flush()
+            return await self.backend.add_many(entries, dedup_threshold=dedup_threshold)
+        for entry in entries:
+            self._track(entry)
+        await self._append_journal([{"op": "add", "entry": self._entry_to_dict(e)} for e in entries])
+        for entry in entries:
+            await self._enqueue(entry)
+        return [entry.memory_id for entry in entries]
+
+    async def flush(self):
+        """等待调用时已入队的记忆写入后端（或转入死信），之后入队的不等待"""
+        if not self._initialized or not self._pending:
+            return
+        targets = set(self._pending)
+        async with self._batch_done:
+            await self._batch_done.wait_for(lambda: targets.isdisjoint(self._pending))
+
+    @property
+    def pending_writes(self) -> int:
+        """尚未写入后端的记忆数"""
+        return len(self._pending)
+
+    # ===== 读取（合并待写记忆） =====
+
+    async def search(
+        self,
+        query: str,
+        limit: int = 5,
+        level: Optional[MemoryLevel] = None,
+        min_score: float = 0.0
+    ) -> List[Dict[str, Any]]:
+        """搜索记忆，结果包含尚未刷新的匹配记忆（标记 pending=True）"""
+        results = await self.backend.search(query, limit=limit, level=level, min_score=min_score)
+        if not self._pending:
+            return results
+
+        level_value = MemoryLevel(level).value if level is not None else None
+        threshold = max(min_score, self.pending_min_score)
+        seen = {r.get("id") for r in results}
+        extra = []
+        for entry in list(self._pending.values()):
+            if entry.memory_id in seen:
+                continue
+            if level_value is not None and entry.level.value != level_value:
+                continue
+            score = pending_match_score(query, entry.content)
+            if score >= threshold:
+                extra.append(self._pending_result(entry, score))
+        if not extra:
+            return results
+        merged = sorted(results + extra, key=lambda r: r.get("score", 0.0), reverse=True)
+        return merged[:limit]
+
+    async def get_by_level(self, level: MemoryLevel) -> List[Dict[str, Any]]:
+        results = await self.backend.get_by_level(level)
+        level_value = MemoryLevel(level).value
+        seen = {r.get("id") for r in results}
+        for entry in list(self._pending.values()):
+            if entry.level.value == level_value and entry.memory_id not in seen:
+                results.append(self._pending_result(entry, None))
+        return results
+
+    async def delete(self, memory_id: str) -> bool:
+        await self.flush()
+        return await self.backend.delete(memory_id)
+
+    async def delete_many(self, memory_ids: List[str]) -> int:
+        await self.flush()
+        return await self.backend.delete_many(memory_ids)
+
+    async def get_by_age(
+        self,
+        min_days: int,
+        max_days: Optional[int] = None,
+        level: Optional[MemoryLevel] = None,
+        limit: Optional[int] = None,
+        include_embeddings: bool = False
+    ) -> List[Dict[str, Any]]:
+        """按年龄查询（先等待队列写完，结果只来自后端）"""
+        await self.flush()
+        return await self.backend.get_by_age(
+            min_days, max_days=max_days, level=level, limit=limit, include_embeddings=include_embeddings
+        )
+
+    async def get_stats(self) -> Dict[str, Any]:
+        stats = dict(await self.backend.get_stats())
+        flush_ms = sorted(self._flush_ms)
+        stats["write_behind"] = {
+            "pending": len(self._pending),
+            "max_pending": self.max_pending,
+            "enqueued": self._enqueued,
+            "flushed": self._flushed,
+            "batches": self._batches,
+            "avg_batch": round(self._flushed / self._batches, 2) if self._batches else 0.0,
+            "flush_p50_ms": round(flush_ms[len(flush_ms) // 2], 2) if flush_ms else 0.0,
+            "flush_errors": self._flush_errors,
+            "dead_lettered": self._dead_lettered,
+            "backpressure_waits": self._backpressure_waits,
+            "replayed": self._replayed,
+            "journal_bytes": self._journal_bytes,
+            "compactions": self._compactions,
+        }
+        return stats
+
+    # ===== 内部实现 =====
+
+    @staticmethod
+    def _entry_to_dict(entry: MemoryEntry) -> Dict[str, Any]:
+        data = entry.to_dict()
+        if data.get("embedding") is not None:
+            data["embedding"] = [float(x) for x in data["embedding"]]
+        return data
+
+    @staticmethod
+    def _pending_result(entry: MemoryEntry, score: Optional[float]) -> Dict[str, Any]:
+        result = {
+            "id": entry.memory_id,
+            "content": entry.content,
+            "metadata": entry.metadata,
+            "level": entry.level.value,
+            "created_at": entry.created_at.isoformat() if entry.created_at else None,
+            "pending": True,
+        }
+        if score is not None:
+            result["score"] = score
+        return result
+
+    def _track(self, entry: MemoryEntry):
+        self._pending[entry.memory_id] = entry
+
+    async def _enqueue(self, entry: MemoryEntry):
+        """入队，队列已满时等待（背压）"""
+        if self._queue.full():
+            self._backpressure_waits += 1
+        self._enqueued += 1
+        await self._queue.put(entry)
+
+    async def _flush_loop(self):
+        """后台批量刷新"""
+        while True:
+            first = await self._queue.get()
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            await self._write_batch(batch)
+            for _ in batch:
+                self._queue.task_done()
+            async with self._batch_done:
+                self._batch_done.notify_all()
+
+    async def _write_batch(self, batch: List[MemoryEntry]):
+        """写入一批记忆，失败时退避重试，超过 max_retries 后转入死信日志"""
+        delay = self.retry_delay_s
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                await self.backend.add_many(batch)
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._flush_errors += 1
+                if attempt >= self.max_retries:
+                    logger.error(f"Write-behind flush of {len(batch)} memories failed {attempt + 1} times, dead-lettering: {e}")
+                    await self._dead_letter(batch, e)
+                    return
+                attempt += 1
+                logger.warning(f"Write-behind flush of {len(batch)} memories failed, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+        self._flush_ms.append((time.perf_counter() - start) * 1000)
+        if len(self._flush_ms) > 1024:
+            del self._flush_ms[:512]
+        self._batches += 1
+        self._flushed += len(batch)
+        await self._ack(batch)
+
+    async def _dead_letter(self, batch: List[MemoryEntry], error: Exception):
+        """把无法写入的一批记忆追加到死信日志，并从队列中确认移除"""
+        self._dead_lettered += len(batch)
+        if self.dead_letter_path is not None:
+            records = [
+                {"entry": self._entry_to_dict(e), "error": str(error), "failed_at": time.time()}
+                for e in batch
+            ]
+            data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+
+            def write():
+                self.dead_letter_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            try:
+                await asyncio.get_event_loop().run_in_executor(None, write)
+            except Exception as e:
+                # 不记录确认，重启后从主日志重放
+                logger.error(f"Failed to write dead-letter journal {self.dead_letter_path}: {e}")
+                for entry in batch:
+                    self._unrecorded[entry.memory_id] = entry
+                await self._ack(batch, record=False)
+                return
+        await self._ack(batch)
+
+    async def _ack(self, batch: List[MemoryEntry], record: bool = True):
+        """从待写集合中移除，record 为 True 时在日志中记录确认"""
+        for entry in batch:
+            self._pending.pop(entry.memory_id, None)
+        if not record:
+            return
+
+        try:
+            await self._append_journal([{"op": "ack", "ids": [e.memory_id for e in batch]}])
+            await self._maybe_compact()
+        except Exception as e:
+            # 确认记录写失败只会导致重启后重复写入（后端按内容去重）
+            logger.warning(f"Failed to record write-behind ack: {e}")
+
+    def _open_journal(self) -> List[MemoryEntry]:
+        """读取日志中未确认的记忆并打开日志用于追加"""
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        unacked: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        if self.journal_path.exists():
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 崩溃时写了一半的最后一行
+                        continue
+                    if record.get("op") == "add":
+                        unacked[record["entry"]["id"]] = record["entry"]
+                    elif record.get("op") == "ack":
+                        for memory_id in record.get("ids", []):
+                            unacked.pop(memory_id, None)
+
+        entries = [MemoryEntry.from_dict(data) for data in unacked.values()]
+        self._rewrite_journal([self._entry_to_dict(e) for e in entries])
+        return entries
+
+    def _rewrite_journal(self, entries: List[Dict[str, Any]]):
+        """只保留给定条目，原子替换日志文件"""
+        if self._journal is not None:
+            self._journal.close()
+        fd, tmp_name = tempfile.mkstemp(dir=self.journal_path.parent, prefix=f".{self.journal_path.name}.")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for data in entries:
+                f.write(json.dumps({"op": "add", "entry": data}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, self.journal_path)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._journal_bytes = self.journal_path.stat().st_size
+
+    async def _append_journal(self, records: List[Dict[str, Any]]):
+        if self._journal is None:
+            return
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+
+        def write():
+            self._journal.write(data)
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+
+        async with self._journal_lock:
+            await asyncio.get_event_loop().run_in_executor(None, write)
+            self._journal_bytes += len(data.encode("utf-8"))
+
+    async def _maybe_compact(self):
+        """队列清空时截断日志；日志过大时只保留待写记忆"""
+        if self._journal is None:
+            return
+        if (self._pending or self._unrecorded) and self._journal_bytes < self.compact_bytes:
+            return
+        async with self._journal_lock:
+            entries = [self._entry_to_dict(e) for e in [*self._unrecorded.values(), *self._pending.values()]]
+            await asyncio.get_event_loop().run_in_executor(None, self._rewrite_journal, entries)
+            self._compactions += 1
@@ -101,6 +101,8 @@ class EncryptedStorage:
 class APIManagerPlugin(Plugin):
     """API 密钥管理插件"""
     
+    side_effect_tools = {"api_key_add", "api_key_delete", "api_key_rotate"}
+    
     @property
     def name(self) -> str:
         return "api_manager"
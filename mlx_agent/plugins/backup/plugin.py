@@ -46,6 +46,8 @@ class BackupInfo:
 class BackupPlugin(Plugin):
     """备份恢复插件"""
     
+    side_effect_tools = {"backup_create", "backup_restore", "backup_delete"}
+    
     @property
     def name(self) -> str:
         return "backup"
@@ -80,6 +82,9 @@ class BackupPlugin(Plugin):
         self.auto_time = self.auto_backup.get("time", "02:00")  # 每天凌晨2点
         self.keep_count = self.auto_backup.get("keep_count", 7)  # 保留7个版本
         
+        # 记忆后端（由 Agent 注入，用于按条目恢复记忆）
+        self.memory_backend = None
+        
         # 元数据存储
         self.metadata_file = self.backup_dir / "backups.json"
         self._backups: Dict[str, BackupInfo] = {}
@@ -278,6 +283,90 @@ class BackupPlugin(Plugin):
                 "error": str(e)
             }
     
+    def attach_memory(self, backend):
+        """注入记忆后端，启用按条目恢复记忆"""
+        self.memory_backend = backend
+    
+    async def restore_memories(self, backup_id: str, batch_size: int = 1000) -> Dict[str, Any]:
+        """把备份中 SQLite 记忆库的条目批量导入当前记忆后端
+        
+        不覆盖现有文件，已存在的记忆会被跳过；备份中的嵌入直接复用。
+        
+        Args:
+            backup_id: 备份ID
+            batch_size: 每批导入条数
+            
+        Returns:
+            恢复结果
+        """
+        import sqlite3
+        import tempfile
+        from ...memory import MemoryEntry
+        from ...memory.quantization import decode_embedding
+        
+        if self.memory_backend is None:
+            return {"success": False, "error": "Memory backend not available"}
+        
+        backup_file = self.backup_dir / f"{backup_id}.tar.gz"
+        if backup_id not in self._backups or not backup_file.exists():
+            return {"success": False, "error": f"Backup file not found: {backup_id}"}
+        
+        restored = 0
+        databases = []
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                with tarfile.open(backup_file, 'r:gz') as tar:
+                    members = [m for m in tar.getmembers() if m.isfile() and m.name.endswith(".db")]
+                    for i, member in enumerate(members):
+                        db_path = Path(tmp) / f"{i}.db"
+                        with tar.extractfile(member) as src, open(db_path, 'wb') as dst:
+                            shutil.copyfileobj(src, dst)
+                        databases.append((member.name, db_path))
+                
+                for name, db_path in databases:
+                    db = sqlite3.connect(str(db_path))
+                    try:
+                        has_table = db.execute(
+                            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='memories'"
+                        ).fetchone()
+                        if not has_table:
+                            continue
+                        
+                        cursor = db.execute(
+                            "SELECT id, content, metadata, level, embedding, created_at FROM memories"
+                        )
+                        while True:
+                            rows = cursor.fetchmany(batch_size)
+                            if not rows:
+                                break
+                            entries = [
+                                MemoryEntry(
+                                    content=content,
+                                    metadata=json.loads(metadata or "{}"),
+                                    level=level or "P1",
+                                    embedding=decode_embedding(embedding).tolist() if embedding else None,
+                                    memory_id=memory_id,
+                                    created_at=datetime.fromisoformat(created_at) if created_at else None
+                                )
+                                for memory_id, content, metadata, level, embedding, created_at in rows
+                            ]
+                            await self.memory_backend.add_many(entries)
+                            restored += len(entries)
+                        logger.info(f"Restored memories from {name}")
+                    finally:
+                        db.close()
+            
+            logger.info(f"Memories restored from backup {backup_id}: {restored} entries")
+            return {
+                "success": True,
+                "backup_id": backup_id,
+                "databases": [name for name, _ in databases],
+                "memories_processed": restored
+            }
+        except Exception as e:
+            logger.error(f"Failed to restore memories: {e}")
+            return {"success": False, "error": str(e)}
+    
     async def list_backups(self) -> List[Dict]:
         """列出所有备份"""
         return [
@@ -447,6 +536,11 @@ class BackupPlugin(Plugin):
                             "target_dir": {
                                 "type": "string",
                                 "description": "恢复目标目录 (可选，默认原地恢复)"
+                            },
+                            "mode": {
+                                "type": "string",
+                                "enum": ["files", "memories"],
+                                "description": "files: 解压文件 (默认); memories: 把备份中的记忆批量导入当前记忆库"
                             }
                         },
                         "required": ["backup_id"]
@@ -492,6 +586,8 @@ class BackupPlugin(Plugin):
             return await self.create_backup(sources, metadata)
         
         elif tool_name == "backup_restore":
+            if params.get("mode") == "memories":
+                return await self.restore_memories(params.get("backup_id"))
             return await self.restore_backup(
                 params.get("backup_id"),
                 params.get("target_dir")
@@ -5,7 +5,7 @@ MLX-Agent 插件基类
 """
 
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set
 from dataclasses import dataclass
 from datetime import datetime
 import asyncio
@@ -23,6 +23,9 @@ class PluginTool:
 class Plugin(ABC):
     """MLX-Agent 插件基类"""
     
+    # 有副作用的工具名，同一轮中的多个工具调用里这些工具串行执行，其余并发
+    side_effect_tools: Set[str] = set()
+    
     def __init__(self):
         self._initialized = False
         self._config: Dict[str, Any] = {}
@@ -101,6 +104,10 @@ class Plugin(ABC):
             "error": f"Tool '{tool_name}' not implemented in plugin '{self.name}'"
         }
     
+    def has_side_effects(self, tool_name: str) -> bool:
+        """工具是否有副作用（需串行执行）"""
+        return tool_name in self.side_effect_tools
+    
     def get_config(self, key: str, default: Any = None) -> Any:
         """获取配置项
         
@@ -132,6 +139,7 @@ class PluginManager:
     def __init__(self):
         self._plugins: Dict[str, Plugin] = {}
         self._tool_map: Dict[str, str] = {}  # tool_name -> plugin_name
+        self.version = 0  # 注册/注销插件时递增，供 Schema 缓存判断失效
     
     def register(self, plugin: Plugin):
         """注册插件
@@ -149,6 +157,7 @@ class PluginManager:
             tool_name = tool.get("function", {}).get("name")
             if tool_name:
                 self._tool_map[tool_name] = plugin.name
+        self.version += 1
     
     def unregister(self, plugin_name: str):
         """注销插件
@@ -168,6 +177,7 @@ class PluginManager:
             del self._tool_map[tool_name]
         
         del self._plugins[plugin_name]
+        self.version += 1
     
     def get(self, name: str) -> Optional[Plugin]:
         """获取插件
@@ -191,6 +201,11 @@ class PluginManager:
             tools.extend(plugin.get_tools())
         return tools
     
+    def has_side_effects(self, tool_name: str) -> bool:
+        """工具是否有副作用（需串行执行）"""
+        plugin = self._plugins.get(self._tool_map.get(tool_name, ""))
+        return plugin is not None and plugin.has_side_effects(tool_name)
+    
     async def handle_tool(self, tool_name: str, params: Dict[str, Any]) -> Dict[str, Any]:
         """处理工具调用
         
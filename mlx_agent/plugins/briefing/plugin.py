@@ -41,6 +41,8 @@ class BriefingSchedule:
 class BriefingPlugin(Plugin):
     """每日晨报插件"""
     
+    side_effect_tools = {"briefing_schedule"}
+    
     @property
     def name(self) -> str:
         return "briefing"
@@ -43,6 +43,8 @@ class CronTask:
 class CronPlugin(Plugin):
     """定时任务管理插件"""
     
+    side_effect_tools = {"cron_add", "cron_delete", "cron_toggle"}
+    
     @property
     def name(self) -> str:
         return "cron"
@@ -15,6 +15,8 @@ from ..base import Plugin, register_plugin
 class ExcelPlugin(Plugin):
     """Excel表格处理插件"""
     
+    side_effect_tools = {"excel_create", "excel_write", "excel_export"}
+    
     @property
     def name(self) -> str:
         return "excel"
@@ -15,6 +15,8 @@ from ..base import Plugin, register_plugin
 class PDFPlugin(Plugin):
     """PDF文档处理插件"""
     
+    side_effect_tools = {"pdf_merge", "pdf_split", "pdf_create", "pdf_add_metadata"}
+    
     @property
     def name(self) -> str:
         return "pdf"
@@ -15,6 +15,8 @@ from ..base import Plugin, register_plugin
 class PixivPlugin(Plugin):
     """Pixiv插画搜索和排行榜插件"""
     
+    side_effect_tools = {"pixiv_set_token"}
+    
     @property
     def name(self) -> str:
         return "pixiv"
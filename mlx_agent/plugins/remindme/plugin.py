@@ -21,6 +21,8 @@ from .scheduler import ReminderScheduler, Reminder
 class RemindmePlugin(Plugin):
     """提醒插件"""
     
+    side_effect_tools = {"reminder_add", "reminder_delete", "reminder_snooze"}
+    
     @property
     def name(self) -> str:
         return "remindme"
@@ -18,6 +18,8 @@ from ..base import Plugin
 class TelegramSenderPlugin(Plugin):
     """Telegram 消息发送插件"""
     
+    side_effect_tools = {"telegram_send", "telegram_notify"}
+    
     @property
     def name(self) -> str:
         return "telegram_sender"
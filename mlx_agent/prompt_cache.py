@@ -0,0 +1,68 @@
+"""
+系统提示与工具 Schema 缓存
+
+系统提示的静态部分（基础规则 + 插件技能说明 + 人设 + 当前模型）和工具 Schema 列表
+只在插件/技能注册表变化、人设重载或模型切换时才需要重建。PromptCache 以这些来源的
+版本号为键缓存构建结果，工具列表同时预渲染为 JSON，LLMClient 发送请求时直接拼接。
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+
+class RenderedTools(list):
+    """工具 Schema 列表，附带预渲染的 JSON 文本
+
+    仍是普通 list，可直接作为 tools 参数传递；LLMClient 识别后复用 json 而不重新序列化。
+    不要原地修改，修改后 json 与内容不再一致。
+    """
+
+    def __init__(self, schemas: List[Dict[str, Any]]):
+        super().__init__(schemas)
+        self.json = json.dumps(schemas, ensure_ascii=False, separators=(",", ":"))
+
+
+@dataclass
+class PromptBundle:
+    """一次构建的系统提示与工具集"""
+    system_prompt: str
+    tools: Optional[RenderedTools]
+    key: Hashable
+
+
+class PromptCache:
+    """按来源版本号缓存 PromptBundle
+
+    Example:
+        >>> cache = PromptCache()
+        >>> bundle = cache.get_or_build(key, build)   # key 变化时才调用 build()
+    """
+
+    def __init__(self):
+        self._bundle: Optional[PromptBundle] = None
+        self._hits = 0
+        self._builds = 0
+
+    def get_or_build(self, key: Hashable, build: Callable[[], PromptBundle]) -> PromptBundle:
+        bundle = self._bundle
+        if bundle is not None and bundle.key == key:
+            self._hits += 1
+            return bundle
+        bundle = build()
+        bundle.key = key
+        self._bundle = bundle
+        self._builds += 1
+        return bundle
+
+    def invalidate(self):
+        self._bundle = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        bundle = self._bundle
+        return {
+            "hits": self._hits,
+            "builds": self._builds,
+            "tools": len(bundle.tools) if bundle and bundle.tools else 0,
+            "prompt_chars": len(bundle.system_prompt) if bundle else 0,
+        }
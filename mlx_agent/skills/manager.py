@@ -26,6 +26,7 @@ class SkillManager:
     def __init__(self, plugin_dir: str = "plugins"):
         self.plugin_dir = Path(plugin_dir)
         self.plugins: Dict[str, BasePlugin] = {}  # plugin_name -> instance
+        self.version = 0  # 重载插件时递增，供 Schema 缓存判断失效
         self.context = None  # Agent 实例引用
 
     async def initialize(self, context: Any):
@@ -52,6 +53,7 @@ class SkillManager:
                 logger.warning(f"Error unloading plugin {name}: {e}")
         
         self.plugins.clear()
+        self.version += 1
         
         # 扫描目录
         if not self.plugin_dir.exists():
@@ -91,6 +93,7 @@ class SkillManager:
                     meta = plugin._metadata
                     
                     self.plugins[meta.name] = plugin
+                    self.version += 1
                     
                     # 注册插件的工具到全局 registry
                     tools = plugin.define_tools()
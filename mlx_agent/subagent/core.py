@@ -89,7 +89,7 @@ class SubAgent:
         else:
             self.memory = None
         
-        # 2. 独立的 LLM 客户端
+        # 2. 独立的 LLM 客户端（共用进程级 HTTP 连接池）
         from ..llm import LLMClient
         self.llm = LLMClient(
             primary_config={
@@ -149,6 +149,10 @@ class SubAgent:
             )
         
         finally:
+            # 释放隔离记忆持有的共享嵌入模型引用
+            if self.memory is not None:
+                await self.memory.close()
+            await self.llm.close()
             if self.result:
                 self.result.status = self.status
                 self.result.completed_at = datetime.now()
@@ -59,6 +59,9 @@ class BaseTool(ABC):
     所有原生工具必须继承此类
     """
     
+    # 有副作用（写文件、执行代码、共享浏览器会话等）的工具在同一轮中串行执行
+    side_effects: bool = False
+    
     def __init__(self):
         self._schema: Optional[ToolSchema] = None
     
@@ -272,10 +275,12 @@ class ToolRegistry:
     
     def __init__(self):
         self._tools: Dict[str, BaseTool] = {}
+        self.version = 0  # 每次注册递增，供 Schema 缓存判断失效
     
     def register(self, tool: BaseTool):
         """注册工具"""
         self._tools[tool.name] = tool
+        self.version += 1
     
     def get(self, name: str) -> Optional[BaseTool]:
         """获取工具"""
@@ -285,6 +290,10 @@ class ToolRegistry:
         """列出所有工具名称"""
         return list(self._tools.keys())
     
+    def has_side_effects(self, name: str) -> bool:
+        """工具是否声明了副作用"""
+        return bool(getattr(self.get(name), "side_effects", False))
+    
     def get_all_schemas(self) -> List[Dict[str, Any]]:
         """获取所有工具的 Schema"""
         return [tool.get_schema() for tool in self._tools.values()]
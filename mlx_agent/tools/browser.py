@@ -19,6 +19,7 @@ class BrowserTool(BaseTool):
     name = "browser"
     description = "控制浏览器进行网页操作：访问、点击、输入、截图等（带反爬配置）"
     category = ToolCategory.BROWSER
+    side_effects = True
 
     # 反爬配置
     STEALTH_USER_AGENT = (
@@ -22,6 +22,7 @@ class CodeTool(BaseTool):
     name = "execute_code"
     description = "执行 Python 或 Shell 代码。⚠️ 注意：此工具可执行任意代码，请确保代码来源可信。"
     category = ToolCategory.CODE
+    side_effects = True
     
     def get_parameters(self) -> List[ToolParameter]:
         return [
@@ -104,6 +105,10 @@ class CodeTool(BaseTool):
                     proc.communicate(),
                     timeout=timeout
                 )
+            except asyncio.CancelledError:
+                # 被取消时不留下仍在运行的子进程
+                proc.kill()
+                raise
             except asyncio.TimeoutError:
                 proc.kill()
                 return ToolResult(
@@ -148,6 +153,10 @@ class CodeTool(BaseTool):
                     proc.communicate(),
                     timeout=timeout
                 )
+            except asyncio.CancelledError:
+                # 被取消时不留下仍在运行的子进程
+                proc.kill()
+                raise
             except asyncio.TimeoutError:
                 proc.kill()
                 return ToolResult(
@@ -182,6 +191,10 @@ class CodeTool(BaseTool):
                 proc.communicate(),
                 timeout=timeout
             )
+        except asyncio.CancelledError:
+            # 被取消时不留下仍在运行的子进程
+            proc.kill()
+            raise
         except asyncio.TimeoutError:
             proc.kill()
             return ToolResult(
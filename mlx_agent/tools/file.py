@@ -23,6 +23,7 @@ class FileTool(BaseTool):
     name = "file_operations"
     description = "文件和目录操作：读取、写入、列出、复制、移动、删除"
     category = ToolCategory.FILE
+    side_effects = True
 
     # 默认允许的基础目录
     DEFAULT_ALLOWED_PATHS = [
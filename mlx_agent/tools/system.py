@@ -216,6 +216,7 @@ class ProcessTool(BaseTool):
     name = "process_manager"
     description = "管理系统进程: 查看、终止等"
     category = ToolCategory.SYSTEM
+    side_effects = True
     
     def get_parameters(self) -> List[ToolParameter]:
         return [
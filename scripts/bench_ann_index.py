@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+近似向量索引基准测试
+
+对比 VectorMatrixIndex (精确) 与 IVFFlatIndex 在不同 nprobe 下的
+recall@k 与查询延迟。数据为带噪声的聚类向量，接近真实嵌入的分布。
+
+用法:
+    python scripts/bench_ann_index.py
+    python scripts/bench_ann_index.py --size 200000 --dim 384 --nprobe 4 8 16 32
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from mlx_agent.memory.ann_index import IVFFlatIndex
+from mlx_agent.memory.vector_index import VectorMatrixIndex
+
+
+def make_data(size: int, dim: int, queries: int, clusters: int, seed: int = 42):
+    """生成聚类数据：随机中心 + 高斯噪声"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, clusters, size)
+    vectors = centers[labels] + 0.5 * rng.standard_normal((size, dim), dtype=np.float32)
+    q_labels = rng.integers(0, clusters, queries)
+    query_vectors = centers[q_labels] + 0.5 * rng.standard_normal((queries, dim), dtype=np.float32)
+    return vectors, query_vectors
+
+
+def timed_search(index, query_vectors: np.ndarray, k: int):
+    """返回 (每次查询的结果 ID 列表, 平均延迟 ms, p99 延迟 ms)"""
+    results, latencies = [], []
+    for q in query_vectors:
+        start = time.perf_counter()
+        hits = index.search(q, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append([memory_id for memory_id, _ in hits])
+    return results, float(np.mean(latencies)), float(np.percentile(latencies, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark IVF-Flat recall vs latency")
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=1024, help="Embedding dimension (bge-m3: 1024)")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    vectors, query_vectors = make_data(args.size, args.dim, args.queries, args.clusters)
+    ids = [f"mem_{i}" for i in range(args.size)]
+
+    exact = VectorMatrixIndex(dim=args.dim)
+    exact.add_many(ids, vectors)
+    truth, exact_ms, exact_p99 = timed_search(exact, query_vectors, args.k)
+
+    ivf = IVFFlatIndex(dim=args.dim, nlist=args.nlist, train_threshold=1)
+    ivf.add_many(ids, vectors)
+    start = time.perf_counter()
+    ivf.train()
+    train_s = time.perf_counter() - start
+    stats = ivf.get_stats()
+
+    print(f"size={args.size}, dim={args.dim}, k={args.k}, queries={args.queries}")
+    print(f"ivf: nlist={stats['nlist']}, train={train_s:.1f}s")
+    print(f"{'index':>10} | {'recall@k':>9} | {'mean ms':>9} | {'p99 ms':>9} | {'speedup':>8}")
+    print("-" * 58)
+    print(f"{'flat':>10} | {1.0:>9.3f} | {exact_ms:>9.3f} | {exact_p99:>9.3f} | {1.0:>7.1f}x")
+
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        found, mean_ms, p99_ms = timed_search(ivf, query_vectors, args.k)
+        recall = np.mean([
+            len(set(expected) & set(got)) / len(expected)
+            for expected, got in zip(truth, found)
+        ])
+        print(f"{'nprobe=' + str(nprobe):>10} | {recall:>9.3f} | {mean_ms:>9.3f} | {p99_ms:>9.3f} | "
+              f"{exact_ms / mean_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
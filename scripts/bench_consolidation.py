@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+记忆整合分组基准测试
+
+对比逐对 Jaccard 比较 (O(n²)) 与 MinHash + LSH 分组在 1k 到 100k 条记忆上的耗时，
+并在逐对比较可承受的规模上统计 LSH 分组的召回率（被正确分组的记忆比例）。
+
+数据为若干“记忆家族”，同一家族内的文本只替换少量词，其余为随机文本。
+
+用法:
+    python scripts/bench_consolidation.py
+    python scripts/bench_consolidation.py --sizes 1000 10000 100000 --pairwise-max 5000
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+from loguru import logger
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from mlx_agent.memory.consolidation import MemoryConsolidator
+from mlx_agent.memory.minhash import jaccard, tokenize
+
+
+def make_memories(size: int, family_ratio: float = 0.3, words: int = 24, seed: int = 42):
+    """生成记忆：family_ratio 比例的记忆属于 3 条一组的近重复家族"""
+    rng = random.Random(seed)
+    vocab = [f"w{i}" for i in range(50_000)]
+    memories = []
+    families = int(size * family_ratio) // 3
+    for f in range(families):
+        base = rng.sample(vocab, words)
+        for v in range(3):
+            text = list(base)
+            for _ in range(2):
+                text[rng.randrange(words)] = rng.choice(vocab)
+            memories.append({'id': f"f{f}_{v}", 'content': " ".join(text)})
+    while len(memories) < size:
+        memories.append({'id': f"r{len(memories)}", 'content': " ".join(rng.sample(vocab, words))})
+    rng.shuffle(memories)
+    return memories
+
+
+def pairwise_groups(memories, threshold: float):
+    """原实现：逐对比较（分词已预计算，只衡量比较次数的影响）"""
+    tokens = [tokenize(m['content']) for m in memories]
+    groups, used = [], set()
+    for i in range(len(memories)):
+        if i in used:
+            continue
+        group = [i]
+        used.add(i)
+        for j in range(i + 1, len(memories)):
+            if j not in used and jaccard(tokens[i], tokens[j]) >= threshold:
+                group.append(j)
+                used.add(j)
+        if len(group) > 1:
+            groups.append([memories[k] for k in group])
+    return groups
+
+
+def grouped_ids(groups):
+    return {m['id'] for group in groups for m in group}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark consolidation grouping")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--threshold", type=float, default=0.7)
+    parser.add_argument("--pairwise-max", type=int, default=5_000,
+                        help="Largest size to run the O(n^2) pairwise baseline on")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    consolidator = MemoryConsolidator(Path("."), similarity_threshold=args.threshold)
+
+    print(f"{'size':>8} {'pairwise':>11} {'minhash':>10} {'groups':>7} {'recall':>7}")
+    for size in args.sizes:
+        memories = make_memories(size)
+
+        start = time.perf_counter()
+        groups = consolidator._find_similar_groups(memories)
+        lsh_s = time.perf_counter() - start
+
+        pairwise_s, recall = None, None
+        if size <= args.pairwise_max:
+            start = time.perf_counter()
+            expected = pairwise_groups(memories, args.threshold)
+            pairwise_s = time.perf_counter() - start
+            expected_ids = grouped_ids(expected)
+            recall = len(grouped_ids(groups) & expected_ids) / len(expected_ids) if expected_ids else 1.0
+
+        pairwise_str = f"{pairwise_s:>10.2f}s" if pairwise_s is not None else f"{'skipped':>11}"
+        recall_str = f"{recall:>7.3f}" if recall is not None else f"{'-':>7}"
+        print(f"{size:>8} {pairwise_str} {lsh_s:>9.2f}s {len(groups):>7} {recall_str}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+嵌入量化基准测试
+
+对比不同存储精度 / 索引量化组合的数据库大小、索引常驻内存、
+recall@k 与查询延迟。近似候选按数据库中的向量重排（与 SQLiteMemoryBackend 一致）。
+
+用法:
+    python scripts/bench_quantization.py
+    python scripts/bench_quantization.py --size 100000 --dim 1024 --rerank-factor 4
+"""
+
+import argparse
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from mlx_agent.memory.quantization import QuantizedMatrixIndex, decode_embedding, encode_embedding
+from mlx_agent.memory.vector_index import VectorIndex, VectorMatrixIndex
+
+# (名称, BLOB 存储精度, 索引量化)
+MODES = [
+    ("float32", "float32", None),
+    ("float16", "float16", "float16"),
+    ("int8", "int8", "int8"),
+    ("int8+f16", "float16", "int8"),
+    ("pq+f16", "float16", "pq"),
+]
+
+
+def make_data(size: int, dim: int, queries: int, clusters: int, seed: int = 42):
+    """生成聚类数据：随机中心 + 高斯噪声"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, clusters, size)
+    vectors = centers[labels] + 0.5 * rng.standard_normal((size, dim), dtype=np.float32)
+    q_labels = rng.integers(0, clusters, queries)
+    query_vectors = centers[q_labels] + 0.5 * rng.standard_normal((queries, dim), dtype=np.float32)
+    return vectors, query_vectors
+
+
+def build_db(path: Path, ids, vectors, storage: str) -> int:
+    """写入 memories 表，返回 VACUUM 后的文件大小"""
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE memories (id TEXT PRIMARY KEY, embedding BLOB)")
+    conn.executemany(
+        "INSERT INTO memories (id, embedding) VALUES (?, ?)",
+        ((memory_id, encode_embedding(vector, storage)) for memory_id, vector in zip(ids, vectors))
+    )
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    return path.stat().st_size
+
+
+def rerank(conn, query: np.ndarray, candidates, k: int):
+    """取回候选的存储向量按余弦重排"""
+    ids = [memory_id for memory_id, _ in candidates]
+    placeholders = ",".join("?" * len(ids))
+    rows = conn.execute(f"SELECT id, embedding FROM memories WHERE id IN ({placeholders})", ids).fetchall()
+    stored = {row[0]: decode_embedding(row[1]) for row in rows}
+    matrix = VectorIndex._normalize_rows(np.stack([stored[memory_id] for memory_id in ids]))
+    scores = matrix @ VectorIndex._normalize_rows(query)[0]
+    return [ids[i] for i in np.argsort(-scores, kind="stable")[:k]]
+
+
+def run_queries(index, conn, query_vectors: np.ndarray, k: int, rerank_factor: int):
+    """返回 (每次查询的结果 ID 列表, 平均延迟 ms)"""
+    results, latencies = [], []
+    for q in query_vectors:
+        start = time.perf_counter()
+        if index.approximate_scores:
+            found = rerank(conn, q, index.search(q, k * rerank_factor), k)
+        else:
+            found = [memory_id for memory_id, _ in index.search(q, k)]
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(found)
+    return results, float(np.mean(latencies))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark quantized embedding storage")
+    parser.add_argument("--size", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=1024, help="Embedding dimension (bge-m3: 1024)")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument("--pq-m", type=int, default=64)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    vectors, query_vectors = make_data(args.size, args.dim, args.queries, args.clusters)
+    ids = [f"mem_{i}" for i in range(args.size)]
+
+    exact = VectorMatrixIndex(dim=args.dim)
+    exact.add_many(ids, vectors)
+    truth = [[memory_id for memory_id, _ in exact.search(q, args.k)] for q in query_vectors]
+
+    print(f"size={args.size}, dim={args.dim}, k={args.k}, queries={args.queries}, rerank_factor={args.rerank_factor}")
+    print(f"{'mode':>10} | {'db MB':>8} | {'index MB':>9} | {'recall@k':>9} | {'mean ms':>8}")
+    print("-" * 56)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, storage, quantization in MODES:
+            db_path = Path(tmp) / f"{name}.db"
+            db_bytes = build_db(db_path, ids, vectors, storage)
+
+            if quantization is None:
+                index = exact
+            else:
+                index = QuantizedMatrixIndex(
+                    quantization, dim=args.dim, pq_m=args.pq_m, train_threshold=1,
+                    rerank_factor=args.rerank_factor
+                )
+                index.add_many(ids, vectors)
+                if index.needs_training:
+                    index.train()
+
+            conn = sqlite3.connect(str(db_path))
+            found, mean_ms = run_queries(index, conn, query_vectors, args.k, args.rerank_factor)
+            conn.close()
+
+            recall = np.mean([
+                len(set(expected) & set(got)) / len(expected)
+                for expected, got in zip(truth, found)
+            ])
+            index_mb = index.get_stats()["memory_bytes"] / 1024 / 1024
+            print(f"{name:>10} | {db_bytes / 1024 / 1024:>8.1f} | {index_mb:>9.1f} | {recall:>9.3f} | {mean_ms:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
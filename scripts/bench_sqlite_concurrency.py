@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+SQLite 并发读写基准测试
+
+在持续并发写入的同时执行搜索，对比:
+- legacy: DELETE 日志 + synchronous=FULL + 单连接（读写串行，每次写入单独提交）
+- tuned:  WAL + synchronous=NORMAL + mmap + 单写线程组提交 + 只读连接池
+
+输出搜索延迟 p50/p99 与写入吞吐。嵌入使用确定性的假编码器，只衡量存储层。
+
+用法:
+    python scripts/bench_sqlite_concurrency.py
+    python scripts/bench_sqlite_concurrency.py --prefill 20000 --writers 8 --searchers 8 --duration 10
+"""
+
+import argparse
+import asyncio
+import hashlib
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from mlx_agent.memory.base import MemoryEntry, MemoryLevel
+from mlx_agent.memory.sqlite import SQLiteMemoryBackend
+
+WORDS = [f"w{i}" for i in range(2000)]
+
+PROFILES = {
+    "legacy": dict(journal_mode="DELETE", synchronous="FULL", mmap_size=0, cache_size_kb=0,
+                   read_pool_size=0, dedicated_writer=False),
+    "tuned": dict(),
+}
+
+
+class FakeEncoder:
+    """确定性的假嵌入模型：按词哈希生成词袋向量"""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def _encode_one(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for word in text.split():
+            vec[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1.0
+        return vec
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        if isinstance(texts, str):
+            return self._encode_one(texts)
+        return np.stack([self._encode_one(t) for t in texts])
+
+
+def random_text(rng: np.random.Generator, n: int = 12) -> str:
+    return " ".join(rng.choice(WORDS, n))
+
+
+async def run_profile(name: str, args) -> dict:
+    rng = np.random.default_rng(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = SQLiteMemoryBackend(
+            path=str(Path(tmp) / "memory.db"),
+            auto_archive=False,
+            **PROFILES[name]
+        )
+        backend._init_embedding_model = lambda: setattr(
+            backend, "_embedding_model_obj", FakeEncoder(args.dim)
+        )
+        await backend.initialize()
+
+        levels = list(MemoryLevel)
+        prefill = [
+            MemoryEntry(content=random_text(rng), level=levels[i % len(levels)])
+            for i in range(args.prefill)
+        ]
+        await backend.add_many(prefill, dedup_threshold=1.1)
+
+        deadline = time.perf_counter() + args.duration
+        search_ms, write_ms = [], []
+
+        async def writer(seed: int):
+            local = np.random.default_rng(seed)
+            while time.perf_counter() < deadline:
+                entry = MemoryEntry(content=random_text(local), level=MemoryLevel.P2)
+                start = time.perf_counter()
+                await backend.add(entry)
+                write_ms.append((time.perf_counter() - start) * 1000)
+
+        async def searcher(seed: int):
+            local = np.random.default_rng(seed)
+            while time.perf_counter() < deadline:
+                query = random_text(local, 3)
+                start = time.perf_counter()
+                await backend.search(query, limit=10)
+                search_ms.append((time.perf_counter() - start) * 1000)
+
+        await asyncio.gather(
+            *(writer(1000 + i) for i in range(args.writers)),
+            *(searcher(2000 + i) for i in range(args.searchers))
+        )
+        stats = (await backend.get_stats())["sqlite"]
+        await backend.close()
+
+    return {
+        "profile": name,
+        "searches": len(search_ms),
+        "search_p50": float(np.percentile(search_ms, 50)) if search_ms else 0.0,
+        "search_p99": float(np.percentile(search_ms, 99)) if search_ms else 0.0,
+        "write_p50": float(np.percentile(write_ms, 50)) if write_ms else 0.0,
+        "write_p99": float(np.percentile(write_ms, 99)) if write_ms else 0.0,
+        "writes_per_s": len(write_ms) / args.duration,
+        "ops_per_commit": (stats["writer"] or {}).get("avg_ops_per_commit", 1.0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SQLite search latency under concurrent writes")
+    parser.add_argument("--prefill", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--searchers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per profile")
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    print(f"prefill={args.prefill} dim={args.dim} writers={args.writers} "
+          f"searchers={args.searchers} duration={args.duration}s")
+    print(f"{'profile':<8} {'searches':>9} {'search p50':>11} {'search p99':>11} "
+          f"{'write p50':>10} {'write p99':>10} {'writes/s':>9} {'ops/commit':>11}")
+    for name in args.profiles:
+        r = asyncio.run(run_profile(name, args))
+        print(f"{r['profile']:<8} {r['searches']:>9} {r['search_p50']:>9.2f}ms {r['search_p99']:>9.2f}ms "
+              f"{r['write_p50']:>8.2f}ms {r['write_p99']:>8.2f}ms {r['writes_per_s']:>9.1f} "
+              f"{r['ops_per_commit']:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
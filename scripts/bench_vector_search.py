@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+向量检索基准测试
+
+对比 SQLiteMemoryBackend 旧的逐行余弦计算与 VectorMatrixIndex 的矩阵检索。
+
+用法:
+    python scripts/bench_vector_search.py
+    python scripts/bench_vector_search.py --sizes 1000 10000 --dim 384 --queries 50
+"""
+
+import argparse
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from mlx_agent.memory.vector_index import VectorMatrixIndex
+
+
+def _cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """与 SQLiteMemoryBackend._cosine_similarity 相同的实现"""
+    norm_a = np.linalg.norm(a)
+    norm_b = np.linalg.norm(b)
+    if norm_a == 0 or norm_b == 0:
+        return 0.0
+    return float(np.dot(a, b) / (norm_a * norm_b))
+
+
+def build_db(path: str, vectors: np.ndarray) -> sqlite3.Connection:
+    """构建与后端相同结构的 memories 表"""
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    db.execute("""
+        CREATE TABLE memories (
+            id TEXT PRIMARY KEY,
+            content TEXT NOT NULL,
+            metadata TEXT DEFAULT '{}',
+            level TEXT DEFAULT 'P1',
+            embedding BLOB
+        )
+    """)
+    db.executemany(
+        "INSERT INTO memories (id, content, metadata, level, embedding) VALUES (?, ?, ?, ?, ?)",
+        (
+            (f"mem_{i}", f"content {i}", "{}", ("P0", "P1", "P2")[i % 3], vec.tobytes())
+            for i, vec in enumerate(vectors)
+        )
+    )
+    db.commit()
+    return db
+
+
+def loop_search(db: sqlite3.Connection, query: np.ndarray, k: int):
+    """旧实现：全表扫描 + 逐行 frombuffer + 余弦"""
+    cursor = db.execute("SELECT id, content, metadata, level, embedding FROM memories")
+    results = []
+    for row in cursor.fetchall():
+        emb = np.frombuffer(row["embedding"], dtype=np.float32)
+        results.append((row["id"], _cosine_similarity(query, emb)))
+    results.sort(key=lambda x: x[1], reverse=True)
+    return results[:k]
+
+
+def bench(size: int, dim: int, queries: int, k: int):
+    rng = np.random.default_rng(42)
+    vectors = rng.standard_normal((size, dim), dtype=np.float32)
+    query_vectors = rng.standard_normal((queries, dim), dtype=np.float32)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = build_db(str(Path(tmp) / "bench.db"), vectors)
+
+        # 旧实现
+        loop_queries = max(1, min(queries, 5 if size >= 100_000 else queries))
+        start = time.perf_counter()
+        for q in query_vectors[:loop_queries]:
+            loop_search(db, q, k)
+        loop_ms = (time.perf_counter() - start) * 1000 / loop_queries
+
+        # 矩阵索引
+        start = time.perf_counter()
+        index = VectorMatrixIndex(dim=dim)
+        cursor = db.execute("SELECT id, level, embedding FROM memories")
+        rows = cursor.fetchall()
+        index.add_many(
+            [r["id"] for r in rows],
+            np.stack([np.frombuffer(r["embedding"], dtype=np.float32) for r in rows]),
+            [r["level"] for r in rows]
+        )
+        build_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        for q in query_vectors:
+            index.search(q, k)
+        index_ms = (time.perf_counter() - start) * 1000 / queries
+
+        start = time.perf_counter()
+        for q in query_vectors:
+            index.search(q, k, level="P1")
+        level_ms = (time.perf_counter() - start) * 1000 / queries
+
+        # 校验 Top-K 一致
+        expected = [i for i, _ in loop_search(db, query_vectors[0], k)]
+        same = expected == [i for i, _ in index.search(query_vectors[0], k)]
+
+        db.close()
+
+    print(
+        f"{size:>8} | {loop_ms:>10.2f} | {index_ms:>10.3f} | {level_ms:>10.3f} | "
+        f"{build_ms:>10.1f} | {loop_ms / index_ms:>8.1f}x | {'ok' if same else 'MISMATCH'}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SQLite vector search")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=1024, help="Embedding dimension (bge-m3: 1024)")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"dim={args.dim}, k={args.k}, queries={args.queries}")
+    print(f"{'rows':>8} | {'loop ms':>10} | {'index ms':>10} | {'level ms':>10} | {'build ms':>10} | {'speedup':>9} | top-k")
+    print("-" * 84)
+    for size in args.sizes:
+        bench(size, args.dim, args.queries, args.k)
+
+
+if __name__ == "__main__":
+    main()
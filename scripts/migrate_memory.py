@@ -133,15 +133,17 @@ async def _save_to_chroma(entry: Dict, level: str, base_path: Path):
         f.write(json.dumps(document, ensure_ascii=False) + "\n")
 
 
-async def import_to_chroma(memory_path: str = "./memory"):
-    """将迁移的数据导入 ChromaDB"""
+async def import_to_chroma(memory_path: str = "./memory", batch_size: int = 1000):
+    """将迁移的数据导入 ChromaDB（批量写入）"""
     try:
         import chromadb
-        from chromadb.config import Settings
     except ImportError:
         logger.error("chromadb not installed. Run: pip install chromadb")
         return
     
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+    from mlx_agent.memory import ChromaMemoryBackend, MemoryEntry
+    
     memory_path = Path(memory_path)
     chroma_dir = memory_path / "chroma_import"
     
@@ -149,35 +151,49 @@ async def import_to_chroma(memory_path: str = "./memory"):
         logger.info("No migration data found to import")
         return
     
-    # 初始化 ChromaDB
-    client = chromadb.PersistentClient(
-        path=str(memory_path / "chroma"),
-        settings=Settings(anonymized_telemetry=False)
-    )
-    
-    collection = client.get_or_create_collection(name="memories")
+    backend = ChromaMemoryBackend(path=str(memory_path / "chroma"), auto_archive=False)
+    await backend.initialize()
     
     imported_count = 0
     
     # 导入所有 JSONL 文件
     for jsonl_file in chroma_dir.glob("*.jsonl"):
         try:
+            batch: List[MemoryEntry] = []
             with open(jsonl_file, "r", encoding="utf-8") as f:
                 for line in f:
                     if not line.strip():
                         continue
                     
                     doc = json.loads(line)
-                    collection.add(
-                        ids=[doc["id"]],
-                        documents=[doc["content"]],
-                        metadatas=[doc["metadata"]]
-                    )
-                    imported_count += 1
+                    metadata = dict(doc["metadata"])
+                    level = metadata.pop("level", "P1")
+                    # 保留原始创建时间，否则按年龄的分层迁移与归档都会从导入时刻重新计时
+                    try:
+                        created_at = datetime.fromisoformat(metadata["created_at"]) if metadata.get("created_at") else None
+                    except (TypeError, ValueError):
+                        created_at = None
+                    batch.append(MemoryEntry(
+                        content=doc["content"],
+                        metadata=metadata,
+                        level=level,
+                        memory_id=doc["id"],
+                        created_at=created_at
+                    ))
+                    
+                    if len(batch) >= batch_size:
+                        await backend.add_many(batch)
+                        imported_count += len(batch)
+                        batch = []
+            
+            if batch:
+                await backend.add_many(batch)
+                imported_count += len(batch)
                     
         except Exception as e:
             logger.error(f"Failed to import {jsonl_file}: {e}")
     
+    await backend.close()
     logger.info(f"Imported {imported_count} memories to ChromaDB")
     
     # 清理导入文件
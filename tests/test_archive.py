@@ -0,0 +1,152 @@
+"""
+记忆归档测试
+
+测试内容:
+1. ArchiveWriter 缓冲压缩写入、分段与索引；多个写入器共用目录
+2. 按月份读取与旧版 YYYY-MM.jsonl 兼容
+3. import_archive 分批导入与中断后续传
+"""
+
+import json
+
+import pytest
+
+from mlx_agent.memory.archive import (
+    CHECKPOINT_FILE,
+    ArchiveWriter,
+    count_archived,
+    import_archive,
+    iter_archive,
+    list_segments,
+)
+
+
+class RecordingBackend:
+    """记录 add_many 调用的后端替身，可在第 fail_on 次调用时抛错"""
+
+    def __init__(self, fail_on=None):
+        self.batches = []
+        self.thresholds = []
+        self.fail_on = fail_on
+
+    async def add_many(self, entries, dedup_threshold=0.95):
+        if self.fail_on is not None and len(self.batches) + 1 == self.fail_on:
+            self.fail_on = None
+            raise RuntimeError("interrupted")
+        self.batches.append(entries)
+        self.thresholds.append(dedup_threshold)
+        return [entry.memory_id for entry in entries]
+
+    @property
+    def ids(self):
+        return [entry.memory_id for batch in self.batches for entry in batch]
+
+
+def memory(i: int) -> dict:
+    return {
+        "id": f"P1_m{i}",
+        "content": f"archived memory {i}",
+        "metadata": {"n": i},
+        "level": "P1",
+        "created_at": "2026-09-01T12:00:00",
+    }
+
+
+def write_archive(path, n: int = 10, month: str = "2026-09", **kwargs) -> ArchiveWriter:
+    writer = ArchiveWriter(path, compression="gzip", **kwargs)
+    for i in range(n):
+        writer.append(memory(i), month=month)
+    writer.close()
+    return writer
+
+
+class TestArchiveWriter:
+    """测试压缩分段写入"""
+
+    def test_buffered_segments_and_index(self, tmp_path):
+        writer = write_archive(tmp_path, n=10, flush_records=4, segment_max_records=6)
+
+        segments = list_segments(tmp_path)
+        assert [seg.file for seg in segments] == ["2026-09-00001.jsonl.gz", "2026-09-00002.jsonl.gz"]
+        assert [seg.records for seg in segments] == [6, 4]
+        assert writer.get_stats()["flushes"] == 3
+        assert [r["id"] for r in iter_archive(tmp_path)] == [f"P1_m{i}" for i in range(10)]
+
+    def test_unindexed_tail_discarded_on_reopen(self, tmp_path):
+        write_archive(tmp_path, n=3)
+        segment = list_segments(tmp_path)[0]
+        # 模拟写入后、更新索引前崩溃
+        with open(tmp_path / segment.file, "ab") as f:
+            f.write(b"\x1f\x8b partial frame")
+
+        assert count_archived(tmp_path) == 3
+        writer = ArchiveWriter(tmp_path, compression="gzip")
+        writer.append(memory(3), month="2026-09")
+        writer.flush()
+        assert [r["id"] for r in iter_archive(tmp_path)] == [f"P1_m{i}" for i in range(4)]
+
+    def test_month_filter_and_legacy_files(self, tmp_path):
+        write_archive(tmp_path, n=2, month="2026-09")
+        write_archive(tmp_path, n=1, month="2026-10")
+        with open(tmp_path / "2026-08.jsonl", "w", encoding="utf-8") as f:
+            f.write(json.dumps(memory(99)) + "\n")
+
+        assert count_archived(tmp_path) == 4
+        assert [r["id"] for r in iter_archive(tmp_path, months="2026-08")] == ["P1_m99"]
+        assert len(list(iter_archive(tmp_path, months=["2026-09", "2026-10"]))) == 3
+
+    def test_writers_sharing_directory(self, tmp_path):
+        first = ArchiveWriter(tmp_path, compression="gzip")
+        second = ArchiveWriter(tmp_path, compression="gzip")
+
+        first.append(memory(1), month="2026-09")
+        first.flush()
+        second.append(memory(2), month="2026-09")
+        second.flush()
+        first.append(memory(3), month="2026-09")
+        first.flush()
+
+        assert [r["id"] for r in iter_archive(tmp_path)] == ["P1_m1", "P1_m2", "P1_m3"]
+        assert count_archived(tmp_path) == 3
+
+    def test_unindexed_segment_not_overwritten(self, tmp_path):
+        (tmp_path / "2026-09-00001.jsonl.gz").write_bytes(b"orphan")
+        write_archive(tmp_path, n=2)
+
+        assert [seg.file for seg in list_segments(tmp_path)] == ["2026-09-00002.jsonl.gz"]
+        assert (tmp_path / "2026-09-00001.jsonl.gz").read_bytes() == b"orphan"
+
+    def test_unknown_compression(self, tmp_path):
+        with pytest.raises(ValueError):
+            ArchiveWriter(tmp_path, compression="lz4")
+
+
+class TestImportArchive:
+    """测试流式导入与续传"""
+
+    @pytest.mark.asyncio
+    async def test_batched_import(self, tmp_path):
+        write_archive(tmp_path, n=10)
+        backend = RecordingBackend()
+
+        stats = await import_archive(backend, tmp_path, batch_size=4)
+
+        assert [len(batch) for batch in backend.batches] == [4, 4, 2]
+        assert stats["imported"] == 10 and stats["resumed_from"] == 0
+        assert backend.batches[0][0].created_at.month == 9
+        # 恢复时不按相似度去重
+        assert set(backend.thresholds) == {1.1}
+        assert not (tmp_path / CHECKPOINT_FILE).exists()
+
+    @pytest.mark.asyncio
+    async def test_resume_after_interruption(self, tmp_path):
+        write_archive(tmp_path, n=10)
+        backend = RecordingBackend(fail_on=2)
+
+        with pytest.raises(RuntimeError):
+            await import_archive(backend, tmp_path, batch_size=4)
+        assert (tmp_path / CHECKPOINT_FILE).exists()
+
+        stats = await import_archive(backend, tmp_path, batch_size=4)
+        assert stats["resumed_from"] == 4 and stats["imported"] == 6
+        assert backend.ids == [f"P1_m{i}" for i in range(10)]
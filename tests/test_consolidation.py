@@ -0,0 +1,167 @@
+"""
+记忆整合测试
+
+测试内容:
+1. MinHash + LSH 分组与逐对 Jaccard 比较结果一致
+2. embedding 模式按余弦相似度分组
+3. 按文件汇总编辑计划，每个文件只重写一次
+4. 增量整合只解析新增或变化的文件
+"""
+
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from mlx_agent.memory.consolidation import MemoryConsolidator
+from mlx_agent.memory.minhash import jaccard, tokenize
+
+
+def brute_force_groups(memories, threshold):
+    """原 O(n²) 分组算法（参照实现）"""
+    groups, used = [], set()
+    for i, mem1 in enumerate(memories):
+        if i in used:
+            continue
+        group = [mem1]
+        used.add(i)
+        for j in range(i + 1, len(memories)):
+            if j not in used and jaccard(tokenize(mem1['content']), tokenize(memories[j]['content'])) >= threshold:
+                group.append(memories[j])
+                used.add(j)
+        if len(group) > 1:
+            groups.append(group)
+    return groups
+
+
+def make_memories(families: int = 40, variants: int = 3, seed: int = 7):
+    rng = random.Random(seed)
+    vocab = [f"word{i:04d}" for i in range(3000)]
+    memories = []
+    for f in range(families):
+        base = rng.sample(vocab, 20)
+        for v in range(variants):
+            words = list(base)
+            words[rng.randrange(len(words))] = rng.choice(vocab)  # 变体只改一个词
+            memories.append({'id': f"m{f}_{v}", 'content': " ".join(words)})
+    rng.shuffle(memories)
+    return memories
+
+
+class TestConsolidationGrouping:
+    """测试相似记忆分组"""
+
+    def test_minhash_matches_pairwise(self, tmp_path):
+        memories = make_memories()
+        consolidator = MemoryConsolidator(tmp_path, similarity_threshold=0.7)
+
+        groups = consolidator._find_similar_groups(memories)
+        expected = brute_force_groups(memories, 0.7)
+
+        as_ids = lambda gs: sorted(sorted(m['id'] for m in g) for g in gs)
+        assert as_ids(groups) == as_ids(expected)
+        assert len(groups) == 40
+
+    @pytest.mark.asyncio
+    async def test_embedding_mode(self, tmp_path):
+        vectors = {"a": [1.0, 0.0], "a2": [0.99, 0.05], "b": [0.0, 1.0], "c": [0.7, 0.7]}
+
+        async def embed(texts):
+            return [np.array(vectors[t]) if t in vectors else None for t in texts]
+
+        consolidator = MemoryConsolidator(
+            tmp_path, cluster_mode="embedding", embedding_fn=embed, embedding_threshold=0.95
+        )
+        memories = [{'id': t, 'content': t} for t in ["a", "b", "a2", "missing", "c"]]
+        groups = await consolidator._find_groups(memories)
+
+        assert [[m['id'] for m in g] for g in groups] == [["a", "a2"]]
+
+    def test_invalid_mode(self, tmp_path):
+        with pytest.raises(ValueError):
+            MemoryConsolidator(tmp_path, cluster_mode="kmeans")
+
+
+
+class TestConsolidationRewrite:
+    """测试按文件批量重写"""
+
+    @pytest.mark.asyncio
+    async def test_single_pass_rewrite(self, tmp_path):
+        session = tmp_path / "session"
+        session.mkdir()
+        today = datetime.now()
+        main_file = session / f"{today:%Y-%m-%d}.md"
+        temp_file = session / f"{today - timedelta(days=1):%Y-%m-%d}.md"
+
+        text = "user likes strawberry donuts with chocolate glaze every morning"
+        main_file.write_text(
+            f"## [a1] 08:00\n{text}\n\n"
+            f"## [a2] 09:00\n{text} today\n\n"
+            '## [t1] 10:00\ntemporary note\n<!-- metadata: {"temporary": true} -->\n\n'
+            "## [k1] 11:00\nunrelated memory about python projects\n\n"
+            f"## [a3] 12:00\n{text} again\n",
+            encoding='utf-8'
+        )
+        temp_file.write_text(
+            '## [t2] 07:00\nscratch note\n<!-- metadata: {"temporary": true} -->\n', encoding='utf-8'
+        )
+
+        consolidator = MemoryConsolidator(tmp_path, similarity_threshold=0.7)
+        report = await consolidator.consolidate()
+
+        assert report['errors'] == []
+        assert report['duplicates_removed'] == 2
+        assert report['archived_memories'] == 2
+        # 两个文件扫描、重写各读一次；主文件重写一次 + 归档文件追加一次，空文件直接删除
+        assert report['files_read'] == 4
+        assert report['files_written'] == 2
+        assert not temp_file.exists()
+
+        remaining = consolidator._parse_memory_file(main_file, 'session')
+        assert [m['id'] for m in remaining] == ["a1", "k1"]
+        assert remaining[0]['metadata'] == {"consolidated": True, "variations": 2}
+
+        archived = (tmp_path / "archive" / f"{today:%Y-%m-%d}_consolidated.md").read_text(encoding='utf-8')
+        assert "[t1]" in archived and "[t2]" in archived
+        assert not list(session.glob(".*.tmp"))
+
+    @pytest.mark.asyncio
+    async def test_incremental_run(self, tmp_path):
+        session = tmp_path / "session"
+        session.mkdir()
+        today = datetime.now()
+        old_file = session / f"{today - timedelta(days=2):%Y-%m-%d}.md"
+        other_file = session / f"{today - timedelta(days=1):%Y-%m-%d}.md"
+        new_file = session / f"{today:%Y-%m-%d}.md"
+
+        text = "project deadline for the quarterly budget review is next friday afternoon"
+        old_file.write_text(f"## [o1] 08:00\n{text}\n", encoding='utf-8')
+        other_file.write_text("## [x1] 09:00\nunrelated memory about gardening tomatoes\n", encoding='utf-8')
+
+        consolidator = MemoryConsolidator(tmp_path, similarity_threshold=0.7)
+        first = await consolidator.consolidate()
+        assert first['new_memories'] == 2 and first['files_parsed'] == 2
+        assert (tmp_path / ".consolidation_index.json").exists()
+
+        # 没有变化：不读取任何文件
+        second = await MemoryConsolidator(tmp_path).consolidate()
+        assert second['new_memories'] == 0
+        assert second['files_read'] == 0
+        assert second['memories_found'] == 2
+
+        # 新增一条与旧记忆相似的记忆：只解析新文件，只读取命中的旧文件
+        new_file.write_text(f"## [n1] 10:00\n{text} reminder\n", encoding='utf-8')
+        third = await MemoryConsolidator(tmp_path).consolidate()
+        assert third['new_memories'] == 1
+        assert third['files_parsed'] == 1
+        assert third['duplicates_removed'] == 1
+        # 新文件解析 + 命中的旧文件读取 + 两个文件重写
+        assert third['files_read'] == 4
+        assert not new_file.exists()
+        assert "[Related memories from 1 occasions]" in old_file.read_text(encoding='utf-8')
+
+        # 重写后的文件已记入索引，不会被当作新数据再次处理
+        fourth = await MemoryConsolidator(tmp_path).consolidate()
+        assert fourth['new_memories'] == 0 and fourth['files_read'] == 0
@@ -0,0 +1,56 @@
+"""
+嵌入批处理服务测试
+
+测试内容:
+1. 并发请求合并成批次，批内去重
+2. 编码失败时返回 None 并计数
+"""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from mlx_agent.memory.embedding_batcher import EmbeddingBatcher
+
+
+class TestEmbeddingBatcher:
+    """测试嵌入微批处理"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_coalesced(self):
+        calls = []
+
+        def encode(texts):
+            calls.append(list(texts))
+            return np.array([[float(len(t)), 1.0] for t in texts], dtype=np.float32)
+
+        batcher = EmbeddingBatcher(encode, max_batch_size=16, max_wait_ms=20)
+        try:
+            results = await asyncio.gather(*(batcher.embed(t) for t in ["a", "bb", "a", "ccc"]))
+        finally:
+            await batcher.close()
+
+        assert calls == [["a", "bb", "ccc"]]
+        assert [r[0] for r in results] == [1.0, 2.0, 1.0, 3.0]
+        stats = batcher.get_stats()
+        assert stats["batches"] == 1
+        assert stats["texts"] == 4 and stats["encoded"] == 3
+
+    @pytest.mark.asyncio
+    async def test_max_batch_size_and_errors(self):
+        def encode(texts):
+            if "bad" in texts:
+                raise RuntimeError("encoder down")
+            return [[1.0] for _ in texts]
+
+        batcher = EmbeddingBatcher(encode, max_batch_size=2, max_wait_ms=1)
+        try:
+            results = await batcher.embed_many(["x", "y", "z"])
+            assert all(r is not None for r in results)
+            assert batcher.get_stats()["max_batch_size"] == 2
+
+            assert await batcher.embed("bad") is None
+            assert batcher.get_stats()["errors"] == 1
+        finally:
+            await batcher.close()
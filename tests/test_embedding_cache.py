@@ -0,0 +1,94 @@
+"""
+两级嵌入缓存测试
+
+测试内容:
+1. L1 / L2 命中与统计
+2. 超过行数上限时按最近访问时间淘汰
+3. 旧版 embedding_cache 表迁移
+"""
+
+import sqlite3
+
+import numpy as np
+import pytest
+
+from mlx_agent.memory.embedding_cache import EmbeddingCache, migrate_embedding_cache, text_hash
+
+
+def make_db() -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""
+        CREATE TABLE embedding_cache (
+            text_hash TEXT PRIMARY KEY,
+            text_preview TEXT,
+            embedding BLOB,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    migrate_embedding_cache(conn)
+    return conn
+
+
+def make_cache(conn, **kwargs) -> EmbeddingCache:
+    async def read(fn):
+        return fn(conn)
+
+    def write_nowait(fn):
+        fn(conn)
+        conn.commit()
+
+    cache = EmbeddingCache(read, write_nowait, **kwargs)
+    cache.load_totals(conn)
+    return cache
+
+
+class TestEmbeddingCache:
+    """测试两级嵌入缓存"""
+
+    @pytest.mark.asyncio
+    async def test_memory_and_disk_tiers(self):
+        conn = make_db()
+        cache = make_cache(conn, memory_entries=1)
+        a, b = text_hash("a"), text_hash("b")
+        cache.put_many({a: ("a", np.ones(4)), b: ("b", np.zeros(4))})
+
+        # L1 只保留最近写入的 b
+        found = await cache.get_many([a, b, text_hash("c")])
+        assert set(found) == {a, b}
+        assert np.allclose(found[a], 1.0)
+
+        stats = cache.get_stats()
+        assert stats["memory_hits"] == 1 and stats["disk_hits"] == 1 and stats["misses"] == 1
+        assert stats["disk_rows"] == 2 and stats["disk_bytes"] == 2 * 4 * 4
+
+    @pytest.mark.asyncio
+    async def test_evicts_least_recently_accessed(self):
+        conn = make_db()
+        cache = make_cache(conn, memory_entries=0, max_rows=4, low_watermark=0.5, touch_batch=1)
+        hashes = [text_hash(str(i)) for i in range(4)]
+        for i, h in enumerate(hashes):
+            cache.put_many({h: (str(i), np.full(4, i))})
+            conn.execute("UPDATE embedding_cache SET last_access = ? WHERE text_hash = ?", (i, h))
+
+        # 访问最旧的条目，使其变为最近访问
+        await cache.get_many([hashes[0]])
+        cache.put_many({text_hash("new"): ("new", np.ones(4))})
+
+        remaining = {row[0] for row in conn.execute("SELECT text_hash FROM embedding_cache")}
+        assert remaining == {hashes[0], text_hash("new")}
+        assert cache.get_stats()["disk_evictions"] == 3
+        assert cache.get_stats()["disk_rows"] == 2
+
+    def test_migrates_legacy_rows(self):
+        conn = sqlite3.connect(":memory:")
+        conn.execute(
+            "CREATE TABLE embedding_cache (text_hash TEXT PRIMARY KEY, text_preview TEXT, "
+            "embedding BLOB, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+        )
+        conn.execute("INSERT INTO embedding_cache (text_hash, embedding) VALUES ('x', ?)",
+                     (np.ones(8, dtype=np.float32).tobytes(),))
+        migrate_embedding_cache(conn)
+
+        last_access, size = conn.execute(
+            "SELECT last_access, size_bytes FROM embedding_cache").fetchone()
+        assert last_access > 0 and size == 32
@@ -0,0 +1,95 @@
+"""
+共享嵌入模型注册表测试
+
+测试内容:
+1. 多个句柄共享同一份模型，延迟加载
+2. 引用归零与空闲超时卸载，卸载后按需重新加载
+3. 多个 SQLite 后端共享模型
+"""
+
+import numpy as np
+import pytest
+
+import mlx_agent.memory.sqlite as sqlite_module
+from mlx_agent.memory.base import MemoryEntry
+from mlx_agent.memory.embedding_registry import EmbeddingModelRegistry
+from mlx_agent.memory.sqlite import SQLiteMemoryBackend
+
+
+class FakeModel:
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        return np.stack([np.full(8, float(len(t)), dtype=np.float32) for t in texts])
+
+
+class CountingLoader:
+    def __init__(self):
+        self.loaded = []
+
+    def __call__(self, name):
+        self.loaded.append(name)
+        return FakeModel()
+
+
+class TestEmbeddingRegistry:
+    """测试注册表引用计数与卸载"""
+
+    def test_shared_lazy_load(self):
+        loader = CountingLoader()
+        registry = EmbeddingModelRegistry(loader=loader, idle_unload_s=0)
+
+        a = registry.acquire("bge")
+        b = registry.acquire("bge")
+        assert loader.loaded == []
+
+        a.encode(["x"])
+        b.encode(["yy", "zzz"])
+        assert loader.loaded == ["bge"]
+        stats = registry.get_stats()["models"]["bge"]
+        assert stats["refs"] == 2 and stats["loaded"] and stats["encodes"] == 2
+
+        a.release()
+        a.release()  # 重复释放无效
+        assert registry.get_stats()["models"]["bge"]["loaded"]
+        b.release()
+        assert "bge" not in registry.get_stats()["models"]
+        with pytest.raises(RuntimeError):
+            b.encode(["x"])
+
+    def test_idle_unload_and_reload(self):
+        loader = CountingLoader()
+        registry = EmbeddingModelRegistry(loader=loader, idle_unload_s=0.01, check_interval_s=3600)
+        handle = registry.acquire("bge")
+        handle.encode(["x"])
+
+        registry._entries["bge"].last_used -= 1
+        assert registry.unload_idle() == 1
+        assert not registry.get_stats()["models"]["bge"]["loaded"]
+
+        handle.encode(["x"])
+        assert loader.loaded == ["bge", "bge"]
+        registry.shutdown()
+
+
+class TestSharedBackends:
+    """测试后端共享模型"""
+
+    @pytest.mark.asyncio
+    async def test_sqlite_backends_share_model(self, tmp_path, monkeypatch):
+        loader = CountingLoader()
+        registry = EmbeddingModelRegistry(loader=loader, idle_unload_s=0)
+        monkeypatch.setattr(sqlite_module, "embedding_registry", registry)
+
+        backends = [
+            SQLiteMemoryBackend(path=str(tmp_path / f"m{i}.db"), auto_archive=False)
+            for i in range(3)
+        ]
+        for i, backend in enumerate(backends):
+            await backend.initialize()
+            await backend.add(MemoryEntry(content=f"memory number {i}"))
+
+        assert loader.loaded == ["BAAI/bge-m3"]
+        assert registry.get_stats()["models"]["BAAI/bge-m3"]["refs"] == 3
+
+        for backend in backends:
+            await backend.close()
+        assert registry.get_stats()["models"] == {}
@@ -0,0 +1,78 @@
+"""
+LLM 共享 HTTP 连接池测试
+
+测试内容:
+1. 多个 LLMClient 共用同一个 AsyncClient，最后一个引用释放时关闭
+2. 连接上限、保活与分项超时配置
+3. 新建连接、TLS 握手与协议版本统计
+"""
+
+import httpx
+import pytest
+
+from mlx_agent.http_pool import HAS_H2, LLMHTTPPool
+from mlx_agent.llm import LLMClient
+
+
+def make_client(pool: LLMHTTPPool) -> LLMClient:
+    return LLMClient({"model": "m", "api_key": "k", "api_base": "http://x"}, http_pool=pool)
+
+
+class TestSharedPool:
+    """测试引用计数共享"""
+
+    @pytest.mark.asyncio
+    async def test_clients_share_connection_pool(self):
+        pool = LLMHTTPPool()
+        main, sub = make_client(pool), make_client(pool)
+        assert main.client is sub.client
+        assert pool.get_stats()["refs"] == 2
+
+        shared = main.client
+        await sub.close()
+        await sub.close()  # 重复关闭只释放一次
+        assert not shared.is_closed and pool.get_stats()["refs"] == 1
+
+        await main.close()
+        assert shared.is_closed and not pool.get_stats()["active"]
+
+        # 全部释放后重新创建
+        again = make_client(pool)
+        assert again.client is not shared
+        await again.close()
+
+    def test_limits_and_timeouts(self):
+        pool = LLMHTTPPool()
+        pool.configure(max_connections=8, keepalive_expiry=30.0, connect_timeout=3.0, read_timeout=90.0)
+
+        timeout = pool.timeout()
+        assert (timeout.connect, timeout.read, timeout.pool) == (3.0, 90.0, 10.0)
+        limits = pool.limits()
+        assert limits.max_connections == 8 and limits.max_keepalive_connections == 8
+        assert limits.keepalive_expiry == 30.0
+        assert pool.http2_enabled == HAS_H2
+
+        with pytest.raises(ValueError):
+            pool.configure(retries=3)
+
+
+class TestPoolStats:
+    """测试连接统计"""
+
+    @pytest.mark.asyncio
+    async def test_trace_counts(self):
+        pool = LLMHTTPPool()
+        for _ in range(3):
+            request = httpx.Request("POST", "https://api.example.com/v1/chat/completions")
+            await pool._on_request(request)
+            assert request.extensions["trace"] == pool._trace
+            await pool._on_response(httpx.Response(200, request=request, extensions={"http_version": b"HTTP/2"}))
+
+        await pool._trace("connection.connect_tcp.complete", {})
+        await pool._trace("connection.start_tls.complete", {})
+
+        stats = pool.get_stats()
+        assert stats["requests"] == 3 and stats["connections_opened"] == 1
+        assert stats["tls_handshakes"] == 1
+        assert stats["reuse_rate"] == round(2 / 3, 4)
+        assert stats["http_versions"] == {"HTTP/2": 3}
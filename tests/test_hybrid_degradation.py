@@ -0,0 +1,226 @@
+"""
+混合后端降级与恢复测试
+
+测试内容:
+1. MemoryPressureMonitor 采样限速与滞回
+2. 降级期间的写入/删除记入变更日志，恢复后后台追赶到 ChromaDB
+3. 预热在后台完成，请求路径不调用 psutil
+4. ChangeLog 序号、水位与重启恢复
+"""
+
+import asyncio
+
+import pytest
+
+from mlx_agent.memory.base import MemoryEntry
+from mlx_agent.memory.change_log import OP_ADD, OP_DELETE, ChangeLog
+from mlx_agent.memory.hybrid import HybridConfig, HybridMemoryBackend
+from mlx_agent.memory.resource_monitor import MemoryPressureMonitor
+
+
+class FakeChroma:
+    """记录调用的 ChromaDB 替身"""
+
+    instances = []
+
+    def __init__(self, **kwargs):
+        self.added = {}
+        self.deleted = []
+        self.warmed = False
+        self.closed = False
+        FakeChroma.instances.append(self)
+
+    async def initialize(self):
+        pass
+
+    async def warm_up(self):
+        await asyncio.sleep(0.01)
+        self.warmed = True
+
+    async def add(self, entry):
+        self.added[entry.memory_id] = entry
+        return entry.memory_id
+
+    async def add_many(self, entries, **kwargs):
+        for entry in entries:
+            self.added[entry.memory_id] = entry
+        return [entry.memory_id for entry in entries]
+
+    async def delete(self, memory_id):
+        self.deleted.append(memory_id)
+        return True
+
+    async def delete_many(self, memory_ids):
+        self.deleted.extend(memory_ids)
+        return len(memory_ids)
+
+    async def search(self, *args, **kwargs):
+        return []
+
+    async def get_stats(self):
+        return {"status": "initialized"}
+
+    async def close(self):
+        self.closed = True
+
+
+def scripted_monitor(monitor: MemoryPressureMonitor, readings):
+    """按顺序返回预设的可用内存读数"""
+    values = iter(readings)
+    monitor._read_available_mb = lambda: next(values)
+    return monitor
+
+
+class TestMemoryPressureMonitor:
+    """测试监控滞回与限速"""
+
+    def test_hysteresis(self):
+        changes = []
+        monitor = scripted_monitor(
+            MemoryPressureMonitor(low_mb=100, recover_mb=200, recover_samples=2,
+                                  min_sample_interval_s=0, on_change=changes.append),
+            [150, 90, 150, 250, 180, 250, 250]
+        )
+
+        results = [monitor.sample(force=True) for _ in range(7)]
+        # 90 触发降级；150/180 低于恢复线，250 需连续两次
+        assert results == [False, True, True, True, True, True, False]
+        assert changes == [True, False]
+
+    def test_rate_limited(self):
+        calls = []
+        monitor = MemoryPressureMonitor(low_mb=100, min_sample_interval_s=60)
+        monitor._read_available_mb = lambda: calls.append(1) or 500.0
+
+        for _ in range(10):
+            monitor.sample()
+        assert len(calls) == 1
+        assert monitor.get_stats()["available_mb"] == 500.0
+
+
+class TestChangeLog:
+    """测试变更日志"""
+
+    def test_sequence_and_watermark_survive_reopen(self, tmp_path):
+        log = ChangeLog(tmp_path / "changes.db")
+        log.open()
+        assert log.append(OP_ADD, ["a", "b"]) == 2
+        assert log.append(OP_DELETE, ["a"]) == 3
+        assert [op for _, op, _ in log.read_after(0, 10)] == [OP_ADD, OP_ADD, OP_DELETE]
+
+        log.mark_applied(2)
+        assert log.read_after(log.applied_seq, 10) == [(3, OP_DELETE, "a")]
+        log.close()
+
+        log = ChangeLog(tmp_path / "changes.db")
+        log.open()
+        try:
+            assert log.get_stats() == {"last_seq": 3, "applied_seq": 2, "pending": 1}
+            log.mark_applied(3)
+            # 压缩后序号仍单调递增
+            assert log.append(OP_ADD, ["c"]) == 4
+        finally:
+            log.close()
+
+
+class TestHybridDegradation:
+    """测试降级写入追赶与后台预热"""
+
+    async def make_backend(self, tmp_path, **kwargs) -> HybridMemoryBackend:
+        FakeChroma.instances = []
+        backend = HybridMemoryBackend(HybridConfig(
+            sqlite_path=str(tmp_path / "hybrid.db"),
+            chroma_path=str(tmp_path / "chroma"),
+            memory_threshold_mb=100,
+            memory_recover_samples=1,
+            memory_check_interval=3600,
+            **kwargs
+        ))
+        backend._ChromaMemoryBackend = FakeChroma
+        backend.sqlite.auto_archive = False
+        backend.sqlite._init_embedding_model = lambda: None
+        backend._monitor._read_available_mb = lambda: 1000.0
+        await backend.initialize()
+        return backend
+
+    @pytest.mark.asyncio
+    async def test_degraded_writes_replayed_on_recovery(self, tmp_path):
+        backend = await self.make_backend(tmp_path, sync_batch_size=2)
+        try:
+            first = backend._chroma
+            kept = MemoryEntry(content="written before degradation")
+            await backend.add(kept)
+            assert kept.memory_id in first.added
+
+            # 内存不足：降级并释放 ChromaDB
+            backend._monitor._read_available_mb = lambda: 50.0
+            backend._monitor.sample(force=True)
+            assert backend._degraded_mode and backend._chroma is None
+
+            during = MemoryEntry(content="written while degraded")
+            dropped = MemoryEntry(content="added then deleted while degraded")
+            await backend.add_many([during, dropped])
+            await backend.delete(dropped.memory_id)
+            await backend.delete(kept.memory_id)
+            sync = (await backend.get_stats())["sync"]
+            assert sync["pending"] == 4 and sync["replayed"] == 0
+
+            # 内存恢复：后台预热，完成前仍为降级模式
+            backend._monitor._read_available_mb = lambda: 1000.0
+            backend._monitor.sample(force=True)
+            assert backend._degraded_mode
+            await backend._warm_up_task
+            await backend._catch_up_task
+
+            warmed = backend._chroma
+            assert warmed is not first and warmed.warmed
+            assert not backend._degraded_mode
+            # 已删除的记忆在 SQLite 中不存在，回放时跳过
+            assert set(warmed.added) == {during.memory_id}
+            assert warmed.added[during.memory_id].content == during.content
+            assert set(warmed.deleted) == {dropped.memory_id, kept.memory_id}
+            sync = (await backend.get_stats())["sync"]
+            assert sync["pending"] == 0 and sync["replayed"] == 4 and sync["batches"] == 2
+        finally:
+            await backend.close()
+
+    @pytest.mark.asyncio
+    async def test_delete_many_batched_on_both_sides(self, tmp_path):
+        backend = await self.make_backend(tmp_path)
+        try:
+            entries = [MemoryEntry(content=f"bulk delete {i}") for i in range(3)]
+            await backend.add_many(entries, dedup_threshold=1.1)
+            ids = [entry.memory_id for entry in entries[:2]]
+
+            assert await backend.delete_many(ids) == 2
+            assert backend._chroma.deleted == ids
+            assert len(await backend.get_by_age(0)) == 1
+        finally:
+            await backend.close()
+
+    @pytest.mark.asyncio
+    async def test_pending_changes_resume_after_restart(self, tmp_path):
+        backend = await self.make_backend(tmp_path)
+        backend._monitor._read_available_mb = lambda: 50.0
+        backend._monitor.sample(force=True)
+        entry = MemoryEntry(content="written before a crash")
+        await backend.add(entry)
+        await backend.close()
+
+        backend = await self.make_backend(tmp_path)
+        try:
+            await backend._catch_up_task
+            assert entry.memory_id in backend._chroma.added
+            assert (await backend.get_stats())["sync"]["pending"] == 0
+        finally:
+            await backend.close()
+
+    @pytest.mark.asyncio
+    async def test_request_path_does_not_sample(self, tmp_path):
+        backend = await self.make_backend(tmp_path)
+        try:
+            backend._monitor._read_available_mb = lambda: pytest.fail("psutil polled on request path")
+            await backend.add(MemoryEntry(content="no polling here"))
+            await backend.search("polling")
+        finally:
+            await backend.close()
@@ -0,0 +1,157 @@
+"""
+LLM 响应缓存测试
+
+测试内容:
+1. 规范化请求体的精确命中与按调用绕过
+2. 带工具的请求不缓存
+3. TTL 过期与 LRU 淘汰
+4. 语义命中与命中率 / 节省 token 统计
+5. 未命中时查询只编码一次；故障转移后按实际回答的模型写入
+"""
+
+import time
+
+import pytest
+
+from mlx_agent.llm import LLMClient, LLMResponseCache
+
+
+class CountingClient(LLMClient):
+    """不发请求、按调用次数编号回复的客户端"""
+
+    def __init__(self, response_cache: LLMResponseCache, primary_fails: bool = False):
+        super().__init__(
+            {"model": "m", "api_key": "k", "api_base": "http://x"},
+            fallback_config={"model": "backup", "api_key": "k", "api_base": "http://y"},
+            max_retries=1,
+            response_cache=response_cache
+        )
+        self.primary_fails = primary_fails
+        self.calls = 0
+
+    async def _call_api(self, config, messages, temperature, max_tokens,
+                        tools=None, tool_choice=None, reasoning=False, usage=None):
+        if self.primary_fails and config["model"] == "m":
+            raise RuntimeError("primary down")
+        self.calls += 1
+        if usage is not None:
+            usage.update({"prompt_tokens": 30, "completion_tokens": 10, "total_tokens": 40})
+        return {"role": "assistant", "content": f"reply {self.calls}"}
+
+
+def fake_embed(texts):
+    """按关键词出现与否生成向量"""
+    words = ["天气", "明天", "股票", "你好"]
+    return [[1.0 if w in text else 0.0 for w in words] + [0.1] for text in texts]
+
+
+class TestExactCache:
+    """测试精确命中"""
+
+    @pytest.mark.asyncio
+    async def test_normalized_hit_and_bypass(self):
+        llm = CountingClient(LLMResponseCache())
+
+        assert await llm.simple_chat("Hello  World", "简短回复。") == "reply 1"
+        assert await llm.simple_chat(" hello world ", "简短回复。") == "reply 1"
+        # 系统提示不同不命中
+        assert await llm.simple_chat("hello world", "其他提示") == "reply 2"
+        # 绕过缓存
+        assert await llm.simple_chat("hello world", "简短回复。", cache=False) == "reply 3"
+
+        stats = llm.get_cache_stats()["response_cache"]
+        assert stats["hits_exact"] == 1 and stats["misses"] == 2
+        assert stats["saved_tokens"] == 40
+        await llm.close()
+
+    @pytest.mark.asyncio
+    async def test_tool_requests_not_cached(self):
+        llm = CountingClient(LLMResponseCache())
+        tools = [{"type": "function", "function": {"name": "search"}}]
+        messages = [{"role": "user", "content": "查一下"}]
+
+        await llm.chat(messages, tools=tools)
+        await llm.chat(messages, tools=tools)
+
+        assert llm.calls == 2
+        assert llm.response_cache.get_stats()["entries"] == 0
+        await llm.close()
+
+    @pytest.mark.asyncio
+    async def test_ttl_and_lru(self):
+        cache = LLMResponseCache(max_entries=2, ttl_seconds=0.05)
+        request = lambda text: {"model": "m", "messages": [{"role": "user", "content": text}]}
+
+        for text in ("a", "b", "c"):
+            await cache.put(request(text), {"content": text})
+        assert (await cache.get(request("a")))[0] is None
+        assert (await cache.get(request("c")))[0]["content"] == "c"
+
+        time.sleep(0.06)
+        assert (await cache.get(request("c")))[0] is None
+        stats = cache.get_stats()
+        assert stats["evictions"] == 1 and stats["expirations"] == 1
+
+
+class TestSemanticCache:
+    """测试语义命中"""
+
+    @pytest.mark.asyncio
+    async def test_semantic_hit_within_context(self):
+        llm = CountingClient(LLMResponseCache(semantic_threshold=0.95, embed=fake_embed))
+
+        assert await llm.simple_chat("明天天气怎么样", "简短回复。") == "reply 1"
+        assert await llm.simple_chat("明天的天气如何？", "简短回复。") == "reply 1"
+        # 语义不同
+        assert await llm.simple_chat("股票行情", "简短回复。") == "reply 2"
+        # 上下文（系统提示）不同，不做语义比较
+        assert await llm.simple_chat("明天天气怎么样", "其他提示") == "reply 3"
+
+        stats = llm.get_cache_stats()["response_cache"]
+        assert stats["hits_semantic"] == 1 and stats["hits_exact"] == 0
+        assert stats["hit_rate"] == 0.25
+        await llm.close()
+
+    @pytest.mark.asyncio
+    async def test_embedding_failure_falls_back_to_exact(self):
+        def broken(texts):
+            raise RuntimeError("model unavailable")
+
+        llm = CountingClient(LLMResponseCache(semantic_threshold=0.9, embed=broken))
+        await llm.simple_chat("你好")
+        assert await llm.simple_chat("你好") == "reply 1"
+        assert llm.response_cache.get_stats()["embed_failures"] >= 1
+        await llm.close()
+
+
+class TestCacheKeying:
+    """测试编码次数与模型键"""
+
+    @pytest.mark.asyncio
+    async def test_query_encoded_once_per_miss(self):
+        encoded = []
+
+        def counting_embed(texts):
+            encoded.extend(texts)
+            return fake_embed(texts)
+
+        llm = CountingClient(LLMResponseCache(semantic_threshold=0.95, embed=counting_embed))
+        await llm.simple_chat("明天天气怎么样")
+        await llm.simple_chat("股票行情")   # 上下文已有条目：get 编码，put 复用
+
+        assert len(encoded) == 2
+        await llm.close()
+
+    @pytest.mark.asyncio
+    async def test_fallback_answer_keyed_on_fallback_model(self):
+        llm = CountingClient(LLMResponseCache(), primary_fails=True)
+
+        assert await llm.simple_chat("你好") == "reply 1"
+        assert llm.get_current_model() == "backup"
+        # 后续请求发往备用模型，命中其写入的条目
+        assert await llm.simple_chat("你好") == "reply 1"
+
+        llm.switch_to_primary()
+        llm.primary_fails = False
+        assert await llm.simple_chat("你好") == "reply 2"
+        await llm.close()
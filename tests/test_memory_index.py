@@ -0,0 +1,327 @@
+"""
+记忆向量索引测试
+
+测试内容:
+1. VectorMatrixIndex 的增删改查
+2. IVFFlatIndex 训练、墓碑删除与持久化
+3. SQLiteMemoryBackend 与索引保持同步
+4. SQLite 组提交与只读连接池
+"""
+
+import asyncio
+import hashlib
+
+import numpy as np
+import pytest
+
+from mlx_agent.memory.base import MemoryEntry, MemoryLevel
+from mlx_agent.memory.sqlite import SQLiteMemoryBackend
+from mlx_agent.memory.ann_index import IVFFlatIndex
+from mlx_agent.memory.vector_index import VectorMatrixIndex, find_duplicate_clusters
+
+
+class FakeEncoder:
+    """确定性的假嵌入模型：按词哈希生成词袋向量"""
+
+    dim = 64
+
+    def _encode_one(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            idx = int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim
+            vec[idx] += 1.0
+        return vec
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        if isinstance(texts, str):
+            return self._encode_one(texts)
+        return np.stack([self._encode_one(t) for t in texts])
+
+
+async def make_backend(tmp_path) -> SQLiteMemoryBackend:
+    backend = SQLiteMemoryBackend(path=str(tmp_path / "memory.db"), auto_archive=False)
+    backend._init_embedding_model = lambda: setattr(backend, "_embedding_model_obj", FakeEncoder())
+    await backend.initialize()
+    return backend
+
+
+class TestVectorMatrixIndex:
+    """测试内存矩阵索引"""
+
+    def test_search_top_k(self):
+        index = VectorMatrixIndex()
+        index.add("a", [1.0, 0.0], "P1")
+        index.add("b", [0.9, 0.1], "P1")
+        index.add("c", [0.0, 1.0], "P2")
+
+        hits = index.search([1.0, 0.0], k=2)
+        assert [h[0] for h in hits] == ["a", "b"]
+        assert hits[0][1] == pytest.approx(1.0)
+
+    def test_level_mask(self):
+        index = VectorMatrixIndex()
+        index.add_many(["a", "b", "c"], np.eye(3, dtype=np.float32), ["P0", "P1", "P1"])
+
+        hits = index.search([1.0, 1.0, 1.0], k=5, level=MemoryLevel.P1)
+        assert {h[0] for h in hits} == {"b", "c"}
+
+        index.set_level("a", "P1")
+        hits = index.search([1.0, 0.0, 0.0], k=1, level="P1")
+        assert hits[0][0] == "a"
+
+    def test_remove_keeps_rows_compact(self):
+        index = VectorMatrixIndex(initial_capacity=2)
+        index.add_many(["a", "b", "c"], np.eye(3, dtype=np.float32), ["P1"] * 3)
+
+        assert index.remove("a") is True
+        assert index.remove("a") is False
+        assert len(index) == 2
+        assert "a" not in index
+
+        hits = index.search([0.0, 0.0, 1.0], k=1)
+        assert hits[0][0] == "c"
+
+    def test_dimension_mismatch_ignored(self):
+        index = VectorMatrixIndex()
+        index.add("a", [1.0, 0.0, 0.0])
+        assert index.add("b", [1.0, 0.0]) is False
+        assert index.search([1.0, 0.0], k=1) == []
+
+
+def clustered_vectors(n: int = 2000, dim: int = 32, clusters: int = 16):
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    return centers[rng.integers(0, clusters, n)] + 0.1 * rng.standard_normal((n, dim)).astype(np.float32)
+
+
+class TestIVFFlatIndex:
+    """测试 IVF-Flat 近似索引"""
+
+    def test_trained_search_matches_exact(self):
+        vectors = clustered_vectors()
+        ids = [f"m{i}" for i in range(len(vectors))]
+        exact = VectorMatrixIndex()
+        exact.add_many(ids, vectors)
+        ivf = IVFFlatIndex(train_threshold=1000, nprobe=16)
+        ivf.add_many(ids, vectors)
+
+        assert ivf.needs_training
+        ivf.train()
+        assert ivf.is_trained and not ivf.needs_training
+
+        recall = []
+        for q in vectors[:20]:
+            expected = {h[0] for h in exact.search(q, 10)}
+            recall.append(len(expected & {h[0] for h in ivf.search(q, 10)}) / 10)
+        assert np.mean(recall) >= 0.9
+
+    def test_tombstone_and_incremental_add(self):
+        vectors = clustered_vectors(n=500)
+        ivf = IVFFlatIndex(train_threshold=100)
+        ivf.add_many([f"m{i}" for i in range(500)], vectors)
+        ivf.train()
+
+        assert ivf.remove("m0") is True
+        assert "m0" not in ivf and len(ivf) == 499
+        assert "m0" not in {h[0] for h in ivf.search(vectors[0], 5)}
+
+        ivf.add("new", vectors[0], "P0")
+        assert ivf.search(vectors[0], 1, level="P0")[0][0] == "new"
+
+    def test_save_load_roundtrip(self, tmp_path):
+        vectors = clustered_vectors(n=500)
+        ivf = IVFFlatIndex(train_threshold=100)
+        ivf.add_many([f"m{i}" for i in range(500)], vectors, ["P1"] * 500)
+        ivf.train()
+        ivf.remove("m1")
+
+        path = tmp_path / "memory.ann.npz"
+        ivf.save(path, meta={"signature": [499, 500]})
+        loaded, meta = IVFFlatIndex.load(path)
+
+        assert meta["signature"] == [499, 500]
+        assert len(loaded) == 499 and loaded.is_trained
+        assert loaded.search(vectors[2], 3) == ivf.search(vectors[2], 3)
+
+
+class TestDuplicateClusters:
+    """测试分块重复簇检测"""
+
+    def test_blocked_matches_unblocked(self):
+        rng = np.random.default_rng(1)
+        base = rng.standard_normal((40, 16)).astype(np.float32)
+        vectors = np.concatenate([base, base[:10] + 0.01, base[:5] + 0.02])
+
+        expected = find_duplicate_clusters(vectors, 0.99, block_size=1000)
+        assert find_duplicate_clusters(vectors, 0.99, block_size=7) == expected
+        assert len(expected) == 10
+        assert expected[0] == [0, 40, 50]
+
+    @pytest.mark.asyncio
+    async def test_merge_keeps_oldest_or_newest(self, tmp_path):
+        from datetime import datetime, timedelta
+
+        backend = await make_backend(tmp_path)
+        try:
+            now = datetime.now()
+            old = MemoryEntry(content="deploy on friday", created_at=now - timedelta(days=2), memory_id="old")
+            new = MemoryEntry(content="deploy on friday", created_at=now, memory_id="new")
+            await backend.add_many([old], dedup_threshold=1.1)
+            await backend.add_many([new], dedup_threshold=1.1)
+
+            clusters = await backend.detect_duplicates(threshold=0.99)
+            assert clusters == [["old", "new"]]
+
+            result = await backend.merge_duplicates(keep="oldest")
+            assert result == {"merged": 1, "deleted": 1, "clusters": 1}
+            assert "old" in backend._vector_index and "new" not in backend._vector_index
+        finally:
+            await backend.close()
+
+
+class TestSQLiteVectorIndexSync:
+    """测试 SQLite 后端与向量索引同步"""
+
+    @pytest.mark.asyncio
+    async def test_add_delete_upgrade(self, tmp_path):
+        backend = await make_backend(tmp_path)
+        try:
+            entry = MemoryEntry(content="user likes strawberry donuts", level=MemoryLevel.P2)
+            await backend.add(entry)
+            assert entry.memory_id in backend._vector_index
+
+            results = await backend._vector_search("strawberry donuts", limit=5, level=MemoryLevel.P2)
+            assert entry.memory_id in results
+
+            await backend.upgrade_memory_level(entry.memory_id, "P0")
+            assert await backend._vector_search("strawberry donuts", limit=5, level=MemoryLevel.P2) == {}
+            assert entry.memory_id in await backend._vector_search("strawberry donuts", 5, MemoryLevel.P0)
+
+            await backend.delete(entry.memory_id)
+            assert entry.memory_id not in backend._vector_index
+        finally:
+            await backend.close()
+
+    @pytest.mark.asyncio
+    async def test_index_reloaded_on_open(self, tmp_path):
+        backend = await make_backend(tmp_path)
+        entry = MemoryEntry(content="python asyncio event loop", level=MemoryLevel.P1)
+        await backend.add(entry)
+        await backend.close()
+
+        backend = await make_backend(tmp_path)
+        try:
+            assert len(backend._vector_index) == 1
+            results = await backend.search("asyncio event loop", limit=3)
+            assert results and results[0]["id"] == entry.memory_id
+        finally:
+            await backend.close()
+
+    @pytest.mark.asyncio
+    async def test_search_fetches_rows_once_and_reports_timings(self, tmp_path):
+        backend = await make_backend(tmp_path)
+        try:
+            p0 = MemoryEntry(content="kubernetes cluster upgrade notes", level=MemoryLevel.P0)
+            p1 = MemoryEntry(content="kubernetes pod restart policy", level=MemoryLevel.P1)
+            await backend.add_many([p0, p1])
+
+            keyword = await backend._keyword_search("kubernetes", 5, MemoryLevel.P1)
+            assert set(keyword) == {p1.memory_id}
+
+            results = await backend.search("kubernetes", limit=2)
+            assert {r["id"] for r in results} == {p0.memory_id, p1.memory_id}
+            assert all(r["content"] and "score" in r for r in results)
+
+            timings = (await backend.get_stats())["search_timings"]
+            assert timings["searches"] == 1
+            assert {"embed", "vector", "keyword", "merge", "fetch", "total"} <= set(timings["avg_ms"])
+        finally:
+            await backend.close()
+
+    @pytest.mark.asyncio
+    async def test_add_many_dedups_in_one_batch(self, tmp_path):
+        backend = await make_backend(tmp_path)
+        try:
+            existing = MemoryEntry(content="user prefers dark mode", level=MemoryLevel.P1)
+            await backend.add(existing)
+
+            entries = [
+                MemoryEntry(content="alpha beta gamma", level=MemoryLevel.P1),
+                MemoryEntry(content="gamma beta alpha", level=MemoryLevel.P1),  # 批内近重复
+                MemoryEntry(content="alpha beta gamma", level=MemoryLevel.P2),  # 级别不同，保留
+                MemoryEntry(content="dark mode user prefers", level=MemoryLevel.P1),  # 与索引重复
+                MemoryEntry(content="carried vector", embedding=[0.0] * 63 + [1.0]),
+            ]
+            ids = await backend.add_many(entries)
+
+            assert ids == [e.memory_id for e in entries]
+            assert len(backend._vector_index) == 4
+            assert entries[1].memory_id not in backend._vector_index
+            assert entries[3].memory_id not in backend._vector_index
+            assert entries[4].memory_id in backend._vector_index
+        finally:
+            await backend.close()
+
+    @pytest.mark.asyncio
+    async def test_ivf_index_persisted(self, tmp_path):
+        def make_ivf_backend():
+            backend = SQLiteMemoryBackend(
+                path=str(tmp_path / "memory.db"), auto_archive=False,
+                vector_index="ivf", ann_config={"train_threshold": 10}
+            )
+            backend._init_embedding_model = lambda: setattr(backend, "_embedding_model_obj", FakeEncoder())
+            return backend
+
+        backend = make_ivf_backend()
+        await backend.initialize()
+        entry = MemoryEntry(content="sqlite write ahead log")
+        await backend.add(entry)
+        await backend.close()
+        assert backend.index_path.exists()
+
+        backend = make_ivf_backend()
+        backend._rebuild_vector_index = lambda: pytest.fail("index should be loaded from disk")
+        await backend.initialize()
+        try:
+            assert entry.memory_id in backend._vector_index
+        finally:
+            await backend.close()
+
+
+class TestSQLiteConcurrency:
+    """测试 WAL + 单写线程组提交 + 只读连接池"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_adds_group_committed(self, tmp_path):
+        backend = await make_backend(tmp_path)
+        try:
+            entries = [MemoryEntry(content=f"note {i} topic{i}", level=MemoryLevel.P1) for i in range(20)]
+            await asyncio.gather(*(backend.add(e) for e in entries))
+
+            stats = (await backend.get_stats())["sqlite"]
+            assert stats["pragmas"]["journal_mode"] == "WAL"
+            assert stats["writer"]["ops"] >= 20
+            assert stats["writer"]["commits"] < stats["writer"]["ops"]
+
+            results = await backend.search("topic7", limit=3)
+            assert results and results[0]["id"] == entries[7].memory_id
+            assert (await backend.get_stats())["sqlite"]["read_pool"]["queries"] > 0
+        finally:
+            await backend.close()
+
+    @pytest.mark.asyncio
+    async def test_failed_op_does_not_abort_batch(self, tmp_path):
+        backend = await make_backend(tmp_path)
+        try:
+            def bad(conn):
+                conn.execute("INSERT INTO missing_table VALUES (1)")
+
+            entry = MemoryEntry(content="survives a failing neighbour", level=MemoryLevel.P1)
+            outcomes = await asyncio.gather(
+                backend._write(bad), backend.add(entry), return_exceptions=True
+            )
+            assert isinstance(outcomes[0], Exception)
+            assert outcomes[1] == entry.memory_id
+            assert await backend._fetch_rows([entry.memory_id])
+        finally:
+            await backend.close()
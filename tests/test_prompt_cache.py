@@ -0,0 +1,207 @@
+"""
+系统提示与工具 Schema 缓存测试
+
+测试内容:
+1. RenderedTools 预渲染 JSON，LLM 请求体直接拼接
+2. 插件注册、人设重载、模型切换使缓存失效
+3. LLMClient 服务端前缀缓存提示与 usage 命中统计
+4. 每轮记忆放在用户消息中，system 消息只出现在首位
+"""
+
+import json
+
+import pytest
+
+from mlx_agent.agent import MLXAgent
+from mlx_agent.identity import IdentityManager
+from mlx_agent.llm import encode_payload
+from mlx_agent.plugins.base import Plugin, PluginManager
+from mlx_agent.prompt_cache import PromptCache, RenderedTools
+
+
+class EchoPlugin(Plugin):
+    """每次 get_tools 都计数的插件"""
+
+    calls = 0
+
+    @property
+    def name(self) -> str:
+        return "echo"
+
+    @property
+    def description(self) -> str:
+        return "echo"
+
+    async def _setup(self):
+        pass
+
+    def get_tools(self):
+        EchoPlugin.calls += 1
+        return [{"type": "function", "function": {"name": "echo", "description": "回声", "parameters": {}}}]
+
+
+class FakeLLM:
+    model = "primary-model"
+
+    def __init__(self):
+        self.requests = []
+
+    def get_current_model(self):
+        return self.model
+
+    async def chat(self, messages, **kwargs):
+        self.requests.append(list(messages))
+        return {"role": "assistant", "content": "ok"}
+
+    async def chat_stream(self, messages, **kwargs):
+        self.requests.append(list(messages))
+        yield {"type": "content", "content": "ok"}
+        yield {"type": "done"}
+
+
+class FakeMemory:
+    async def search(self, query, limit=5):
+        return [{"content": "用户喜欢草莓"}]
+
+
+def make_agent(tmp_path) -> MLXAgent:
+    agent = MLXAgent.__new__(MLXAgent)
+    agent.skill_manager = None
+    agent.plugin_manager = PluginManager()
+    agent.identity = IdentityManager(tmp_path)
+    agent.llm = FakeLLM()
+    agent._prompt_cache = PromptCache()
+    return agent
+
+
+class TestRenderedTools:
+    """测试预渲染 JSON"""
+
+    def test_payload_splices_rendered_tools(self):
+        tools = RenderedTools([{"type": "function", "function": {"name": "搜索"}}])
+        data = {"model": "m", "messages": [{"role": "user", "content": "你好"}], "tools": tools}
+
+        body = encode_payload(data)
+
+        assert json.loads(body) == json.loads(json.dumps(data))
+        assert tools.json.encode("utf-8") in body
+
+    def test_plain_list_payload(self):
+        data = {"model": "m", "tools": [{"type": "function"}]}
+        assert json.loads(encode_payload(data)) == data
+
+
+class TestPromptBundleCache:
+    """测试缓存失效"""
+
+    @pytest.mark.asyncio
+    async def test_invalidated_by_sources(self, tmp_path):
+        agent = make_agent(tmp_path)
+        await agent.identity.load()
+
+        first = agent._get_prompt_bundle()
+        assert first.tools is None
+        assert agent._get_prompt_bundle() is first
+
+        # 插件注册
+        agent.plugin_manager.register(EchoPlugin())
+        with_plugin = agent._get_prompt_bundle()
+        assert [t["function"]["name"] for t in with_plugin.tools] == ["echo"]
+        calls = EchoPlugin.calls
+        agent._get_prompt_bundle()
+        assert EchoPlugin.calls == calls
+
+        # 人设重载
+        await agent.identity.load(force=True)
+        assert agent._get_prompt_bundle() is not with_plugin
+
+        # 模型切换
+        agent.llm.model = "fallback-model"
+        bundle = agent._get_prompt_bundle()
+        assert "fallback-model" in bundle.system_prompt
+        assert agent._prompt_cache.get_stats()["builds"] == 4
+
+
+class TestMessageLayout:
+    """测试请求消息布局"""
+
+    @pytest.mark.asyncio
+    async def test_memories_in_user_turn(self, tmp_path):
+        agent = make_agent(tmp_path)
+        agent.memory = FakeMemory()
+        await agent.identity.load()
+        history = [{"role": "user", "content": "早"}, {"role": "assistant", "content": "早上好"}]
+
+        await agent._slow_handle_message("我喜欢什么？", history=history)
+
+        messages = agent.llm.requests[0]
+        assert [m["role"] for m in messages] == ["system", "user", "assistant", "user"]
+        assert messages[0]["content"] == agent._get_prompt_bundle().system_prompt
+        assert messages[-1]["content"].startswith("相关记忆:\n- 用户喜欢草莓")
+        assert messages[-1]["content"].endswith("我喜欢什么？")
+
+    @pytest.mark.asyncio
+    async def test_stream_uses_static_prefix(self, tmp_path):
+        agent = make_agent(tmp_path)
+        agent.memory = FakeMemory()
+        await agent.identity.load()
+
+        chunks = [chunk async for chunk in agent._slow_handle_message_stream("我喜欢什么？")]
+
+        assert chunks[-1] == "ok"
+        messages = agent.llm.requests[0]
+        assert [m["role"] for m in messages] == ["system", "user"]
+        assert messages[0]["content"] == agent._get_prompt_bundle().system_prompt
+        assert messages[-1]["content"].startswith("相关记忆:\n- 用户喜欢草莓")
+
+
+class TestProviderPrefixCache:
+    """测试 LLMClient 前缀缓存提示与命中统计"""
+
+    def make_client(self, style):
+        from mlx_agent.llm import LLMClient
+        return LLMClient({"model": "m", "api_key": "k", "api_base": "http://x", "prompt_cache": style})
+
+    def request(self, system="static prompt", user="hi"):
+        return {
+            "model": "m",
+            "messages": [{"role": "system", "content": system}, {"role": "user", "content": user}],
+            "tools": RenderedTools([{"type": "function", "function": {"name": "t"}}]),
+        }
+
+    @pytest.mark.asyncio
+    async def test_openai_key_stable_across_turns(self):
+        client = self.make_client("openai")
+        first, second, changed = self.request(user="a"), self.request(user="b"), self.request(system="other")
+        for data in (first, second, changed):
+            client._apply_cache_hints(client.primary_config, data)
+
+        assert first["prompt_cache_key"] == second["prompt_cache_key"]
+        assert first["prompt_cache_key"] != changed["prompt_cache_key"]
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_cache_control_breakpoint(self):
+        client = self.make_client("cache_control")
+        data = self.request()
+        client._apply_cache_hints(client.primary_config, data)
+
+        system = data["messages"][0]["content"]
+        assert system == [{"type": "text", "text": "static prompt", "cache_control": {"type": "ephemeral"}}]
+        assert data["messages"][1] == {"role": "user", "content": "hi"}
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_usage_tracking(self):
+        client = self.make_client(None)
+        client._record_usage({"prompt_tokens": 1000, "prompt_tokens_details": {"cached_tokens": 800}})
+        client._record_usage({"prompt_tokens": 1000, "prompt_cache_hit_tokens": 0})
+
+        stats = client.get_cache_stats()
+        assert stats["cached_tokens"] == 800 and stats["prompt_tokens"] == 2000
+        assert stats["cached_ratio"] == 0.4 and stats["hit_rate"] == 0.5
+        await client.close()
+
+    def test_unknown_style(self):
+        with pytest.raises(ValueError):
+            self.make_client("bogus")
@@ -0,0 +1,177 @@
+"""
+嵌入量化测试
+
+测试内容:
+1. float16 / int8 BLOB 编解码与旧版 float32 兼容
+2. QuantizedMatrixIndex (float16 / int8 / pq) 检索与删除
+3. SQLiteMemoryBackend 量化存储 + 全精度重排
+"""
+
+import hashlib
+
+import numpy as np
+import pytest
+
+from mlx_agent.memory.base import MemoryEntry, MemoryLevel
+from mlx_agent.memory.quantization import (
+    QuantizedMatrixIndex,
+    decode_embedding,
+    encode_embedding,
+)
+from mlx_agent.memory.sqlite import SQLiteMemoryBackend
+from mlx_agent.memory.vector_index import VectorMatrixIndex, create_vector_index
+
+
+class FakeEncoder:
+    """确定性的假嵌入模型：按词哈希生成词袋向量"""
+
+    dim = 64
+
+    def _encode_one(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            idx = int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim
+            vec[idx] += 1.0
+        return vec
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        if isinstance(texts, str):
+            return self._encode_one(texts)
+        return np.stack([self._encode_one(t) for t in texts])
+
+
+def make_vectors(n: int = 500, dim: int = 32, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((n, dim)).astype(np.float32)
+
+
+class TestEmbeddingCodec:
+    """测试 BLOB 编解码"""
+
+    @pytest.mark.parametrize("dtype,size", [("float32", 4 * 64), ("float16", 4 + 2 * 64), ("int8", 8 + 64)])
+    def test_roundtrip(self, dtype, size):
+        vector = make_vectors(1, 64)[0]
+        blob = encode_embedding(vector, dtype)
+        decoded = decode_embedding(blob)
+
+        assert len(blob) == size
+        assert decoded.dtype == np.float32 and decoded.shape == (64,)
+        cosine = decoded @ vector / (np.linalg.norm(decoded) * np.linalg.norm(vector))
+        assert cosine > 0.999
+
+    def test_legacy_float32_blob(self):
+        vector = np.arange(8, dtype=np.float32)
+        assert np.array_equal(decode_embedding(vector.tobytes()), vector)
+
+    def test_unknown_dtype(self):
+        with pytest.raises(ValueError):
+            encode_embedding([1.0, 0.0], "bfloat16")
+
+
+class TestQuantizedMatrixIndex:
+    """测试量化索引"""
+
+    @pytest.mark.parametrize("quantization", ["float16", "int8", "pq"])
+    def test_recall_with_rerank_candidates(self, quantization):
+        vectors = make_vectors()
+        ids = [f"m{i}" for i in range(len(vectors))]
+        exact = VectorMatrixIndex()
+        exact.add_many(ids, vectors)
+        index = QuantizedMatrixIndex(quantization, pq_m=8, train_threshold=100)
+        index.add_many(ids, vectors)
+        if index.needs_training:
+            index.train()
+
+        hits = 0
+        for q in make_vectors(20, seed=1):
+            truth = {memory_id for memory_id, _ in exact.search(q, 5)}
+            candidates = {memory_id for memory_id, _ in index.search(q, 5 * index.rerank_factor)}
+            hits += len(truth & candidates)
+        assert hits / 100 >= 0.9
+
+    def test_pq_compresses_after_training(self):
+        index = QuantizedMatrixIndex("pq", pq_m=8, pq_ksub=16, train_threshold=50)
+        index.add_many([f"m{i}" for i in range(60)], make_vectors(60))
+        assert index.needs_training
+        before = index.get_stats()["memory_bytes"]
+
+        index.train()
+        stats = index.get_stats()
+        assert stats["pq_trained"] and not index.needs_training
+        assert stats["memory_bytes"] < before
+
+        extra = make_vectors(1, seed=3)[0]
+        index.add("extra", extra, "P1")
+        assert "extra" in {memory_id for memory_id, _ in index.search(extra, 5)}
+
+    def test_remove_and_level_mask(self):
+        index = QuantizedMatrixIndex("int8", initial_capacity=2)
+        index.add_many(["a", "b", "c"], np.eye(3, dtype=np.float32), ["P0", "P1", "P1"])
+
+        assert index.remove("b") is True
+        assert [h[0] for h in index.search([0.0, 0.0, 1.0], 1)] == ["c"]
+        assert index.search([1.0, 0.0, 0.0], 2, level="P1")[0][0] == "c"
+        assert index._scales[1] == pytest.approx(1 / 127)
+
+    def test_factory(self):
+        assert isinstance(create_vector_index("flat", quantization="float16"), QuantizedMatrixIndex)
+        with pytest.raises(ValueError):
+            create_vector_index("ivf", quantization="int8")
+
+
+class TestSQLiteQuantizedStorage:
+    """测试 SQLite 后端量化存储"""
+
+    async def make_backend(self, tmp_path, **kwargs) -> SQLiteMemoryBackend:
+        backend = SQLiteMemoryBackend(path=str(tmp_path / "memory.db"), auto_archive=False, **kwargs)
+        backend._init_embedding_model = lambda: setattr(backend, "_embedding_model_obj", FakeEncoder())
+        await backend.initialize()
+        return backend
+
+    @pytest.mark.asyncio
+    async def test_int8_storage_and_rerank(self, tmp_path):
+        backend = await self.make_backend(
+            tmp_path, embedding_storage="int8", vector_quantization="int8"
+        )
+        try:
+            entries = [
+                MemoryEntry(content="redis cache eviction policy", level=MemoryLevel.P1),
+                MemoryEntry(content="postgres vacuum schedule", level=MemoryLevel.P1),
+                MemoryEntry(content="cache eviction redis policy", level=MemoryLevel.P1),  # 近重复
+            ]
+            await backend.add_many(entries)
+            assert entries[2].memory_id not in backend._vector_index
+
+            blob = backend._db.execute(
+                "SELECT embedding FROM memories WHERE id = ?", (entries[0].memory_id,)
+            ).fetchone()[0]
+            assert len(blob) == 8 + FakeEncoder.dim
+
+            results = await backend._vector_search("redis eviction", limit=1)
+            assert list(results) == [entries[0].memory_id]
+
+            stats = await backend.get_stats()
+            assert stats["embedding_storage"] == "int8"
+            assert stats["vector_index"]["quantization"] == "int8"
+            assert "rerank" in stats["search_timings"]["avg_ms"]
+        finally:
+            await backend.close()
+
+    @pytest.mark.asyncio
+    async def test_reopen_mixed_precision(self, tmp_path):
+        backend = await self.make_backend(tmp_path)
+        old = MemoryEntry(content="legacy float32 memory")
+        await backend.add(old)
+        await backend.close()
+
+        backend = await self.make_backend(tmp_path, embedding_storage="float16", vector_quantization="float16")
+        try:
+            new = MemoryEntry(content="compact float16 memory")
+            await backend.add(new)
+            assert len(backend._vector_index) == 2
+
+            aged = await backend.get_by_age(0, include_embeddings=True)
+            assert {m["embedding"].dtype for m in aged} == {np.dtype(np.float32)}
+            assert list(await backend._vector_search("legacy float32", limit=1)) == [old.memory_id]
+        finally:
+            await backend.close()
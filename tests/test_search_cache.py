@@ -0,0 +1,163 @@
+"""
+记忆搜索结果缓存测试
+
+测试内容:
+1. 查询归一化后命中，统计命中率
+2. add / delete / upgrade 的精确失效
+3. LRU 淘汰与 TTL 过期
+4. 内层 write-behind 有待写记忆时不缓存
+5. delete_many / get_by_age 穿过两层包装交给内层后端
+"""
+
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from mlx_agent.memory.base import MemoryEntry, MemoryLevel
+from mlx_agent.memory.search_cache import CachedMemoryBackend, SearchResultCache, normalize_query
+from mlx_agent.memory.write_behind import WriteBehindMemoryBackend
+
+
+def make_inner():
+    inner = Mock()
+    inner.search = AsyncMock(side_effect=lambda query, limit, level, min_score: [
+        {"id": f"{level.value if level else 'all'}_{query.strip()}", "content": query, "score": 0.9}
+    ])
+    inner.add = AsyncMock(return_value="new_id")
+    inner.delete = AsyncMock(return_value=True)
+    inner.upgrade_memory_level = AsyncMock(return_value=True)
+    inner.merge_duplicates = AsyncMock(return_value={"merged": 0})
+    inner.get_stats = AsyncMock(return_value={"backend": "mock"})
+    return inner
+
+
+class TestSearchResultCache:
+    """测试搜索结果缓存"""
+
+    def test_normalize_query(self):
+        assert normalize_query("  What's my  NAME? ") == "what's my name"
+        assert normalize_query("我的名字？") == normalize_query("我的名字")
+
+    @pytest.mark.asyncio
+    async def test_hit_on_normalized_query(self):
+        inner = make_inner()
+        backend = CachedMemoryBackend(inner)
+
+        first = await backend.search("Favourite color?", limit=3)
+        first[0]["content"] = "mutated by caller"
+        second = await backend.search("  favourite   COLOR ", limit=3)
+        await backend.search("favourite color", limit=5)
+
+        assert inner.search.await_count == 2
+        assert second[0]["content"] == "Favourite color?"
+        stats = (await backend.get_stats())["search_cache"]
+        assert stats["hits"] == 1 and stats["misses"] == 2
+        assert stats["hit_rate"] == pytest.approx(1 / 3, abs=1e-3)
+
+    @pytest.mark.asyncio
+    async def test_precise_invalidation(self):
+        inner = make_inner()
+        backend = CachedMemoryBackend(inner)
+
+        await backend.search("alpha", limit=3)                       # id: all_alpha
+        await backend.search("beta", limit=3, level=MemoryLevel.P0)  # id: P0_beta
+        await backend.search("gamma", limit=3, level=MemoryLevel.P2)  # id: P2_gamma
+
+        # P1 写入: 只影响不限级别的查询
+        await backend.add(MemoryEntry(content="x", level=MemoryLevel.P1))
+        assert backend.cache.get_stats()["size"] == 2
+
+        # 删除: 只影响包含该 ID 的查询
+        await backend.delete("P2_gamma")
+        assert backend.cache.get_stats()["size"] == 1
+
+        # 升级到 P0: 影响 P0 查询
+        await backend.upgrade_memory_level("other", "P0")
+        assert backend.cache.get_stats()["size"] == 0
+
+        await backend.search("alpha", limit=3)
+        await backend.merge_duplicates(keep="newest")
+        assert backend.cache.get_stats()["size"] == 0
+        assert inner.merge_duplicates.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_bypass_and_stale_fill(self):
+        inner = make_inner()
+        backend = CachedMemoryBackend(inner)
+
+        await backend.search("alpha", limit=3, use_cache=False)
+        assert backend.cache.get_stats()["size"] == 0
+
+        # 搜索期间发生写入时不写回缓存
+        cache = backend.cache
+        key = cache.make_key("alpha", 3, None, 0.0)
+        version = cache.version
+        cache.invalidate_levels([None])
+        cache.put(key, [{"id": "stale"}], version)
+        assert cache.get(key) is None
+
+    @pytest.mark.asyncio
+    async def test_no_caching_while_writes_pending(self):
+        inner = make_inner()
+        inner.initialize = AsyncMock()
+        inner.close = AsyncMock()
+        inner.add_many = AsyncMock(side_effect=lambda entries: [e.memory_id for e in entries])
+        write_behind = WriteBehindMemoryBackend(inner, journal_path=None, flush_interval_ms=200)
+        backend = CachedMemoryBackend(write_behind)
+        await backend.initialize()
+
+        await backend.add(MemoryEntry(content="新记忆"))
+        await backend.search("新记忆", limit=3)
+        await backend.search("新记忆", limit=3)
+        assert inner.search.await_count == 2
+
+        await write_behind.close()
+        await backend.search("新记忆", limit=3)
+        await backend.search("新记忆", limit=3)
+        assert inner.search.await_count == 3
+
+    @pytest.mark.asyncio
+    async def test_bulk_methods_delegated(self):
+        inner = make_inner()
+        inner.initialize = AsyncMock()
+        inner.close = AsyncMock()
+        inner.add_many = AsyncMock(side_effect=lambda entries: [e.memory_id for e in entries])
+        inner.delete_many = AsyncMock(return_value=2)
+        inner.get_by_age = AsyncMock(return_value=[{"id": "old", "embedding": [0.1]}])
+        write_behind = WriteBehindMemoryBackend(inner, journal_path=None, flush_interval_ms=200)
+        backend = CachedMemoryBackend(write_behind)
+        await backend.initialize()
+
+        await backend.search("alpha", limit=3)  # id: all_alpha
+        await backend.add(MemoryEntry(content="待写"))
+        assert await backend.delete_many(["all_alpha", "x"]) == 2
+        # 删除前先写完队列，并使包含被删 ID 的缓存失效
+        assert inner.add_many.await_count == 1
+        inner.delete_many.assert_awaited_once_with(["all_alpha", "x"])
+        assert backend.cache.get_stats()["size"] == 0
+
+        aged = await backend.get_by_age(7, level=MemoryLevel.P1, limit=10, include_embeddings=True)
+        assert aged == [{"id": "old", "embedding": [0.1]}]
+        inner.get_by_age.assert_awaited_once_with(
+            7, max_days=None, level=MemoryLevel.P1, limit=10, include_embeddings=True
+        )
+        await write_behind.close()
+
+    def test_lru_and_ttl(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr("mlx_agent.memory.search_cache.time.monotonic", lambda: now[0])
+
+        cache = SearchResultCache(max_entries=2, ttl_seconds=10)
+        keys = [cache.make_key(q, 3, None, 0.0) for q in ("a", "b", "c")]
+        cache.put(keys[0], [{"id": "1"}], cache.version)
+        cache.put(keys[1], [{"id": "2"}], cache.version)
+        assert cache.get(keys[0]) is not None   # a 变为最近使用
+        cache.put(keys[2], [{"id": "3"}], cache.version)
+
+        assert cache.get(keys[1]) is None       # b 被淘汰
+        assert cache.get(keys[0]) is not None
+
+        now[0] += 11
+        assert cache.get(keys[0]) is None
+        stats = cache.get_stats()
+        assert stats["evictions"] == 1 and stats["expirations"] == 1
@@ -0,0 +1,176 @@
+"""
+三层记忆并发搜索测试
+
+测试内容:
+1. 热层足够可信时跳过更深的层
+2. 超出预算的层被丢弃，结果按融合分数排序
+3. 分层迁移按年龄分批执行并复用已有嵌入
+4. 只查热层时不受预算限制；单条结果的层不被归一化为满分
+5. 源层删除不完整时迁移停止
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock
+
+import numpy as np
+import pytest
+
+from mlx_agent.memory.base import MemoryEntry, MemoryLevel
+from mlx_agent.memory.sqlite import SQLiteMemoryBackend
+from mlx_agent.memory.tiered import TieredMemoryBackend
+
+
+def make_tiered(hot, warm, cold, **kwargs) -> TieredMemoryBackend:
+    backend = TieredMemoryBackend(
+        hot_path="/tmp/unused_hot", warm_path="/tmp/unused_warm.db", cold_path="/tmp/unused_cold",
+        auto_tiering=False, **kwargs
+    )
+    backend.hot, backend.warm, backend.cold = hot, warm, cold
+    backend._initialized = True
+    return backend
+
+
+def tier(results, delay: float = 0.0):
+    mock = AsyncMock()
+
+    async def search(query, limit, level, min_score):
+        await asyncio.sleep(delay)
+        return results[:limit]
+
+    mock.search = AsyncMock(side_effect=search)
+    return mock
+
+
+class TestTieredSearch:
+    """测试分层并发搜索"""
+
+    @pytest.mark.asyncio
+    async def test_early_termination_skips_deeper_tiers(self):
+        hot = tier([{"id": "h1", "score": 0.95}, {"id": "h2", "score": 0.9}])
+        warm, cold = tier([{"id": "w1", "score": 0.99}]), tier([])
+        backend = make_tiered(hot, warm, cold)
+
+        results = await backend.search("q", limit=2, depth="deep")
+
+        assert [r["id"] for r in results] == ["h1", "h2"]
+        warm.search.assert_not_called()
+        cold.search.assert_not_called()
+        latency = backend._tier_latency
+        assert latency["warm"].skipped == 1 and latency["cold"].skipped == 1
+        assert backend._early_terminations == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrent_fusion_with_budget(self):
+        # 热层分数尺度 (0.5-1) 与温层 (0-1) 不同；冷层超时
+        hot = tier([{"id": "a", "score": 0.62}, {"id": "b", "score": 0.55}])
+        warm = tier([{"id": "c", "score": 0.9}, {"id": "a", "score": 0.3}], delay=0.02)
+        cold = tier([{"id": "z", "score": 1.0}], delay=1.0)
+        backend = make_tiered(hot, warm, cold, tier_budgets_ms={"cold": 50}, hot_head_start_ms=0)
+
+        start = asyncio.get_running_loop().time()
+        results = await backend.search("q", limit=3, depth="deep")
+        elapsed = asyncio.get_running_loop().time() - start
+
+        assert elapsed < 0.5
+        ids = [r["id"] for r in results]
+        assert ids[0] == "a"               # 两层都出现，RRF 累加
+        assert set(ids) == {"a", "b", "c"}
+        assert results[0]["tier"] == "hot" and results[0]["tier_score"] == 0.62
+        assert backend._tier_latency["cold"].timeouts == 1
+        assert backend._tier_latency["warm"].get_stats()["count"] == 1
+
+    @pytest.mark.asyncio
+    async def test_hot_only_search_ignores_budget(self):
+        hot = tier([{"id": "h1", "score": 0.8}], delay=0.05)
+        backend = make_tiered(hot, tier([]), tier([]), tier_budgets_ms={"hot": 10})
+
+        results = await backend.search("q", limit=3, depth="hot")
+
+        assert [r["id"] for r in results] == ["h1"]
+        assert backend._tier_latency["hot"].timeouts == 0
+
+    def test_single_result_tier_not_normalized_to_top(self):
+        backend = make_tiered(tier([]), tier([]), tier([]))
+        fused = backend._fuse_results([
+            ("hot", [{"id": "a", "score": 0.9}, {"id": "b", "score": 0.6}]),
+            ("cold", [{"id": "z", "score": 0.2}]),
+        ])
+        scores = {r["id"]: r["score"] for r in fused}
+        # 单条低分结果只得到排名分，不与另一层的最高分并列
+        assert fused[0]["id"] == "a"
+        assert scores["z"] < scores["a"] - 0.3
+
+
+class CountingEncoder:
+    """记录编码次数的假嵌入模型"""
+
+    def __init__(self):
+        self.encoded = 0
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        self.encoded += len(texts)
+        return np.stack([np.array([len(t), 1.0, 0.0, 0.0], dtype=np.float32) for t in texts])
+
+
+async def make_sqlite(path, encoder) -> SQLiteMemoryBackend:
+    backend = SQLiteMemoryBackend(path=str(path), auto_archive=False)
+    backend._init_embedding_model = lambda: setattr(backend, "_embedding_model_obj", encoder)
+    await backend.initialize()
+    return backend
+
+
+class TestTierMigration:
+    """测试分层迁移"""
+
+    @pytest.mark.asyncio
+    async def test_batched_migration_carries_embeddings(self, tmp_path):
+        encoder = CountingEncoder()
+        hot = await make_sqlite(tmp_path / "hot.db", encoder)
+        warm = await make_sqlite(tmp_path / "warm.db", encoder)
+        cold = await make_sqlite(tmp_path / "cold.db", encoder)
+        backend = make_tiered(hot, warm, cold, migration_batch_size=2)
+        try:
+            now = datetime.now()
+            old_p1 = [
+                MemoryEntry(content=f"old note {i}", level=MemoryLevel.P1, created_at=now - timedelta(days=10))
+                for i in range(5)
+            ]
+            fresh = MemoryEntry(content="fresh note", level=MemoryLevel.P1, created_at=now)
+            old_p2 = MemoryEntry(content="stale scratch", level=MemoryLevel.P2, created_at=now - timedelta(days=2))
+            await hot.add_many(old_p1 + [fresh, old_p2], dedup_threshold=1.1)
+
+            aged = await hot.get_by_age(min_days=7, max_days=30, level=MemoryLevel.P1, limit=3)
+            assert len(aged) == 3 and all(m["id"] != fresh.memory_id for m in aged)
+
+            encoded_before = encoder.encoded
+            reports = []
+            stats = await backend.auto_tier(progress=lambda name, moved, rate: reports.append((name, moved)))
+
+            assert stats == {"p2_to_cold": 1, "hot_to_warm": 5, "warm_to_cold": 0}
+            assert encoder.encoded == encoded_before
+            assert [m for name, m in reports if name == "hot_to_warm"] == [2, 4, 5]
+            assert [m["id"] for m in await hot.get_by_level(MemoryLevel.P1)] == [fresh.memory_id]
+            assert len(warm._vector_index) == 5 and len(cold._vector_index) == 1
+            assert backend._last_tier_run["hot_to_warm"] == 5
+        finally:
+            for tier_backend in (hot, warm, cold):
+                await tier_backend.close()
+
+    @pytest.mark.asyncio
+    async def test_partial_source_delete_stops_migration(self):
+        batch = [
+            {"id": f"P1_m{i}", "content": f"note {i}", "metadata": {}, "level": "P1",
+             "created_at": "2026-09-01T12:00:00"}
+            for i in range(4)
+        ]
+        hot, warm = AsyncMock(), AsyncMock()
+        hot.get_by_age = AsyncMock(side_effect=[batch[:2], batch[2:]])
+        hot.delete_many = AsyncMock(return_value=1)
+        backend = make_tiered(hot, warm, AsyncMock(), migration_batch_size=2)
+
+        moved = await backend._migrate("hot_to_warm", hot, warm, MemoryLevel.P1, min_days=7)
+
+        assert moved == 2
+        assert hot.get_by_age.await_count == 1
+        warm.add_many.assert_awaited_once()
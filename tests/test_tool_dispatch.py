@@ -0,0 +1,106 @@
+"""
+工具调用并发执行测试
+
+测试内容:
+1. 同一轮的工具调用并发执行，结果按 tool_call_id 原顺序返回
+2. 声明副作用的工具串行执行
+3. 单个工具超时不影响其他调用
+4. 副作用工具不加外层超时，参数中的 timeout 放宽外层超时
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from mlx_agent.agent import MLXAgent
+from mlx_agent.config import Config, ToolsConfig
+from mlx_agent.plugins.base import PluginManager
+
+
+class SlowAgent(MLXAgent):
+    """跳过初始化、工具调用按参数 sleep 的 Agent"""
+
+    def __init__(self, tools: ToolsConfig, side_effect_tools=()):
+        self.config = Config(tools=tools)
+        self.plugin_manager = PluginManager()
+        self.side_effect_tools = set(side_effect_tools)
+        self.active = 0
+        self.peak = 0
+        self.order = []
+
+    def _tool_has_side_effects(self, function_name: str) -> bool:
+        return function_name in self.side_effect_tools
+
+    async def _execute_tool_call(self, tool_call: dict, context: dict = None) -> str:
+        name = tool_call["function"]["name"]
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(float(tool_call["function"]["arguments"]))
+            self.order.append(tool_call["id"])
+            return f"{name} done"
+        finally:
+            self.active -= 1
+
+
+def call(call_id: str, name: str, delay: float) -> dict:
+    return {"id": call_id, "function": {"name": name, "arguments": str(delay)}}
+
+
+class TestToolDispatch:
+    """测试工具调用调度"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_results_in_original_order(self):
+        agent = SlowAgent(ToolsConfig(max_concurrency=4))
+        calls = [call("a", "search", 0.2), call("b", "anilist", 0.1), call("c", "read", 0.05)]
+
+        start = time.perf_counter()
+        messages = await agent._execute_tool_calls(calls)
+        elapsed = time.perf_counter() - start
+
+        assert elapsed < 0.3
+        assert agent.order == ["c", "b", "a"]
+        assert [m["tool_call_id"] for m in messages] == ["a", "b", "c"]
+        assert messages[0] == {"role": "tool", "tool_call_id": "a", "name": "search", "content": "search done"}
+
+    @pytest.mark.asyncio
+    async def test_concurrency_limit(self):
+        agent = SlowAgent(ToolsConfig(max_concurrency=2))
+        await agent._execute_tool_calls([call(str(i), "search", 0.02) for i in range(6)])
+        assert agent.peak == 2
+
+    @pytest.mark.asyncio
+    async def test_side_effect_tools_serialized(self):
+        agent = SlowAgent(ToolsConfig(max_concurrency=4), side_effect_tools={"write"})
+        calls = [call("w1", "write", 0.05), call("r", "read", 0.01), call("w2", "write", 0.01)]
+
+        await agent._execute_tool_calls(calls)
+
+        # 两个写操作按原顺序执行，不与彼此重叠
+        assert agent.order.index("w1") < agent.order.index("w2")
+        assert agent.order[0] == "r"
+
+    @pytest.mark.asyncio
+    async def test_timeout(self):
+        agent = SlowAgent(ToolsConfig(max_concurrency=4, timeout_seconds=0.05))
+        messages = await agent._execute_tool_calls([call("slow", "search", 1.0), call("fast", "read", 0.01)])
+
+        assert "超时" in messages[0]["content"]
+        assert messages[1]["content"] == "read done"
+
+    @pytest.mark.asyncio
+    async def test_side_effect_tools_not_cancelled(self):
+        agent = SlowAgent(ToolsConfig(timeout_seconds=0.02), side_effect_tools={"write"})
+        messages = await agent._execute_tool_calls([call("w", "write", 0.05)])
+        assert messages[0]["content"] == "write done"
+
+    def test_timeout_respects_tool_argument(self):
+        agent = SlowAgent(ToolsConfig(timeout_seconds=60), side_effect_tools={"execute_code"})
+        margin = agent.TOOL_TIMEOUT_MARGIN
+
+        assert agent._tool_call_timeout(call("a", "search", 0.1)) == 60
+        assert agent._tool_call_timeout({"function": {"name": "http", "arguments": '{"timeout": 300}'}}) == 300 + margin
+        assert agent._tool_call_timeout({"function": {"name": "http", "arguments": {"timeout": 5}}}) == 60
+        assert agent._tool_call_timeout({"function": {"name": "execute_code", "arguments": '{"timeout": 300}'}}) is None
@@ -0,0 +1,162 @@
+"""
+记忆异步批量写入测试
+
+测试内容:
+1. add 立即返回，后台按批次写入，刷新前搜索可见
+2. 队列满时 add 等待（背压）
+3. 崩溃后从日志重放未确认的记忆
+4. 持续失败的批次超过重试上限后转入死信日志，flush 不会永久等待
+"""
+
+import asyncio
+import json
+
+import pytest
+from unittest.mock import AsyncMock, Mock
+
+from mlx_agent.memory.base import MemoryEntry, MemoryLevel
+from mlx_agent.memory.write_behind import WriteBehindMemoryBackend, pending_match_score
+
+
+def make_inner():
+    inner = Mock()
+    inner.initialize = AsyncMock()
+    inner.close = AsyncMock()
+    inner.add_many = AsyncMock(side_effect=lambda entries: [e.memory_id for e in entries])
+    inner.search = AsyncMock(return_value=[])
+    inner.get_stats = AsyncMock(return_value={})
+    return inner
+
+
+class TestWriteBehind:
+    """测试 write-behind 队列"""
+
+    @pytest.mark.asyncio
+    async def test_batched_flush_and_read_your_writes(self, tmp_path):
+        inner = make_inner()
+        backend = WriteBehindMemoryBackend(
+            inner, journal_path=str(tmp_path / "wb.jsonl"), batch_size=10, flush_interval_ms=50
+        )
+        await backend.initialize()
+
+        entries = [MemoryEntry(content=f"用户喜欢草莓味甜甜圈 {i}", level=MemoryLevel.P1) for i in range(5)]
+        ids = [await backend.add(e) for e in entries]
+        assert ids == [e.memory_id for e in entries]
+        inner.add_many.assert_not_called()
+
+        results = await backend.search("草莓味甜甜圈", limit=3)
+        assert len(results) == 3 and all(r["pending"] for r in results)
+        assert await backend.search("草莓", level=MemoryLevel.P0) == []
+
+        await backend.flush()
+        assert inner.add_many.await_count == 1
+        assert len(inner.add_many.await_args.args[0]) == 5
+
+        stats = (await backend.get_stats())["write_behind"]
+        assert stats["pending"] == 0 and stats["flushed"] == 5 and stats["batches"] == 1
+        assert (tmp_path / "wb.jsonl").stat().st_size == 0
+        await backend.close()
+
+    @pytest.mark.asyncio
+    async def test_backpressure(self, tmp_path):
+        inner = make_inner()
+        release = asyncio.Event()
+
+        async def slow_add_many(entries):
+            await release.wait()
+            return [e.memory_id for e in entries]
+
+        inner.add_many = AsyncMock(side_effect=slow_add_many)
+        backend = WriteBehindMemoryBackend(
+            inner, journal_path=None, max_pending=2, batch_size=1, flush_interval_ms=0
+        )
+        await backend.initialize()
+
+        for i in range(3):
+            await backend.add(MemoryEntry(content=f"memory {i}"))
+        blocked = asyncio.create_task(backend.add(MemoryEntry(content="memory 3")))
+        await asyncio.sleep(0.05)
+        assert not blocked.done()
+
+        release.set()
+        await asyncio.wait_for(blocked, 1.0)
+        await backend.flush()
+        assert (await backend.get_stats())["write_behind"]["backpressure_waits"] >= 1
+        await backend.close()
+
+    @pytest.mark.asyncio
+    async def test_replay_after_crash(self, tmp_path):
+        journal = tmp_path / "wb.jsonl"
+        acked = MemoryEntry(content="already written")
+        lost = MemoryEntry(content="never flushed", metadata={"k": "v"}, level=MemoryLevel.P0)
+        journal.write_text(
+            "\n".join([
+                json.dumps({"op": "add", "entry": acked.to_dict()}),
+                json.dumps({"op": "add", "entry": lost.to_dict()}),
+                json.dumps({"op": "ack", "ids": [acked.memory_id]}),
+                '{"op": "add", "entry": {"trunc',
+            ]),
+            encoding="utf-8"
+        )
+
+        inner = make_inner()
+        backend = WriteBehindMemoryBackend(inner, journal_path=str(journal), flush_interval_ms=10)
+        await backend.initialize()
+        await backend.flush()
+
+        written = inner.add_many.await_args.args[0]
+        assert [e.memory_id for e in written] == [lost.memory_id]
+        assert written[0].level == MemoryLevel.P0 and written[0].metadata == {"k": "v"}
+        assert (await backend.get_stats())["write_behind"]["replayed"] == 1
+        await backend.close()
+
+    @pytest.mark.asyncio
+    async def test_dead_letter_after_retries(self, tmp_path):
+        inner = make_inner()
+        inner.add_many = AsyncMock(side_effect=OSError("disk full"))
+        backend = WriteBehindMemoryBackend(
+            inner, journal_path=str(tmp_path / "wb.jsonl"), flush_interval_ms=0,
+            retry_delay_s=0.01, max_retries=2
+        )
+        await backend.initialize()
+
+        entry = MemoryEntry(content="坏数据")
+        await backend.add(entry)
+        await asyncio.wait_for(backend.flush(), 1.0)
+
+        assert inner.add_many.await_count == 3
+        dead = [json.loads(line) for line in (tmp_path / "wb.dead.jsonl").read_text(encoding="utf-8").splitlines()]
+        assert [d["entry"]["id"] for d in dead] == [entry.memory_id] and "disk full" in dead[0]["error"]
+        stats = (await backend.get_stats())["write_behind"]
+        assert stats["pending"] == 0 and stats["dead_lettered"] == 1
+        await backend.close()
+
+    @pytest.mark.asyncio
+    async def test_flush_waits_only_for_earlier_entries(self, tmp_path):
+        inner = make_inner()
+        release = asyncio.Event()
+        calls = []
+
+        async def add_many(entries):
+            calls.append(entries)
+            if len(calls) > 1:
+                await release.wait()
+            return [e.memory_id for e in entries]
+
+        inner.add_many = AsyncMock(side_effect=add_many)
+        backend = WriteBehindMemoryBackend(inner, journal_path=None, batch_size=1, flush_interval_ms=0)
+        await backend.initialize()
+
+        await backend.add(MemoryEntry(content="first"))
+        flushing = asyncio.create_task(backend.flush())
+        await asyncio.sleep(0)  # flush 先记录待写集合
+        await backend.add(MemoryEntry(content="second"))  # 刷新开始后入队，写入被阻塞
+
+        await asyncio.wait_for(flushing, 1.0)
+        assert backend.pending_writes == 1
+        release.set()
+        await backend.close()
+
+    def test_pending_match_score(self):
+        assert pending_match_score("草莓", "用户喜欢草莓味") == 1.0
+        assert pending_match_score("python project", "notes about gardening") < 0.3